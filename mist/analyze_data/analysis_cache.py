@@ -0,0 +1,286 @@
+"""Persistent per-patient cache for the Analyzer's dataset scan.
+
+The records produced by scan_utils.scan_patient are stored on disk as JSON
+lines next to fg_bboxes.csv. Each entry is keyed by a fingerprint of the
+patient's files (resolved path, size, modification time, and a hash of the
+image header), so re-running the analysis on a grown dataset only opens the
+new or changed files. The first line of the cache records a hash of the
+analyzer and preprocessing constants; the whole cache is discarded when any
+of them change.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import ants
+import numpy as np
+
+# MIST imports.
+from mist.analyze_data import scan_utils
+from mist.analyze_data.analyzer_constants import AnalyzeConstants
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants
+
+# Bump when the layout of a cached record changes.
+CACHE_FORMAT_VERSION = 1
+
+
+def _json_default(value: Any) -> Any:
+    """Convert numpy and other non-JSON types for json.dumps."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _hash_json(value: Any) -> str:
+    """Get a stable SHA-256 hex digest of a JSON-serializable value."""
+    payload = json.dumps(value, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _public_constants(constants_cls: type) -> dict[str, Any]:
+    """Get the public class-level constants of a constants dataclass."""
+    return {
+        name: value
+        for name, value in vars(constants_cls).items()
+        if name.isupper() and not isinstance(value, Path)
+    }
+
+
+def get_settings_hash() -> str:
+    """Get a hash of every setting that affects the cached records.
+
+    The hash covers the cache format version and all analyzer and
+    preprocessing constants, so editing any of them invalidates the cache.
+    """
+    return _hash_json(
+        {
+            "version": CACHE_FORMAT_VERSION,
+            "analyze": _public_constants(AnalyzeConstants),
+            "preprocessing": _public_constants(PreprocessingConstants),
+        }
+    )
+
+
+def get_file_fingerprint(path: str) -> dict[str, Any]:
+    """Fingerprint a single image file without reading its voxel data.
+
+    Args:
+        path: Path to the image file.
+
+    Returns:
+        Dictionary with the resolved path, size in bytes, modification time
+        in nanoseconds, and a hash of the image header.
+    """
+    resolved = Path(path).resolve()
+    stat = os.stat(resolved)
+    header = ants.image_header_info(str(resolved))
+    return {
+        "path": str(resolved),
+        "size": int(stat.st_size),
+        "mtime_ns": int(stat.st_mtime_ns),
+        "header_hash": _hash_json(header),
+    }
+
+
+def get_patient_fingerprint(patient: dict[str, Any]) -> str | None:
+    """Fingerprint all files of a patient.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+
+    Returns:
+        Hash over the fingerprints of the mask and every image, or None if
+        any file cannot be fingerprinted (e.g., it does not exist).
+    """
+    columns = ["mask"] + scan_utils.get_image_columns(patient)
+    try:
+        fingerprints = {col: get_file_fingerprint(patient[col]) for col in columns}
+    except Exception:
+        return None
+    return _hash_json(fingerprints)
+
+
+def get_scan_options(
+    compute_ct_stats: bool,
+    dump_channels: list[str] | None,
+    dump_labels: list[int] | None,
+    skeleton_voxel_budget: int | None = None,
+) -> dict[str, Any]:
+    """Bundle the scan_patient options that determine a record's contents."""
+    return {
+        "compute_ct_stats": bool(compute_ct_stats),
+        "dump_channels": list(dump_channels) if dump_channels is not None else None,
+        "dump_labels": list(dump_labels) if dump_labels is not None else None,
+        "skeleton_voxel_budget": skeleton_voxel_budget,
+    }
+
+
+def entry_satisfies(entry_options: dict[str, Any], options: dict[str, Any]) -> bool:
+    """Check whether a record scanned with entry_options covers options.
+
+    A record that includes CT statistics or data dump statistics can be
+    reused by a run that does not need them, but not the other way around.
+    """
+    if options["compute_ct_stats"] and not entry_options["compute_ct_stats"]:
+        return False
+    if options["dump_channels"] is not None:
+        return (
+            entry_options["dump_channels"] == options["dump_channels"]
+            and entry_options["dump_labels"] == options["dump_labels"]
+            and entry_options.get("skeleton_voxel_budget") == options["skeleton_voxel_budget"]
+        )
+    return True
+
+
+def is_cacheable(record: dict[str, Any]) -> bool:
+    """Only records without read or analysis errors are cached."""
+    return record["read_error"] is None and record["error"] is None
+
+
+def encode_record(record: dict[str, Any]) -> dict[str, Any]:
+    """Convert a scan record into a JSON-serializable dictionary.
+
+    The CT histogram is stored sparsely since most of its bins are empty.
+    """
+    encoded = dict(record)
+    if record["ct_stats"] is not None:
+        n, mean, m2, hist, n_out = record["ct_stats"]
+        nonzero = np.flatnonzero(hist)
+        encoded["ct_stats"] = {
+            "n": int(n),
+            "mean": float(mean),
+            "M2": float(m2),
+            "hist_bins": nonzero.tolist(),
+            "hist_counts": np.asarray(hist)[nonzero].tolist(),
+            "n_out_of_range": int(n_out),
+        }
+    if record["dump_stats"] is not None:
+        dump = record["dump_stats"]
+        encoded["dump_stats"] = {
+            **dump,
+            "label_voxel_counts": {str(k): v for k, v in dump["label_voxel_counts"].items()},
+            "label_shape_descriptors": {
+                str(k): v for k, v in dump["label_shape_descriptors"].items()
+            },
+            "channel_samples": {
+                col: np.asarray(vals).tolist() for col, vals in dump["channel_samples"].items()
+            },
+        }
+    return encoded
+
+
+def decode_record(encoded: dict[str, Any]) -> dict[str, Any]:
+    """Invert encode_record."""
+    record = dict(encoded)
+    for key in ("rai_spacing", "image_dims"):
+        if record[key] is not None:
+            record[key] = tuple(record[key])
+    if record["mask_header"] is not None:
+        record["mask_header"] = {k: tuple(v) for k, v in record["mask_header"].items()}
+    if record["ct_stats"] is not None:
+        ct = record["ct_stats"]
+        hist = np.zeros(AnalyzeConstants.CT_HU_HIST_BINS, dtype=np.int64)
+        hist[np.asarray(ct["hist_bins"], dtype=np.int64)] = ct["hist_counts"]
+        record["ct_stats"] = (ct["n"], ct["mean"], ct["M2"], hist, ct["n_out_of_range"])
+    if record["dump_stats"] is not None:
+        dump = record["dump_stats"]
+        record["dump_stats"] = {
+            **dump,
+            "label_voxel_counts": {int(k): v for k, v in dump["label_voxel_counts"].items()},
+            "label_shape_descriptors": {
+                int(k): v for k, v in dump["label_shape_descriptors"].items()
+            },
+            "channel_samples": {
+                col: np.asarray(vals, dtype=np.float32)
+                for col, vals in dump["channel_samples"].items()
+            },
+        }
+    return record
+
+
+def load_cache(cache_path: str | Path) -> dict[str, dict[str, Any]]:
+    """Load the cache entries, keyed by patient ID as a string.
+
+    Returns an empty dictionary if the file does not exist, cannot be parsed,
+    or was written with different settings.
+
+    Args:
+        cache_path: Path to the JSON-lines cache file.
+
+    Returns:
+        Dictionary mapping str(patient ID) to an entry with the keys
+        fingerprint, options, and record (still encoded).
+    """
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        return {}
+
+    entries: dict[str, dict[str, Any]] = {}
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("settings_hash") != get_settings_hash():
+                return {}
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[str(entry["id"])] = entry
+    except (OSError, ValueError, KeyError, AttributeError):
+        return {}
+    return entries
+
+
+def write_cache(cache_path: str | Path, entries: list[dict[str, Any]]) -> None:
+    """Write cache entries as JSON lines, atomically replacing any old cache.
+
+    Args:
+        cache_path: Path to the JSON-lines cache file.
+        entries: Entries with the keys id, fingerprint, options, and record
+            (already encoded).
+    """
+    cache_path = Path(cache_path)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"settings_hash": get_settings_hash()}) + "\n")
+        for entry in entries:
+            file.write(json.dumps(entry, default=_json_default) + "\n")
+    os.replace(tmp_path, cache_path)
+
+
+def scan_patient_cached(
+    patient: dict[str, Any],
+    cached_entry: dict[str, Any] | None,
+    options: dict[str, Any],
+) -> tuple[dict[str, Any], str | None, bool]:
+    """Return a patient's record from the cache, or scan it if stale.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+        cached_entry: The patient's cache entry, if any.
+        options: Scan options from get_scan_options.
+
+    Returns:
+        Tuple of (record, fingerprint, cache_hit). The fingerprint is None if
+        the files could not be fingerprinted.
+    """
+    fingerprint = get_patient_fingerprint(patient)
+    if (
+        cached_entry is not None
+        and fingerprint is not None
+        and cached_entry["fingerprint"] == fingerprint
+        and entry_satisfies(cached_entry["options"], options)
+    ):
+        record = decode_record(cached_entry["record"])
+        # The cache key is str(id); restore the ID type used in paths_df.
+        record["id"] = patient["id"]
+        return record, fingerprint, True
+
+    record = scan_utils.scan_patient(patient, **options)
+    return record, fingerprint, False
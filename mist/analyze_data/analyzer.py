@@ -12,23 +12,29 @@ be used for preprocessing and training models.
 
 import argparse
 from collections.abc import Iterable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Executor, as_completed
 from importlib import metadata
 from pathlib import Path
+from typing import Any
 
-import ants
 import numpy as np
 import pandas as pd
 
-from mist.analyze_data import analyzer_utils
+from mist.analyze_data import (
+    analysis_cache,
+    analyzer_utils,
+    memory_planner,
+    sampling,
+    scan_utils,
+)
 from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
 from mist.analyze_data.data_dumper import DataDumper
-from mist.preprocessing import preprocessing_utils
 
 # MIST imports.
 from mist.utils import io, progress_bar
 from mist.utils.console import (
     print_error,
+    print_info,
     print_section_header,
     print_success,
     print_warning,
@@ -96,6 +102,54 @@ def _percentile_from_histogram(
     return float(bin_edges[idx])
 
 
+def _get_ct_bootstrap_statistics(
+    per_patient: list[tuple[int, float, float, np.ndarray, int]],
+) -> dict[str, Any]:
+    """Build bootstrap statistics for the CT normalization parameters.
+
+    A resample that draws a patient k times weights its histogram and its
+    Welford summary by k, so each resample is a weighted merge of the
+    per-patient CT statistics rather than a new pass over voxels.
+
+    Args:
+        per_patient: Per-patient CT statistics from the dataset scan.
+
+    Returns:
+        Dictionary mapping the names of the CT normalization parameters to
+        functions of an array of resampled record indices.
+    """
+    n = np.array([stats[0] for stats in per_patient], dtype=float)
+    means = np.array([stats[1] for stats in per_patient], dtype=float)
+    m2 = np.array([stats[2] for stats in per_patient], dtype=float)
+    hists = np.array([stats[3] for stats in per_patient], dtype=float)
+    bin_edges = scan_utils.get_ct_hist_bin_edges()
+
+    def _weights(idx: np.ndarray) -> np.ndarray:
+        return np.bincount(idx, minlength=len(per_patient)).astype(float)
+
+    def _window(percentile: float) -> Any:
+        return lambda idx: _percentile_from_histogram(_weights(idx) @ hists, bin_edges, percentile)
+
+    def _mean(idx: np.ndarray) -> float:
+        w = _weights(idx) * n
+        return float(np.sum(w * means) / np.sum(w)) if np.sum(w) > 0 else 0.0
+
+    def _std(idx: np.ndarray) -> float:
+        w = _weights(idx)
+        total = np.sum(w * n)
+        if total == 0:
+            return 0.0
+        mean = np.sum(w * n * means) / total
+        return float(np.sqrt(np.sum(w * (m2 + n * (means - mean) ** 2)) / total))
+
+    return {
+        "ct_window_min": _window(constants.CT_GLOBAL_CLIP_MIN_PERCENTILE),
+        "ct_window_max": _window(constants.CT_GLOBAL_CLIP_MAX_PERCENTILE),
+        "ct_z_score_mean": _mean,
+        "ct_z_score_std": _std,
+    }
+
+
 class Analyzer:
     """Analyzer class for getting config.json file for MIST.
 
@@ -127,6 +181,7 @@ class Analyzer:
         self.paths_csv = self.results_dir / "train_paths.csv"
         self.fg_bboxes_csv = self.results_dir / "fg_bboxes.csv"
         self.config_json = self.results_dir / "config.json"
+        self.analysis_cache_path = self.results_dir / "analysis_cache.jsonl"
 
         # If the config.json file already exists, we will overwrite it and
         # print a warning to the console. This is to ensure that the user
@@ -142,6 +197,61 @@ class Analyzer:
         num_workers = getattr(self.mist_arguments, "num_workers_analyze", None)
         self.n_workers = int(num_workers) if num_workers is not None else 1
 
+        # Executor used for the per-patient scan. Threads are cheap to start
+        # but the scan is mostly GIL-holding NumPy work, so processes scale
+        # better with many workers. Workers are module-level functions that
+        # return compact records, so both backends stream the same results.
+        self.backend = getattr(self.mist_arguments, "analyze_backend", None) or "thread"
+        if self.backend not in ("thread", "process"):
+            raise ValueError(
+                f"Unknown analyze backend '{self.backend}'. Expected 'thread' or 'process'."
+            )
+
+        # Optional sampled analysis. With --analyze-sample N, only N patients
+        # drawn at random (optionally stratified by header geometry) are read
+        # in full; every other patient only has its headers read and checked.
+        sample_size = getattr(self.mist_arguments, "analyze_sample", None)
+        self.sample_size = int(sample_size) if sample_size is not None else None
+        self.sample_stratify = getattr(self.mist_arguments, "analyze_stratify", None) or "none"
+        if self.sample_stratify not in sampling.STRATIFY_OPTIONS:
+            raise ValueError(
+                f"Unknown stratification '{self.sample_stratify}'. "
+                f"Expected one of {list(sampling.STRATIFY_OPTIONS)}."
+            )
+        sample_seed = getattr(self.mist_arguments, "analyze_seed", None)
+        self.sample_seed = int(sample_seed) if sample_seed is not None else 42
+        self.sample_ids: set[Any] | None = None
+        self.header_records: dict[Any, dict[str, Any]] = {}
+        self.sample_json = self.results_dir / "analysis_sample.json"
+
+        # Optional architecture-aware patch planning. With --gpu-memory-budget,
+        # the patch and batch size are chosen by tracing the model on the meta
+        # device instead of from the fixed voxel budget. --plan-model selects
+        # the architecture and is also written to the configuration.
+        memory_budget = getattr(self.mist_arguments, "gpu_memory_budget", None)
+        self.gpu_memory_budget = float(memory_budget) if memory_budget is not None else None
+        plan_model = getattr(self.mist_arguments, "plan_model", None)
+        if plan_model is not None:
+            self.config["model"]["architecture"] = plan_model
+
+        # Per-patient scan records keyed by patient ID. Every mask and anchor
+        # image is read once by scan_dataset and the analysis methods reduce
+        # over these records instead of reading files again.
+        self.scan_records: dict[Any, dict[str, Any]] = {}
+
+        # Entries of the persistent analysis cache keyed by str(patient ID).
+        # Loaded on the first scan; --refresh ignores the cache on disk and
+        # rescans every patient.
+        self.refresh_cache = bool(getattr(self.mist_arguments, "refresh", False))
+        self.cache_entries: dict[str, dict[str, Any]] | None = None
+
+        # Voxel budget for skeletonizing labels in the data dump. It changes
+        # the skeleton ratios, so it is part of the scan options of the cache.
+        skeleton_budget = getattr(self.mist_arguments, "skeleton_voxel_budget", None)
+        self.skeleton_voxel_budget = (
+            int(skeleton_budget) if skeleton_budget is not None else constants.MAX_SKELETON_VOXELS
+        )
+
     def _check_dataset_info(self) -> None:
         """Check if the dataset description file is in the correct format.
 
@@ -312,6 +422,177 @@ class Analyzer:
                     f"{self.dataset_info['labels']}."
                 )
 
+    def scan_dataset(self, patients: list[dict[str, Any]] | None = None) -> None:
+        """Read each patient's files once and store the per-patient records.
+
+        This is the only stage of the analysis that touches voxel data. For
+        every patient it reads the mask and the anchor image (the first image
+        column) exactly once and computes the spacing, foreground bounding
+        box, non-zero ratio, label set, header checks, the CT statistics when
+        the modality is CT, and the data dump statistics when the data dump is
+        requested. Records are stored in self.scan_records keyed by patient ID.
+
+        Records are also persisted to analysis_cache.jsonl in the results
+        directory. On later runs, patients whose files have the same path,
+        size, modification time, and header are taken from the cache instead
+        of being read again, unless --refresh is given.
+
+        Args:
+            patients: Patient rows to scan. Defaults to all rows of paths_df.
+        """
+        if patients is None:
+            patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
+        if not patients:
+            return
+
+        compute_ct_stats = self.dataset_info["modality"].lower() == "ct"
+        dump_channels, dump_labels, skeleton_voxel_budget = None, None, None
+        if getattr(self.mist_arguments, "data_dump", False):
+            dump_channels = list(self.dataset_info["images"].keys())
+            dump_labels = [lbl for lbl in self.dataset_info["labels"] if lbl != 0]
+            skeleton_voxel_budget = self.skeleton_voxel_budget
+
+        options = analysis_cache.get_scan_options(
+            compute_ct_stats, dump_channels, dump_labels, skeleton_voxel_budget
+        )
+        if self.cache_entries is None:
+            self.cache_entries = (
+                {} if self.refresh_cache else analysis_cache.load_cache(self.analysis_cache_path)
+            )
+
+        n_cached = 0
+        progress = progress_bar.get_progress_bar("Scanning dataset")
+        with self._get_executor() as executor:
+            futures = [
+                executor.submit(
+                    analysis_cache.scan_patient_cached,
+                    patient,
+                    self.cache_entries.get(str(patient["id"])),
+                    options,
+                )
+                for patient in patients
+            ]
+            with progress as pb:
+                for future in pb.track(as_completed(futures), total=len(patients)):
+                    record, fingerprint, cache_hit = future.result()
+                    self.scan_records[record["id"]] = record
+                    n_cached += int(cache_hit)
+                    if cache_hit:
+                        continue
+                    key = str(record["id"])
+                    if fingerprint is not None and analysis_cache.is_cacheable(record):
+                        self.cache_entries[key] = {
+                            "id": key,
+                            "fingerprint": fingerprint,
+                            "options": options,
+                            "record": analysis_cache.encode_record(record),
+                        }
+                    else:
+                        self.cache_entries.pop(key, None)
+
+        if n_cached > 0:
+            print_info(f"Reused cached analysis for {n_cached} of {len(patients)} patient(s).")
+        self._write_analysis_cache()
+
+    def _get_executor(self) -> Executor:
+        """Create the executor for the per-patient scan."""
+        return analyzer_utils.get_executor(self.backend, self.n_workers)
+
+    def _write_analysis_cache(self) -> None:
+        """Persist the cache entries of all scanned patients.
+
+        Entries of patients that are no longer in the dataset are dropped.
+        The cache is only written if the results directory already exists.
+        """
+        if not self.cache_entries or not self.results_dir.is_dir():
+            return
+        keys = {str(patient_id) for patient_id in self.scan_records}
+        analysis_cache.write_cache(
+            self.analysis_cache_path,
+            [entry for key, entry in self.cache_entries.items() if key in keys],
+        )
+
+    def scan_headers(self, patients: list[dict[str, Any]]) -> None:
+        """Read and check the headers of patients without reading voxel data.
+
+        Records are stored in self.header_records keyed by patient ID.
+
+        Args:
+            patients: Patient rows to scan.
+        """
+        if not patients:
+            return
+        with self._get_executor() as executor:
+            for record in executor.map(scan_utils.scan_patient_header, patients):
+                self.header_records[record["id"]] = record
+
+    def _get_header_records(self, patients: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Get header records for patients, scanning unseen patients first."""
+        self.scan_headers([p for p in patients if p["id"] not in self.header_records])
+        return [self.header_records[p["id"]] for p in patients]
+
+    def _get_sample_ids(self, candidates: list[dict[str, Any]] | None = None) -> set[Any] | None:
+        """Draw the patients analyzed in sampled mode, once.
+
+        Args:
+            candidates: Patient rows to draw from. Defaults to all rows of
+                paths_df.
+
+        Returns:
+            IDs of the sampled patients, or None if the analysis is not
+            sampled.
+        """
+        if self.sample_size is None or self.sample_ids is not None:
+            return self.sample_ids
+        if candidates is None:
+            candidates = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
+
+        # Stratification only needs the headers, which sampled mode reads for
+        # every patient anyway.
+        strata = np.zeros(len(candidates), dtype=np.int64)
+        if self.sample_stratify != "none":
+            strata = sampling.get_strata(
+                self._get_header_records(candidates),
+                self.sample_stratify,
+                constants.ANALYZE_SAMPLE_STRATA,
+            )
+        indices = sampling.draw_sample(strata, self.sample_size, self.sample_seed)
+        self.sample_ids = {candidates[i]["id"] for i in indices}
+        print_info(
+            f"Analyzing a sample of {len(self.sample_ids)} of {len(candidates)} patient(s) "
+            f"(stratify: {self.sample_stratify}, seed: {self.sample_seed})."
+        )
+        return self.sample_ids
+
+    def _get_analysis_patients(self) -> list[dict[str, Any]]:
+        """Get the patient rows whose voxel data is analyzed, in paths_df order.
+
+        This is every patient, or only the sampled patients with
+        --analyze-sample.
+        """
+        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
+        sample_ids = self._get_sample_ids()
+        if sample_ids is None:
+            return patients
+        return [p for p in patients if p["id"] in sample_ids]
+
+    def _get_scan_records(self) -> list[dict[str, Any]]:
+        """Get scan records in paths_df order, scanning unseen patients first.
+
+        With --analyze-sample, only the sampled patients are returned.
+        """
+        patients = self._get_analysis_patients()
+        self.scan_dataset([p for p in patients if p["id"] not in self.scan_records])
+        return [self.scan_records[p["id"]] for p in patients]
+
+    def _get_analysis_records(self) -> list[dict[str, Any]]:
+        """Get scan records, raising if any patient could not be analyzed."""
+        records = self._get_scan_records()
+        for record in records:
+            if record["error"] is not None:
+                raise RuntimeError(f"Error processing patient '{record['id']}': {record['error']}")
+        return records
+
     def check_crop_fg(self) -> tuple[bool, np.ndarray]:
         """Check if cropping to FG reduces image volume by at least 20%.
 
@@ -323,41 +604,26 @@ class Analyzer:
         foreground is beneficial. It also saves the bounding box information
         to a CSV file.
 
-        To compute the foreground bounding box, it uses the
+        To compute the foreground bounding box, the dataset scan uses
         `get_fg_mask_bbox`, which uses an Otsu threshold method to find the
         foreground mask and then computes the bounding box around the
         non-zero voxels of the foreground mask.
         """
-
-        def _process(patient):
-            try:
-                image_list = list(patient.values())[3:]
-                image = ants.image_read(image_list[0])
-                fg_bbox = preprocessing_utils.get_fg_mask_bbox(image)
-                cropped_dims_i = [
-                    fg_bbox["x_end"] - fg_bbox["x_start"] + 1,
-                    fg_bbox["y_end"] - fg_bbox["y_start"] + 1,
-                    fg_bbox["z_end"] - fg_bbox["z_start"] + 1,
-                ]
-                vol_reduction_i = 1.0 - (np.prod(cropped_dims_i) / np.prod(image.shape))
-                fg_bbox["id"] = patient["id"]
-                return fg_bbox, cropped_dims_i, vol_reduction_i
-            except Exception as e:
-                raise RuntimeError(f"Error processing patient '{patient['id']}': {e}") from e
-
-        n_workers = self.n_workers
-        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
-        fg_bbox_records = [None] * len(patients)
-        cropped_dims = np.zeros((len(patients), 3))
-        vol_reduction = [0.0] * len(patients)
-
-        progress = progress_bar.get_progress_bar("Checking FG vol. reduction")
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = {executor.submit(_process, p): i for i, p in enumerate(patients)}
-            with progress as pb:
-                for future in pb.track(as_completed(futures), total=len(patients)):
-                    i = futures[future]
-                    fg_bbox_records[i], cropped_dims[i, :], vol_reduction[i] = future.result()
+        records = self._get_analysis_records()
+        fg_bbox_records = []
+        cropped_dims = np.zeros((len(records), 3))
+        vol_reduction = [0.0] * len(records)
+
+        for i, record in enumerate(records):
+            fg_bbox = dict(record["fg_bbox"])
+            cropped_dims[i, :] = [
+                fg_bbox["x_end"] - fg_bbox["x_start"] + 1,
+                fg_bbox["y_end"] - fg_bbox["y_start"] + 1,
+                fg_bbox["z_end"] - fg_bbox["z_start"] + 1,
+            ]
+            vol_reduction[i] = 1.0 - (np.prod(cropped_dims[i, :]) / np.prod(record["image_dims"]))
+            fg_bbox["id"] = record["id"]
+            fg_bbox_records.append(fg_bbox)
 
         pd.DataFrame(fg_bbox_records).to_csv(self.fg_bboxes_csv, index=False)
         crop_to_fg = np.mean(vol_reduction) >= constants.MIN_AVERAGE_VOLUME_REDUCTION_FRACTION
@@ -373,26 +639,7 @@ class Analyzer:
         cases) and apply the normalization scheme only to the non-zero
         voxels.
         """
-
-        def _process(patient):
-            try:
-                image_list = list(patient.values())[3:]
-                image = ants.image_read(image_list[0])
-                return float(np.sum(image.numpy() != 0) / np.prod(image.shape))
-            except Exception as e:
-                raise RuntimeError(f"Error processing patient '{patient['id']}': {e}") from e
-
-        n_workers = self.n_workers
-        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
-        nz_ratio = [0.0] * len(patients)
-
-        progress = progress_bar.get_progress_bar("Checking non-zero ratio")
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = {executor.submit(_process, p): i for i, p in enumerate(patients)}
-            with progress as pb:
-                for future in pb.track(as_completed(futures), total=len(patients)):
-                    nz_ratio[futures[future]] = future.result()
-
+        nz_ratio = [record["nz_ratio"] for record in self._get_analysis_records()]
         use_nz_mask = (1.0 - np.mean(nz_ratio)) >= constants.MIN_SPARSITY_FRACTION
         return use_nz_mask
 
@@ -407,27 +654,7 @@ class Analyzer:
         that we still have a reasonable resolution when we preprocess the
         data.
         """
-
-        def _process(patient):
-            try:
-                mask = ants.image_read(patient["mask"])
-                mask = ants.reorient_image2(mask, "RAI")
-                mask.set_direction(constants.RAI_ANTS_DIRECTION)
-                return tuple(mask.spacing)
-            except Exception as e:
-                raise RuntimeError(f"Error processing patient '{patient['id']}': {e}") from e
-
-        n_workers = self.n_workers
-        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
-        spacings = [None] * len(patients)
-
-        progress = progress_bar.get_progress_bar("Getting target spacing")
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = {executor.submit(_process, p): i for i, p in enumerate(patients)}
-            with progress as pb:
-                for future in pb.track(as_completed(futures), total=len(patients)):
-                    spacings[futures[future]] = future.result()
-
+        spacings = [record["rai_spacing"] for record in self._get_analysis_records()]
         original_spacings = np.array(spacings, dtype=float)
 
         # Initialize target spacing.
@@ -480,55 +707,31 @@ class Analyzer:
                 "has been called before check_resampled_dims."
             )
 
-        # Capture config values in local variables so the closure does not
-        # hold a reference to self (keeps the worker lightweight).
         crop_to_fg = bool(self.config["preprocessing"]["crop_to_foreground"])
         tgt_spacing = self.config["spatial_config"]["target_spacing"]
         n_labels = len(self.dataset_info["labels"])
 
-        def _process(patient, cropped_dims_i):
-            try:
-                mask_header = ants.image_header_info(patient["mask"])
-                image_list = list(patient.values())[3:]
-                current_dims = cropped_dims_i if crop_to_fg else mask_header["dimensions"]
-                current_spacing = mask_header["spacing"]
-                new_dims = analyzer_utils.get_resampled_image_dimensions(
-                    current_dims, current_spacing, tgt_spacing
-                )
-                image_memory_size = analyzer_utils.get_float32_example_memory_size(
-                    new_dims, len(image_list), n_labels
-                )
-                msg = None
-                if image_memory_size > constants.MAX_RECOMMENDED_MEMORY_SIZE:
-                    msg = (
-                        f"In {patient['id']}: Resampled example is larger "
-                        "than the recommended memory size of "
-                        f"{constants.MAX_RECOMMENDED_MEMORY_SIZE / 1e9} GB. "
-                        "Consider coarsening or removing this example."
-                    )
-                return new_dims, msg
-            except Exception as e:
-                raise RuntimeError(f"Error processing patient '{patient['id']}': {e}") from e
-
-        n_workers = self.n_workers
-        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
-        resampled_dims = np.zeros((len(patients), 3))
-        messages = [None] * len(patients)
-
-        progress = progress_bar.get_progress_bar("Checking resampled dimensions")
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = {
-                executor.submit(_process, patients[i], cropped_dims[i, :]): i
-                for i in range(len(patients))
-            }
-            with progress as pb:
-                for future in pb.track(as_completed(futures), total=len(patients)):
-                    i = futures[future]
-                    resampled_dims[i, :], messages[i] = future.result()
+        records = self._get_analysis_records()
+        patients = self._get_analysis_patients()
+        resampled_dims = np.zeros((len(records), 3))
 
-        for msg in messages:
-            if msg:
-                print_warning(msg)
+        for i, (patient, record) in enumerate(zip(patients, records, strict=True)):
+            mask_header = record["mask_header"]
+            current_dims = cropped_dims[i, :] if crop_to_fg else mask_header["dimensions"]
+            new_dims = analyzer_utils.get_resampled_image_dimensions(
+                current_dims, mask_header["spacing"], tgt_spacing
+            )
+            image_memory_size = analyzer_utils.get_float32_example_memory_size(
+                new_dims, len(scan_utils.get_image_columns(patient)), n_labels
+            )
+            if image_memory_size > constants.MAX_RECOMMENDED_MEMORY_SIZE:
+                print_warning(
+                    f"In {patient['id']}: Resampled example is larger "
+                    "than the recommended memory size of "
+                    f"{constants.MAX_RECOMMENDED_MEMORY_SIZE / 1e9} GB. "
+                    "Consider coarsening or removing this example."
+                )
+            resampled_dims[i, :] = new_dims
 
         return list(np.median(resampled_dims, axis=0))
 
@@ -543,58 +746,20 @@ class Analyzer:
         global window range based on the foreground intensities.
 
         Rather than accumulating all subsampled voxel intensities across the
-        dataset (which can reach several GB for large CT datasets), each
-        worker returns lightweight per-patient summary statistics:
+        dataset (which can reach several GB for large CT datasets), the
+        dataset scan stores lightweight per-patient summary statistics:
           - (n, mean, M2) for exact mean/std via parallel Welford's algorithm.
           - A histogram over the clinical HU range for percentile estimation.
-        These are merged in the main thread with no per-voxel storage.
+        These are merged here with no per-voxel storage.
         """
-        _hist_bin_edges = np.linspace(
-            constants.CT_HU_HIST_MIN,
-            constants.CT_HU_HIST_MAX,
-            constants.CT_HU_HIST_BINS + 1,
-        )
-
-        def _process(patient):
-            try:
-                image_list = list(patient.values())[3:]
-                image = ants.image_read(image_list[0])
-                mask = ants.image_read(patient["mask"])
-                arr = np.asarray(
-                    (image[mask != 0]).tolist()[  # type: ignore
-                        :: constants.CT_GATHER_EVERY_ITH_VOXEL_VALUE
-                    ],
-                    dtype=np.float64,
+        records = self._get_analysis_records()
+        for record in records:
+            if record["ct_stats"] is None:
+                raise RuntimeError(
+                    f"No CT statistics were collected for patient '{record['id']}'. "
+                    "CT statistics are only computed when the dataset modality is 'ct'."
                 )
-                if len(arr) == 0:
-                    return (
-                        0,
-                        0.0,
-                        0.0,
-                        np.zeros(constants.CT_HU_HIST_BINS, dtype=np.int64),
-                        0,
-                    )
-                n = len(arr)
-                mean = float(np.mean(arr))
-                M2 = float(np.sum((arr - mean) ** 2))
-                hist, _ = np.histogram(arr, bins=_hist_bin_edges)
-                n_out_of_range = int(
-                    np.sum((arr < constants.CT_HU_HIST_MIN) | (arr > constants.CT_HU_HIST_MAX))
-                )
-                return n, mean, M2, hist.astype(np.int64), n_out_of_range
-            except Exception as e:
-                raise RuntimeError(f"Error processing patient '{patient['id']}': {e}") from e
-
-        n_workers = self.n_workers
-        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
-        per_patient = [None] * len(patients)
-
-        progress = progress_bar.get_progress_bar("Getting CT norm. params.")
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = {executor.submit(_process, p): i for i, p in enumerate(patients)}
-            with progress as pb:
-                for future in pb.track(as_completed(futures), total=len(patients)):
-                    per_patient[futures[future]] = future.result()
+        per_patient = [record["ct_stats"] for record in records]
 
         # Merge per-patient statistics — no per-voxel list required.
         welford_stats = [(n_i, mean_i, M2_i) for n_i, mean_i, M2_i, _, _ in per_patient]
@@ -608,11 +773,12 @@ class Analyzer:
                 "in mean/std but excluded from window bound estimation."
             )
         _, global_z_score_mean, global_z_score_std = _welford_merge(welford_stats)
+        hist_bin_edges = scan_utils.get_ct_hist_bin_edges()
         global_window_range_min = _percentile_from_histogram(
-            combined_hist, _hist_bin_edges, constants.CT_GLOBAL_CLIP_MIN_PERCENTILE
+            combined_hist, hist_bin_edges, constants.CT_GLOBAL_CLIP_MIN_PERCENTILE
         )
         global_window_range_max = _percentile_from_histogram(
-            combined_hist, _hist_bin_edges, constants.CT_GLOBAL_CLIP_MAX_PERCENTILE
+            combined_hist, hist_bin_edges, constants.CT_GLOBAL_CLIP_MAX_PERCENTILE
         )
         return {
             "window_min": float(global_window_range_min),
@@ -621,6 +787,134 @@ class Analyzer:
             "z_score_std": float(global_z_score_std),
         }
 
+    def get_sample_estimates(self) -> dict[str, dict[str, Any]]:
+        """Get bootstrap confidence intervals for the sampled estimates.
+
+        The sampled patients are resampled with replacement
+        BOOTSTRAP_RESAMPLES times and each dataset-level quantity is
+        recomputed per resample: the median spacing per axis, the mean volume
+        reduction from cropping, the mean non-zero ratio, and for CT the
+        window percentiles and z-score parameters.
+
+        Returns:
+            Dictionary mapping each quantity to its estimate and the lower and
+            upper bounds of its confidence interval.
+        """
+        records = self._get_analysis_records()
+        spacings = np.array([record["rai_spacing"] for record in records], dtype=float)
+        vol_reduction = np.array(
+            [
+                1.0
+                - np.prod(
+                    [
+                        record["fg_bbox"][f"{ax}_end"] - record["fg_bbox"][f"{ax}_start"] + 1
+                        for ax in "xyz"
+                    ]
+                )
+                / np.prod(record["image_dims"])
+                for record in records
+            ]
+        )
+        nz_ratio = np.array([record["nz_ratio"] for record in records], dtype=float)
+
+        statistics: dict[str, Any] = {
+            "median_spacing": lambda idx: np.median(spacings[idx], axis=0),
+            "volume_reduction": lambda idx: np.mean(vol_reduction[idx]),
+            "nonzero_ratio": lambda idx: np.mean(nz_ratio[idx]),
+        }
+        if self.dataset_info["modality"].lower() == "ct":
+            statistics.update(_get_ct_bootstrap_statistics([r["ct_stats"] for r in records]))
+
+        estimates = {}
+        all_records = np.arange(len(records))
+        for name, statistic in statistics.items():
+            lower, upper = sampling.bootstrap_interval(
+                len(records),
+                statistic,
+                constants.BOOTSTRAP_RESAMPLES,
+                constants.BOOTSTRAP_CONFIDENCE,
+                self.sample_seed,
+            )
+            estimates[name] = {
+                "estimate": np.asarray(statistic(all_records), dtype=float).tolist(),
+                "ci_lower": np.asarray(lower).tolist(),
+                "ci_upper": np.asarray(upper).tolist(),
+            }
+        return estimates
+
+    def report_sample_estimates(self) -> None:
+        """Print the sampled estimates and save them to analysis_sample.json."""
+        estimates = self.get_sample_estimates()
+        confidence = int(round(constants.BOOTSTRAP_CONFIDENCE * 100))
+        precision = constants.PRINT_FLOATING_POINT_PRECISION
+
+        def _fmt(value: Any) -> str:
+            values = np.atleast_1d(np.asarray(value, dtype=float))
+            text = ", ".join(f"{v:.{precision}f}" for v in values)
+            return f"[{text}]" if len(values) > 1 else text
+
+        print_info(f"Sampled estimates with {confidence}% bootstrap confidence intervals:")
+        for name, estimate in estimates.items():
+            print_info(
+                f"  {name}: {_fmt(estimate['estimate'])} "
+                f"(CI {_fmt(estimate['ci_lower'])} to {_fmt(estimate['ci_upper'])})"
+            )
+
+        io.write_json_file(
+            self.sample_json,
+            {
+                "sample_size": len(self._get_analysis_patients()),
+                "num_patients": len(self.paths_df),
+                "stratify": self.sample_stratify,
+                "seed": self.sample_seed,
+                "confidence": constants.BOOTSTRAP_CONFIDENCE,
+                "bootstrap_resamples": constants.BOOTSTRAP_RESAMPLES,
+                "estimates": estimates,
+            },
+        )
+
+    def plan_patch_size(self, median_dims: list[int], target_spacing: list[float]) -> list[int]:
+        """Choose the patch and batch size that fit --gpu-memory-budget.
+
+        The configured architecture is traced on the meta device for each
+        candidate patch (see memory_planner). If the configured batch size
+        does not fit with any patch, the batch size in the configuration is
+        reduced.
+
+        Args:
+            median_dims: Median resampled image size, [x, y, z].
+            target_spacing: Target voxel spacing in mm, [x, y, z].
+
+        Returns:
+            The planned patch size.
+        """
+        budget_bytes = self.gpu_memory_budget * 1024**3
+        training = self.config["training"]
+        plan = memory_planner.plan_patch_and_batch_size(
+            self.config["model"]["architecture"],
+            self.config["model"]["params"],
+            [int(dim) for dim in median_dims],
+            target_spacing,
+            budget_bytes,
+            batch_size_per_gpu=training["batch_size_per_gpu"],
+            amp=training["amp"],
+        )
+        message = (
+            f"Planned patch size {plan['patch_size']} with batch size {plan['batch_size']} "
+            f"for {self.config['model']['architecture']}: "
+            f"~{plan['peak_bytes'] / 1024**3:.1f} GB peak memory, "
+            f"{plan['flops'] / 1e12:.1f} TFLOPs per step."
+        )
+        if plan["fits"]:
+            print_info(message)
+        else:
+            print_warning(
+                f"{message} Even the smallest patch exceeds the "
+                f"{self.gpu_memory_budget:g} GB memory budget."
+            )
+        training["batch_size_per_gpu"] = plan["batch_size"]
+        return plan["patch_size"]
+
     def analyze_dataset(self) -> None:
         """Analyze dataset and prepare configuration file.
 
@@ -685,11 +979,14 @@ class Analyzer:
         # Set a default patch size based on the median resampled image size.
         # The patch size can be overridden by the user in the config file or in
         # the command line arguments for the training pipeline.
-        patch_size = analyzer_utils.get_best_patch_size(
-            median_dims,
-            target_spacing,
-            batch_size_per_gpu=self.config["training"]["batch_size_per_gpu"],
-        )
+        if self.gpu_memory_budget is None:
+            patch_size = analyzer_utils.get_best_patch_size(
+                median_dims,
+                target_spacing,
+                batch_size_per_gpu=self.config["training"]["batch_size_per_gpu"],
+            )
+        else:
+            patch_size = self.plan_patch_size(median_dims, target_spacing)
         self.config["spatial_config"]["patch_size"] = [int(size) for size in patch_size]
 
         # Build and add the evaluation metrics to the evaluation section of the
@@ -697,6 +994,10 @@ class Analyzer:
         evaluation_config = analyzer_utils.build_evaluation_config(self.dataset_info)
         self.config.update(evaluation_config)
 
+        # Report how precise the sampled estimates are.
+        if self.sample_size is not None:
+            self.report_sample_estimates()
+
     def validate_dataset(self) -> None:
         """Check if headers match, images are 3D, and create paths dataframe.
 
@@ -706,67 +1007,44 @@ class Analyzer:
         checks that all images are 3D and that the mask is 3D. If there are
         multiple images, it checks that they have the same header
         information. If any of these checks fail, the patient is excluded
-        from training.
+        from training. The checks reduce over the records from scan_dataset,
+        so the files read here are not read again during analysis.
+
+        With --analyze-sample, the header checks still run on every patient,
+        but only the sampled patients are read in full and have their labels
+        checked. The sample is drawn from the patients that pass the header
+        checks.
         """
         dataset_labels_set = set(self.dataset_info["labels"])
         data_path = self.mist_arguments.data
 
-        def _validate(patient):
-            """Validate one patient. Returns (is_bad, message_or_None)."""
-            try:
-                # Patient values are ["id", "mask", "image_1", "image_2", ...].
-                image_list = list(patient.values())[2:]
-                mask = ants.image_read(patient["mask"])
-                mask_labels = set(mask.unique().astype(int))
-                mask_header = ants.image_header_info(patient["mask"])
-
-                if not mask_labels.issubset(dataset_labels_set):
-                    return True, (
-                        f"In {patient['id']}: Labels in mask do not match "
-                        f"those specified in {data_path}"
-                    )
-
-                if not analyzer_utils.is_image_3d(mask_header):
-                    return True, (f"In {patient['id']}: Got 4D mask, make sure all images are 3D")
-
-                for image_path in image_list:
-                    image_header = ants.image_header_info(image_path)
-                    if not analyzer_utils.compare_headers(mask_header, image_header):
-                        return True, (
-                            f"In {patient['id']}: Mismatch between image and "
-                            "mask header information"
-                        )
-                    if not analyzer_utils.is_image_3d(image_header):
-                        return True, (
-                            f"In {patient['id']}: Got 4D image, make sure all images are 3D"
-                        )
-
-                if len(image_list) > 1:
-                    anchor_header = ants.image_header_info(image_list[0])
-                    for image_path in image_list[1:]:
-                        image_header = ants.image_header_info(image_path)
-                        if not analyzer_utils.compare_headers(anchor_header, image_header):
-                            return True, (
-                                f"In {patient['id']}: Mismatch between images' header information"
-                            )
-
-                return False, None
-
-            except Exception as e:
-                return True, f"In {patient['id']}: {e}"
-
-        n_workers = self.n_workers
-        patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
-        is_bad = [False] * len(patients)
-        messages = [None] * len(patients)
-
-        progress = progress_bar.get_progress_bar("Verifying dataset")
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = {executor.submit(_validate, p): i for i, p in enumerate(patients)}
-            with progress as pb:
-                for future in pb.track(as_completed(futures), total=len(patients)):
-                    i = futures[future]
-                    is_bad[i], messages[i] = future.result()
+        if self.sample_size is None:
+            records = self._get_scan_records()
+        else:
+            patients = [self.paths_df.iloc[i].to_dict() for i in range(len(self.paths_df))]
+            header_records = self._get_header_records(patients)
+            self._get_sample_ids(
+                [
+                    patient
+                    for patient, record in zip(patients, header_records, strict=True)
+                    if record["read_error"] is None and record["header_error"] is None
+                ]
+            )
+            self._get_scan_records()
+            records = [self.scan_records.get(record["id"], record) for record in header_records]
+        is_bad = [False] * len(records)
+        messages = [None] * len(records)
+
+        for i, record in enumerate(records):
+            if record["read_error"] is not None:
+                messages[i] = record["read_error"]
+            elif not set(record["labels"] or []).issubset(dataset_labels_set):
+                messages[i] = (
+                    f"In {record['id']}: Labels in mask do not match those specified in {data_path}"
+                )
+            elif record["header_error"] is not None:
+                messages[i] = record["header_error"]
+            is_bad[i] = messages[i] is not None
 
         bad_data = {i for i, bad in enumerate(is_bad) if bad}
 
@@ -825,6 +1103,10 @@ class Analyzer:
                 config=self.config,
                 results_dir=self.results_dir,
                 cropped_dims=self.cropped_dims,
+                patient_stats=[record["dump_stats"] for record in self._get_scan_records()],
+                num_workers=self.n_workers,
+                backend=self.backend,
+                skeleton_voxel_budget=self.skeleton_voxel_budget,
             )
             data_dumper.run()
 
@@ -58,8 +58,9 @@ class AnalyzeConstants:
     # PCA-based shape descriptor computation.
     MAX_SHAPE_COORDS = 10_000
 
-    # Labels with more voxels than this are skipped for skeletonization to
-    # bound compute time. Structures this large are rarely thin/tubular.
+    # Voxel budget for skeletonization in the data dump. Labels with more
+    # voxels than this are downsampled by max pooling until they fit, which
+    # bounds compute time at the price of an approximate skeleton ratio.
     MAX_SKELETON_VOXELS = 500_000
 
     # Skeleton ratio threshold for flagging a label as tubular/branching.
@@ -109,5 +110,20 @@ class AnalyzeConstants:
     # Fallback voxel budget used when no CUDA device is available.
     PATCH_BUDGET_DEFAULT_VOXELS = 128**3
 
+    # Memory planner (--gpu-memory-budget). Only this fraction of the declared
+    # budget is planned for, leaving room for the CUDA context, cuDNN
+    # workspaces, and allocator fragmentation. Each trainable parameter costs
+    # its fp32 weight, its gradient, and two AdamW moment buffers.
+    PLANNER_MEMORY_HEADROOM_FRACTION = 0.85
+    PLANNER_BYTES_PER_PARAMETER = 16
+
+    # Sampled analysis (--analyze-sample). Stratified samples use this many
+    # quantile bins of the header geometry. Estimates are reported with
+    # percentile bootstrap intervals at BOOTSTRAP_CONFIDENCE computed from
+    # BOOTSTRAP_RESAMPLES resamples of the sampled patients.
+    ANALYZE_SAMPLE_STRATA = 4
+    BOOTSTRAP_RESAMPLES = 1000
+    BOOTSTRAP_CONFIDENCE = 0.95
+
     # Create the base_config.json path.
     BASE_CONFIG_JSON_PATH = Path(__file__).parent / "base_config.json"
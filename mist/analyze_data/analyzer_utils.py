@@ -1,6 +1,7 @@
 """Utilities for the analyzer module."""
 
 import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Literal
 
@@ -55,6 +56,61 @@ def is_image_3d(header: dict[str, Any]) -> bool:
     return len(header["dimensions"]) == 3
 
 
+def get_rai_spacing_and_dimensions(
+    header: dict[str, Any],
+) -> tuple[tuple[float, ...], tuple[int, ...]] | None:
+    """Get the spacing and dimensions of an image after reorienting to RAI.
+
+    Reorienting to RAI only permutes (and flips) the voxel axes, so the RAI
+    spacing and dimensions follow from the direction matrix in the header
+    alone: each voxel axis maps to the physical axis its direction cosine
+    vector is most aligned with. This matches ants.reorient_image2(image, "RAI")
+    without reading or resampling any voxel data.
+
+    Args:
+        header: Image header information from ants.image_header_info.
+
+    Returns:
+        Tuple of (spacing, dimensions) in RAI axis order, or None if the
+        direction is so oblique that two voxel axes share a dominant physical
+        axis. In that case the orientation is ambiguous and the caller should
+        fall back to ants.reorient_image2.
+    """
+    # Row i of the header direction is the direction cosine vector of voxel
+    # axis i (the transpose of ANTsImage.direction, whose columns are axes).
+    direction = np.asarray(header["direction"], dtype=float).reshape(3, 3)
+    dominant_axes = np.argmax(np.abs(direction), axis=1)
+    if len(set(dominant_axes.tolist())) != 3:
+        return None
+
+    spacing = [0.0] * 3
+    dimensions = [0] * 3
+    for voxel_axis, physical_axis in enumerate(dominant_axes):
+        spacing[physical_axis] = float(header["spacing"][voxel_axis])
+        dimensions[physical_axis] = int(header["dimensions"][voxel_axis])
+    return tuple(spacing), tuple(dimensions)
+
+
+def get_executor(backend: str, max_workers: int) -> Executor:
+    """Create the executor used for per-patient analysis work.
+
+    Args:
+        backend: Either "thread" or "process".
+        max_workers: Number of parallel workers.
+
+    Returns:
+        A ThreadPoolExecutor or ProcessPoolExecutor.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    if backend == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    raise ValueError(f"Unknown analyze backend '{backend}'. Expected 'thread' or 'process'.")
+
+
 def get_resampled_image_dimensions(
     dimensions: tuple[int, int, int],
     spacing: tuple[float, float, float],
@@ -304,6 +360,7 @@ def get_best_patch_size(
     median_resampled_size: list[int],
     target_spacing: list[float],
     batch_size_per_gpu: int = 2,
+    voxel_budget: int | None = None,
 ) -> list[int]:
     """Select a patch size from the median resampled image size and spacing.
 
@@ -334,11 +391,14 @@ def get_best_patch_size(
         batch_size_per_gpu: Number of samples per GPU per step. The voxel
             budget scales inversely with this value so that total memory per
             step stays constant. Defaults to 2 (the MIST default).
+        voxel_budget: Per-patch voxel budget to use instead of the
+            GPU-memory-derived one. The memory planner uses this to search
+            over patch sizes.
 
     Returns:
         Patch size as a list of three integers.
     """
-    budget = _get_voxel_budget(batch_size_per_gpu)
+    budget = voxel_budget if voxel_budget is not None else _get_voxel_budget(batch_size_per_gpu)
 
     anisotropy_ratio = max(target_spacing) / min(target_spacing)
     low_res_axis = int(np.argmax(target_spacing))
@@ -497,6 +557,8 @@ def build_base_config() -> dict[str, Any]:
             },
             "compute_dtms": False,
             "normalize_dtms": True,
+            "dtm_band": None,
+            "storage_format": "npy",
         },
         "model": {
             "architecture": "nnunet",
@@ -514,6 +576,13 @@ def build_base_config() -> dict[str, Any]:
             "min_steps_per_epoch": 250,
             "batch_size_per_gpu": 2,
             "dali_foreground_prob": 0.6,
+            "data_loader": "dali",
+            "samples_per_volume": 1,
+            "shared_cache": {
+                "enabled": False,
+                "max_size_gb": 32.0,
+                "directory": "/dev/shm",
+            },
             "loss": {
                 "name": "dice_ce",
                 "composite_loss_weighting": None,
@@ -525,6 +594,19 @@ def build_base_config() -> dict[str, Any]:
             "l2_penalty": 0.0001,
             "grad_clip_norm": 1.0,
             "amp": True,
+            "loss_sync_steps": 25,
+            "checkpoints": {
+                "async_write": True,
+                "keep_last": 1,
+                "keep_best": False,
+            },
+            "compile": {
+                "enabled": False,
+                "mode": "default",
+                "backend": "inductor",
+                "dynamic": None,
+                "cache_dir": None,
+            },
             "augmentation": {
                 "enabled": True,
                 "transforms": {
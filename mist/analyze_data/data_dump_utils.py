@@ -1,13 +1,16 @@
 """Utilities for the DataDumper module."""
 
+from concurrent.futures import as_completed
 from pathlib import Path
 from typing import Any
 
 import ants
 import numpy as np
 import pandas as pd
+from scipy import ndimage
 from skimage.morphology import skeletonize
 
+from mist.analyze_data import analyzer_utils
 from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
 from mist.utils import progress_bar as progress_bar_utils
 
@@ -154,7 +157,29 @@ def compute_compactness(
     return float(min(iq, 1.0))
 
 
-def compute_skeleton_ratio(mask: np.ndarray) -> float | None:
+def _downsample_mask(mask: np.ndarray, factor: int) -> np.ndarray:
+    """Downsample a boolean mask by max pooling over factor^3 blocks.
+
+    Max pooling keeps thin structures connected, which strided subsampling
+    would break apart.
+    """
+    pad = [(0, -dim % factor) for dim in mask.shape]
+    padded = np.pad(mask, pad, constant_values=False)
+    blocks = padded.reshape(
+        padded.shape[0] // factor,
+        factor,
+        padded.shape[1] // factor,
+        factor,
+        padded.shape[2] // factor,
+        factor,
+    )
+    return blocks.any(axis=(1, 3, 5))
+
+
+def compute_skeleton_ratio(
+    mask: np.ndarray,
+    voxel_budget: int | None = None,
+) -> float | None:
     """Compute the ratio of skeleton voxels to total label voxels.
 
     Thin, branching structures (vessels, airways) have a high skeleton
@@ -162,36 +187,287 @@ def compute_skeleton_ratio(mask: np.ndarray) -> float | None:
     blob-like structures have a low ratio because most voxels are deep
     interior and far from the medial axis.
 
-    Skeletonization is skipped for labels exceeding
-    constants.MAX_SKELETON_VOXELS to bound compute time; None is returned
-    in that case.
+    Labels with more voxels than the voxel budget are downsampled by max
+    pooling until they fit the budget, and the ratio is computed on the
+    downsampled mask. This bounds the cost of skeletonization at the price of
+    an approximate ratio for very large labels.
 
     Args:
         mask: Boolean 3D array of the label region.
+        voxel_budget: Maximum number of voxels to skeletonize. Defaults to
+            constants.MAX_SKELETON_VOXELS.
 
     Returns:
-        skeleton_voxels / label_voxels in [0, 1], or None if the label is
-        too large to skeletonize efficiently.
+        skeleton_voxels / label_voxels in [0, 1], or None for an empty mask.
     """
-    voxel_count = int(np.sum(mask))
+    if voxel_budget is None:
+        voxel_budget = constants.MAX_SKELETON_VOXELS
+    mask = mask.astype(bool)
+    voxel_count = int(np.count_nonzero(mask))
     if voxel_count == 0:
         return None
-    if voxel_count > constants.MAX_SKELETON_VOXELS:
-        return None
-    skel = skeletonize(mask.astype(bool))
-    return float(np.sum(skel)) / float(voxel_count)
+
+    if voxel_count > voxel_budget:
+        # Block pooling of thin structures keeps more than 1/factor^3 of the
+        # voxels, so grow the factor until the pooled mask fits the budget.
+        factor = max(2, int(np.ceil(np.cbrt(voxel_count / max(voxel_budget, 1)))))
+        pooled = _downsample_mask(mask, factor)
+        while int(np.count_nonzero(pooled)) > voxel_budget and min(pooled.shape) > 1:
+            factor *= 2
+            pooled = _downsample_mask(mask, factor)
+        mask = pooled
+        voxel_count = int(np.count_nonzero(mask))
+
+    skel = skeletonize(mask)
+    return float(np.count_nonzero(skel)) / float(voxel_count)
+
+
+def get_label_voxel_counts_and_boxes(
+    mask_arr: np.ndarray,
+    labels: list[int],
+) -> tuple[np.ndarray, dict[int, int], dict[int, tuple[slice, ...] | None]]:
+    """Count the voxels of every label and find their bounding boxes.
+
+    All counts come from a single np.bincount and all boxes from a single
+    ndimage.find_objects pass over the mask, instead of one full-volume
+    comparison per label.
+
+    Args:
+        mask_arr: 3D integer-valued mask array.
+        labels: Labels to report, excluding background.
+
+    Returns:
+        Tuple of (integer mask, voxel count per label, bounding box slices per
+        label). The box of a label that is absent from the mask is None.
+    """
+    mask_int = np.asarray(mask_arr).astype(np.intp, copy=False)
+    full_box = tuple(slice(0, dim) for dim in mask_int.shape)
+    # np.bincount and find_objects only handle non-negative labels.
+    fast = mask_int.size > 0 and int(mask_int.min()) >= 0
+    if fast:
+        bincounts = np.bincount(mask_int.ravel())
+        objects = ndimage.find_objects(mask_int, max_label=max([1, *labels]))
+
+    counts: dict[int, int] = {}
+    boxes: dict[int, tuple[slice, ...] | None] = {}
+    for lbl in labels:
+        if fast and lbl > 0:
+            counts[lbl] = int(bincounts[lbl]) if lbl < len(bincounts) else 0
+            boxes[lbl] = objects[lbl - 1] if counts[lbl] > 0 else None
+        else:
+            counts[lbl] = int(np.count_nonzero(mask_int == lbl))
+            boxes[lbl] = full_box if counts[lbl] > 0 else None
+    return mask_int, counts, boxes
+
+
+def compute_patient_label_stats(
+    mask_arr: np.ndarray,
+    spacing: tuple[float, float, float] | np.ndarray,
+    non_bg_labels: list[int],
+    skeleton_voxel_budget: int | None = None,
+) -> dict[str, Any]:
+    """Compute the mask-derived data dump statistics for a single patient.
+
+    Label voxel counts and bounding boxes come from one pass over the mask.
+    Shape descriptors, compactness, and skeletonization then only touch each
+    label's bounding box rather than the whole volume.
+
+    Args:
+        mask_arr: 3D integer-valued mask array.
+        spacing: Voxel spacing of the mask in mm.
+        non_bg_labels: Labels to report, excluding background.
+        skeleton_voxel_budget: Voxel budget of compute_skeleton_ratio.
+            Defaults to constants.MAX_SKELETON_VOXELS.
+
+    Returns:
+        Dictionary with the following keys:
+            - spacing: Voxel spacing as a list of floats.
+            - dims: Mask dimensions as a list of ints.
+            - fg_count: Number of non-background voxels.
+            - label_voxel_counts: dict mapping label int to voxel count.
+            - label_shape_descriptors: dict mapping label int to its shape
+                descriptor dict. Labels that are absent or degenerate are
+                omitted.
+            - channel_samples: Empty dict, filled by the caller with
+                sample_foreground_intensities for each channel.
+    """
+    spacing_arr = np.array(spacing, dtype=float)
+    mask_int, label_voxel_counts, label_boxes = get_label_voxel_counts_and_boxes(
+        mask_arr, non_bg_labels
+    )
+
+    label_shape_descriptors: dict[int, dict[str, Any]] = {}
+    for lbl in non_bg_labels:
+        box = label_boxes[lbl]
+        if label_voxel_counts[lbl] == 0 or box is None:
+            continue
+
+        lbl_mask = mask_int[box] == lbl
+        offset = np.array([sl.start for sl in box], dtype=np.float32)
+        coords = np.argwhere(lbl_mask).astype(np.float32) + offset
+        coords_mm = coords * spacing_arr
+        shape = compute_shape_descriptors(coords_mm)
+        if shape is not None:
+            shape["compactness"] = compute_compactness(lbl_mask, spacing_arr)
+            shape["skeleton_ratio"] = compute_skeleton_ratio(
+                lbl_mask, voxel_budget=skeleton_voxel_budget
+            )
+            label_shape_descriptors[lbl] = shape
+
+    return {
+        "spacing": [float(s) for s in spacing_arr],
+        "dims": [int(d) for d in mask_arr.shape],
+        "fg_count": int(np.count_nonzero(mask_arr)),
+        "label_voxel_counts": label_voxel_counts,
+        "label_shape_descriptors": label_shape_descriptors,
+        "channel_samples": {},
+    }
+
+
+def sample_foreground_intensities(
+    image_arr: np.ndarray,
+    fg_mask: np.ndarray,
+) -> np.ndarray:
+    """Sample up to ~5000 foreground intensities from one channel.
+
+    Args:
+        image_arr: 3D image array for one channel.
+        fg_mask: Boolean foreground mask with the same shape as image_arr.
+
+    Returns:
+        1D float32 array of evenly strided foreground intensity samples.
+    """
+    fg_vals = image_arr[fg_mask]
+    # Sample up to ~5000 voxels per patient to keep memory low.
+    step = max(1, len(fg_vals) // 5000)
+    return np.asarray(fg_vals[::step], dtype=np.float32)
+
+
+def aggregate_per_patient_stats(
+    patient_stats: list[dict[str, Any]],
+    dataset_info: dict[str, Any],
+    effective_dims: np.ndarray | None = None,
+) -> dict[str, Any]:
+    """Reduce per-patient data dump statistics into the raw_stats dictionary.
+
+    Args:
+        patient_stats: One dictionary per patient as returned by
+            compute_patient_label_stats (with channel_samples filled in).
+        dataset_info: Dataset description from the JSON file.
+        effective_dims: Optional (n_patients, 3) array of per-patient image
+            dimensions used as the foreground fraction denominator. If None,
+            the original mask dimensions are used.
+
+    Returns:
+        Dictionary with the same keys as collect_per_patient_stats.
+    """
+    n_patients = len(patient_stats)
+    image_cols = list(dataset_info["images"].keys())
+    non_bg_labels = [lbl for lbl in dataset_info["labels"] if lbl != 0]
+
+    spacings = np.zeros((n_patients, 3))
+    original_dims = np.zeros((n_patients, 3))
+    foreground_fractions = np.zeros(n_patients)
+    total_fg_voxels: list[int] = []
+
+    # Per-channel: sampled foreground intensities pooled across all patients.
+    channel_intensities: dict[str, list[float]] = {col: [] for col in image_cols}
+
+    # Per-label: voxel count, presence, and shape descriptors per patient.
+    label_voxel_counts: dict[int, list[int]] = {lbl: [] for lbl in non_bg_labels}
+    label_presence: dict[int, list[int]] = {lbl: [] for lbl in non_bg_labels}
+    label_shape_descriptors: dict[int, list[dict[str, Any]]] = {lbl: [] for lbl in non_bg_labels}
+
+    for i, stats in enumerate(patient_stats):
+        spacings[i, :] = stats["spacing"]
+        original_dims[i, :] = stats["dims"]
+
+        fg_count = int(stats["fg_count"])
+        total_fg_voxels.append(fg_count)
+        eff_voxels = (
+            int(np.prod(effective_dims[i]))
+            if effective_dims is not None
+            else int(np.prod(stats["dims"]))
+        )
+        foreground_fractions[i] = fg_count / max(eff_voxels, 1)
+
+        for lbl in non_bg_labels:
+            voxel_count = int(stats["label_voxel_counts"].get(lbl, 0))
+            label_voxel_counts[lbl].append(voxel_count)
+            label_presence[lbl].append(1 if voxel_count > 0 else 0)
+            shape = stats["label_shape_descriptors"].get(lbl)
+            if shape is not None:
+                label_shape_descriptors[lbl].append(shape)
+
+        for col, samples in stats["channel_samples"].items():
+            if col in channel_intensities:
+                channel_intensities[col].extend(np.asarray(samples).tolist())
+
+    return {
+        "spacings": spacings,
+        "original_dims": original_dims,
+        "effective_dims": (effective_dims if effective_dims is not None else original_dims),
+        "foreground_fractions": foreground_fractions,
+        "total_fg_voxels": total_fg_voxels,
+        "channel_intensities": channel_intensities,
+        "label_voxel_counts": label_voxel_counts,
+        "label_presence": label_presence,
+        "label_shape_descriptors": label_shape_descriptors,
+    }
+
+
+def collect_patient_stats(
+    patient: dict[str, Any],
+    image_cols: list[str],
+    non_bg_labels: list[int],
+    skeleton_voxel_budget: int | None = None,
+) -> dict[str, Any]:
+    """Read one patient's files and compute its data dump statistics.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+        image_cols: Channel columns to sample foreground intensities from.
+        non_bg_labels: Labels to report, excluding background.
+        skeleton_voxel_budget: Voxel budget of compute_skeleton_ratio.
+
+    Returns:
+        Per-patient statistics as returned by compute_patient_label_stats,
+        with channel_samples filled in.
+    """
+    mask = ants.image_read(patient["mask"])
+    mask_arr = mask.numpy()
+    stats = compute_patient_label_stats(
+        mask_arr, mask.spacing, non_bg_labels, skeleton_voxel_budget
+    )
+
+    # Per-channel intensity statistics sampled from foreground.
+    if stats["fg_count"] > 0:
+        fg_mask = mask_arr != 0
+        for col in image_cols:
+            if col not in patient or not isinstance(patient[col], str):
+                continue
+            img = ants.image_read(patient[col])
+            stats["channel_samples"][col] = sample_foreground_intensities(img.numpy(), fg_mask)
+    return stats
 
 
 def collect_per_patient_stats(
     paths_df: pd.DataFrame,
     dataset_info: dict[str, Any],
     effective_dims: np.ndarray | None = None,
+    num_workers: int = 1,
+    backend: str = "thread",
+    skeleton_voxel_budget: int | None = None,
 ) -> dict[str, Any]:
     """Single-pass collection of per-patient statistics for the data dump.
 
     Iterates over each patient once to collect spacings, original dimensions,
     per-channel foreground intensity samples, per-label voxel counts, label
     presence flags, foreground fractions, and per-label shape descriptors.
+    The Analyzer computes the same per-patient statistics during its dataset
+    scan and reduces them with aggregate_per_patient_stats directly; this
+    function is the standalone path that reads the files itself. Patients are
+    processed in parallel with the same kind of executor as the Analyzer.
 
     Args:
         paths_df: DataFrame with file paths for each patient.
@@ -202,6 +478,9 @@ def collect_per_patient_stats(
             foreground bounding box dims here so the fractions reflect the
             actual image region the model sees rather than the full uncropped
             volume. If None, the original mask dimensions are used.
+        num_workers: Number of parallel workers.
+        backend: Executor backend, either "thread" or "process".
+        skeleton_voxel_budget: Voxel budget of compute_skeleton_ratio.
 
     Returns:
         Dictionary with the following keys:
@@ -225,79 +504,25 @@ def collect_per_patient_stats(
     image_cols = list(dataset_info["images"].keys())
     non_bg_labels = [lbl for lbl in dataset_info["labels"] if lbl != 0]
 
-    spacings = np.zeros((n_patients, 3))
-    original_dims = np.zeros((n_patients, 3))
-    foreground_fractions = np.zeros(n_patients)
-    total_fg_voxels: list[int] = []
-
-    # Per-channel: sampled foreground intensities pooled across all patients.
-    channel_intensities: dict[str, list[float]] = {col: [] for col in image_cols}
-
-    # Per-label: voxel count, presence, and shape descriptors per patient.
-    label_voxel_counts: dict[int, list[int]] = {lbl: [] for lbl in non_bg_labels}
-    label_presence: dict[int, list[int]] = {lbl: [] for lbl in non_bg_labels}
-    label_shape_descriptors: dict[int, list[dict[str, Any]]] = {lbl: [] for lbl in non_bg_labels}
-
+    # Results are collected as they finish and reduced in paths_df order.
+    patient_stats: list[dict[str, Any] | None] = [None] * n_patients
     progress = progress_bar_utils.get_progress_bar("Building data dump")
-    with progress as pb:
-        for i in pb.track(range(n_patients)):
-            patient = paths_df.iloc[i].to_dict()
-
-            mask = ants.image_read(patient["mask"])
-            mask_arr = mask.numpy()
-
-            spacings[i, :] = mask.spacing
-            original_dims[i, :] = mask.shape
-
-            fg_mask = mask_arr != 0
-            fg_count = int(np.sum(fg_mask))
-            total_fg_voxels.append(fg_count)
-            eff_voxels = (
-                int(np.prod(effective_dims[i]))
-                if effective_dims is not None
-                else int(np.prod(mask.shape))
-            )
-            foreground_fractions[i] = fg_count / max(eff_voxels, 1)
-
-            # Per-label statistics and shape descriptors.
-            spacing_arr = np.array(mask.spacing)
-            for lbl in non_bg_labels:
-                lbl_mask = mask_arr == lbl
-                voxel_count = int(np.sum(lbl_mask))
-                label_voxel_counts[lbl].append(voxel_count)
-                label_presence[lbl].append(1 if voxel_count > 0 else 0)
-
-                if voxel_count > 0:
-                    coords = np.argwhere(lbl_mask).astype(np.float32)
-                    coords_mm = coords * spacing_arr
-                    shape = compute_shape_descriptors(coords_mm)
-                    if shape is not None:
-                        shape["compactness"] = compute_compactness(lbl_mask, spacing_arr)
-                        shape["skeleton_ratio"] = compute_skeleton_ratio(lbl_mask)
-                        label_shape_descriptors[lbl].append(shape)
-
-            # Per-channel intensity statistics sampled from foreground.
-            if fg_count > 0:
-                for col in image_cols:
-                    if col not in patient or not isinstance(patient[col], str):
-                        continue
-                    img = ants.image_read(patient[col])
-                    fg_vals = img.numpy()[fg_mask]
-                    # Sample up to ~5000 voxels per patient to keep memory low.
-                    step = max(1, len(fg_vals) // 5000)
-                    channel_intensities[col].extend(fg_vals[::step].tolist())
+    with analyzer_utils.get_executor(backend, num_workers) as executor:
+        futures = {
+            executor.submit(
+                collect_patient_stats,
+                paths_df.iloc[i].to_dict(),
+                image_cols,
+                non_bg_labels,
+                skeleton_voxel_budget,
+            ): i
+            for i in range(n_patients)
+        }
+        with progress as pb:
+            for future in pb.track(as_completed(futures), total=n_patients):
+                patient_stats[futures[future]] = future.result()
 
-    return {
-        "spacings": spacings,
-        "original_dims": original_dims,
-        "effective_dims": (effective_dims if effective_dims is not None else original_dims),
-        "foreground_fractions": foreground_fractions,
-        "total_fg_voxels": total_fg_voxels,
-        "channel_intensities": channel_intensities,
-        "label_voxel_counts": label_voxel_counts,
-        "label_presence": label_presence,
-        "label_shape_descriptors": label_shape_descriptors,
-    }
+    return aggregate_per_patient_stats(patient_stats, dataset_info, effective_dims=effective_dims)
 
 
 def _axis_stats(values: np.ndarray) -> dict[str, float]:
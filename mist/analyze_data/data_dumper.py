@@ -29,6 +29,16 @@ class DataDumper:
         dataset_info: Dataset description from the JSON file.
         config: MIST configuration dict computed by the Analyzer.
         results_dir: Directory where outputs are saved.
+        cropped_dims: Optional per-patient foreground bounding box dims.
+        patient_stats: Optional per-patient statistics already computed by the
+            Analyzer's dataset scan. When given, the data dump reduces over
+            them instead of reading the images again.
+        num_workers: Number of parallel workers used when the statistics are
+            collected from the files.
+        backend: Executor backend for collecting statistics, either "thread"
+            or "process".
+        skeleton_voxel_budget: Voxel budget for the skeleton ratios when the
+            statistics are collected from the files.
         console: Rich console for printing messages.
     """
 
@@ -39,12 +49,20 @@ class DataDumper:
         config: dict[str, Any],
         results_dir: str | Path,
         cropped_dims: np.ndarray | None = None,
+        patient_stats: list[dict[str, Any]] | None = None,
+        num_workers: int = 1,
+        backend: str = "thread",
+        skeleton_voxel_budget: int | None = None,
     ):
         self.paths_df = paths_df
         self.dataset_info = dataset_info
         self.config = config
         self.results_dir = Path(results_dir).resolve()
         self.cropped_dims = cropped_dims
+        self.patient_stats = patient_stats
+        self.num_workers = num_workers
+        self.backend = backend
+        self.skeleton_voxel_budget = skeleton_voxel_budget
         self.console = rich.console.Console()
 
     def _build_dataset_summary(self) -> dict[str, Any]:
@@ -82,10 +100,21 @@ class DataDumper:
             self.cropped_dims if (crop_to_fg and self.cropped_dims is not None) else None
         )
 
-        # Single pass over all patients to collect raw statistics.
-        raw_stats = data_dump_utils.collect_per_patient_stats(
-            self.paths_df, self.dataset_info, effective_dims=effective_dims
-        )
+        # Reuse the Analyzer's per-patient statistics if available. Otherwise,
+        # make a single pass over all patients to collect raw statistics.
+        if self.patient_stats is not None:
+            raw_stats = data_dump_utils.aggregate_per_patient_stats(
+                self.patient_stats, self.dataset_info, effective_dims=effective_dims
+            )
+        else:
+            raw_stats = data_dump_utils.collect_per_patient_stats(
+                self.paths_df,
+                self.dataset_info,
+                effective_dims=effective_dims,
+                num_workers=self.num_workers,
+                backend=self.backend,
+                skeleton_voxel_budget=self.skeleton_voxel_budget,
+            )
 
         image_stats = data_dump_utils.build_image_statistics(raw_stats, self.config)
         label_stats = data_dump_utils.build_label_statistics(raw_stats, self.dataset_info)
@@ -421,9 +450,9 @@ class DataDumper:
                 "the skeleton is the morphological medial axis (skimage "
                 "skeletonize). High values indicate that most label voxels lie "
                 "close to the centerline — the hallmark of thin, branching "
-                "structures such as vessels or airways. Skeletonization is skipped "
-                "for labels exceeding 500,000 voxels (reported as \u2014); "
-                "structures that large are rarely thin/tubular."
+                "structures such as vessels or airways. Labels exceeding 500,000 "
+                "voxels are downsampled before skeletonization, so their ratio "
+                "is approximate."
             ),
             "",
             "## Observations",
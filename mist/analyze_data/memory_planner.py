@@ -0,0 +1,193 @@
+"""Architecture-aware patch and batch size planning on the meta device.
+
+get_best_patch_size picks a patch from a fixed voxel budget that is the same
+for every architecture. With --gpu-memory-budget, the Analyzer instead builds
+the configured model on PyTorch's meta device, runs one forward and backward
+pass on a meta input, and measures what a training step would hold in
+memory. Meta tensors carry shapes and dtypes but no data, so the trace needs
+neither a GPU nor the memory it describes.
+
+Activation memory is measured with autograd saved-tensor hooks, which see
+every tensor kept for the backward pass. The peak estimate adds the fp32
+weights, gradients, and AdamW state, plus the gradient buffers of the
+largest saved activation, which are alive at the start of the backward pass.
+FLOPs per step are counted with torch.utils.flop_counter.
+"""
+
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+import torch
+from torch.utils.flop_counter import FlopCounterMode
+
+# MIST imports. Importing mist.models registers all architectures.
+import mist.models  # noqa: F401
+from mist.analyze_data import analyzer_utils
+from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
+from mist.models.model_registry import get_model_from_registry
+
+
+def _build_meta_model(
+    architecture: str, model_params: dict[str, Any], spatial_config: dict[str, Any]
+) -> torch.nn.Module:
+    """Build a model whose parameters live on the meta device.
+
+    Models whose constructors compute values from tensors (e.g. stochastic
+    depth rates in SwinUNETR) cannot be built under the meta device context.
+    These are built on the CPU and moved to the meta device instead.
+    """
+    kwargs = {**model_params, **spatial_config}
+    try:
+        with torch.device("meta"):
+            return get_model_from_registry(architecture, **kwargs)
+    except (RuntimeError, NotImplementedError):
+        return get_model_from_registry(architecture, **kwargs).to("meta")
+
+
+def _iter_tensors(output: Any) -> Iterator[torch.Tensor]:
+    """Yield every tensor in a model output (tensor, dict, list, or tuple)."""
+    if isinstance(output, torch.Tensor):
+        yield output
+    elif isinstance(output, dict):
+        for value in output.values():
+            yield from _iter_tensors(value)
+    elif isinstance(output, (list, tuple)):
+        for value in output:
+            yield from _iter_tensors(value)
+
+
+def estimate_training_step(
+    architecture: str,
+    model_params: dict[str, Any],
+    patch_size: list[int],
+    target_spacing: list[float],
+    batch_size: int,
+    amp: bool = True,
+) -> dict[str, Any]:
+    """Estimate the memory and compute of one training step.
+
+    Args:
+        architecture: Registered model name.
+        model_params: Model parameters from the configuration, including
+            in_channels and out_channels.
+        patch_size: Patch size, [x, y, z].
+        target_spacing: Target voxel spacing in mm, [x, y, z].
+        batch_size: Number of patches per step.
+        amp: Whether activations are stored in half precision.
+
+    Returns:
+        Dictionary with patch_size, batch_size, parameter_bytes (fp32
+        weights), activation_bytes (tensors saved for backward), peak_bytes
+        (estimated peak memory of the step), and flops (forward plus
+        backward).
+    """
+    spatial_config = {"patch_size": list(patch_size), "target_spacing": list(target_spacing)}
+    model = _build_meta_model(architecture, model_params, spatial_config)
+    model.train()
+    dtype = torch.float16 if amp else torch.float32
+    model.to(dtype)
+    parameter_storages = {p.untyped_storage()._cdata for p in model.parameters()}
+    parameter_bytes = sum(p.numel() for p in model.parameters() if p.requires_grad) * 4
+
+    # Tensors can be saved by several operations and as views of each other;
+    # count each underlying storage once.
+    saved: dict[int, int] = {}
+
+    def _pack(tensor: torch.Tensor) -> torch.Tensor:
+        storage = tensor.untyped_storage()
+        if storage._cdata not in parameter_storages:
+            saved[storage._cdata] = storage.nbytes()
+        return tensor
+
+    image = torch.empty(
+        (batch_size, model_params["in_channels"], *patch_size), dtype=dtype, device="meta"
+    )
+    flop_counter = FlopCounterMode(display=False)
+    with flop_counter:
+        with torch.autograd.graph.saved_tensors_hooks(_pack, lambda tensor: tensor):
+            output = model(image)
+        loss = sum(tensor.float().sum() for tensor in _iter_tensors(output))
+        loss.backward()
+
+    activation_bytes = sum(saved.values())
+    largest_activation = max(saved.values(), default=0)
+    peak_bytes = (
+        parameter_bytes // 4 * constants.PLANNER_BYTES_PER_PARAMETER
+        + activation_bytes
+        + 2 * largest_activation
+    )
+    return {
+        "patch_size": [int(size) for size in patch_size],
+        "batch_size": int(batch_size),
+        "parameter_bytes": int(parameter_bytes),
+        "activation_bytes": int(activation_bytes),
+        "peak_bytes": int(peak_bytes),
+        "flops": int(flop_counter.get_total_flops()),
+    }
+
+
+def plan_patch_and_batch_size(
+    architecture: str,
+    model_params: dict[str, Any],
+    median_resampled_size: list[int],
+    target_spacing: list[float],
+    memory_budget_bytes: float,
+    batch_size_per_gpu: int = 2,
+    amp: bool = True,
+) -> dict[str, Any]:
+    """Find the largest patch and batch size that fit a memory budget.
+
+    Candidate patches come from get_best_patch_size with a varying voxel
+    budget, so they follow the same shape rules (isotropic or quasi-2D,
+    multiples of 32, clamped to the median image size). For each batch
+    size, starting at batch_size_per_gpu and decreasing to 1, the voxel
+    budget is bisected for the largest candidate whose estimated peak
+    memory fits. The first batch size with a fitting patch is returned.
+
+    Args:
+        architecture: Registered model name.
+        model_params: Model parameters, including in_channels and
+            out_channels.
+        median_resampled_size: Median image size after resampling, [x, y, z].
+        target_spacing: Target voxel spacing in mm, [x, y, z].
+        memory_budget_bytes: Memory available per GPU, in bytes.
+        batch_size_per_gpu: Preferred batch size.
+        amp: Whether training uses automatic mixed precision.
+
+    Returns:
+        The estimate from estimate_training_step for the chosen patch and
+        batch size, with an added "fits" key. If even the smallest patch at
+        batch size 1 exceeds the budget, that estimate is returned with
+        fits set to False.
+    """
+    usable_bytes = memory_budget_bytes * constants.PLANNER_MEMORY_HEADROOM_FRACTION
+    max_voxels = int(np.prod(median_resampled_size))
+    estimates: dict[tuple[tuple[int, ...], int], dict[str, Any]] = {}
+
+    def _estimate(voxel_budget: int, batch_size: int) -> dict[str, Any]:
+        patch = analyzer_utils.get_best_patch_size(
+            median_resampled_size, target_spacing, voxel_budget=voxel_budget
+        )
+        key = (tuple(patch), batch_size)
+        if key not in estimates:
+            estimates[key] = estimate_training_step(
+                architecture, model_params, patch, target_spacing, batch_size, amp
+            )
+        return estimates[key]
+
+    for batch_size in range(batch_size_per_gpu, 0, -1):
+        if _estimate(1, batch_size)["peak_bytes"] > usable_bytes:
+            continue
+
+        # Largest voxel budget whose patch fits; patches grow with the budget.
+        low, high = 1, max_voxels
+        while low < high:
+            mid = (low + high + 1) // 2
+            if _estimate(mid, batch_size)["peak_bytes"] <= usable_bytes:
+                low = mid
+            else:
+                high = mid - 1
+        return {**_estimate(low, batch_size), "fits": True}
+
+    return {**_estimate(1, 1), "fits": False}
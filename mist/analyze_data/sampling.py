@@ -0,0 +1,128 @@
+"""Patient subsampling and bootstrap intervals for the Analyzer.
+
+With --analyze-sample N, the Analyzer reads voxel data for a random subset
+of N patients only. Headers are still read for every patient, so header
+checks cover the whole dataset and the subset can be stratified by header
+geometry. Dataset-level quantities estimated from the subset are reported
+with percentile bootstrap confidence intervals, which show whether the
+sample was large enough.
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+# Header quantities the sample can be stratified by.
+STRATIFY_OPTIONS = ("none", "spacing", "size")
+
+
+def get_strata(
+    header_records: list[dict[str, Any]],
+    stratify: str,
+    n_strata: int,
+) -> np.ndarray:
+    """Assign each patient to a stratum based on its header geometry.
+
+    Patients are binned by quantiles of their voxel volume ("spacing") or
+    number of voxels ("size"). Patients whose header could not be read form
+    a stratum of their own.
+
+    Args:
+        header_records: Records from scan_utils.scan_patient_header.
+        stratify: One of STRATIFY_OPTIONS.
+        n_strata: Number of quantile bins.
+
+    Returns:
+        Integer stratum per patient.
+
+    Raises:
+        ValueError: If stratify is not one of STRATIFY_OPTIONS.
+    """
+    if stratify not in STRATIFY_OPTIONS:
+        raise ValueError(
+            f"Unknown stratification '{stratify}'. Expected one of {list(STRATIFY_OPTIONS)}."
+        )
+    n_patients = len(header_records)
+    if stratify == "none" or n_patients == 0:
+        return np.zeros(n_patients, dtype=np.int64)
+
+    field = "spacing" if stratify == "spacing" else "dimensions"
+    keys = np.array(
+        [
+            float(np.prod(record["mask_header"][field]))
+            if record["mask_header"] is not None
+            else np.nan
+            for record in header_records
+        ]
+    )
+    strata = np.full(n_patients, n_strata, dtype=np.int64)
+    valid = ~np.isnan(keys)
+    if np.any(valid):
+        inner_edges = np.quantile(keys[valid], np.linspace(0, 1, n_strata + 1)[1:-1])
+        strata[valid] = np.searchsorted(inner_edges, keys[valid], side="right")
+    return strata
+
+
+def draw_sample(strata: np.ndarray, sample_size: int, seed: int) -> np.ndarray:
+    """Draw a stratified random sample without replacement.
+
+    The sample is split across strata in proportion to their size, with the
+    remaining slots going to the strata with the largest fractional quotas.
+
+    Args:
+        strata: Stratum of each patient, as returned by get_strata.
+        sample_size: Number of patients to draw.
+        seed: Random seed.
+
+    Returns:
+        Sorted indices of the sampled patients. All indices are returned if
+        sample_size is at least the number of patients.
+    """
+    n_patients = len(strata)
+    if sample_size >= n_patients:
+        return np.arange(n_patients)
+
+    rng = np.random.default_rng(seed)
+    labels, counts = np.unique(strata, return_counts=True)
+    quotas = counts * sample_size / n_patients
+    allocation = np.floor(quotas).astype(np.int64)
+    remainder = sample_size - int(allocation.sum())
+    allocation[np.argsort(-(quotas - allocation), kind="stable")[:remainder]] += 1
+
+    chosen = [
+        rng.choice(np.flatnonzero(strata == label), size=int(k), replace=False)
+        for label, k in zip(labels, allocation, strict=True)
+        if k > 0
+    ]
+    return np.sort(np.concatenate(chosen))
+
+
+def bootstrap_interval(
+    n_records: int,
+    statistic: Callable[[np.ndarray], Any],
+    n_resamples: int,
+    confidence: float,
+    seed: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap confidence interval of a statistic.
+
+    Args:
+        n_records: Number of sampled patients.
+        statistic: Function of an array of resampled record indices that
+            returns a scalar or a 1D array.
+        n_resamples: Number of bootstrap resamples.
+        confidence: Confidence level in (0, 1).
+        seed: Random seed.
+
+    Returns:
+        Tuple of (lower, upper) bounds with the shape of the statistic.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.array(
+        [statistic(rng.integers(0, n_records, size=n_records)) for _ in range(n_resamples)],
+        dtype=float,
+    )
+    tail = (1.0 - confidence) / 2.0 * 100.0
+    lower, upper = np.percentile(values, [tail, 100.0 - tail], axis=0)
+    return lower, upper
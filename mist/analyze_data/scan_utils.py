@@ -0,0 +1,294 @@
+"""Single-pass dataset scan utilities for the Analyzer.
+
+The Analyzer needs several per-patient quantities (spacing, foreground bounding
+box, non-zero ratio, CT intensity statistics, label set, header checks, and
+optionally the data dump statistics). Computing each of them in its own pass
+reads and decompresses every mask and image several times. The functions here
+read each patient's mask and anchor image exactly once and return a compact
+record holding everything the Analyzer and DataDumper reduce over.
+
+Workers are plain module-level functions so that they do not capture the
+Analyzer instance.
+"""
+
+from typing import Any
+
+import ants
+import numpy as np
+
+# MIST imports.
+from mist.analyze_data import analyzer_utils, data_dump_utils
+from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
+from mist.preprocessing import preprocessing_utils
+
+# Columns in the paths dataframe that do not point to image files.
+NON_IMAGE_COLUMNS = ("id", "fold", "mask")
+
+
+def get_image_columns(patient: dict[str, Any]) -> list[str]:
+    """Get the image columns of a patient row in dataframe order.
+
+    The first returned column is the anchor image used for foreground
+    cropping, non-zero ratio, and CT statistics.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+
+    Returns:
+        List of column names that hold image paths.
+    """
+    return [col for col in patient if col not in NON_IMAGE_COLUMNS]
+
+
+def get_ct_hist_bin_edges() -> np.ndarray:
+    """Get the histogram bin edges used for CT percentile estimation."""
+    return np.linspace(
+        constants.CT_HU_HIST_MIN,
+        constants.CT_HU_HIST_MAX,
+        constants.CT_HU_HIST_BINS + 1,
+    )
+
+
+def compute_ct_statistics(
+    image_arr: np.ndarray,
+    mask_arr: np.ndarray,
+) -> tuple[int, float, float, np.ndarray, int]:
+    """Compute the CT foreground summary statistics for one patient.
+
+    Every CT_GATHER_EVERY_ITH_VOXEL_VALUE-th foreground voxel is gathered and
+    summarized as a Welford tuple plus a histogram over the clinical HU range,
+    so the per-patient results can be merged without per-voxel storage.
+
+    Args:
+        image_arr: CT image array.
+        mask_arr: Ground truth mask array with the same shape as image_arr.
+
+    Returns:
+        Tuple of (n, mean, M2, histogram, n_out_of_range).
+    """
+    arr = np.asarray(
+        image_arr[mask_arr != 0][:: constants.CT_GATHER_EVERY_ITH_VOXEL_VALUE],
+        dtype=np.float64,
+    )
+    if len(arr) == 0:
+        return 0, 0.0, 0.0, np.zeros(constants.CT_HU_HIST_BINS, dtype=np.int64), 0
+
+    n = len(arr)
+    mean = float(np.mean(arr))
+    M2 = float(np.sum((arr - mean) ** 2))
+    hist, _ = np.histogram(arr, bins=get_ct_hist_bin_edges())
+    n_out_of_range = int(
+        np.sum((arr < constants.CT_HU_HIST_MIN) | (arr > constants.CT_HU_HIST_MAX))
+    )
+    return n, mean, M2, hist.astype(np.int64), n_out_of_range
+
+
+def check_patient_headers(
+    patient_id: Any,
+    mask_header: dict[str, Any],
+    image_paths: list[str],
+) -> str | None:
+    """Check that the mask and images of one patient have valid headers.
+
+    Args:
+        patient_id: Patient identifier used in the returned message.
+        mask_header: Header of the mask from ants.image_header_info.
+        image_paths: Paths to the patient's images.
+
+    Returns:
+        None if all checks pass, otherwise a message describing the first
+        failing check.
+    """
+    try:
+        if not analyzer_utils.is_image_3d(mask_header):
+            return f"In {patient_id}: Got 4D mask, make sure all images are 3D"
+
+        image_headers = []
+        for image_path in image_paths:
+            image_header = ants.image_header_info(image_path)
+            if not analyzer_utils.compare_headers(mask_header, image_header):
+                return f"In {patient_id}: Mismatch between image and mask header information"
+            if not analyzer_utils.is_image_3d(image_header):
+                return f"In {patient_id}: Got 4D image, make sure all images are 3D"
+            image_headers.append(image_header)
+
+        for image_header in image_headers[1:]:
+            if not analyzer_utils.compare_headers(image_headers[0], image_header):
+                return f"In {patient_id}: Mismatch between images' header information"
+    except Exception as e:
+        return f"In {patient_id}: {e}"
+    return None
+
+
+def scan_patient_header(patient: dict[str, Any]) -> dict[str, Any]:
+    """Read only the headers of one patient's files.
+
+    This is the part of scan_patient that does not touch voxel data. It is
+    used for the patients outside the subset when the analysis runs on a
+    sample, so header checks still cover every patient.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+
+    Returns:
+        Dictionary with the keys of scan_patient. Only id, read_error,
+        header_error, error, mask_header, and rai_spacing are filled in;
+        rai_spacing is None if the direction is too oblique to derive it
+        from the header.
+    """
+    patient_id = patient["id"]
+    record: dict[str, Any] = {
+        "id": patient_id,
+        "read_error": None,
+        "header_error": None,
+        "error": None,
+        "labels": None,
+        "mask_header": None,
+        "rai_spacing": None,
+        "image_dims": None,
+        "fg_bbox": None,
+        "nz_ratio": None,
+        "ct_stats": None,
+        "dump_stats": None,
+    }
+    try:
+        mask_header = ants.image_header_info(patient["mask"])
+    except Exception as e:
+        record["read_error"] = f"In {patient_id}: {e}"
+        record["error"] = str(e)
+        return record
+
+    image_paths = [patient[col] for col in get_image_columns(patient)]
+    record["header_error"] = check_patient_headers(patient_id, mask_header, image_paths)
+    try:
+        record["mask_header"] = {
+            "dimensions": tuple(int(d) for d in mask_header["dimensions"]),
+            "spacing": tuple(float(s) for s in mask_header["spacing"]),
+        }
+        rai_geometry = analyzer_utils.get_rai_spacing_and_dimensions(mask_header)
+        if rai_geometry is not None:
+            record["rai_spacing"] = rai_geometry[0]
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def scan_patient(
+    patient: dict[str, Any],
+    compute_ct_stats: bool = False,
+    dump_channels: list[str] | None = None,
+    dump_labels: list[int] | None = None,
+    skeleton_voxel_budget: int | None = None,
+) -> dict[str, Any]:
+    """Read one patient's files once and compute all analysis quantities.
+
+    Failures never raise. A failure to read the mask or its header is stored
+    in both read_error and error; any other failure while computing the
+    analysis quantities is stored in error. Header check failures are stored
+    in header_error and do not stop the remaining computations.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+        compute_ct_stats: Whether to compute the CT foreground statistics.
+        dump_channels: Channel columns to sample for the data dump. If None,
+            the data dump statistics are not computed.
+        dump_labels: Non-background labels reported in the data dump.
+        skeleton_voxel_budget: Voxel budget for the skeleton ratios of the
+            data dump. Defaults to AnalyzeConstants.MAX_SKELETON_VOXELS.
+
+    Returns:
+        Dictionary with the following keys:
+            - id: Patient identifier.
+            - read_error: Message if the mask could not be read, else None.
+            - header_error: Message if a header check failed, else None.
+            - error: Message if any analysis quantity failed, else None.
+            - labels: Sorted list of label values present in the mask.
+            - mask_header: Mask dimensions and spacing from its header.
+            - rai_spacing: Mask spacing after reorienting to RAI.
+            - image_dims: Dimensions of the anchor image.
+            - fg_bbox: Foreground bounding box of the anchor image.
+            - nz_ratio: Fraction of non-zero voxels in the anchor image.
+            - ct_stats: Output of compute_ct_statistics, or None.
+            - dump_stats: Per-patient data dump statistics, or None.
+    """
+    patient_id = patient["id"]
+    record: dict[str, Any] = {
+        "id": patient_id,
+        "read_error": None,
+        "header_error": None,
+        "error": None,
+        "labels": None,
+        "mask_header": None,
+        "rai_spacing": None,
+        "image_dims": None,
+        "fg_bbox": None,
+        "nz_ratio": None,
+        "ct_stats": None,
+        "dump_stats": None,
+    }
+
+    # Read the mask and its header. Nothing else can be computed without them.
+    try:
+        mask = ants.image_read(patient["mask"])
+        mask_header = ants.image_header_info(patient["mask"])
+    except Exception as e:
+        record["read_error"] = f"In {patient_id}: {e}"
+        record["error"] = str(e)
+        return record
+
+    image_columns = get_image_columns(patient)
+    image_paths = [patient[col] for col in image_columns]
+    record["header_error"] = check_patient_headers(patient_id, mask_header, image_paths)
+
+    try:
+        mask_arr = mask.numpy()
+        record["labels"] = [int(lbl) for lbl in np.unique(mask_arr)]
+        record["mask_header"] = {
+            "dimensions": tuple(int(d) for d in mask_header["dimensions"]),
+            "spacing": tuple(float(s) for s in mask_header["spacing"]),
+        }
+
+        # Spacing in RAI orientation for the target spacing. This is a
+        # permutation of the header spacing; only directions too oblique to
+        # have a unique dominant axis per voxel axis need the full reorient.
+        rai_geometry = analyzer_utils.get_rai_spacing_and_dimensions(mask_header)
+        if rai_geometry is not None:
+            record["rai_spacing"] = rai_geometry[0]
+        else:
+            mask_rai = ants.reorient_image2(mask, "RAI")
+            record["rai_spacing"] = tuple(float(s) for s in mask_rai.spacing)
+
+        # Anchor image quantities: foreground bounding box, non-zero ratio,
+        # and CT intensity statistics.
+        anchor = ants.image_read(image_paths[0])
+        anchor_arr = anchor.numpy()
+        record["image_dims"] = tuple(int(d) for d in anchor.shape)
+        record["fg_bbox"] = preprocessing_utils.get_fg_mask_bbox(anchor)
+        record["nz_ratio"] = float(np.sum(anchor_arr != 0) / np.prod(anchor.shape))
+        if compute_ct_stats:
+            record["ct_stats"] = compute_ct_statistics(anchor_arr, mask_arr)
+
+        # Data dump statistics. The anchor channel is reused; any remaining
+        # channels are only read when the patient has foreground voxels.
+        if dump_channels is not None:
+            dump_stats = data_dump_utils.compute_patient_label_stats(
+                mask_arr, mask.spacing, dump_labels or [], skeleton_voxel_budget
+            )
+            if dump_stats["fg_count"] > 0:
+                fg_mask = mask_arr != 0
+                for col in dump_channels:
+                    if col not in patient or not isinstance(patient[col], str):
+                        continue
+                    channel_arr = (
+                        anchor_arr
+                        if col == image_columns[0]
+                        else ants.image_read(patient[col]).numpy()
+                    )
+                    dump_stats["channel_samples"][col] = (
+                        data_dump_utils.sample_foreground_intensities(channel_arr, fg_mask)
+                    )
+            record["dump_stats"] = dump_stats
+    except Exception as e:
+        record["error"] = str(e)
+
+    return record
@@ -99,6 +99,55 @@ def add_analyzer_args(parser: ArgParser) -> None:
         default=1,
         help="Number of parallel workers for dataset analysis.",
     )
+    g.add_argument(
+        "--analyze-backend",
+        type=str,
+        choices=["thread", "process"],
+        default="thread",
+        help=(
+            "Executor for the analysis workers. 'process' avoids GIL contention "
+            "in the NumPy-heavy per-patient scan and scales better with many workers."
+        ),
+    )
+    g.add_argument(
+        "--analyze-sample",
+        type=positive_int,
+        default=None,
+        help=(
+            "Estimate spacing, cropping, sparsity, and CT statistics from a random "
+            "sample of this many patients. Header checks still run on every patient."
+        ),
+    )
+    g.add_argument(
+        "--analyze-stratify",
+        type=str,
+        choices=["none", "spacing", "size"],
+        default="none",
+        help="Stratify the --analyze-sample subset by voxel volume or image size.",
+    )
+    g.add_argument(
+        "--analyze-seed",
+        type=non_negative_int,
+        default=42,
+        help="Random seed for --analyze-sample and its bootstrap intervals.",
+    )
+    g.add_argument(
+        "--gpu-memory-budget",
+        type=positive_float,
+        default=None,
+        help=(
+            "GPU memory per device in GB. Choose the patch and batch size by tracing "
+            "the model's activation memory on the meta device instead of using a "
+            "fixed voxel budget. Does not require a GPU."
+        ),
+    )
+    g.add_argument(
+        "--plan-model",
+        type=str,
+        choices=list_registered_models(),
+        default=None,
+        help="Architecture to plan for with --gpu-memory-budget (default: nnunet).",
+    )
     parser.flag(
         "--verify",
         help=("Verify dataset integrity before analysis (checks headers, dimensions, etc.)."),
@@ -110,6 +159,22 @@ def add_analyzer_args(parser: ArgParser) -> None:
             "alongside the configuration."
         ),
     )
+    g.add_argument(
+        "--skeleton-voxel-budget",
+        type=positive_int,
+        default=None,
+        help=(
+            "Largest number of voxels a label is skeletonized at for the data dump. "
+            "Larger labels are downsampled to fit (default: 500000)."
+        ),
+    )
+    parser.flag(
+        "--refresh",
+        help=(
+            "Ignore the cached per-patient analysis (analysis_cache.jsonl) and "
+            "rescan every patient."
+        ),
+    )
     parser.boolean_flag(
         "--overwrite",
         default=False,
@@ -149,6 +214,51 @@ def add_preprocess_args(parser: ArgParser) -> None:
             "functions (bl, hdos, gsl)."
         ),
     )
+    g.add_argument(
+        "--dtm-band",
+        type=positive_int,
+        help=(
+            "Compute exact DTM distances only within this many voxels of "
+            "each label's bounding box and use the distance to the bounding "
+            "box further away. Saved to config.json. By default, distances "
+            "are exact everywhere."
+        ),
+    )
+    g.add_argument(
+        "--dtm-threads",
+        type=positive_int,
+        default=1,
+        help="Number of labels whose DTMs are computed at the same time.",
+    )
+    g.add_argument(
+        "--preprocess-memory-budget",
+        type=positive_float,
+        help=(
+            "Memory budget in GB for the preprocessing workers. Patients are "
+            "started largest first, and only while the estimated peak memory "
+            "of the running patients fits the budget. By default, all "
+            "patients are submitted at once."
+        ),
+    )
+    g.add_argument(
+        "--storage-format",
+        type=str,
+        choices=["npy", "compact"],
+        help=(
+            "Format of the preprocessed NumPy data. 'compact' stores images "
+            "and DTMs as float16 and labels cropped to their foreground, "
+            "with a JSON sidecar per patient. Saved to config.json. "
+            "Defaults to 'npy'."
+        ),
+    )
+    parser.boolean_flag(
+        "--profile-preprocess",
+        default=False,
+        help=(
+            "Time each preprocessing stage per patient and save the timings "
+            "to preprocess_profile.csv in the results directory."
+        ),
+    )
     parser.boolean_flag(
         "--overwrite",
         default=False,
@@ -240,6 +350,15 @@ def add_train_args(parser: ArgParser) -> None:
         default=False,
         help="Resume training from the latest checkpoint.",
     )
+    parser.boolean_flag(
+        "--compile",
+        default=None,
+        help=(
+            "Compile the model with torch.compile for training and inference. "
+            "Compiled kernels are cached in the results directory. Saved to "
+            "config.json. Defaults to the training.compile.enabled setting."
+        ),
+    )
 
     # Evaluation workers.
     g.add_argument(
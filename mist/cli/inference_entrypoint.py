@@ -75,6 +75,14 @@ def _parse_inference_args(argv: list[str] | None = None) -> argparse.Namespace:
             "with 'mist_ensemble --input-type probabilities'."
         ),
     )
+    p.flag(
+        "--compile",
+        help=(
+            "Compile the models with torch.compile, whatever training.compile "
+            "in the config says. Compiled kernels are cached next to the "
+            "models directory."
+        ),
+    )
     return p.parse_args(argv)
 
 
@@ -133,6 +141,8 @@ def run_inference(ns: argparse.Namespace) -> None:
     df = pd.read_csv(paths_csv)
     inference_utils.validate_paths_dataframe(df)  # Raises if invalid.
     mist_cfg = io.read_json_file(str(config_path))
+    if getattr(ns, "compile", False):
+        mist_cfg.setdefault("training", {}).setdefault("compile", {})["enabled"] = True
 
     # Execute inference
     inference_runners.infer_from_dataframe(
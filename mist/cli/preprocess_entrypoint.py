@@ -7,7 +7,8 @@ from pathlib import Path
 # MIST imports.
 from mist.cli import args as argmod
 from mist.preprocessing import preprocess
-from mist.utils.console import print_warning
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
+from mist.utils.console import print_info, print_warning
 
 
 def _parse_preprocess_args(argv: list[str] | None = None) -> argparse.Namespace:
@@ -56,11 +57,15 @@ def _prepare_preprocess_dirs(ns: argparse.Namespace) -> None:
     """Validate and create the numpy directory for saving preprocessed data."""
     numpy_dir = Path(ns.numpy).expanduser().resolve()
 
-    # If the target exists and is non-empty, require --overwrite.
+    # If the target exists and is non-empty, require --overwrite. Output of a
+    # previous run has a manifest and is resumed instead.
     if numpy_dir.exists():
         # Consider “non-empty” to be having any file/dir inside.
         non_empty = any(numpy_dir.iterdir())
-        if non_empty and not getattr(ns, "overwrite", False):
+        resumable = (numpy_dir / pc.MANIFEST_FILENAME).is_file()
+        if non_empty and resumable and not getattr(ns, "overwrite", False):
+            print_info(f"Resuming preprocessing in {numpy_dir}")
+        elif non_empty and not getattr(ns, "overwrite", False):
             raise FileExistsError(
                 f"Destination {numpy_dir} already contains files. "
                 "Use --overwrite or choose a different --numpy directory."
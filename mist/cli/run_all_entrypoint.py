@@ -56,6 +56,10 @@ def _parse_run_all_args(argv: list[str] | None = None) -> argparse.Namespace:
     if not getattr(ns, "numpy", None):
         ns.numpy = str(Path("./numpy").expanduser().resolve())
 
+    # Plan the patch size for the model that will be trained.
+    if getattr(ns, "plan_model", None) is None and getattr(ns, "model", None):
+        ns.plan_model = ns.model
+
     # Minimal top-level validation.
     if not getattr(ns, "data", None):
         parser.error("Missing required argument for analyze: --data")
@@ -71,8 +75,16 @@ def run_all_entry(argv: list[str] | None = None) -> None:
         "results",
         "nfolds",
         "num_workers_analyze",
+        "analyze_backend",
+        "analyze_sample",
+        "analyze_stratify",
+        "analyze_seed",
+        "gpu_memory_budget",
+        "plan_model",
         "verify",
         "data_dump",
+        "skeleton_voxel_budget",
+        "refresh",
         "overwrite",
     ]
     preprocess_keys = [
@@ -81,6 +93,11 @@ def run_all_entry(argv: list[str] | None = None) -> None:
         "num_workers_preprocess",
         "no_preprocess",
         "compute_dtms",
+        "dtm_band",
+        "dtm_threads",
+        "preprocess_memory_budget",
+        "storage_format",
+        "profile_preprocess",
         "overwrite",
     ]
     train_keys = [
@@ -98,6 +115,7 @@ def run_all_entry(argv: list[str] | None = None) -> None:
         "optimizer",
         "l2_penalty",
         "folds",
+        "compile",
         "num_workers_evaluate",
         "overwrite",
     ]
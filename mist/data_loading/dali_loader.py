@@ -3,7 +3,7 @@
 from collections.abc import Sequence
 
 import numpy as np
-from nvidia.dali import fn, types
+from nvidia.dali import fn, math, types
 from nvidia.dali.pipeline import Pipeline
 from nvidia.dali.plugin.pytorch import DALIGenericIterator
 from nvidia.dali.tensors import TensorCPU, TensorGPU
@@ -23,6 +23,10 @@ class GenericPipeline(Pipeline):
         input_image_files: DALI Numpy reader operator for reading images.
         input_label_files: DALI Numpy reader operator for reading labels.
         input_dtm: DALI Numpy reader operator for reading DTM data.
+        input_label_boxes: DALI Numpy reader operator for reading the crop
+            boxes of labels saved in the compact storage format.
+        input_fg_voxels: DALI Numpy reader operator for reading the sampled
+            foreground voxels of each label.
     """
 
     def __init__(
@@ -37,6 +41,9 @@ class GenericPipeline(Pipeline):
         input_image_files: list[str] | None = None,
         input_label_files: list[str] | None = None,
         input_dtm_files: list[str] | None = None,
+        input_label_box_files: list[str] | None = None,
+        input_fg_voxel_files: list[str] | None = None,
+        half_precision: bool = False,
     ):
         """Initialize the pipeline with the given parameters.
 
@@ -53,6 +60,13 @@ class GenericPipeline(Pipeline):
             input_x_files: List of file paths to the image data.
             input_y_files: List of file paths to the label data.
             input_dtm_files: List of file paths to the DTM data.
+            input_label_box_files: List of file paths to the label crop
+                boxes. Only used for labels saved in the compact storage
+                format.
+            input_fg_voxel_files: List of file paths to the sampled
+                foreground voxels of each label, used to pick crop centers.
+            half_precision: Whether images and DTMs are saved as float16, as
+                in the compact storage format.
         """
         super().__init__(
             batch_size=batch_size,
@@ -60,6 +74,9 @@ class GenericPipeline(Pipeline):
             device_id=device_id,
             seed=seed,
         )
+        self.half_precision = half_precision
+        self.has_label_boxes = bool(input_label_box_files)
+        self.has_fg_voxels = bool(input_fg_voxel_files)
 
         # Initialize the input readers for images, labels, and DTM data.
         if input_image_files:
@@ -95,6 +112,66 @@ class GenericPipeline(Pipeline):
                 )
             else:
                 raise ValueError("Input DTMs are not valid. Please check the input paths.")
+        if input_label_box_files:
+            if utils.is_valid_generic_pipeline_input(input_label_box_files):
+                self.input_label_boxes = utils.get_numpy_reader(
+                    files=input_label_box_files,
+                    shard_id=shard_id,
+                    seed=seed,
+                    num_shards=num_gpus,
+                    shuffle=shuffle_input,
+                )
+            else:
+                raise ValueError("Input label boxes are not valid. Please check the input paths.")
+        if input_fg_voxel_files:
+            if utils.is_valid_generic_pipeline_input(input_fg_voxel_files):
+                self.input_fg_voxels = utils.get_numpy_reader(
+                    files=input_fg_voxel_files,
+                    shard_id=shard_id,
+                    seed=seed,
+                    num_shards=num_gpus,
+                    shuffle=shuffle_input,
+                )
+            else:
+                raise ValueError(
+                    "Input foreground voxels are not valid. Please check the input paths."
+                )
+
+    def restore_label(self, label: TensorCPU | TensorGPU) -> TensorCPU | TensorGPU:
+        """Restore a label saved cropped to its foreground to its full size.
+
+        The crop box holds the negated crop start and the full label shape in
+        (x, y, z, channel) order, so slicing the cropped label with it and
+        padding with zeros gives the full label. Labels are returned
+        unchanged when there are no crop boxes.
+
+        Args:
+            label: Label in DHWC layout.
+
+        Returns:
+            The label at its full size.
+        """
+        if not self.has_label_boxes:
+            return label
+        label_box = self.input_label_boxes(name="label_box_reader")
+        return fn.slice(
+            label,
+            label_box[0],
+            label_box[1],
+            axes=[0, 1, 2, 3],
+            out_of_bounds_policy="pad",
+            fill_values=0,
+        )
+
+    def to_float(self, data: TensorCPU | TensorGPU) -> TensorCPU | TensorGPU:
+        """Cast float16 images and DTMs to float32.
+
+        Images and DTMs saved in the compact storage format are float16. Other
+        data is returned unchanged.
+        """
+        if self.half_precision:
+            return fn.cast(data, dtype=types.FLOAT)
+        return data
 
 
 class TrainPipeline(GenericPipeline):
@@ -149,12 +226,16 @@ class TrainPipeline(GenericPipeline):
         use_blur: bool = True,
         use_brightness: bool = True,
         use_contrast: bool = True,
+        label_box_paths: list[str] | None = None,
+        fg_voxel_paths: list[str] | None = None,
         **kwargs,
     ):
         super().__init__(
             input_image_files=image_paths,
             input_label_files=label_paths,
             input_dtm_files=dtm_paths,
+            input_label_box_files=label_box_paths,
+            input_fg_voxel_files=fg_voxel_paths,
             shuffle_input=True,
             **kwargs,
         )
@@ -203,18 +284,50 @@ class TrainPipeline(GenericPipeline):
     def load_data(self):
         """Load the image, label, and DTM data from the input readers."""
         image = self.input_images(name="image_reader")
-        image = fn.reshape(image, layout="DHWC")
+        image = self.to_float(fn.reshape(image, layout="DHWC"))
 
         label = self.input_labels(name="label_reader")
-        label = fn.reshape(label, layout="DHWC")
+        label = self.restore_label(fn.reshape(label, layout="DHWC"))
 
         if self.has_dtms:
             dtm = self.input_dtms(name="dtm_reader")
-            dtm = fn.reshape(dtm, layout="DHWC")
+            dtm = self.to_float(fn.reshape(dtm, layout="DHWC"))
             return image, label, dtm
 
         return image, label
 
+    def fg_voxel_roi(self, label: TensorCPU) -> tuple[TensorCPU, TensorCPU]:
+        """Pick the region of interest of a crop from the sampled voxels.
+
+        Each row of the sampled foreground voxels is a one-voxel box, and
+        every class has the same number of rows, so a random row picks a
+        class with equal weights and then one of its voxels, without scanning
+        the label. With probability 1 - oversampling, the region is the whole
+        volume instead. Labels without foreground have a single row that
+        covers the whole volume.
+
+        Args:
+            label: The padded label, used for the shape of the volume.
+
+        Returns:
+            The start and end of the region of interest in (x, y, z, channel)
+            order, which spans every channel, like the bounds of
+            fn.segmentation.random_object_bbox.
+        """
+        fg_voxels = self.input_fg_voxels(name="fg_voxels_reader")
+        num_rows = fn.shapes(fg_voxels, dtype=types.INT32)[0]
+        row = fn.cast(fn.random.uniform(range=(0.0, 1.0)) * num_rows, dtype=types.INT32)
+        box = fg_voxels[math.clamp(row, 0, num_rows - 1)]
+
+        use_foreground = fn.random.coin_flip(probability=self.oversampling, dtype=types.INT32)
+        shape = fn.shapes(label, dtype=types.INT32)
+        channels = shape[3:4]
+        roi_start = fn.cat(box[0:3] * use_foreground, channels * 0, axis=0)
+        roi_end = fn.cat(
+            box[3:6] * use_foreground + shape[0:3] * (1 - use_foreground), channels, axis=0
+        )
+        return roi_start, roi_end
+
     def biased_crop_fn(
         self,
         image: TensorCPU,
@@ -245,19 +358,24 @@ class TrainPipeline(GenericPipeline):
         if self.has_dtms:
             dtm = fn.pad(dtm, axes=(0, 1, 2), shape=self.roi_size)
 
-        # Generate a region of interest (ROI) by identifying bounding boxes
-        # around the foreground objects in the label. 'foreground_prob' controls
-        # how often the crop is centered on objects rather than the background.
-        roi_start, roi_end = fn.segmentation.random_object_bbox(
-            label,
-            format="start_end",  # ROI format as (start, end) coordinates.
-            background=0,  # Background pixel value to ignore.
-            classes=self.labels,  # List of labels in the dataset.
-            class_weights=self.label_weights,  # Class weights.
-            foreground_prob=self.oversampling,  # Probability of foreground.
-            device="cpu",  # Perform the operation on the CPU.
-            cache_objects=True,  # Cache object locations for efficiency.
-        )
+        # Generate a region of interest (ROI) around the foreground.
+        # 'oversampling' controls how often the crop is centered on the
+        # foreground rather than anywhere in the volume. Voxels sampled during
+        # preprocessing give the ROI without scanning the label. Otherwise,
+        # find bounding boxes around the foreground objects in the label.
+        if self.has_fg_voxels:
+            roi_start, roi_end = self.fg_voxel_roi(label)
+        else:
+            roi_start, roi_end = fn.segmentation.random_object_bbox(
+                label,
+                format="start_end",  # ROI format as (start, end) coordinates.
+                background=0,  # Background pixel value to ignore.
+                classes=self.labels,  # List of labels in the dataset.
+                class_weights=self.label_weights,  # Class weights.
+                foreground_prob=self.oversampling,  # Probability of foreground.
+                device="cpu",  # Perform the operation on the CPU.
+                cache_objects=True,  # Cache object locations for efficiency.
+            )
 
         # Randomly select an anchor point within the identified ROI for
         # cropping. The crop shape is the patch size plus one channel. Here the
@@ -482,7 +600,7 @@ class TestPipeline(GenericPipeline):
         image = self.input_images(name="image_reader").gpu()
 
         # Reshape the image data to DHWC format.
-        image = fn.reshape(image, layout="DHWC")
+        image = self.to_float(fn.reshape(image, layout="DHWC"))
 
         # Change format to CDHW for pytorch compatibility
         image = fn.transpose(image, perm=[3, 0, 1, 2])
@@ -503,11 +621,13 @@ class EvalPipeline(GenericPipeline):
         self,
         image_paths: list[str],
         label_paths: list[str],
+        label_box_paths: list[str] | None = None,
         **kwargs,
     ):
         super().__init__(
             input_image_files=image_paths,
             input_label_files=label_paths,
+            input_label_box_files=label_box_paths,
             shuffle_input=False,
             **kwargs,
         )
@@ -517,10 +637,10 @@ class EvalPipeline(GenericPipeline):
         # Load the image and label data from the input readers and transfer them
         # to the GPU.
         image = self.input_images(name="image_reader").gpu()
-        image = fn.reshape(image, layout="DHWC")
+        image = self.to_float(fn.reshape(image, layout="DHWC"))
 
         label = self.input_labels(name="label_reader").gpu()
-        label = fn.reshape(label, layout="DHWC")
+        label = self.restore_label(fn.reshape(label, layout="DHWC"))
 
         # Change format to CDHW for pytorch compatibility.
         image = fn.transpose(image, perm=[3, 0, 1, 2])
@@ -549,6 +669,10 @@ def get_training_dataset(
     use_blur: bool = True,
     use_brightness: bool = True,
     use_contrast: bool = True,
+    label_box_paths: list[str] | None = None,
+    half_precision: bool = False,
+    fg_voxel_paths: list[str] | None = None,
+    samples_per_volume: int = 1,
 ) -> DALIGenericIterator:
     """Retrieve the appropriate training pipeline based on the input data.
 
@@ -587,15 +711,31 @@ def get_training_dataset(
         num_workers: The number of workers for data loading.
         rank: The rank of the current process (GPU).
         world_size: The total number of GPUs used for training.
+        label_box_paths: List of file paths to the label crop boxes, for
+            labels saved in the compact storage format.
+        half_precision: Whether images and DTMs are saved as float16, as in
+            the compact storage format.
+        fg_voxel_paths: List of file paths to the sampled foreground voxels
+            of each label. If given, crop centers are picked from them
+            instead of searching the label for objects.
+        samples_per_volume: Number of patches drawn from each file read.
+            DALI pipelines give one patch per file, so it must be one.
 
     Returns:
         dali_iter: A DALI iterator for training data loading.
 
     Raises:
         AssertionError: If the input data is invalid or missing.
+        ValueError: If samples_per_volume is not one.
     """
     # Check that inputs are valid.
     utils.validate_train_and_eval_inputs(image_paths, label_paths, dtm_paths)
+    if samples_per_volume != 1:
+        raise ValueError(
+            f"The DALI loader draws one patch per volume, got samples_per_volume="
+            f"{samples_per_volume}. Set training.data_loader to 'torch' to draw "
+            "several patches from each volume."
+        )
 
     # Configure the DALI pipeline based on the input parameters.
     pipe_kwargs = {
@@ -605,6 +745,7 @@ def get_training_dataset(
         "num_threads": num_workers,
         "device_id": rank,
         "shard_id": rank,
+        "half_precision": half_precision,
     }
 
     # Create the training pipeline with the specified parameters.
@@ -623,6 +764,8 @@ def get_training_dataset(
         use_blur=use_blur if use_augmentation else False,
         use_brightness=use_brightness if use_augmentation else False,
         use_contrast=use_contrast if use_augmentation else False,
+        label_box_paths=label_box_paths,
+        fg_voxel_paths=fg_voxel_paths,
         **pipe_kwargs,
     )
 
@@ -640,6 +783,8 @@ def get_validation_dataset(
     num_workers: int,
     rank: int,
     world_size: int,
+    label_box_paths: list[str] | None = None,
+    half_precision: bool = False,
 ) -> DALIGenericIterator:
     """Build a DALI validation pipeline for loading images and labels.
 
@@ -657,6 +802,10 @@ def get_validation_dataset(
         num_workers: The number of workers for data loading.
         rank: The rank of the current process (GPU).
         world_size: The total number of GPUs used for training.
+        label_box_paths: List of file paths to the label crop boxes, for
+            labels saved in the compact storage format.
+        half_precision: Whether images are saved as float16, as in the
+            compact storage format.
 
     Returns:
         dali_iter: A DALI iterator for validation data loading.
@@ -672,9 +821,12 @@ def get_validation_dataset(
         "num_threads": num_workers,
         "device_id": rank,
         "shard_id": rank,
+        "half_precision": half_precision,
     }
 
-    pipeline = EvalPipeline(image_paths, label_paths, **pipe_kwargs)
+    pipeline = EvalPipeline(
+        image_paths, label_paths, label_box_paths=label_box_paths, **pipe_kwargs
+    )
     dali_iter = DALIGenericIterator(pipeline, ["image", "label"])
     return dali_iter
 
@@ -685,6 +837,7 @@ def get_test_dataset(
     num_workers: int,
     rank: int = 0,
     world_size: int = 1,
+    half_precision: bool = False,
 ) -> DALIGenericIterator:
     """ "Build a DALI test pipeline for loading images.
 
@@ -701,6 +854,8 @@ def get_test_dataset(
         seed: Random seed for shuffling or any other randomness in the reader.
         num_workers: The number of workers for data loading.
         rank: The rank of the current process (GPU). Defaults to 0.
+        half_precision: Whether images are saved as float16, as in the
+            compact storage format.
 
     Returns:
         dali_iter: A DALI iterator for test data loading.
@@ -720,6 +875,7 @@ def get_test_dataset(
         "num_threads": num_workers,
         "device_id": rank,
         "shard_id": rank,
+        "half_precision": half_precision,
     }
 
     pipeline = TestPipeline(image_paths, **pipe_kwargs)
@@ -36,3 +36,22 @@ class DataLoadingConstants:
     HORIZONTAL_FLIP_PROBABILITY = 0.5
     VERTICAL_FLIP_PROBABILITY = 0.5
     DEPTH_FLIP_PROBABILITY = 0.5
+
+    # Blur kernel radius of the PyTorch loader in standard deviations. DALI
+    # uses a kernel of 2 * ceil(3 * sigma) + 1 voxels.
+    BLUR_FN_TRUNCATE = 3.0
+
+    # Data loader backends, selected by config["training"]["data_loader"].
+    DATA_LOADER_BACKENDS = ("dali", "torch")
+    DEFAULT_DATA_LOADER = "dali"
+
+    # Patches drawn from each training volume the PyTorch loader reads, set by
+    # config["training"]["samples_per_volume"]. With more than one, the
+    # shuffle buffer holds the patches of this many volumes.
+    DEFAULT_SAMPLES_PER_VOLUME = 1
+    SHUFFLE_BUFFER_VOLUMES = 4
+
+    # Shared memory cache of preprocessed files, set by
+    # config["training"]["shared_cache"].
+    SHARED_CACHE_DIRECTORY = "/dev/shm"
+    DEFAULT_SHARED_CACHE_SIZE_GB = 32.0
@@ -0,0 +1,64 @@
+"""Checks of the inputs of the data loaders.
+
+These checks do not depend on DALI, so both the DALI and the PyTorch loaders
+use them.
+"""
+
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+
+def validate_train_and_eval_inputs(
+    imgs: list[str],
+    lbls: list[str],
+    dtms: list[str] | None = None,
+) -> None:
+    """Validate that the input data is correct.
+
+    Ensures that images, labels, and optional DTM data are provided and that
+    the lengths of the image, label, and DTM lists match.
+
+    Args:
+        imgs: List of image file paths.
+        lbls: List of label file paths.
+        dtms: Optional list of DTM data file paths. Defaults to None.
+
+    Raises:
+        ValueError: If the number of images, labels, or DTMs are incorrect.
+    """
+    if not imgs:
+        raise ValueError("No images found!")
+
+    if not lbls:
+        raise ValueError("No labels found!")
+
+    if len(imgs) != len(lbls):
+        raise ValueError("Number of images and labels do not match!")
+
+    if dtms is not None:
+        if not dtms:
+            raise ValueError("No DTM data found!")
+        if len(imgs) != len(dtms):
+            raise ValueError("Number of images and DTMs do not match!")
+
+
+def is_valid_generic_pipeline_input(input_data: Any) -> bool:
+    """Check if the input data is a valid generic pipeline input.
+
+    Args:
+        input_data: The input data to check.
+
+    Returns:
+        True if the input data is a valid generic pipeline input, False otherwise.
+    """
+    if not isinstance(input_data, Sequence) or isinstance(input_data, str):
+        return False  # Must be a sequence but not a single string.
+
+    if len(input_data) == 0:
+        return False  # Empty lists are not valid.
+
+    return all(
+        isinstance(item, str) and item.endswith(".npy") and Path(item).is_file()
+        for item in input_data
+    )
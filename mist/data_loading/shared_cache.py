@@ -0,0 +1,210 @@
+"""Node-wide cache of preprocessed numpy files in shared memory.
+
+Training reads the same preprocessed files every epoch, and with several
+GPUs the processes of every rank read their shards from disk on their own.
+SharedFileCache copies each file once into a directory on a RAM-backed file
+system, /dev/shm by default. From there, every process on the node reads it
+from memory. The directory is named after the numpy directory, so the ranks,
+folds, and runs that train on the same data share it. It is not removed when
+training ends.
+
+The cache holds files up to a size cap. Files are added when they are first
+read, and the files read least recently are removed to make room for new
+ones, so datasets larger than the cap are partly cached. A file can be
+removed after get returns its path and before the caller opens it, so
+callers read the original file if the cached copy is gone.
+
+Readers that take a fixed list of files, such as the DALI numpy reader,
+cannot fall back like that. They use get_all, which never removes files and
+pins the files it returns: pinned files are never removed to make room, and
+stay until the directory is deleted. Cached files are named after the path,
+size, and modification time of the original, so a file that is preprocessed
+again is cached again. Processes add and remove files under a lock, and
+write each new file under a temporary name first, so readers never see
+partly written files.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import warnings
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from mist.data_loading.data_loading_constants import DataLoadingConstants as constants
+
+_LOCK_NAME = ".lock"
+_TEMPORARY_SUFFIX = ".tmp"
+_PINNED_SUFFIX = ".pinned"
+
+
+class SharedFileCache:
+    """Least recently used cache of files in a shared directory.
+
+    Attributes:
+        directory: Directory that holds the cached files.
+        max_bytes: Largest total size of the cached files.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def cached_path(self, path: str, pinned: bool = False) -> Path:
+        """Return the path of the cached copy of a file, or of its pinned copy."""
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        name = hashlib.sha1(key.encode()).hexdigest() + (_PINNED_SUFFIX if pinned else "")
+        return self.directory / f"{name}{Path(path).suffix}"
+
+    def get(self, path: str) -> str:
+        """Return the path to read a file from, caching the file if it fits.
+
+        Args:
+            path: Path to the original file.
+
+        Returns:
+            The path of the cached copy, or the original path if the file
+            does not fit in the cache.
+        """
+        pinned = self.cached_path(path, pinned=True)
+        cached = self.cached_path(path)
+        for copy in (pinned, cached):
+            if self._touch(copy):
+                return str(copy)
+
+        with self._lock():
+            # Another process may have cached the file while we waited.
+            for copy in (pinned, cached):
+                if self._touch(copy):
+                    return str(copy)
+            size = os.path.getsize(path)
+            if not self._make_room(size):
+                return path
+            temporary = cached.with_suffix(_TEMPORARY_SUFFIX)
+            shutil.copyfile(path, temporary)
+            os.replace(temporary, cached)
+        return str(cached)
+
+    def get_all(self, paths: list[str]) -> list[str]:
+        """Cache and pin the files that fit without removing any cached files.
+
+        This is for readers that take a fixed list of files, such as the DALI
+        numpy reader. Removing files to make room could remove files that such
+        a reader of another fold or run still reads, so files that do not fit
+        in the room left under the cap are read from disk instead. Files that
+        get cached before are pinned without copying them again.
+
+        Args:
+            paths: Paths to the original files.
+
+        Returns:
+            The paths to read the files from: the cached copies, or the
+            original paths, with a warning, for files that did not fit.
+        """
+        result = []
+        with self._lock():
+            total = sum(size for _, size, _ in self._entries())
+            free = self._free_bytes()
+            for path in paths:
+                pinned = self.cached_path(path, pinned=True)
+                if self._touch(pinned):
+                    result.append(str(pinned))
+                    continue
+                cached = self.cached_path(path)
+                if self._touch(cached):
+                    os.replace(cached, pinned)
+                    result.append(str(pinned))
+                    continue
+                size = os.path.getsize(path)
+                if total + size > self.max_bytes or free <= size:
+                    result.append(path)
+                    continue
+                temporary = pinned.with_suffix(_TEMPORARY_SUFFIX)
+                shutil.copyfile(path, temporary)
+                os.replace(temporary, pinned)
+                total += size
+                free -= size
+                result.append(str(pinned))
+
+        uncached = sum(cached == path for cached, path in zip(result, paths, strict=True))
+        if uncached > 0:
+            warnings.warn(
+                f"{uncached} of {len(paths)} files do not fit in the "
+                f"{self.max_bytes / 2**30:.1f} GiB shared cache. Reading them from disk.",
+                stacklevel=2,
+            )
+        return result
+
+    def _touch(self, cached: Path) -> bool:
+        """Mark a cached file as read now. Return False if it is not cached."""
+        try:
+            os.utime(cached)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _make_room(self, size: int) -> bool:
+        """Remove the least recently read unpinned files until a new file fits.
+
+        Must be called with the lock held. Returns False if the file cannot
+        fit, either in the cache or in the free space of the file system.
+        """
+        if size > self.max_bytes:
+            return False
+        entries = sorted(self._entries())
+        total = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry_path in entries:
+            if Path(entry_path).stem.endswith(_PINNED_SUFFIX):
+                continue
+            if total + size <= self.max_bytes and self._free_bytes() > size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(entry_path)
+            total -= entry_size
+        return total + size <= self.max_bytes and self._free_bytes() > size
+
+    def _entries(self) -> list[tuple[int, int, str]]:
+        """Return the modification time, size, and path of each cached file."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name == _LOCK_NAME or entry.name.endswith(_TEMPORARY_SUFFIX):
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def _free_bytes(self) -> int:
+        """Free space of the file system that holds the cache."""
+        return shutil.disk_usage(self.directory).free
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Hold a lock shared by every process that uses the directory."""
+        with open(self.directory / _LOCK_NAME, "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+
+def get_shared_cache(training_config: dict[str, Any], numpy_dir: Path) -> SharedFileCache | None:
+    """Create the shared cache set in config["training"]["shared_cache"].
+
+    Args:
+        training_config: The "training" section of the configuration.
+        numpy_dir: Directory with the preprocessed data.
+
+    Returns:
+        The cache, or None if it is not enabled.
+    """
+    settings = training_config.get("shared_cache") or {}
+    if not settings.get("enabled", False):
+        return None
+    key = hashlib.sha1(str(Path(numpy_dir).resolve()).encode()).hexdigest()[:12]
+    directory = Path(settings.get("directory", constants.SHARED_CACHE_DIRECTORY))
+    max_size_gb = settings.get("max_size_gb", constants.DEFAULT_SHARED_CACHE_SIZE_GB)
+    return SharedFileCache(directory / f"mist-cache-{key}", int(max_size_gb * 2**30))
@@ -0,0 +1,919 @@
+"""PyTorch loaders for loading data into models during training.
+
+These loaders are an alternative to the DALI loaders in dali_loader that only
+need PyTorch, NumPy, and SciPy. They run on the CPU with torch.utils.data, so
+training and test_on_fold work on machines without DALI or a GPU. They are
+selected with config["training"]["data_loader"] = "torch".
+
+The loaders mirror the DALI pipelines:
+  - Training samples a patch with the same biased crop as
+    TrainPipeline.biased_crop_fn, using the foreground voxels sampled during
+    preprocessing when they are given. It then applies zoom (without DTMs),
+    flips, noise, blur, brightness, and contrast with the probabilities and
+    ranges in DataLoadingConstants.
+  - Validation and testing stream whole images in order, one per batch.
+  - Files are split into contiguous shards by rank, as the DALI numpy reader
+    does, and training files are reshuffled every epoch.
+  - Training patches are read straight from the files, so only the part of
+    each image, label, and DTM inside the patch is read from disk.
+
+Worker processes prepare batches in parallel and send them to the main
+process through shared memory. Batches are copied to pinned memory and moved
+to cuda:<rank> when a GPU is available, and stay on the CPU otherwise. The
+functions return iterators with the next() and reset() methods of the DALI
+iterators, so the trainers use both backends in the same way.
+"""
+
+from collections.abc import Callable, Iterator
+from typing import Any, BinaryIO, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+import torch
+from scipy import ndimage
+from torch.utils.data import DataLoader, Dataset, IterableDataset, get_worker_info
+
+from mist.data_loading.data_loading_constants import DataLoadingConstants as constants
+from mist.data_loading.input_validation import (
+    is_valid_generic_pipeline_input,
+    validate_train_and_eval_inputs,
+)
+from mist.data_loading.shared_cache import SharedFileCache
+from mist.preprocessing import storage
+
+# Object boxes of one label, as (start, stop) arrays for each class.
+ObjectBoxes = dict[int, list[tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]]]
+
+T = TypeVar("T")
+
+
+def check_files(paths: list[str] | None, name: str) -> None:
+    """Raise a ValueError if a list of input files is given but not valid."""
+    if paths and not is_valid_generic_pipeline_input(paths):
+        raise ValueError(f"Input {name} are not valid. Please check the input paths.")
+
+
+def shard_indices(num_files: int, rank: int, world_size: int) -> list[int]:
+    """Return the indices of the files read by one rank.
+
+    The files are split into contiguous shards in the same way as the DALI
+    numpy reader.
+    """
+    start = num_files * rank // world_size
+    stop = num_files * (rank + 1) // world_size
+    return list(range(start, stop))
+
+
+def load_array(path: str, half_precision: bool = False) -> npt.NDArray[Any]:
+    """Load a numpy file, casting float16 images and DTMs to float32."""
+    array = np.load(path)
+    return array.astype(np.float32, copy=False) if half_precision else array
+
+
+def load_label(path: str, label_box_path: str | None = None) -> npt.NDArray[Any]:
+    """Load a label, restoring labels saved in the compact format."""
+    label = np.load(path)
+    if label_box_path is None:
+        return label
+    return storage.restore_label(label, np.load(label_box_path))
+
+
+def read_header(file: BinaryIO) -> tuple[tuple[int, ...], bool, np.dtype]:
+    """Read the shape, order, and dtype of an open numpy file.
+
+    The file is left at the start of the array data.
+    """
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(file)
+    return np.lib.format.read_array_header_2_0(file)
+
+
+def array_shape(path: str) -> tuple[int, ...]:
+    """Return the shape of the array in a numpy file without reading it."""
+    with open(path, "rb") as file:
+        return read_header(file)[0]
+
+
+def read_patch(
+    path: str,
+    start: npt.NDArray[np.int64],
+    roi_size: tuple[int, int, int],
+) -> npt.NDArray[Any]:
+    """Read one patch of a DHWC array from a numpy file.
+
+    Only the patch is read. Each slice of the patch along the first axis is
+    one contiguous range of bytes in the file, from its first voxel to its
+    last, and is read with a single call. Parts of the patch outside the
+    volume are zeros, which matches cropping a volume padded by pad_to_roi.
+
+    Args:
+        path: Path to the numpy file.
+        start: Start of the patch in the volume. It may be negative.
+        roi_size: Size of the patch.
+
+    Returns:
+        The patch.
+
+    Raises:
+        ValueError: If the file is shorter than its header says.
+    """
+    with open(path, "rb", buffering=0) as file:
+        shape, fortran_order, dtype = read_header(file)
+        offset = file.tell()
+        patch = np.zeros((*roi_size, shape[-1]), dtype=dtype)
+        begin = np.maximum(start, 0)
+        stop = np.minimum(start + np.array(roi_size), shape[:3])
+        if np.any(stop <= begin):
+            return patch
+        source = tuple(slice(int(b), int(e)) for b, e in zip(begin, stop, strict=True))
+        target = tuple(
+            slice(int(b - s), int(e - s)) for b, e, s in zip(begin, stop, start, strict=True)
+        )
+
+        if fortran_order:
+            patch[target] = np.load(path, mmap_mode="r")[source]
+            return patch
+
+        # Rows of the slices start a whole row of the volume apart, so a
+        # buffer of full rows holds a slice of the patch at the start of
+        # each row.
+        rows, columns = int(stop[1] - begin[1]), int(stop[2] - begin[2])
+        row_size = shape[2] * shape[3]
+        buffer = np.empty((rows, shape[2], shape[3]), dtype=dtype)
+        length = ((rows - 1) * row_size + columns * shape[3]) * dtype.itemsize
+        data = memoryview(buffer.reshape(-1).view(np.uint8))[:length]
+        for depth in range(source[0].start, source[0].stop):
+            first = (depth * shape[1] + source[1].start) * row_size + source[2].start * shape[3]
+            file.seek(offset + first * dtype.itemsize)
+            if file.readinto(data) != length:
+                raise ValueError(f"The numpy file {path} is shorter than its header says.")
+            patch[depth - int(start[0]), target[1], target[2]] = buffer[:, :columns]
+    return patch
+
+
+def read_file(path: str, cache: SharedFileCache | None, read: Callable[..., T], *args: Any) -> T:
+    """Read a file with read(path, *args), through the shared cache if any.
+
+    Another process may remove the cached copy to make room for other files
+    between cache.get and the read. The original file is read then.
+    """
+    if cache is None:
+        return read(path, *args)
+    cached = cache.get(path)
+    try:
+        return read(cached, *args)
+    except FileNotFoundError:
+        if cached == path:
+            raise
+        return read(path, *args)
+
+
+def to_tensor(array: npt.NDArray[Any]) -> torch.Tensor:
+    """Convert an array from DHWC to a contiguous CDHW tensor."""
+    return torch.from_numpy(np.ascontiguousarray(np.moveaxis(array, -1, 0)))
+
+
+def pad_to_roi(array: npt.NDArray[Any], roi_size: tuple[int, int, int]) -> npt.NDArray[Any]:
+    """Pad the spatial axes with zeros at the end to at least the ROI size."""
+    padding = [(0, max(0, roi - size)) for roi, size in zip(roi_size, array.shape[:3], strict=True)]
+    if not any(after for _, after in padding):
+        return array
+    return np.pad(array, [*padding, (0, 0)])
+
+
+def find_object_boxes(label: npt.NDArray[Any], classes: list[int]) -> ObjectBoxes:
+    """Find the bounding box of every connected object of each class.
+
+    Args:
+        label: Label in DHWC layout.
+        classes: Classes to find objects of.
+
+    Returns:
+        Dictionary from each class present in the label to the (start, stop)
+        boxes of its objects.
+    """
+    structure = ndimage.generate_binary_structure(3, 3)
+    boxes: ObjectBoxes = {}
+    for value in classes:
+        components, count = ndimage.label(label[..., 0] == value, structure=structure)
+        if count == 0:
+            continue
+        boxes[value] = [
+            (
+                np.array([axis.start for axis in box], dtype=np.int64),
+                np.array([axis.stop for axis in box], dtype=np.int64),
+            )
+            for box in ndimage.find_objects(components)
+        ]
+    return boxes
+
+
+def random_crop_start(
+    rng: np.random.Generator,
+    roi_start: npt.NDArray[np.int64],
+    roi_end: npt.NDArray[np.int64],
+    crop_shape: npt.NDArray[np.int64],
+    shape: npt.NDArray[np.int64],
+) -> npt.NDArray[np.int64]:
+    """Pick a random crop start, as DALI's roi_random_crop does.
+
+    Along each axis, a crop larger than the ROI contains it, and a crop
+    smaller than the ROI lies within it. The crop always lies within the
+    input.
+    """
+    contains_roi = crop_shape >= roi_end - roi_start
+    low = np.where(contains_roi, roi_end - crop_shape, roi_start)
+    high = np.where(contains_roi, roi_start, roi_end - crop_shape)
+    low = np.clip(low, 0, shape - crop_shape)
+    high = np.clip(high, low, shape - crop_shape)
+    return rng.integers(low, high + 1)
+
+
+def biased_crop_start(
+    rng: np.random.Generator,
+    shape: tuple[int, ...],
+    roi_size: tuple[int, int, int],
+    oversampling: float,
+    object_boxes: ObjectBoxes | None = None,
+    fg_voxels: npt.NDArray[np.int32] | None = None,
+) -> npt.NDArray[np.int64]:
+    """Pick the start of a patch, centered on the foreground with some probability.
+
+    This follows TrainPipeline.biased_crop_fn for a volume padded to at least
+    the patch size. With probability oversampling, a class present in the
+    label is chosen with equal weights, and the patch contains a random voxel
+    of that class from the sampled foreground voxels. Without them, the patch
+    contains a random object of that class, or lies within it if the object
+    is larger than the patch. Otherwise the patch is anywhere in the volume.
+
+    Args:
+        rng: Random number generator.
+        shape: Spatial shape of the volume.
+        roi_size: Size of the patch.
+        oversampling: Probability of centering the patch on the foreground.
+        object_boxes: Boxes of the objects in the label from
+            find_object_boxes.
+        fg_voxels: Foreground voxels from
+            storage.sample_foreground_voxels. Used instead of object_boxes
+            when given.
+
+    Returns:
+        The start of the patch.
+    """
+    crop_shape = np.array(roi_size, dtype=np.int64)
+    shape = np.maximum(np.array(shape[:3], dtype=np.int64), crop_shape)
+
+    roi_start, roi_end = np.zeros(3, dtype=np.int64), shape
+    if fg_voxels is not None:
+        if rng.random() < oversampling:
+            box = fg_voxels[rng.integers(len(fg_voxels))].astype(np.int64)
+            roi_start, roi_end = box[:3], box[3:]
+    elif object_boxes and rng.random() < oversampling:
+        classes = sorted(object_boxes)
+        objects = object_boxes[classes[rng.integers(len(classes))]]
+        roi_start, roi_end = objects[rng.integers(len(objects))]
+    return random_crop_start(rng, roi_start, roi_end, crop_shape, shape)
+
+
+def biased_crop_fn(
+    rng: np.random.Generator,
+    arrays: list[npt.NDArray[Any]],
+    roi_size: tuple[int, int, int],
+    oversampling: float,
+    object_boxes: ObjectBoxes | None = None,
+    fg_voxels: npt.NDArray[np.int32] | None = None,
+) -> list[npt.NDArray[Any]]:
+    """Extract a random patch, centered on the foreground with some probability.
+
+    The arrays are padded to at least the patch size, and the patch starts
+    at biased_crop_start, which describes the arguments.
+
+    Returns:
+        The patches of the arrays.
+    """
+    arrays = [pad_to_roi(array, roi_size) for array in arrays]
+    start = biased_crop_start(rng, arrays[0].shape, roi_size, oversampling, object_boxes, fg_voxels)
+    crop = tuple(slice(int(s), int(s + n)) for s, n in zip(start, roi_size, strict=True))
+    return [array[crop] for array in arrays]
+
+
+def flips_fn(
+    rng: np.random.Generator,
+    arrays: list[npt.NDArray[Any]],
+) -> list[npt.NDArray[Any]]:
+    """Flip the image, label, and DTM along each spatial axis at random."""
+    probabilities = (
+        constants.DEPTH_FLIP_PROBABILITY,
+        constants.VERTICAL_FLIP_PROBABILITY,
+        constants.HORIZONTAL_FLIP_PROBABILITY,
+    )
+    axes = tuple(axis for axis, p in enumerate(probabilities) if rng.random() < p)
+    if not axes:
+        return arrays
+    return [np.flip(array, axis=axes) for array in arrays]
+
+
+def zoom_fn(
+    rng: np.random.Generator,
+    image: npt.NDArray[np.float32],
+    label: npt.NDArray[Any],
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[Any]]:
+    """Zoom into the center of the image and label at random.
+
+    With probability ZOOM_FN_PROBABILITY, the center of the patch is cropped
+    to a random fraction of its size and resized back, with cubic
+    interpolation for the image and nearest neighbor for the label.
+    """
+    if rng.random() >= constants.ZOOM_FN_PROBABILITY:
+        return image, label
+
+    scale = rng.uniform(constants.ZOOM_FN_RANGE_MIN, constants.ZOOM_FN_RANGE_MAX)
+    roi_size = np.array(image.shape[:3])
+    crop_shape = np.maximum(np.round(scale * roi_size).astype(np.int64), 1)
+    start = np.round((roi_size - crop_shape) / 2).astype(np.int64)
+    crop = tuple(slice(int(s), int(s + n)) for s, n in zip(start, crop_shape, strict=True))
+    zoom = roi_size / crop_shape
+    # Zoom each channel as a 3D volume. Interpolating along the channel axis
+    # too would be several times slower.
+    image = np.stack(
+        [
+            ndimage.zoom(channel, zoom, order=3, mode="nearest", grid_mode=True)
+            for channel in np.moveaxis(image[crop], -1, 0)
+        ],
+        axis=-1,
+    )
+    label = ndimage.zoom(label[crop][..., 0], zoom, order=0, mode="nearest", grid_mode=True)
+    return image, label[..., np.newaxis]
+
+
+def noise_fn(rng: np.random.Generator, image: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    """Add Gaussian noise with a random standard deviation at random."""
+    if rng.random() >= constants.NOISE_FN_PROBABILITY:
+        return image
+    std = rng.uniform(constants.NOISE_FN_RANGE_MIN, constants.NOISE_FN_RANGE_MAX)
+    noised = image + rng.normal(0.0, std, size=image.shape).astype(np.float32)
+    return np.clip(noised, image.min(), image.max(), out=noised)
+
+
+def blur_fn(rng: np.random.Generator, image: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    """Blur the spatial axes with a random Gaussian kernel at random."""
+    if rng.random() >= constants.BLUR_FN_PROBABILITY:
+        return image
+    sigma = rng.uniform(constants.BLUR_FN_RANGE_MIN, constants.BLUR_FN_RANGE_MAX)
+    blurred = ndimage.gaussian_filter(
+        image, sigma=(sigma, sigma, sigma, 0.0), mode="mirror", truncate=constants.BLUR_FN_TRUNCATE
+    )
+    return np.clip(blurred, image.min(), image.max(), out=blurred)
+
+
+def brightness_fn(
+    rng: np.random.Generator, image: npt.NDArray[np.float32]
+) -> npt.NDArray[np.float32]:
+    """Scale the image by a random factor at random."""
+    if rng.random() >= constants.BRIGHTNESS_FN_PROBABILITY:
+        return image
+    scale = rng.uniform(constants.BRIGHTNESS_FN_RANGE_MIN, constants.BRIGHTNESS_FN_RANGE_MAX)
+    return image * np.float32(scale)
+
+
+def contrast_fn(
+    rng: np.random.Generator, image: npt.NDArray[np.float32]
+) -> npt.NDArray[np.float32]:
+    """Scale the image by a random factor at random, keeping its range."""
+    if rng.random() >= constants.CONTRAST_FN_PROBABILITY:
+        return image
+    scale = rng.uniform(constants.CONTRAST_FN_RANGE_MIN, constants.CONTRAST_FN_RANGE_MAX)
+    scaled = image * np.float32(scale)
+    return np.clip(scaled, image.min(), image.max(), out=scaled)
+
+
+class TrainDataset(IterableDataset):
+    """Endless stream of augmented training patches for one rank.
+
+    The files of the rank are read in a new random order every epoch. With
+    several workers, worker i takes every i-th file of this order, so the
+    workers together read each file once per epoch. The order is the same in
+    every worker, while the crops and augmentations use a random generator
+    of their own.
+
+    With samples_per_volume above one, each file is loaded whole once and
+    that many patches are cropped and augmented from it. The patches go
+    through a shuffle buffer of SHUFFLE_BUFFER_VOLUMES files' worth of
+    patches, so that a batch mixes patches of several files.
+
+    Attributes:
+        image_paths: Paths to the images.
+        label_paths: Paths to the labels.
+        dtm_paths: Paths to the DTMs, or None.
+        label_box_paths: Paths to the label crop boxes of labels saved in the
+            compact storage format, or None.
+        fg_voxel_paths: Paths to the sampled foreground voxels of each
+            label, or None to find the objects in each label instead.
+        cache: Shared memory cache that images, labels, and DTMs are read
+            through, or None to read them from their paths.
+        samples_per_volume: Number of patches drawn from each file read.
+        shuffle_buffer_size: Number of patches held in the shuffle buffer.
+            Zero when each file gives one patch.
+        indices: Indices of the files read by this rank.
+        object_boxes: Object boxes of each label, computed once per worker
+            when there are no sampled foreground voxels.
+    """
+
+    def __init__(
+        self,
+        image_paths: list[str],
+        label_paths: list[str],
+        dtm_paths: list[str] | None,
+        roi_size: tuple[int, int, int],
+        labels: list[int] | None,
+        oversampling: float | None,
+        seed: int,
+        rank: int,
+        world_size: int,
+        extract_patches: bool = True,
+        use_flips: bool = True,
+        use_zoom: bool = True,
+        use_noise: bool = True,
+        use_blur: bool = True,
+        use_brightness: bool = True,
+        use_contrast: bool = True,
+        label_box_paths: list[str] | None = None,
+        half_precision: bool = False,
+        fg_voxel_paths: list[str] | None = None,
+        samples_per_volume: int = 1,
+        cache: SharedFileCache | None = None,
+    ):
+        if samples_per_volume < 1:
+            raise ValueError(f"samples_per_volume must be at least 1, got {samples_per_volume}.")
+        self.image_paths = image_paths
+        self.label_paths = label_paths
+        self.dtm_paths = dtm_paths
+        self.label_box_paths = label_box_paths
+        self.fg_voxel_paths = fg_voxel_paths
+        self.cache = cache
+        self.roi_size = tuple(roi_size)
+        self.labels = list(labels or [])
+        self.oversampling = oversampling or 0.0
+        self.seed = seed
+        self.rank = rank
+        self.extract_patches = extract_patches
+        self.use_flips = use_flips
+        # As in DALI, the zoom is not applied with DTMs.
+        self.use_zoom = use_zoom and dtm_paths is None
+        self.use_noise = use_noise
+        self.use_blur = use_blur
+        self.use_brightness = use_brightness
+        self.use_contrast = use_contrast
+        self.half_precision = half_precision
+        self.samples_per_volume = samples_per_volume
+        self.shuffle_buffer_size = (
+            samples_per_volume * constants.SHUFFLE_BUFFER_VOLUMES if samples_per_volume > 1 else 0
+        )
+        self.indices = shard_indices(len(image_paths), rank, world_size)
+        self.object_boxes: dict[int, ObjectBoxes] = {}
+
+    def file_order(self, worker_id: int, num_workers: int) -> Iterator[int]:
+        """Yield the files read by one worker, reshuffled every epoch."""
+        rng = np.random.default_rng([self.seed, self.rank])
+        position = 0
+        while True:
+            for index in rng.permutation(self.indices):
+                if position % num_workers == worker_id:
+                    yield int(index)
+                position += 1
+
+    def load(self, index: int) -> list[npt.NDArray[Any]]:
+        """Load the image, label, and optionally the DTM of one file."""
+        label_box_path = self.label_box_paths[index] if self.label_box_paths else None
+        arrays = [
+            read_file(self.image_paths[index], self.cache, load_array, self.half_precision),
+            read_file(self.label_paths[index], self.cache, load_label, label_box_path),
+        ]
+        if self.dtm_paths is not None:
+            arrays.append(
+                read_file(self.dtm_paths[index], self.cache, load_array, self.half_precision)
+            )
+        return arrays
+
+    def load_patches(self, rng: np.random.Generator, index: int) -> list[npt.NDArray[Any]]:
+        """Read a biased crop of the image, label, and optionally the DTM of one file.
+
+        Only the patch is read from each file. Without sampled foreground
+        voxels, the whole label is read the first time a worker sees it to
+        find its objects.
+        """
+        image_path, label_path = self.image_paths[index], self.label_paths[index]
+        label_box_path = self.label_box_paths[index] if self.label_box_paths else None
+        shape = read_file(image_path, self.cache, array_shape)
+
+        if self.fg_voxel_paths:
+            start = biased_crop_start(
+                rng,
+                shape,
+                self.roi_size,
+                self.oversampling,
+                fg_voxels=np.load(self.fg_voxel_paths[index]),
+            )
+        else:
+            if index not in self.object_boxes:
+                full_label = read_file(label_path, self.cache, load_label, label_box_path)
+                self.object_boxes[index] = find_object_boxes(full_label, self.labels)
+            start = biased_crop_start(
+                rng,
+                shape,
+                self.roi_size,
+                self.oversampling,
+                object_boxes=self.object_boxes[index],
+            )
+
+        # Compact labels are cropped, and their box holds the negated crop
+        # start, which moves the patch into the coordinates of the crop.
+        label_start = start + np.load(label_box_path)[0, :3] if label_box_path else start
+        arrays = [
+            read_file(image_path, self.cache, read_patch, start, self.roi_size),
+            read_file(label_path, self.cache, read_patch, label_start, self.roi_size),
+        ]
+        if self.dtm_paths is not None:
+            dtm_path = self.dtm_paths[index]
+            arrays.append(read_file(dtm_path, self.cache, read_patch, start, self.roi_size))
+        if self.half_precision:
+            arrays = [
+                array.astype(np.float32) if array.dtype == np.float16 else array for array in arrays
+            ]
+        return arrays
+
+    def load_volume_patches(
+        self, rng: np.random.Generator, index: int
+    ) -> Iterator[list[npt.NDArray[Any]]]:
+        """Load one file whole and yield samples_per_volume biased crops of it."""
+        arrays = self.load(index)
+        if not self.extract_patches:
+            for _ in range(self.samples_per_volume):
+                yield arrays
+            return
+
+        arrays = [pad_to_roi(array, self.roi_size) for array in arrays]
+        fg_voxels, object_boxes = None, None
+        if self.fg_voxel_paths:
+            fg_voxels = np.load(self.fg_voxel_paths[index])
+        else:
+            if index not in self.object_boxes:
+                self.object_boxes[index] = find_object_boxes(arrays[1], self.labels)
+            object_boxes = self.object_boxes[index]
+        for _ in range(self.samples_per_volume):
+            yield biased_crop_fn(
+                rng, arrays, self.roi_size, self.oversampling, object_boxes, fg_voxels
+            )
+
+    def augment(
+        self, rng: np.random.Generator, arrays: list[npt.NDArray[Any]]
+    ) -> dict[str, torch.Tensor]:
+        """Augment one patch and convert it to tensors."""
+        if self.use_zoom:
+            arrays[0], arrays[1] = zoom_fn(rng, arrays[0], arrays[1])
+        if self.use_flips:
+            arrays = flips_fn(rng, arrays)
+
+        image = arrays[0]
+        if self.use_noise:
+            image = noise_fn(rng, image)
+        if self.use_blur:
+            image = blur_fn(rng, image)
+        if self.use_brightness:
+            image = brightness_fn(rng, image)
+        if self.use_contrast:
+            image = contrast_fn(rng, image)
+
+        sample = {"image": to_tensor(image), "label": to_tensor(arrays[1])}
+        if self.dtm_paths is not None:
+            sample["dtm"] = to_tensor(arrays[2])
+        return sample
+
+    def sample(self, rng: np.random.Generator, index: int) -> Iterator[dict[str, torch.Tensor]]:
+        """Load, crop, and augment the patches of one training example."""
+        if self.samples_per_volume > 1:
+            for arrays in self.load_volume_patches(rng, index):
+                yield self.augment(rng, list(arrays))
+        elif self.extract_patches:
+            yield self.augment(rng, self.load_patches(rng, index))
+        else:
+            yield self.augment(rng, self.load(index))
+
+    def __iter__(self) -> Iterator[dict[str, torch.Tensor]]:
+        worker = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker is None else (worker.id, worker.num_workers)
+        rng = np.random.default_rng([self.seed, self.rank, worker_id])
+        buffer: list[dict[str, torch.Tensor]] = []
+        for index in self.file_order(worker_id, num_workers):
+            for sample in self.sample(rng, index):
+                if len(buffer) < self.shuffle_buffer_size:
+                    buffer.append(sample)
+                elif not buffer:
+                    yield sample
+                else:
+                    # Swap the new patch with a random one from the buffer.
+                    position = rng.integers(len(buffer))
+                    yield buffer[position]
+                    buffer[position] = sample
+
+
+class EvalDataset(Dataset):
+    """Whole images, and optionally labels, of one rank in order.
+
+    As with pad_last_batch in the DALI reader, the last file of a shard is
+    repeated so that every rank has the same number of files. Images and
+    labels are read through the shared memory cache when one is given.
+    """
+
+    def __init__(
+        self,
+        image_paths: list[str],
+        label_paths: list[str] | None,
+        rank: int,
+        world_size: int,
+        label_box_paths: list[str] | None = None,
+        half_precision: bool = False,
+        cache: SharedFileCache | None = None,
+    ):
+        self.image_paths = image_paths
+        self.label_paths = label_paths
+        self.label_box_paths = label_box_paths
+        self.half_precision = half_precision
+        self.cache = cache
+        self.indices = shard_indices(len(image_paths), rank, world_size)
+        shard_size = -(-len(image_paths) // world_size)
+        self.indices += self.indices[-1:] * (shard_size - len(self.indices))
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, position: int) -> dict[str, torch.Tensor]:
+        index = self.indices[position]
+        image = read_file(self.image_paths[index], self.cache, load_array, self.half_precision)
+        sample = {"image": to_tensor(image)}
+        if self.label_paths is not None:
+            label_box_path = self.label_box_paths[index] if self.label_box_paths else None
+            label = read_file(self.label_paths[index], self.cache, load_label, label_box_path)
+            sample["label"] = to_tensor(label)
+        return sample
+
+
+class TorchLoaderIterator:
+    """Endless iterator over a DataLoader with the interface of DALI's.
+
+    next() returns a list with one batch, a dictionary of tensors on the
+    device of the rank. Finite datasets start over when they run out, and
+    reset() starts them over from their first file. Training streams are
+    endless, so reset() leaves them where they are.
+    """
+
+    def __init__(self, loader: DataLoader, device: torch.device):
+        self.loader = loader
+        self.device = device
+        self.iterator: Iterator[dict[str, torch.Tensor]] | None = None
+
+    def next(self) -> list[dict[str, torch.Tensor]]:
+        """Return the next batch on the device."""
+        if self.iterator is None:
+            self.iterator = iter(self.loader)
+        try:
+            batch = next(self.iterator)
+        except StopIteration:
+            self.iterator = iter(self.loader)
+            batch = next(self.iterator)
+        non_blocking = self.loader.pin_memory
+        return [
+            {key: value.to(self.device, non_blocking=non_blocking) for key, value in batch.items()}
+        ]
+
+    def reset(self) -> None:
+        """Start finite datasets over from their first file."""
+        if not isinstance(self.loader.dataset, IterableDataset):
+            self.iterator = None
+
+
+def get_device(rank: int) -> torch.device:
+    """Return the GPU of the rank if there is one, otherwise the CPU."""
+    return torch.device(f"cuda:{rank}") if torch.cuda.is_available() else torch.device("cpu")
+
+
+def build_iterator(
+    dataset: Dataset,
+    batch_size: int,
+    num_workers: int,
+    rank: int,
+) -> TorchLoaderIterator:
+    """Wrap a dataset in a DataLoader with worker processes and pinned memory."""
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=num_workers > 0,
+    )
+    return TorchLoaderIterator(loader, get_device(rank))
+
+
+def get_training_dataset(
+    image_paths: list[str],
+    label_paths: list[str],
+    dtm_paths: list[str] | None,
+    batch_size: int,
+    roi_size: tuple[int, int, int],
+    labels: list[int] | None,
+    oversampling: float | None,
+    seed: int,
+    num_workers: int,
+    rank: int,
+    world_size: int,
+    extract_patches: bool = True,
+    use_augmentation: bool = True,
+    use_flips: bool = True,
+    use_zoom: bool = True,
+    use_noise: bool = True,
+    use_blur: bool = True,
+    use_brightness: bool = True,
+    use_contrast: bool = True,
+    label_box_paths: list[str] | None = None,
+    half_precision: bool = False,
+    fg_voxel_paths: list[str] | None = None,
+    samples_per_volume: int = 1,
+    cache: SharedFileCache | None = None,
+) -> TorchLoaderIterator:
+    """Build a PyTorch loader of training patches.
+
+    Takes the same arguments as dali_loader.get_training_dataset, and a shared
+    memory cache.
+
+    Args:
+        image_paths: List of file paths to the image data.
+        label_paths: List of file paths to the label data.
+        dtm_paths: List of file paths to the DTM data.
+        batch_size: The batch size for training.
+        roi_size: The size of the patches.
+        labels: List of labels in the dataset.
+        oversampling: The probability of centering a patch on an object.
+        seed: Random seed for the file order and augmentations.
+        num_workers: The number of worker processes. Zero loads batches in
+            the main process.
+        rank: The rank of the current process (GPU).
+        world_size: The total number of GPUs used for training.
+        extract_patches: Whether to extract patches. If False, whole images
+            are used, and they must all have the ROI size.
+        use_augmentation: Whether to apply any augmentations.
+        use_flips: Whether to apply flips.
+        use_zoom: Whether to apply zoom. Zoom is not applied with DTMs.
+        use_noise: Whether to apply noise.
+        use_blur: Whether to apply blur.
+        use_brightness: Whether to adjust brightness.
+        use_contrast: Whether to adjust contrast.
+        label_box_paths: List of file paths to the label crop boxes, for
+            labels saved in the compact storage format.
+        half_precision: Whether images and DTMs are saved as float16, as in
+            the compact storage format.
+        fg_voxel_paths: List of file paths to the sampled foreground voxels
+            of each label. If given, crop centers are picked from them
+            instead of searching the label for objects.
+        samples_per_volume: Number of patches drawn from each loaded file.
+            Above one, the patches are mixed across files in a shuffle
+            buffer.
+        cache: Shared memory cache to read images, labels, and DTMs
+            through. Only the PyTorch loaders take it.
+
+    Returns:
+        Iterator of training batches.
+
+    Raises:
+        ValueError: If the input data is invalid or missing, or if
+            samples_per_volume is less than one.
+    """
+    validate_train_and_eval_inputs(image_paths, label_paths, dtm_paths)
+    check_files(image_paths, "images")
+    check_files(label_paths, "labels")
+    check_files(dtm_paths, "DTMs")
+    check_files(label_box_paths, "label boxes")
+    check_files(fg_voxel_paths, "foreground voxels")
+
+    dataset = TrainDataset(
+        image_paths=image_paths,
+        label_paths=label_paths,
+        dtm_paths=dtm_paths,
+        roi_size=roi_size,
+        labels=labels,
+        oversampling=oversampling,
+        seed=seed,
+        rank=rank,
+        world_size=world_size,
+        extract_patches=extract_patches,
+        use_flips=use_augmentation and use_flips,
+        use_zoom=use_augmentation and use_zoom,
+        use_noise=use_augmentation and use_noise,
+        use_blur=use_augmentation and use_blur,
+        use_brightness=use_augmentation and use_brightness,
+        use_contrast=use_augmentation and use_contrast,
+        label_box_paths=label_box_paths,
+        half_precision=half_precision,
+        fg_voxel_paths=fg_voxel_paths,
+        samples_per_volume=samples_per_volume,
+        cache=cache,
+    )
+    return build_iterator(dataset, batch_size, num_workers, rank)
+
+
+def get_validation_dataset(
+    image_paths: list[str],
+    label_paths: list[str],
+    seed: int,
+    num_workers: int,
+    rank: int,
+    world_size: int,
+    label_box_paths: list[str] | None = None,
+    half_precision: bool = False,
+    cache: SharedFileCache | None = None,
+) -> TorchLoaderIterator:
+    """Build a PyTorch loader of whole validation images and labels.
+
+    Takes the same arguments as dali_loader.get_validation_dataset, and a shared
+    memory cache.
+
+    Args:
+        image_paths: List of file paths to the image data.
+        label_paths: List of file paths to the label data.
+        seed: Not used, because validation images are read in order. Kept
+            for the same signature as the DALI loader.
+        num_workers: The number of worker processes.
+        rank: The rank of the current process (GPU).
+        world_size: The total number of GPUs used for training.
+        label_box_paths: List of file paths to the label crop boxes, for
+            labels saved in the compact storage format.
+        half_precision: Whether images are saved as float16, as in the
+            compact storage format.
+        cache: Shared memory cache to read images and labels through. Only
+            the PyTorch loaders take it.
+
+    Returns:
+        Iterator of validation batches of one image each.
+
+    Raises:
+        ValueError: If the input data is invalid or missing.
+    """
+    validate_train_and_eval_inputs(image_paths, label_paths)
+    check_files(image_paths, "images")
+    check_files(label_paths, "labels")
+    check_files(label_box_paths, "label boxes")
+
+    dataset = EvalDataset(
+        image_paths,
+        label_paths,
+        rank=rank,
+        world_size=world_size,
+        label_box_paths=label_box_paths,
+        half_precision=half_precision,
+        cache=cache,
+    )
+    return build_iterator(dataset, 1, num_workers, rank)
+
+
+def get_test_dataset(
+    image_paths: list[str],
+    seed: int,
+    num_workers: int,
+    rank: int = 0,
+    world_size: int = 1,
+    half_precision: bool = False,
+) -> TorchLoaderIterator:
+    """Build a PyTorch loader of whole test images.
+
+    Takes the same arguments as dali_loader.get_test_dataset. Images are read
+    in the order of image_paths.
+
+    Args:
+        image_paths: List of file paths to the image data.
+        seed: Not used, because test images are read in order. Kept for the
+            same signature as the DALI loader.
+        num_workers: The number of worker processes.
+        rank: The rank of the current process (GPU). Defaults to 0.
+        world_size: The total number of GPUs. Defaults to 1.
+        half_precision: Whether images are saved as float16, as in the
+            compact storage format.
+
+    Returns:
+        Iterator of test batches of one image each.
+
+    Raises:
+        ValueError: If no images are found in the input data.
+    """
+    if len(image_paths) == 0:
+        raise ValueError("No images found!")
+    check_files(image_paths, "images")
+
+    dataset = EvalDataset(
+        image_paths,
+        None,
+        rank=rank,
+        world_size=world_size,
+        half_precision=half_precision,
+    )
+    return build_iterator(dataset, 1, num_workers, rank)
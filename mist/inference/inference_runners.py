@@ -14,6 +14,8 @@ import numpy as np
 import pandas as pd
 import torch
 
+from mist.data_loading import torch_loader
+from mist.data_loading.data_loading_constants import DataLoadingConstants as dlc
 from mist.inference import inference_utils
 from mist.inference.inference_constants import InferenceConstants as ic
 from mist.inference.predictor import Predictor
@@ -23,7 +25,7 @@ from mist.utils.console import print_error, print_section_header, print_success
 
 # DALI is a training-only dependency (nvidia-dali-cuda120). Guard the import
 # so that inference_runners can be imported on CPU-only machines where only
-# mist_predict is needed.
+# mist_predict is needed, or where test_on_fold uses the PyTorch loader.
 try:
     from mist.data_loading import dali_loader
 except ImportError:
@@ -32,7 +34,7 @@ from mist.inference.ensemblers.ensembler_registry import get_ensembler
 from mist.inference.inferers.inferer_registry import get_inferer
 from mist.inference.tta.strategies import get_strategy
 from mist.postprocessing.postprocessor import Postprocessor
-from mist.preprocessing import preprocess, preprocessing_utils
+from mist.preprocessing import preprocess, preprocessing_utils, storage
 from mist.training import training_utils
 
 
@@ -225,16 +227,23 @@ def test_on_fold(
     # Get bounding box data.
     foreground_bounding_boxes = pd.read_csv(results_dir / "fg_bboxes.csv")
 
-    # Get DALI loader for streaming preprocessed numpy files.
-    if dali_loader is None:
-        raise RuntimeError(
-            "NVIDIA DALI is required for test_on_fold. "
-            "Install with: pip install 'mist-medical[train]'"
-        )
-    test_loader = dali_loader.get_test_dataset(
+    # Get the loader for streaming preprocessed numpy files. DALI is the
+    # default; the PyTorch loader does not need it.
+    loader = torch_loader
+    if config["training"].get("data_loader", dlc.DEFAULT_DATA_LOADER) != "torch":
+        if dali_loader is None:
+            raise RuntimeError(
+                "NVIDIA DALI is required for test_on_fold. "
+                "Install with: pip install 'mist-medical[train]', "
+                "or set training.data_loader to 'torch'."
+            )
+        loader = dali_loader
+    compact = storage.get_storage_format(config) == "compact"
+    test_loader = loader.get_test_dataset(
         image_paths=test_image_paths,
         seed=config["training"]["seed"],
         num_workers=config["training"]["hardware"]["num_cpu_workers"],
+        half_precision=compact,
     )
 
     # Load model.
@@ -242,6 +251,7 @@ def test_on_fold(
     model = model_loader.load_model_from_config(str(weights_path), config)
     model.eval()
     model.to(device)
+    model = model_loader.compile_model(model, config, cache_dir=results_dir / "compile_cache")
 
     # Create Predictor instance.
     predictor = _build_predictor(config, models=[model], device=device)
@@ -272,7 +282,7 @@ def test_on_fold(
                 ]
                 original_ants_image = ants.image_read(image_paths[0])
 
-                # DALI loader is assumed to yield batches in the same order as
+                # The loader is assumed to yield batches in the same order as
                 # test_df. This is enforced upstream and is not checked here.
                 data = test_loader.next()[0]
                 preprocessed_image = data["image"]
@@ -282,10 +292,16 @@ def test_on_fold(
                     config["preprocessing"]["crop_to_foreground"]
                     and not config["preprocessing"]["skip"]
                 ):
-                    foreground_bounding_box = foreground_bounding_boxes.loc[
-                        foreground_bounding_boxes["id"] == patient_id
-                    ].iloc[0]
-                    foreground_bounding_box = foreground_bounding_box.to_dict()
+                    if compact:
+                        # The compact format keeps the box in the sidecar.
+                        foreground_bounding_box = storage.load_metadata(numpy_dir, patient_id)[
+                            "fg_bbox"
+                        ]
+                    else:
+                        foreground_bounding_box = foreground_bounding_boxes.loc[
+                            foreground_bounding_boxes["id"] == patient_id
+                        ].iloc[0]
+                        foreground_bounding_box = foreground_bounding_box.to_dict()
                 else:
                     foreground_bounding_box = None
 
@@ -261,7 +261,13 @@ def load_test_time_models(
     for model_path in pt_files:
         model_path = str(model_path)
         model = model_loader.load_model_from_config(model_path, mist_config)
-        models.append(model.to(device).eval())
+        model = model.to(device).eval()
+        # Reuse the compile cache of the training run next to the models.
+        models.append(
+            model_loader.compile_model(
+                model, mist_config, cache_dir=models_path.parent / "compile_cache"
+            )
+        )
     return models
 
 
@@ -1,7 +1,9 @@
 """Unified interface for validating, building, and loading MIST models."""
 
+import os
 import warnings
 from collections import OrderedDict
+from pathlib import Path
 
 import torch
 
@@ -297,3 +299,78 @@ def load_model_from_config(
 
     model.load_state_dict(state_dict)
     return model
+
+
+def compile_model(
+    model: torch.nn.Module,
+    config: dict,
+    cache_dir: str | Path | None = None,
+) -> torch.nn.Module:
+    """Compile a model in place with torch.compile if the config enables it.
+
+    Settings are read from config["training"]["compile"]: enabled (default
+    False), mode, backend, dynamic, and cache_dir. The model is compiled with
+    nn.Module.compile, so its class and state dict keys do not change and
+    checkpoints load with or without compilation.
+
+    Compiled kernels are cached on disk in cache_dir, so later folds and
+    inference runs with the same model reuse them instead of compiling again.
+    The cache directory is set with the TORCHINDUCTOR_CACHE_DIR environment
+    variable, which applies to the whole process. A value the user set is
+    kept unless the config sets a cache_dir.
+
+    With dynamic unset, a model called with a new input shape, such as the
+    last, smaller batch of sliding window patches, is compiled once more with
+    that dimension marked dynamic. Compilation runs on the first call of the
+    model. If it fails there, PyTorch logs a warning and the model runs
+    without it; torch._dynamo.config.suppress_errors is set only during calls
+    of this model, so other compiled code still raises.
+
+    Args:
+        model: Model to compile. DDP models are compiled as a whole.
+        config: MIST configuration dictionary.
+        cache_dir: Directory for the compile cache, unless the config or the
+            TORCHINDUCTOR_CACHE_DIR environment variable sets one. If None,
+            PyTorch's default cache directory is used.
+
+    Returns:
+        The same model.
+    """
+    settings = config.get("training", {}).get("compile") or {}
+    if not settings.get("enabled", False):
+        return model
+    if not torch._dynamo.is_dynamo_supported():
+        warnings.warn(
+            "torch.compile is not supported on this platform; running the model "
+            "without compiling it.",
+            stacklevel=2,
+        )
+        return model
+
+    if settings.get("cache_dir") or "TORCHINDUCTOR_CACHE_DIR" not in os.environ:
+        cache_dir = settings.get("cache_dir") or cache_dir
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(Path(cache_dir).resolve())
+
+    # torch.compile checks its arguments, such as the backend name, right
+    # away. Errors while compiling come later, on the first call.
+    try:
+        model.compile(
+            mode=settings.get("mode"),
+            backend=settings.get("backend", "inductor"),
+            dynamic=settings.get("dynamic"),
+        )
+    except Exception as e:
+        warnings.warn(
+            f"Could not compile the model ({e}); running it without compiling it.",
+            stacklevel=2,
+        )
+        return model
+
+    # Run the parts of the model that fail to compile without compiling them
+    # instead of raising on the first call.
+    model._compiled_call_impl = torch._dynamo.config.patch(suppress_errors=True)(
+        model._compiled_call_impl
+    )
+    return model
@@ -0,0 +1,122 @@
+"""Manifest of preprocessed patients for resumable preprocessing.
+
+preprocess_dataset records each patient it saves in numpy/manifest.json
+together with a digest of everything that determines the saved arrays:
+
+  - A fingerprint (path, size, and modification time) of each input file.
+  - The preprocessing-relevant part of the configuration: labels, image
+    columns, modality, target spacing, and the preprocessing section, which
+    includes cropping, normalization, DTM, and storage format settings.
+  - The patient's foreground bounding box and whether DTMs are saved.
+
+A rerun skips patients whose digest is unchanged and whose files are all
+present, reprocesses the others, and removes the files of patients that are
+no longer in the dataset. The manifest is rewritten after every patient, so
+an interrupted run resumes where it stopped.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from mist.preprocessing import storage
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
+from mist.utils import io
+
+
+def file_fingerprint(path: str | Path) -> list[Any]:
+    """Return the path, size, and modification time of a file.
+
+    Missing files have a size and modification time of None, so they still
+    produce a fingerprint that changes when the file appears.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [str(path), None, None]
+    return [str(path), stat.st_size, stat.st_mtime_ns]
+
+
+def config_subset(config: dict[str, Any]) -> dict[str, Any]:
+    """Return the part of the configuration that determines the saved arrays."""
+    return {
+        "labels": config["dataset_info"]["labels"],
+        "images": config["dataset_info"]["images"],
+        "modality": config["dataset_info"].get("modality"),
+        "target_spacing": config["spatial_config"]["target_spacing"],
+        "preprocessing": config["preprocessing"],
+    }
+
+
+def patient_digest(
+    input_paths: list[str],
+    settings: dict[str, Any],
+    fg_bbox: dict[str, int] | None,
+    compute_dtms: bool,
+) -> str:
+    """Return a digest of everything that determines a patient's outputs.
+
+    Args:
+        input_paths: Paths to the patient's images and mask.
+        settings: Output of config_subset.
+        fg_bbox: Foreground bounding box used for cropping, or None.
+        compute_dtms: Whether DTMs are saved.
+
+    Returns:
+        SHA-256 hex digest.
+    """
+    payload = {
+        "version": pc.MANIFEST_VERSION,
+        "inputs": [file_fingerprint(path) for path in input_paths],
+        "settings": settings,
+        "fg_bbox": {key: int(value) for key, value in fg_bbox.items()} if fg_bbox else None,
+        "compute_dtms": bool(compute_dtms),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def read_manifest(numpy_dir: str | Path) -> dict[str, Any]:
+    """Read the manifest, or return an empty one if there is none.
+
+    Manifests written by an incompatible version are treated as empty, so
+    every patient is preprocessed again.
+    """
+    path = Path(numpy_dir) / pc.MANIFEST_FILENAME
+    empty = {"version": pc.MANIFEST_VERSION, "patients": {}}
+    if not path.is_file():
+        return empty
+    try:
+        manifest = io.read_json_file(path)
+    except (OSError, ValueError):
+        return empty
+    if manifest.get("version") != pc.MANIFEST_VERSION:
+        return empty
+    return manifest
+
+
+def write_manifest(numpy_dir: str | Path, manifest: dict[str, Any]) -> None:
+    """Write the manifest atomically."""
+    storage.save_json(Path(numpy_dir) / pc.MANIFEST_FILENAME, manifest)
+
+
+def is_up_to_date(numpy_dir: str | Path, entry: dict[str, Any] | None, digest: str) -> bool:
+    """Whether a manifest entry matches a digest and all its files exist."""
+    if entry is None or entry.get("digest") != digest:
+        return False
+    return all((Path(numpy_dir) / name).is_file() for name in entry.get("files", []))
+
+
+def remove_files(numpy_dir: str | Path, files: list[str]) -> None:
+    """Remove files, given relative to the numpy directory, if they exist."""
+    for name in files:
+        (Path(numpy_dir) / name).unlink(missing_ok=True)
+
+
+def remove_temporary_files(numpy_dir: str | Path) -> None:
+    """Remove temporary files left behind by an interrupted run."""
+    for pattern in (f"*{pc.TEMPORARY_FILE_SUFFIX}", f"*/*{pc.TEMPORARY_FILE_SUFFIX}"):
+        for path in Path(numpy_dir).glob(pattern):
+            path.unlink(missing_ok=True)
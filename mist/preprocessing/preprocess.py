@@ -2,6 +2,7 @@
 
 import argparse
 import concurrent.futures
+from collections.abc import Iterator
 from pathlib import Path
 from typing import Any
 
@@ -10,39 +11,51 @@ import numpy as np
 import numpy.typing as npt
 import pandas as pd
 import SimpleITK as sitk
+from scipy import ndimage
 
 from mist.analyze_data import analyzer_utils
-from mist.preprocessing import preprocessing_utils
+from mist.preprocessing import manifest, preprocessing_utils, profiling, scheduler, storage
 from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
 
 # MIST imports.
 from mist.utils import io, progress_bar
-from mist.utils.console import print_section_header, print_success, print_warning
+from mist.utils.console import (
+    print_info,
+    print_section_header,
+    print_success,
+    print_warning,
+)
 
 
-def resample_image(
-    img_ants: ants.core.ants_image.ANTsImage,
+def _array_view(img_sitk: sitk.Image) -> npt.NDArray[Any]:
+    """Return the voxels of a SimpleITK image as a read-only (x, y, z) view.
+
+    The view shares the image buffer, so no copy is made, and is only valid
+    while the caller holds a reference to the image. Its memory layout
+    matches ANTsImage.numpy(), so reductions over it give identical results.
+    """
+    return sitk.GetArrayViewFromImage(img_sitk).T
+
+
+def resample_image_sitk(
+    img_sitk: sitk.Image,
     target_spacing: tuple[float, float, float],
     new_size: tuple[int, int, int] | None = None,
-) -> ants.core.ants_image.ANTsImage:
-    """Resample an image to a target spacing.
+) -> sitk.Image:
+    """Resample a SimpleITK image to a target spacing.
 
     Args:
-        img_ants: Image as ANTs image.
+        img_sitk: Image as SimpleITK image.
         target_spacing: Target spacing as a tuple.
         new_size: New size of the image as a tuple or None.
 
     Returns:
-        Resampled image as ANTs image.
+        Resampled image as SimpleITK image.
 
     Raises:
         ValueError: If the low resolution axis is not an integer when
             resampling an anisotropic image.
     """
-    # Convert ants image to sitk image. We do this because the resampling
-    # function in SimpleITK is more robust and faster than the one in ANTs.
-    img_sitk = preprocessing_utils.ants_to_sitk(img_ants)
-
     # Get new size if not provided. This is done to ensure that the image
     # is resampled to the correct dimensions.
     if new_size is None:
@@ -67,7 +80,7 @@ def resample_image(
         )
 
     # Resample the image to the target spacing using B-spline interpolation.
-    img_sitk = sitk.Resample(
+    return sitk.Resample(
         img_sitk,
         size=np.array(new_size).tolist(),
         transform=sitk.Transform(),
@@ -79,106 +92,338 @@ def resample_image(
         outputPixelType=img_sitk.GetPixelID(),
     )
 
+
+def resample_image(
+    img_ants: ants.core.ants_image.ANTsImage,
+    target_spacing: tuple[float, float, float],
+    new_size: tuple[int, int, int] | None = None,
+) -> ants.core.ants_image.ANTsImage:
+    """Resample an image to a target spacing.
+
+    Args:
+        img_ants: Image as ANTs image.
+        target_spacing: Target spacing as a tuple.
+        new_size: New size of the image as a tuple or None.
+
+    Returns:
+        Resampled image as ANTs image.
+
+    Raises:
+        ValueError: If the low resolution axis is not an integer when
+            resampling an anisotropic image.
+    """
+    # Convert ants image to sitk image. We do this because the resampling
+    # function in SimpleITK is more robust and faster than the one in ANTs.
+    img_sitk = preprocessing_utils.ants_to_sitk(img_ants)
+    img_sitk = resample_image_sitk(img_sitk, target_spacing, new_size)
+
     # Convert the resampled image back to ANTs image.
     return preprocessing_utils.sitk_to_ants(img_sitk)
 
 
-def resample_mask(
-    mask_ants: ants.core.ants_image.ANTsImage,
+def _label_bounding_boxes(
+    mask_npy: npt.NDArray[Any], labels: list[int]
+) -> list[tuple[slice, ...] | None]:
+    """Find the index bounding box of each label in one pass over a mask.
+
+    Args:
+        mask_npy: Mask as a numpy array.
+        labels: List of labels in the dataset.
+
+    Returns:
+        One tuple of slices per label, or None for labels that are not in
+        the mask. Labels that are not positive get the whole mask.
+    """
+    whole = tuple(slice(0, size) for size in mask_npy.shape)
+    positive = [int(label) for label in labels if label > 0]
+    if not positive:
+        return [whole] * len(labels)
+
+    if not np.issubdtype(mask_npy.dtype, np.integer):
+        mask_npy = mask_npy.astype(np.int32)
+    boxes = ndimage.find_objects(mask_npy, max_label=max(positive))
+    return [boxes[int(label) - 1] if label > 0 else whole for label in labels]
+
+
+def _target_range(start: int, stop: int, ratio: float, size: int, margin: int) -> tuple[int, int]:
+    """Target grid indices that can interpolate from source indices [start, stop).
+
+    Source index i lies at target index i * ratio on grids that share their
+    origin, and interpolation reaches at most one voxel beyond the source
+    range.
+    """
+    lo = int(np.floor((start - 1) * ratio)) - margin
+    hi = int(np.ceil(stop * ratio)) + margin + 1
+    return max(0, lo), min(size, hi)
+
+
+def _source_range(start: int, stop: int, ratio: float, size: int, margin: int) -> tuple[int, int]:
+    """Source grid indices that target indices [start, stop) interpolate from."""
+    lo = int(np.floor(start / ratio)) - margin - 1
+    hi = int(np.ceil((stop - 1) / ratio)) + margin + 2
+    return max(0, lo), min(size, hi)
+
+
+def _resample_region(
+    img_sitk: sitk.Image,
+    grid_origin: tuple[float, ...],
+    grid_spacing: list[float],
+    start: list[int],
+    stop: list[int],
+    interpolator: int,
+) -> sitk.Image:
+    """Resample an image onto the [start, stop) index region of a grid.
+
+    The grid has the direction of img_sitk and the given origin and spacing.
+    With start at zero this is a plain resample onto the grid.
+    """
+    origin = grid_origin
+    if any(start):
+        direction = np.reshape(img_sitk.GetDirection(), (3, 3))
+        offset = direction @ (np.asarray(grid_spacing) * np.asarray(start))
+        origin = (np.asarray(grid_origin) + offset).tolist()
+    return sitk.Resample(
+        img_sitk,
+        size=[stop_i - start_i for start_i, stop_i in zip(start, stop, strict=True)],
+        transform=sitk.Transform(),
+        interpolator=interpolator,
+        outputOrigin=origin,
+        outputSpacing=grid_spacing,
+        outputDirection=img_sitk.GetDirection(),
+        defaultPixelValue=0,
+        outputPixelType=img_sitk.GetPixelID(),
+    )
+
+
+def resample_mask_sitk(
+    mask_sitk: sitk.Image,
     labels: list[int],
     target_spacing: tuple[float, float, float],
     new_size: tuple[int, int, int] | None = None,
-) -> ants.core.ants_image.ANTsImage:
-    """Resample a mask to a target spacing.
+    crop_to_labels: bool = True,
+) -> sitk.Image:
+    """Resample a SimpleITK mask to a target spacing.
+
+    Each label is resampled on its own with linear interpolation and the
+    labels are joined by taking the argmax over them. The argmax is updated
+    as each label is resampled, so only one resampled label image is alive
+    at a time.
+
+    With crop_to_labels, each label is only resampled inside its bounding
+    box, padded so that every output voxel that interpolates from the label
+    is covered. Outside this box the resampled label is zero and cannot
+    change the argmax, so the result is the same as resampling the whole
+    mask for every label, at a cost that grows with the size of the labels
+    rather than the size of the mask.
 
     Args:
-        mask_ants: Mask as ANTs image.
+        mask_sitk: Mask as SimpleITK image.
         labels: List of labels in the dataset.
         target_spacing: Target spacing as a tuple.
         new_size: New size of the mask as a tuple or None.
+        crop_to_labels: Whether to resample each label only inside its
+            bounding box.
 
     Returns:
-        Resampled mask as ANTs image.
+        Resampled mask as SimpleITK image. Voxel values are indices into
+        labels.
 
     Raises:
         ValueError: If the low resolution axis is not an integer when
             resampling an anisotropic mask.
     """
-    # Get mask as a series of onehot encoded series of sitk images.
-    masks_sitk = preprocessing_utils.make_onehot(mask_ants, labels)
     if new_size is None:
         new_size = analyzer_utils.get_resampled_image_dimensions(
-            masks_sitk[0].GetSize(), masks_sitk[0].GetSpacing(), target_spacing
+            mask_sitk.GetSize(), mask_sitk.GetSpacing(), target_spacing
         )
+    new_size = [int(n) for n in new_size]
 
-    # Check if the mask is anisotropic. Only do this for the first mask.
-    anisotropic_results = preprocessing_utils.check_anisotropic(masks_sitk[0])
+    # Check if the mask is anisotropic.
+    anisotropic_results = preprocessing_utils.check_anisotropic(mask_sitk)
+    low_res_axis = anisotropic_results["low_resolution_axis"]
+    if anisotropic_results["is_anisotropic"] and not isinstance(low_res_axis, int):
+        raise ValueError("The low resolution axis must be an integer.")
 
-    # Resample each mask in the series. If the mask is anisotropic, we
-    # need to use an intermediate resampling step to avoid artifacts. This
-    # step uses nearest neighbor interpolation to resample the mask to its
-    # new size along the low resolution axis.
-    for i in range(len(labels)):
+    # If the mask is anisotropic, we need to use an intermediate resampling
+    # step to avoid artifacts. This step uses nearest neighbor interpolation
+    # to resample the mask to its new size along the low resolution axis.
+    size = list(mask_sitk.GetSize())
+    spacing = mask_sitk.GetSpacing()
+    origin = mask_sitk.GetOrigin()
+    intermediate_size = list(size)
+    intermediate_spacing = list(spacing)
+    if anisotropic_results["is_anisotropic"]:
+        intermediate_size[low_res_axis] = new_size[low_res_axis]
+        intermediate_spacing[low_res_axis] = target_spacing[low_res_axis]
+
+    if crop_to_labels:
+        boxes = _label_bounding_boxes(_array_view(mask_sitk), labels)
+    else:
+        boxes = [tuple(slice(0, n) for n in size)] * len(labels)
+
+    margin = pc.MASK_RESAMPLE_BBOX_MARGIN
+    best_values = np.zeros(new_size[::-1], dtype=np.float32)
+    best_index = np.zeros(new_size[::-1], dtype=np.min_scalar_type(len(labels) - 1))
+    for i, (label, box) in enumerate(zip(labels, boxes, strict=True)):
+        # A label that is not in the mask resamples to zero everywhere.
+        if box is None:
+            continue
+
+        # Find the output region that can see the label and the mask region
+        # that it is interpolated from. The grids share their origin, and
+        # the intermediate grid matches the mask grid on every cropped axis.
+        output_region, mask_region = [], []
+        for axis, axis_slice in enumerate(box):
+            ratio = spacing[axis] / target_spacing[axis]
+            output_range = _target_range(
+                axis_slice.start, axis_slice.stop, ratio, new_size[axis], margin
+            )
+            mask_range = _source_range(*output_range, ratio, size[axis], margin)
+
+            # Voxels on the edge of the mask, and nearest neighbor ties on the
+            # low resolution axis, fall either way depending on rounding,
+            # which a shifted origin would change. Keep the whole axis there.
+            if mask_range[0] == 0 or mask_range[1] == size[axis] or axis == low_res_axis:
+                output_range = (0, new_size[axis])
+                mask_range = (0, size[axis])
+            output_region.append(output_range)
+            mask_region.append(mask_range)
+
+        cropped = mask_sitk
+        if mask_region != [(0, n) for n in size]:
+            cropped = mask_sitk[tuple(slice(*bounds) for bounds in mask_region)]
+        onehot = sitk.Cast(cropped == label, sitk.sitkFloat32)
         if anisotropic_results["is_anisotropic"]:
-            if not isinstance(anisotropic_results["low_resolution_axis"], int):
-                raise ValueError("The low resolution axis must be an integer.")
-            masks_sitk[i] = preprocessing_utils.aniso_intermediate_resample(
-                masks_sitk[i],
-                new_size,
-                target_spacing,
-                anisotropic_results["low_resolution_axis"],
+            intermediate_region = list(mask_region)
+            intermediate_region[low_res_axis] = (0, intermediate_size[low_res_axis])
+            onehot = _resample_region(
+                onehot,
+                origin,
+                intermediate_spacing,
+                *zip(*intermediate_region, strict=True),
+                sitk.sitkNearestNeighbor,
             )
 
-        # Use linear interpolation for each mask in the series. We use
-        # linear interpolation to avoid artifacts in the mask.
-        masks_sitk[i] = sitk.Resample(
-            masks_sitk[i],
-            size=np.array(new_size).tolist(),
-            transform=sitk.Transform(),
-            interpolator=sitk.sitkLinear,
-            outputOrigin=masks_sitk[i].GetOrigin(),
-            outputSpacing=target_spacing,
-            outputDirection=masks_sitk[i].GetDirection(),
-            defaultPixelValue=0,
-            outputPixelType=masks_sitk[i].GetPixelID(),
+        # Use linear interpolation for each label. We use linear
+        # interpolation to avoid artifacts in the mask.
+        onehot = _resample_region(
+            onehot,
+            origin,
+            list(target_spacing),
+            *zip(*output_region, strict=True),
+            sitk.sitkLinear,
         )
 
-    # Use the argmax function to join the masks into a single mask.
-    mask = preprocessing_utils.sitk_to_ants(sitk.JoinSeries(masks_sitk))
-    mask = mask.numpy()
-    mask = np.argmax(mask, axis=-1)
+        # Keep the running argmax. A strict comparison keeps the first label
+        # on ties, like np.argmax, and zeros never replace the first label.
+        region = tuple(slice(*bounds) for bounds in output_region[::-1])
+        values = sitk.GetArrayViewFromImage(onehot)
+        region_values = best_values[region]
+        update = values > region_values
+        region_values[update] = values[update]
+        best_index[region][update] = i
+
+    mask = sitk.GetImageFromArray(best_index)
+    mask.SetOrigin(origin)
+    mask.SetSpacing(target_spacing)
+    mask.SetDirection(mask_sitk.GetDirection())
+    return mask
+
+
+def resample_mask(
+    mask_ants: ants.core.ants_image.ANTsImage,
+    labels: list[int],
+    target_spacing: tuple[float, float, float],
+    new_size: tuple[int, int, int] | None = None,
+    crop_to_labels: bool = True,
+) -> ants.core.ants_image.ANTsImage:
+    """Resample a mask to a target spacing.
+
+    Args:
+        mask_ants: Mask as ANTs image.
+        labels: List of labels in the dataset.
+        target_spacing: Target spacing as a tuple.
+        new_size: New size of the mask as a tuple or None.
+        crop_to_labels: Whether to resample each label only inside its
+            bounding box. See resample_mask_sitk.
+
+    Returns:
+        Resampled mask as ANTs image.
+
+    Raises:
+        ValueError: If the low resolution axis is not an integer when
+            resampling an anisotropic mask.
+    """
+    mask_sitk = resample_mask_sitk(
+        preprocessing_utils.ants_to_sitk(mask_ants),
+        labels,
+        target_spacing,
+        new_size,
+        crop_to_labels,
+    )
 
     # Set the target spacing, origin, and direction for the mask.
-    mask = ants.from_numpy(data=mask.astype(np.float32))
+    mask = ants.from_numpy(data=_array_view(mask_sitk).astype(np.float32))
     mask.set_spacing(target_spacing)
     mask.set_origin(mask_ants.origin)
     mask.set_direction(mask_ants.direction)
     return mask
 
 
+def _mean_and_std(values: npt.NDArray[Any]) -> tuple[float, float]:
+    """Mean and standard deviation of an array in one chunked pass.
+
+    Chunk statistics are accumulated in float64 and merged with Chan's
+    parallel update, so temporary memory is bounded by the chunk size.
+    """
+    values = values.ravel(order="K")
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for start in range(0, values.size, pc.NORMALIZATION_CHUNK_VOXELS):
+        chunk = values[start : start + pc.NORMALIZATION_CHUNK_VOXELS]
+        chunk_mean = float(np.mean(chunk, dtype=np.float64))
+        chunk_m2 = float(np.sum(np.square(chunk - chunk_mean, dtype=np.float64)))
+        total = count + chunk.size
+        delta = chunk_mean - mean
+        mean += delta * chunk.size / total
+        m2 += chunk_m2 + delta * delta * count * chunk.size / total
+        count = total
+    return mean, float(np.sqrt(m2 / count)) if count else 0.0
+
+
 def window_and_normalize(
     image: npt.NDArray[Any],
     config: dict[str, Any],
+    out: npt.NDArray[Any] | None = None,
 ) -> npt.NDArray[Any]:
     """Window and normalize an image.
 
+    The window and statistics are computed in one pass each, and clipping,
+    z-scoring, and masking are applied in place in the output array.
+
     Args:
         image: Image as a numpy array.
         config: Dictionary with information from the MIST configuration file
             (config.json). This file contains information about the modality,
             window range, and normalization parameters.
+        out: Optional float32 array with the shape of image to write the
+            result into, e.g., a channel of a preallocated image array.
 
     Returns:
-        Normalized image as a numpy array.
+        Normalized image as a float32 numpy array (out, if given).
     """
+    if out is None:
+        out = np.empty(image.shape, dtype=np.float32)
+
     # Get the nonzero values in the image if necessary. In the case that the
     # images in a dataset are sparse enough, we may want to only normalize
     # the nonzero values. Additionally, we will only use the nonzero values
     # to compute the mean and standard deviation if not already given as
     # global parameters (i.e, for CT images).
-    if config["preprocessing"]["normalize_with_nonzero_mask"]:
-        nonzero_mask = (image != 0).astype(np.float32)
-        nonzeros = image[nonzero_mask != 0]
+    use_nonzero_mask = config["preprocessing"]["normalize_with_nonzero_mask"]
+    if use_nonzero_mask:
+        nonzero_mask = image != 0
 
     # Normalize the image based on the modality.
     # For CT images, we use precomputed window ranges and normalization
@@ -193,40 +438,146 @@ def window_and_normalize(
         std = config["preprocessing"]["ct_normalization"]["z_score_std"]
     else:
         # For all other modalities, we clip with the 0.5 and 99.5 percentiles
-        # values of either the entire image or the nonzero values.
-        if config["preprocessing"]["normalize_with_nonzero_mask"] and len(nonzeros) > 0:
-            # Compute the window range based on the 0.5 and 99.5 percentiles
-            # of the nonzero values.
-            lower = np.percentile(nonzeros, pc.WINDOW_PERCENTILE_LOW)
-            upper = np.percentile(nonzeros, pc.WINDOW_PERCENTILE_HIGH)
-
-            # Compute the mean and standard deviation of the nonzero values.
-            mean = np.mean(nonzeros)
-            std = np.std(nonzeros)
+        # values of either the nonzero values or the entire image. Both
+        # percentiles come from a single selection. The nonzero values are a
+        # copy, so the selection may reorder them in place.
+        nonzeros = image[nonzero_mask] if use_nonzero_mask else None
+        if nonzeros is not None and nonzeros.size > 0:
+            values, owned = nonzeros, True
         else:
-            # Window image based on the 0.5 and 99.5 percentiles of the entire
-            # image.
-            lower = np.percentile(image, pc.WINDOW_PERCENTILE_LOW)
-            upper = np.percentile(image, pc.WINDOW_PERCENTILE_HIGH)
-
-            # Get mean and standard deviation of the entire image.
-            mean = np.mean(image)
-            std = np.std(image)
-
-    # Window the image based on the lower and upper values.
-    image = np.clip(image, lower, upper)
+            values, owned = image, False
+        mean, std = _mean_and_std(values)
+        lower, upper = np.percentile(
+            values.ravel(order="K"),
+            [pc.WINDOW_PERCENTILE_LOW, pc.WINDOW_PERCENTILE_HIGH],
+            overwrite_input=owned,
+        )
+        del nonzeros, values
 
-    # Normalize the image based on the mean and standard deviation.
     # Guard against std=0 (e.g. constant or all-zero images).
     if std == 0:
-        return np.zeros_like(image, dtype=np.float32)
-    image = (image - mean) / std
+        out[...] = 0
+        return out
+
+    # Window the image based on the lower and upper values, then normalize
+    # based on the mean and standard deviation, all in place.
+    np.clip(image, float(lower), float(upper), out=out)
+    out -= float(mean)
+    out /= float(std)
 
     # Apply nonzero mask if necessary.
-    if config["preprocessing"]["normalize_with_nonzero_mask"]:
-        image *= nonzero_mask
+    if use_nonzero_mask:
+        np.multiply(out, nonzero_mask, out=out)
+
+    return out
+
+
+def _bounding_box_distance(box: tuple[slice, ...], shape: tuple[int, ...]) -> npt.NDArray[Any]:
+    """Euclidean distance in voxels from every voxel to a bounding box."""
+    gaps = []
+    for axis, (axis_slice, n) in enumerate(zip(box, shape, strict=True)):
+        index = np.arange(n, dtype=np.float32)
+        gap = np.maximum(np.maximum(axis_slice.start - index, index - (axis_slice.stop - 1)), 0)
+        gaps.append(np.expand_dims(gap**2, [a for a in range(len(shape)) if a != axis]))
+    return np.sqrt(gaps[0] + gaps[1] + gaps[2])
+
+
+def _compute_label_dtm(
+    mask_sitk: sitk.Image,
+    label: int,
+    box: tuple[slice, ...] | None,
+    band: int | None,
+    normalize_dtm: bool,
+    out: npt.NDArray[Any],
+) -> None:
+    """Compute the DTM of one label into out, an (x, y, z) float32 view."""
+    whole = tuple(slice(0, n) for n in out.shape)
+    region = whole
+    if box is not None and band is not None:
+        region = tuple(
+            slice(max(0, s.start - band), min(n, s.stop + band))
+            for s, n in zip(box, out.shape, strict=True)
+        )
+
+    mask = mask_sitk == label if region == whole else mask_sitk[region] == label
+    if box is None or preprocessing_utils.sitk_get_sum(mask) == 0:
+        # Handle the case of an empty mask.
+        if normalize_dtm:
+            out[...] = 1.0
+        else:
+            out[...] = np.sqrt(sum(n**2 for n in out.shape))
+        return
+
+    # The nearest label voxel of any voxel in the region lies in the label's
+    # bounding box, so distances inside the region are exact. Outside it,
+    # the distance to the bounding box is a lower bound that is exact for
+    # box-shaped labels and close for compact ones.
+    if region != whole:
+        out[...] = _bounding_box_distance(box, out.shape)
+    dtm_i = sitk.SignedMaurerDistanceMap(mask, squaredDistance=False, useImageSpacing=False)
+    out[region] = _array_view(dtm_i)
+    del dtm_i
+
+    # Normalize the interior (negative) and exterior (positive) parts in
+    # place. Interior voxels are all inside the region.
+    if normalize_dtm:
+        inner = out[region]
+        int_min = min(float(inner.min()), 0.0)
+        ext_max = max(float(out.max()), 0.0)
+
+        # Safeguard against division by zero. If ext_max is zero, then there
+        # are no positive distances. Similarly, if int_min is zero, then
+        # there are no negative distances.
+        if ext_max > 0:
+            np.divide(out, np.float32(ext_max), out=out, where=out > 0)
+        if int_min < 0:
+            np.divide(inner, np.float32(-int_min), out=inner, where=inner < 0)
+
+
+def compute_dtm_sitk(
+    mask_sitk: sitk.Image,
+    labels: list[int],
+    normalize_dtm: bool,
+    band: int | None = None,
+    num_threads: int = 1,
+) -> npt.NDArray[Any]:
+    """Compute distance transform map (DTM) for a SimpleITK mask.
+
+    Labels are independent, so their DTMs are computed concurrently in a
+    thread pool. SimpleITK filters release the GIL while they run.
+
+    With a band, the exact signed distance of each label is only computed
+    within band voxels of the label's bounding box. Further away, the DTM is
+    the distance to the bounding box, which is cheap to compute and does
+    not need a distance transform over the whole volume.
+
+    Args:
+        mask_sitk: Mask as SimpleITK image.
+        labels: List of labels in the dataset.
+        normalize_dtm: Normalize the output DTM to be between -1 and 1.
+        band: Width in voxels of the exact region around each label's
+            bounding box, or None to compute exact distances everywhere.
+        num_threads: Number of labels to process at the same time.
 
-    return image.astype(np.float32)
+    Returns:
+        dtm: DTM for each label in mask as a 4D float32 numpy array. Each
+            label's DTM is written into the output as soon as it is
+            computed.
+    """
+    width, height, depth = mask_sitk.GetSize()
+    dtm = np.empty((width, height, depth, len(labels)), dtype=np.float32, order="F")
+    boxes = _label_bounding_boxes(_array_view(mask_sitk), labels)
+
+    def _compute(i: int) -> None:
+        _compute_label_dtm(mask_sitk, labels[i], boxes[i], band, normalize_dtm, dtm[..., i])
+
+    if num_threads == 1:
+        for i in range(len(labels)):
+            _compute(i)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(_compute, range(len(labels))))
+    return dtm
 
 
 def compute_dtm(
@@ -244,73 +595,75 @@ def compute_dtm(
     Returns:
         dtm: DTM for each label in mask as a 4D numpy array.
     """
-    # Initialize the list of distance transform maps.
-    dtms_sitk = []
-
-    # Get the one-hot encoded masks as a list of SimpleITK images.
-    masks_sitk = preprocessing_utils.make_onehot(mask_ants, labels)
-
-    for mask in masks_sitk:
-        # Start with case that the mask for the label is non-empty.
-        if preprocessing_utils.sitk_get_sum(mask) != 0:
-            # Compute the DTM for the current mask.
-            dtm_i = sitk.SignedMaurerDistanceMap(
-                sitk.Cast(mask, sitk.sitkUInt8),
-                squaredDistance=False,
-                useImageSpacing=False,
-            )
+    return compute_dtm_sitk(preprocessing_utils.ants_to_sitk(mask_ants), labels, normalize_dtm)
+
+
+def _read_image(path: str) -> sitk.Image:
+    """Read an image as float32, the pixel type ants.image_read uses."""
+    return sitk.ReadImage(str(path), sitk.sitkFloat32)
 
-            # Normalize the DTM if necessary.
-            if normalize_dtm:
-                # Separate the negative (interior) and positive (exterior)
-                # parts.
-                dtm_int = sitk.Cast((dtm_i < 0), sitk.sitkFloat32)
-                dtm_int *= dtm_i
-                int_min, _ = preprocessing_utils.sitk_get_min_max(dtm_int)
-
-                dtm_ext = sitk.Cast((dtm_i > 0), sitk.sitkFloat32)
-                dtm_ext *= dtm_i
-                _, ext_max = preprocessing_utils.sitk_get_min_max(dtm_ext)
-
-                # Safeguard against division by zero.
-                # If ext_max is zero, then there are no positive distances.
-                # Similarly, if int_min is zero, then there are no negative
-                # distances.
-                if ext_max == 0:
-                    # Avoid division by zero; this effectively leaves dtm_ext
-                    # unchanged.
-                    ext_max = 1
-                if int_min == 0:
-                    # Avoid division by zero; this effectively leaves dtm_int
-                    # unchanged.
-                    int_min = -1
-
-                dtm_i = (dtm_ext / ext_max) - (dtm_int / int_min)
+
+def _read_images(paths: list[str]) -> list[sitk.Image]:
+    """Read the channels of an example at the same time.
+
+    Reading is mostly gzip decompression, which SimpleITK runs without
+    holding the GIL, so one thread per channel overlaps the reads.
+    """
+    if len(paths) == 1:
+        return [_read_image(paths[0])]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        return list(executor.map(_read_image, paths))
+
+
+def _stack_channels(images: list[sitk.Image]) -> list[sitk.Image]:
+    """Stack channels with identical geometry into one vector image.
+
+    Cropping, reorienting, and resampling a vector image applies the same
+    operations to every component in a single pass, with the same result as
+    applying them to each channel. Channels whose size, spacing, origin, or
+    direction differ are returned as they are.
+    """
+    first = images[0]
+    geometry = (first.GetSize(), first.GetSpacing(), first.GetOrigin(), first.GetDirection())
+    if len(images) == 1 or any(
+        (img.GetSize(), img.GetSpacing(), img.GetOrigin(), img.GetDirection()) != geometry
+        for img in images[1:]
+    ):
+        return images
+    return [sitk.Compose(images)]
+
+
+def _iter_channels(images: list[sitk.Image]) -> Iterator[sitk.Image]:
+    """Yield every channel of a list of scalar and vector images.
+
+    Components of vector images are extracted one at a time into contiguous
+    scalar images, which normalize faster than strided views of the
+    interleaved vector buffer.
+    """
+    for img_sitk in images:
+        if img_sitk.GetNumberOfComponentsPerPixel() == 1:
+            yield img_sitk
         else:
-            # Handle the case of an empty mask.
-            mask_depth = mask.GetDepth()
-            mask_width = mask.GetWidth()
-            mask_height = mask.GetHeight()
-            all_ones_mask = np.ones((mask_depth, mask_height, mask_width))
-            if normalize_dtm:
-                dtm_i = sitk.GetImageFromArray(all_ones_mask)
-            else:
-                diagonal_distance = np.sqrt(mask_depth**2 + mask_width**2 + mask_height**2)
-                dtm_i = sitk.GetImageFromArray(diagonal_distance * all_ones_mask)
+            for component in range(img_sitk.GetNumberOfComponentsPerPixel()):
+                yield sitk.VectorIndexSelectionCast(img_sitk, component)
 
-        # Set the pixel type and spacing for the DTM.
-        dtm_i = sitk.Cast(dtm_i, sitk.sitkFloat32)
-        dtm_i.SetSpacing(mask.GetSpacing())
-        dtm_i.SetOrigin(mask.GetOrigin())
-        dtm_i.SetDirection(mask.GetDirection())
 
-        # Append the current DTM to the final list.
-        dtms_sitk.append(dtm_i)
+def _to_standard_space(img_sitk: sitk.Image, fg_bbox: dict | None, crop: bool) -> sitk.Image:
+    """Crop an image to the foreground (if requested) and reorient it to RAI."""
+    if crop:
+        if fg_bbox is None:
+            raise ValueError(
+                "Foreground bounding box is required for cropping, but none was provided."
+            )
+        img_sitk = preprocessing_utils.crop_to_fg_sitk(img_sitk, fg_bbox)
 
-    # Join the DTMs into a single 4D image and return as a numpy array.
-    dtm = preprocessing_utils.sitk_to_ants(sitk.JoinSeries(dtms_sitk))
-    dtm = dtm.numpy()
-    return dtm
+    # Reorienting permutes and flips axes, so skip it when there is nothing
+    # to do.
+    rai_direction = tuple(float(d) for d in np.ravel(pc.RAI_ANTS_DIRECTION))
+    if not np.allclose(img_sitk.GetDirection(), rai_direction):
+        img_sitk = sitk.DICOMOrient(img_sitk, pc.RAI_SITK_ORIENTATION)
+        img_sitk.SetDirection(rai_direction)
+    return img_sitk
 
 
 def preprocess_example(
@@ -318,6 +671,8 @@ def preprocess_example(
     image_paths_list: list[str],
     mask_path: str | None = None,
     fg_bbox: dict | None = None,
+    dtm_threads: int = 1,
+    timer: profiling.StageTimer | None = None,
 ) -> dict:
     """Preprocessing function for a single example.
 
@@ -338,12 +693,22 @@ def preprocess_example(
     inference (mask_path=None). In inference mode mask and dtm are always
     None in the returned dict.
 
+    Each volume is read once into a SimpleITK image and stays in that
+    representation through every step. The channels are read at the same
+    time and, when they share their geometry, are cropped, reoriented, and
+    resampled together as one vector image. Normalization and DTMs read the
+    image buffers through views and write straight into the output arrays.
+
     Args:
         config: Dictionary with information from config.json.
         image_paths_list: List containing paths to images for the example.
         mask_path: Path to segmentation mask. Pass None for inference.
         fg_bbox: Foreground bounding box. Used only when skip=False and
             crop_to_foreground=True. Ignored when skip=True.
+        dtm_threads: Number of labels whose DTMs are computed at the same
+            time.
+        timer: Optional timer that records the time and peak memory of
+            each stage.
     Returns:
         preprocessed_output: Dictionary containing the following keys:
             image: Preprocessed image(s) as a numpy array.
@@ -352,6 +717,7 @@ def preprocess_example(
             fg_bbox: Foreground bounding box, or None if skip=True or no
                 cropping was performed.
             dtm: DTM(s) as a numpy array, or None in inference mode.
+            spacing: Voxel spacing of the returned arrays.
     """
     # Set the training flag based on the presence of a mask.
     training = bool(mask_path)
@@ -362,84 +728,88 @@ def preprocess_example(
     target_spacing = config["spatial_config"]["target_spacing"]
     compute_dtms = config["preprocessing"]["compute_dtms"]
     normalize_dtms = config["preprocessing"]["normalize_dtms"]
+    dtm_band = config["preprocessing"].get("dtm_band")
     labels = config["dataset_info"]["labels"]
 
-    # Read all images.
-    images = []
-    for i, image_path in enumerate(image_paths_list):
-        # Load image as ants image.
-        image_i = ants.image_read(image_path)
-
-        if not skip:
-            # Get foreground mask if necessary.
-            if i == 0 and crop and fg_bbox is None:
-                fg_bbox = preprocessing_utils.get_fg_mask_bbox(image_i)
-
-            # If cropping is requested, but the foreground bounding box is not
-            # provided, raise an error. Otherwise, crop the image to the
-            # foreground bounding box.
-            if crop:
-                if fg_bbox is None:
-                    raise ValueError(
-                        "Foreground bounding box is required for cropping, but none was provided."
-                    )
-                image_i = preprocessing_utils.crop_to_fg(image_i, fg_bbox)
-
-            # Put image into standard space.
-            image_i = ants.reorient_image2(image_i, "RAI")
-            image_i.set_direction(pc.RAI_ANTS_DIRECTION)
-            if not np.allclose(image_i.spacing, target_spacing):
-                image_i = resample_image(image_i, target_spacing=target_spacing)
-
-        images.append(image_i)
+    # Read all images at the same time.
+    with profiling.stage(timer, "read"):
+        images = _read_images(image_paths_list)
+
+    if not skip:
+        # Get foreground mask if necessary.
+        if crop and fg_bbox is None:
+            with profiling.stage(timer, "foreground_bbox"):
+                fg_bbox = preprocessing_utils.get_fg_mask_bbox(_array_view(images[0]))
+
+        # Channels that share their geometry go through cropping,
+        # reorientation, and resampling together as one vector image.
+        images = _stack_channels(images)
+        for i, image_i in enumerate(images):
+            # Crop to the foreground and put image into standard space.
+            with profiling.stage(timer, "reorient_crop"):
+                image_i = _to_standard_space(image_i, fg_bbox, crop)
+            if not np.allclose(image_i.GetSpacing(), target_spacing):
+                with profiling.stage(timer, "resample"):
+                    image_i = resample_image_sitk(image_i, target_spacing=target_spacing)
+            images[i] = image_i
 
     if training:
         # Read mask if we are in training mode.
-        mask = ants.image_read(mask_path)
+        with profiling.stage(timer, "read"):
+            mask = _read_image(mask_path)
 
         if not skip:
-            # Crop to foreground.
-            if crop:
-                mask = preprocessing_utils.crop_to_fg(mask, fg_bbox)
+            # Crop to the foreground and put mask into standard space.
+            with profiling.stage(timer, "reorient_crop"):
+                mask = _to_standard_space(mask, fg_bbox, crop)
+            with profiling.stage(timer, "resample"):
+                mask = resample_mask_sitk(mask, labels=labels, target_spacing=target_spacing)
 
-            # Put mask into standard space.
-            mask = ants.reorient_image2(mask, "RAI")
-            mask.set_direction(pc.RAI_ANTS_DIRECTION)
-            mask = resample_mask(mask, labels=labels, target_spacing=target_spacing)
-
-        # Compute DTM if requested and cast to float32.
+        # Compute DTM if requested.
         if compute_dtms:
-            dtm = compute_dtm(mask, labels=labels, normalize_dtm=normalize_dtms)
-            dtm = dtm.astype(np.float32)
+            with profiling.stage(timer, "dtm"):
+                dtm = compute_dtm_sitk(
+                    mask,
+                    labels=labels,
+                    normalize_dtm=normalize_dtms,
+                    band=dtm_band,
+                    num_threads=dtm_threads,
+                )
         else:
             dtm = None
 
         # Add channel axis to mask and cast to uint8.
-        mask = np.expand_dims(mask.numpy(), axis=-1).astype(np.uint8)
+        mask = _array_view(mask)[..., np.newaxis].astype(np.uint8)
     else:
         mask = None
         dtm = None
 
     # Build the image array from all channels.
-    image = np.zeros((*images[0].shape, len(images)), dtype=np.float32)
-    for i, image_i in enumerate(images):
-        if not skip:
-            # Apply windowing and normalization if not skipping preprocessing.
-            image[..., i] = window_and_normalize(image_i.numpy(), config)
-        else:
-            # skip=True: pure pass-through, just convert to numpy.
-            image[..., i] = image_i.numpy()
+    with profiling.stage(timer, "normalize"):
+        number_of_channels = sum(img.GetNumberOfComponentsPerPixel() for img in images)
+        image = np.zeros((*images[0].GetSize(), number_of_channels), dtype=np.float32)
+        for i, image_i in enumerate(_iter_channels(images)):
+            if not skip:
+                # Apply windowing and normalization if not skipping preprocessing.
+                window_and_normalize(_array_view(image_i), config, out=image[..., i])
+            else:
+                # skip=True: pure pass-through, just convert to numpy.
+                image[..., i] = _array_view(image_i)
 
-    # Cast image to float32 for consistency.
-    image = image.astype(np.float32)
     return {
         "image": image,
         "mask": mask,
         "fg_bbox": fg_bbox if not skip else None,
         "dtm": dtm,
+        "spacing": images[0].GetSpacing(),
     }
 
 
+def _get_fg_bbox_from_file(image_path: str) -> dict[str, int]:
+    """Read an image and compute its foreground bounding box."""
+    return preprocessing_utils.get_fg_mask_bbox(ants.image_read(image_path))
+
+
 def _preprocess_single_patient(
     config: dict,
     patient: dict,
@@ -447,6 +817,9 @@ def _preprocess_single_patient(
     fg_bbox: dict | None,
     output_dirs: dict[str, Path],
     compute_dtms: bool,
+    dtm_threads: int = 1,
+    storage_format: str = "npy",
+    timer: profiling.StageTimer | None = None,
 ) -> str | None:
     """Preprocess a single patient and save outputs to disk.
 
@@ -457,6 +830,12 @@ def _preprocess_single_patient(
         fg_bbox: Foreground bounding box dict for this patient, or None.
         output_dirs: Mapping of output type to destination directory.
         compute_dtms: Whether to compute and save DTMs.
+        dtm_threads: Number of labels whose DTMs are computed at the same
+            time.
+        storage_format: Storage format of the saved arrays, "npy" or
+            "compact". See mist.preprocessing.storage.
+        timer: Optional timer that records the time and peak memory of
+            each stage.
 
     Returns:
         An error message string if processing fails, otherwise None.
@@ -471,19 +850,44 @@ def _preprocess_single_patient(
             image_paths_list=image_list,
             mask_path=mask,
             fg_bbox=fg_bbox,
+            dtm_threads=dtm_threads,
+            timer=timer,
         )
 
-        patient_npy = f"{patient_id}.npy"
-        np.save(output_dirs["images"] / patient_npy, result["image"])
-        np.save(output_dirs["labels"] / patient_npy, result["mask"])
-        if compute_dtms and result["dtm"] is not None:
-            np.save(output_dirs["dtms"] / patient_npy, result["dtm"])
+        # The output directories are the images/, labels/, and dtms/
+        # subdirectories of the numpy directory.
+        if not compute_dtms:
+            result["dtm"] = None
+        preprocessing = config.get("preprocessing", {})
+        with profiling.stage(timer, "save"):
+            storage.save_example(
+                output_dirs["images"].parent,
+                patient_id,
+                result,
+                storage_format=storage_format,
+                normalized_image=not preprocessing.get("skip", False),
+                normalized_dtm=preprocessing.get("normalize_dtms", True),
+            )
 
         return None
     except Exception as exc:  # pylint: disable=broad-except
         return f"Patient {patient['id']}: {exc}"
 
 
+def _profile_single_patient(*args: Any) -> tuple[str | None, dict[str, float]]:
+    """Run _preprocess_single_patient with a stage timer.
+
+    Args:
+        *args: Positional arguments of _preprocess_single_patient.
+
+    Returns:
+        The error message or None, and the stage timings of the patient.
+    """
+    timer = profiling.StageTimer()
+    error = _preprocess_single_patient(*args, timer=timer)
+    return error, timer.as_dict()
+
+
 def preprocess_dataset(args: argparse.Namespace) -> None:
     """Preprocess a MIST compatible dataset.
 
@@ -519,13 +923,25 @@ def preprocess_dataset(args: argparse.Namespace) -> None:
 
     # Apply CLI overrides to config and write back once, so downstream stages
     # (training, inference) see the correct flags regardless of which
-    # combination of --compute-dtms / --no-preprocess the user passed.
+    # combination of --compute-dtms / --dtm-band / --storage-format /
+    # --no-preprocess the user passed.
+    dtm_band = getattr(args, "dtm_band", None)
+    storage_format = getattr(args, "storage_format", None)
     if args.compute_dtms:
         output_dirs["dtms"].mkdir(parents=True, exist_ok=True)
         config["preprocessing"]["compute_dtms"] = True
+    if dtm_band is not None:
+        config["preprocessing"]["dtm_band"] = dtm_band
+    if storage_format is not None:
+        config["preprocessing"]["storage_format"] = storage_format
     if args.no_preprocess:
         config["preprocessing"]["skip"] = True
-    if args.compute_dtms or args.no_preprocess:
+    if (
+        args.compute_dtms
+        or args.no_preprocess
+        or dtm_band is not None
+        or storage_format is not None
+    ):
         io.write_json_file(config_path, config)
 
     # Print preprocessing message and get progress bar.
@@ -555,28 +971,143 @@ def preprocess_dataset(args: argparse.Namespace) -> None:
     patients = df.to_dict(orient="records")
     max_workers = getattr(args, "num_workers_preprocess", 1)
 
+    # A sampled analysis (--analyze-sample) only writes the bounding boxes of
+    # the sampled patients. Compute the missing ones and save them so that
+    # inference can restore every patient's prediction to its original size.
+    missing = [p for p in patients if p["id"] not in fg_bboxes_by_id]
+    if crop and not config["preprocessing"]["skip"] and missing:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            missing_bboxes = executor.map(
+                _get_fg_bbox_from_file, [p[image_columns[0]] for p in missing]
+            )
+            for patient, fg_bbox in zip(missing, missing_bboxes, strict=True):
+                fg_bboxes_by_id[patient["id"]] = fg_bbox
+        pd.DataFrame(
+            [{**fg_bbox, "id": patient_id} for patient_id, fg_bbox in fg_bboxes_by_id.items()]
+        ).to_csv(fg_bboxes_file, index=False)
+
+    # Skip patients whose inputs and settings have not changed since they were
+    # saved, and remove the outputs of patients that are no longer in the
+    # dataset. --overwrite preprocesses every patient again.
+    numpy_dir = Path(args.numpy)
+    storage_format = storage.get_storage_format(config)
+    settings = manifest.config_subset(config)
+    saved = manifest.read_manifest(numpy_dir)
+    if getattr(args, "overwrite", False):
+        saved["patients"] = {}
+    manifest.remove_temporary_files(numpy_dir)
+
+    patient_ids = {str(patient["id"]) for patient in patients}
+    for patient_id in [pid for pid in saved["patients"] if pid not in patient_ids]:
+        manifest.remove_files(numpy_dir, saved["patients"].pop(patient_id)["files"])
+
+    digests = {
+        str(patient["id"]): manifest.patient_digest(
+            [patient[col] for col in image_columns] + [patient["mask"]],
+            settings,
+            fg_bboxes_by_id.get(patient["id"]) if crop else None,
+            args.compute_dtms,
+        )
+        for patient in patients
+    }
+    stale = [
+        patient
+        for patient in patients
+        if not manifest.is_up_to_date(
+            numpy_dir, saved["patients"].get(str(patient["id"])), digests[str(patient["id"])]
+        )
+    ]
+    if len(stale) < len(patients):
+        print_info(f"Skipping {len(patients) - len(stale)} up-to-date patient(s).")
+    manifest.write_manifest(numpy_dir, saved)
+
+    # With a memory budget, estimate each patient's peak memory from the file
+    # headers and only start jobs while the running estimates fit the budget.
+    memory_budget_gb = getattr(args, "preprocess_memory_budget", None)
+    memory_budget = None
+    estimates = None
+    if memory_budget_gb is not None:
+        memory_budget = int(memory_budget_gb * 1e9)
+        estimates = [
+            scheduler.estimate_peak_memory(
+                patient,
+                image_columns,
+                config["spatial_config"]["target_spacing"],
+                len(config["dataset_info"]["labels"]),
+                fg_bboxes_by_id.get(patient["id"]) if crop else None,
+                args.compute_dtms,
+            )
+            for patient in stale
+        ]
+        too_large = [
+            str(patient["id"])
+            for patient, estimate in zip(stale, estimates, strict=True)
+            if estimate > memory_budget
+        ]
+        if too_large:
+            print_warning(
+                f"{len(too_large)} patient(s) are estimated to need more than the "
+                f"memory budget of {memory_budget_gb} GB and will run alone: "
+                f"{', '.join(too_large)}"
+            )
+
+    # With --profile-preprocess, workers time each stage and return the
+    # timings with their result.
+    profile = getattr(args, "profile_preprocess", False)
+    profile_rows = []
+
     error_messages = []
     with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_patient = {
-            executor.submit(
-                _preprocess_single_patient,
+
+        def _submit(patient: dict[str, Any]) -> concurrent.futures.Future:
+            return executor.submit(
+                _profile_single_patient if profile else _preprocess_single_patient,
                 config,
                 patient,
                 image_columns,
                 fg_bboxes_by_id.get(patient["id"]) if crop else None,
                 output_dirs,
                 args.compute_dtms,
-            ): patient
-            for patient in patients
-        }
+                getattr(args, "dtm_threads", None) or 1,
+                storage_format,
+            )
+
         with progress as pb:
-            for future in pb.track(
-                concurrent.futures.as_completed(future_to_patient),
-                total=len(patients),
+            for patient, future in pb.track(
+                scheduler.run_within_budget(
+                    _submit, stale, estimates, memory_budget, max_in_flight=max_workers
+                ),
+                total=len(stale),
             ):
-                err = future.result()
+                patient_id = str(patient["id"])
+                if profile:
+                    err, timings = future.result()
+                    profile_rows.append({"id": patient_id, **timings})
+                else:
+                    err = future.result()
                 if err:
+                    # The patient's saved files are stale and may now be a mix
+                    # of old and new arrays, so remove them.
                     error_messages.append(err)
+                    entry = saved["patients"].pop(patient_id, None)
+                    if entry is not None:
+                        manifest.remove_files(numpy_dir, entry["files"])
+                        manifest.write_manifest(numpy_dir, saved)
+                    continue
+
+                # Record the patient and remove files it no longer has, e.g.
+                # after a change of storage format.
+                files = storage.output_files(patient_id, storage_format, args.compute_dtms)
+                previous = saved["patients"].get(patient_id, {}).get("files", [])
+                manifest.remove_files(numpy_dir, [f for f in previous if f not in files])
+                saved["patients"][patient_id] = {"digest": digests[patient_id], "files": files}
+                manifest.write_manifest(numpy_dir, saved)
+
+    if profile_rows:
+        profiling.write_profile(results_dir / pc.PROFILE_FILENAME, profile_rows)
+        print_info(f"Slowest patients (profile saved to {results_dir / pc.PROFILE_FILENAME}):")
+        for line in profiling.slowest_patients(profile_rows, pc.PROFILE_SLOWEST_PATIENTS):
+            print_info(f"  {line}")
 
     if error_messages:
         print_warning("\n".join(error_messages))
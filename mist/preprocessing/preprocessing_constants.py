@@ -16,6 +16,66 @@ class PreprocessingConstants:
     # RAI orientation constants.
     RAI_ANTS_DIRECTION = np.eye(3)
 
+    # The same orientation for sitk.DICOMOrient. ANTs names orientations by
+    # where the axes come from and DICOM by where they point to, so ANTs
+    # "RAI" (identity direction) is "LPS" here.
+    RAI_SITK_ORIENTATION = "LPS"
+
+    # Extra voxels around each label's bounding box when masks are resampled
+    # one label at a time. Linear and nearest neighbor interpolation only
+    # reach one voxel, so this is a safety margin for rounding.
+    MASK_RESAMPLE_BBOX_MARGIN = 2
+
     # Foreground bounding box threshold percentiles.
     FOREGROUND_BBOX_PERCENTILE_LOW = 33.0
     FOREGROUND_BBOX_PERCENTILE_HIGH = 99.5
+
+    # Streaming foreground bounding box. Percentiles are located with a
+    # histogram of FOREGROUND_BBOX_HIST_BINS bins and resolved exactly from
+    # the voxels in the target bins. Otsu uses the same number of bins as
+    # skimage.filters.threshold_otsu. Volumes are processed in slabs of about
+    # FOREGROUND_BBOX_CHUNK_VOXELS voxels to bound temporary memory.
+    FOREGROUND_BBOX_HIST_BINS = 65536
+    FOREGROUND_BBOX_OTSU_BINS = 256
+    FOREGROUND_BBOX_CHUNK_VOXELS = 2**22
+    FOREGROUND_BBOX_MAX_GATHER = 2**22
+
+    # Mean and standard deviation for intensity normalization are accumulated
+    # over chunks of NORMALIZATION_CHUNK_VOXELS voxels to bound temporary
+    # memory.
+    NORMALIZATION_CHUNK_VOXELS = 2**20
+
+    # Stages timed by --profile-preprocess, in the order they run, and the
+    # file the profile is written to in the results directory.
+    PROFILE_STAGES = (
+        "read",
+        "foreground_bbox",
+        "reorient_crop",
+        "resample",
+        "dtm",
+        "normalize",
+        "save",
+    )
+    PROFILE_FILENAME = "preprocess_profile.csv"
+    PROFILE_SLOWEST_PATIENTS = 5
+
+    # Storage formats for preprocessed examples. "npy" writes float32 images
+    # and DTMs and full-size labels. "compact" writes float16 images and DTMs,
+    # labels cropped to their foreground with the crop box stored next to
+    # them, and a JSON sidecar with per-patient metadata.
+    STORAGE_FORMATS = ("npy", "compact")
+    COMPACT_FLOAT_DTYPE = np.float16
+
+    # Foreground voxels for biased patch sampling. Every example stores up to
+    # this many voxels of each class, sampled with a fixed seed, so that the
+    # loaders pick crop centers without scanning the label.
+    FG_VOXELS_PER_CLASS = 10_000
+    FG_VOXELS_SEED = 0
+
+    # Resumable preprocessing. The manifest in the numpy directory records a
+    # digest of the inputs and settings of every saved patient. Bump the
+    # version when the saved arrays change for the same inputs. Files are
+    # written to a temporary name and renamed, so they are never truncated.
+    MANIFEST_FILENAME = "manifest.json"
+    MANIFEST_VERSION = 2
+    TEMPORARY_FILE_SUFFIX = ".tmp"
@@ -59,49 +59,186 @@ def sitk_to_ants(img_sitk: sitk.Image) -> ants.core.ants_image.ANTsImage:
     return img_ants
 
 
+def _iter_slabs(arr: np.ndarray):
+    """Yield (start, slab) views of an array in slabs along its first axis.
+
+    Slabs hold about FOREGROUND_BBOX_CHUNK_VOXELS voxels so that temporary
+    arrays created per slab stay small regardless of the volume size.
+    """
+    slice_voxels = max(1, int(np.prod(arr.shape[1:])))
+    step = max(1, pc.FOREGROUND_BBOX_CHUNK_VOXELS // slice_voxels)
+    for start in range(0, arr.shape[0], step):
+        yield start, arr[start : start + step]
+
+
+def _order_statistics(arr: np.ndarray, ranks: list[int]) -> list[float] | None:
+    """Get exact order statistics of an array without sorting a copy of it.
+
+    A histogram over [min, max] locates the bin holding each requested rank.
+    A second pass gathers only the voxels in those bins and partitions them.
+    Bins with more than FOREGROUND_BBOX_MAX_GATHER voxels are only resolved
+    if they hold a single repeated value (e.g., air or zero background).
+
+    Args:
+        arr: Input array.
+        ranks: Zero-based ranks into the sorted flattened array.
+
+    Returns:
+        The values at the requested ranks, or None if the array has
+        non-finite values or a crowded bin holds more than one distinct value.
+    """
+    vmin, vmax = arr.min(), arr.max()
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        return None
+    if vmin == vmax:
+        return [vmin] * len(ranks)
+
+    n_bins = pc.FOREGROUND_BBOX_HIST_BINS
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for _, slab in _iter_slabs(arr):
+        slab_counts, edges = np.histogram(slab, bins=n_bins, range=(vmin, vmax))
+        counts += slab_counts
+    cumulative = np.cumsum(counts)
+    bins = [int(b) for b in np.searchsorted(cumulative, ranks, side="right")]
+
+    # Same bin membership as np.histogram: [lo, hi) except the last bin.
+    gathered: dict[int, list[np.ndarray]] = {b: [] for b in bins}
+    for _, slab in _iter_slabs(arr):
+        for b in gathered:
+            in_bin = slab >= edges[b]
+            in_bin &= slab < edges[b + 1] if b < n_bins - 1 else slab <= edges[b + 1]
+            values = slab[in_bin]
+            if counts[b] > pc.FOREGROUND_BBOX_MAX_GATHER and values.size > 0:
+                # Keep only the extremes of crowded bins.
+                values = np.array([values.min(), values.max()], dtype=arr.dtype)
+            gathered[b].append(values)
+
+    result = []
+    for rank, b in zip(ranks, bins, strict=True):
+        values = np.concatenate(gathered[b])
+        if counts[b] > pc.FOREGROUND_BBOX_MAX_GATHER:
+            if values.min() != values.max():
+                return None
+            result.append(values[0])
+            continue
+        offset = rank - (int(cumulative[b - 1]) if b > 0 else 0)
+        result.append(np.partition(values, offset)[offset])
+    return result
+
+
+def _streaming_percentiles(arr: np.ndarray, percentiles: list[float]) -> list[float]:
+    """Compute np.percentile(arr, percentiles) without a sorted copy.
+
+    The two order statistics around each percentile come from
+    _order_statistics and are interpolated with np.quantile itself, so the
+    result is bit-identical to np.percentile with the default linear method.
+    Falls back to np.percentile if the order statistics cannot be resolved.
+    """
+    n = arr.size
+    virtual = (n - 1) * (np.asarray(percentiles, dtype=np.float64) / 100)
+    previous = np.floor(virtual).astype(np.int64)
+    following = np.minimum(previous + 1, n - 1)
+    ranks = [int(r) for r in np.concatenate([previous, following])]
+
+    values = _order_statistics(arr, ranks)
+    if values is None:
+        return list(np.percentile(arr, percentiles))
+
+    # Interpolate all percentiles in one call with the same shapes and dtypes
+    # as np.percentile, so rounding and the result dtype match exactly.
+    n_pct = len(percentiles)
+    gamma = virtual - previous
+    return [
+        np.quantile(np.array([values[i], values[n_pct + i]], dtype=arr.dtype), gamma[i : i + 1])[0]
+        for i in range(n_pct)
+    ]
+
+
+def _clipped_otsu_threshold(arr: np.ndarray, lower: float, upper: float) -> float:
+    """Otsu threshold of np.clip(arr, lower, upper) without the clipped copy.
+
+    Builds the same histogram that skimage.filters.threshold_otsu computes on
+    the clipped image: values below lower (above upper) land in the first
+    (last) bin, exactly as they would after clipping.
+    """
+    n_bins = pc.FOREGROUND_BBOX_OTSU_BINS
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for _, slab in _iter_slabs(arr):
+        slab_counts, edges = np.histogram(slab, bins=n_bins, range=(lower, upper))
+        counts += slab_counts
+        counts[0] += np.count_nonzero(slab < lower)
+        counts[-1] += np.count_nonzero(slab > upper)
+    bin_centers = (edges[:-1] + edges[1:]) / 2.0
+    return skimage.filters.threshold_otsu(hist=(counts, bin_centers))
+
+
 def get_fg_mask_bbox(
-    img_ants: ants.core.ants_image.ANTsImage,
+    img_ants: ants.core.ants_image.ANTsImage | np.ndarray,
+    stride: int = 1,
 ) -> dict[str, int]:
     """Get the bounding box of the foreground mask.
 
-    This function computes the bounding box of the foreground in a 3D image. It
-    uses an Otsu threshold method to create a binary mask and then finds the
-    coordinates of the non-zero elements in the mask to determine the bounding
-    box.
+    This function computes the bounding box of the foreground in a 3D image.
+    The image is clipped to the FOREGROUND_BBOX_PERCENTILE_* percentiles, an
+    Otsu threshold separates foreground from background, and the bounding box
+    encloses all voxels above the threshold.
+
+    The computation streams over the volume: percentiles and the Otsu
+    threshold come from histograms, and the bounding box from per-axis "any"
+    projections of the thresholded slabs. Neither a sorted or clipped copy of
+    the image nor the coordinates of every foreground voxel are materialized.
+    With stride 1 the result is identical to clipping with np.percentile and
+    thresholding with skimage.filters.threshold_otsu.
 
     Args:
-        img_ants: ANTs image object.
+        img_ants: ANTs image object, or its voxels as an array in (x, y, z)
+            order.
+        stride: Preview mode. If greater than 1, the percentiles and Otsu
+            threshold are estimated from every stride-th voxel along each
+            axis. The box is still found at full resolution, but the
+            threshold is approximate, so box edges may move, most of all on
+            images whose background is noisy or has low contrast.
 
     Returns:
         fg_bbox: Dictionary containing the bounding box coordinates and original
         image size.
     """
     # Convert ANTs image to numpy array.
-    image_npy = img_ants.numpy()
+    image_npy = img_ants if isinstance(img_ants, np.ndarray) else img_ants.numpy()
+    og_size = img_ants.shape
+    stats_npy = (
+        np.ascontiguousarray(image_npy[::stride, ::stride, ::stride]) if stride > 1 else image_npy
+    )
 
     # Clip image to remove outliers and improve foreground detection.
-    lower, upper = np.percentile(
-        image_npy,
+    lower, upper = _streaming_percentiles(
+        stats_npy,
         [pc.FOREGROUND_BBOX_PERCENTILE_LOW, pc.FOREGROUND_BBOX_PERCENTILE_HIGH],
     )
-    image_npy = np.clip(image_npy, lower, upper)
-
-    # Apply Otsu threshold to create a binary foreground mask.
-    threshold = skimage.filters.threshold_otsu(image_npy)
-    fg_mask = image_npy > threshold
 
-    nz = np.nonzero(fg_mask)
-    og_size = img_ants.shape
-
-    # Create the bounding box based on non-zero values.
-    if nz[0].size > 0:
+    # Apply Otsu threshold to the clipped image. A constant clipped image has
+    # no voxel above its threshold.
+    x_any = np.zeros(og_size[0], dtype=bool)
+    yz_any = np.zeros(og_size[1:], dtype=bool)
+    if lower < upper:
+        threshold = _clipped_otsu_threshold(stats_npy, lower, upper)
+        for start, slab in _iter_slabs(image_npy):
+            fg_slab = slab > threshold
+            x_any[start : start + slab.shape[0]] = fg_slab.any(axis=(1, 2))
+            yz_any |= fg_slab.any(axis=0)
+
+    # Create the bounding box from the foreground projections.
+    x_nz = np.flatnonzero(x_any)
+    if x_nz.size > 0:
+        y_nz = np.flatnonzero(yz_any.any(axis=1))
+        z_nz = np.flatnonzero(yz_any.any(axis=0))
         fg_bbox = {
-            "x_start": int(np.min(nz[0])),
-            "x_end": int(np.max(nz[0])),
-            "y_start": int(np.min(nz[1])),
-            "y_end": int(np.max(nz[1])),
-            "z_start": int(np.min(nz[2])),
-            "z_end": int(np.max(nz[2])),
+            "x_start": int(x_nz[0]),
+            "x_end": int(x_nz[-1]),
+            "y_start": int(y_nz[0]),
+            "y_end": int(y_nz[-1]),
+            "z_start": int(z_nz[0]),
+            "z_end": int(z_nz[-1]),
         }
     else:
         # If no foreground is detected, use the entire image size as bbox.
@@ -273,3 +410,21 @@ def crop_to_fg(
         lowerind=[fg_bbox["x_start"], fg_bbox["y_start"], fg_bbox["z_start"]],
         upperind=[fg_bbox["x_end"] + 1, fg_bbox["y_end"] + 1, fg_bbox["z_end"] + 1],
     )
+
+
+def crop_to_fg_sitk(img_sitk: sitk.Image, fg_bbox: dict[str, int]) -> sitk.Image:
+    """Crop a SimpleITK image to the foreground bounding box.
+
+    Args:
+        img_sitk: SimpleITK image object.
+        fg_bbox: Foreground bounding box.
+
+    Returns:
+        Cropped SimpleITK image object, with the origin moved to the first
+        voxel of the box as in crop_to_fg.
+    """
+    return img_sitk[
+        fg_bbox["x_start"] : fg_bbox["x_end"] + 1,
+        fg_bbox["y_start"] : fg_bbox["y_end"] + 1,
+        fg_bbox["z_start"] : fg_bbox["z_end"] + 1,
+    ]
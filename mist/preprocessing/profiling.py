@@ -0,0 +1,139 @@
+"""Per-stage timing of preprocessing.
+
+With --profile-preprocess, each worker times the stages of preprocessing one
+patient (reading, foreground bounding box, reorientation and cropping,
+resampling, normalization, DTMs, and saving) and returns the timings with its
+result. preprocess_dataset writes them to results/preprocess_profile.csv, one
+row per patient followed by summary rows, and prints the slowest patients.
+
+For each stage, the profile records the wall-clock seconds spent in it and the
+peak resident memory of the worker process, in MiB, at the end of the stage.
+On Linux, the peak is reset when a patient starts, so the first stage at which
+it rises is the one that set the patient's peak. Elsewhere the peak covers the
+whole lifetime of the worker.
+
+Without profiling, no timer is created and each stage costs one check for a
+None timer.
+"""
+
+import contextlib
+import resource
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
+
+_NO_TIMING = contextlib.nullcontext()
+
+
+def reset_peak_memory() -> None:
+    """Reset the peak resident memory of this process, where supported."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def peak_memory_mb() -> float:
+    """Return the peak resident memory of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class StageTimer:
+    """Accumulates the wall-clock time and peak memory of named stages."""
+
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = {}
+        self.peak_mb: dict[str, float] = {}
+        self.start = time.perf_counter()
+        reset_peak_memory()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a stage. Stages entered more than once are added up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.peak_mb[name] = max(self.peak_mb.get(name, 0.0), peak_memory_mb())
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the timings as a flat dictionary for one row of the profile.
+
+        Returns:
+            Dictionary with <stage>_seconds and <stage>_peak_mb for each stage
+            in pc.PROFILE_STAGES that was entered, plus total_seconds and
+            peak_mb for the whole patient.
+        """
+        row = {}
+        for name in pc.PROFILE_STAGES:
+            if name in self.seconds:
+                row[f"{name}_seconds"] = self.seconds[name]
+                row[f"{name}_peak_mb"] = self.peak_mb[name]
+        row["total_seconds"] = time.perf_counter() - self.start
+        row["peak_mb"] = peak_memory_mb()
+        return row
+
+
+def stage(timer: StageTimer | None, name: str) -> contextlib.AbstractContextManager:
+    """Return a context that times a stage, or does nothing without a timer."""
+    return _NO_TIMING if timer is None else timer.stage(name)
+
+
+def summarize_profile(rows: list[dict[str, Any]]) -> pd.DataFrame:
+    """Build the profile table from per-patient rows.
+
+    Args:
+        rows: One dictionary per patient with an id and the output of
+            StageTimer.as_dict.
+
+    Returns:
+        Dataframe with one row per patient, sorted by id, followed by the
+        median, 95th percentile, and maximum of each column.
+    """
+    profile_df = pd.DataFrame(rows)
+    if profile_df.empty:
+        return profile_df
+    profile_df = profile_df.sort_values("id", key=lambda ids: ids.astype(str))
+    columns = [col for col in profile_df.columns if col != "id"]
+    stats_rows = [
+        {"id": label, **{col: func(profile_df[col].dropna()) for col in columns}}
+        for label, func in (
+            ("Median", np.median),
+            ("95th Percentile", lambda values: np.percentile(values, 95)),
+            ("Max", np.max),
+        )
+    ]
+    return pd.concat([profile_df, pd.DataFrame(stats_rows)], ignore_index=True)
+
+
+def slowest_patients(rows: list[dict[str, Any]], count: int) -> list[str]:
+    """Describe the slowest patients and the stage that took longest for each."""
+    lines = []
+    for row in sorted(rows, key=lambda r: r["total_seconds"], reverse=True)[:count]:
+        stage_seconds = {
+            name: row[f"{name}_seconds"] for name in pc.PROFILE_STAGES if f"{name}_seconds" in row
+        }
+        slowest = max(stage_seconds, key=stage_seconds.get) if stage_seconds else None
+        detail = f", mostly {slowest} ({stage_seconds[slowest]:.1f} s)" if slowest else ""
+        lines.append(
+            f"{row['id']}: {row['total_seconds']:.1f} s, peak {row['peak_mb']:.0f} MiB{detail}"
+        )
+    return lines
+
+
+def write_profile(path: str | Path, rows: list[dict[str, Any]]) -> pd.DataFrame:
+    """Write the profile table to a CSV file and return it."""
+    profile_df = summarize_profile(rows)
+    profile_df.to_csv(path, index=False)
+    return profile_df
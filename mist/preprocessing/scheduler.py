@@ -0,0 +1,124 @@
+"""Memory-aware admission of preprocessing jobs.
+
+Without a memory budget, preprocess_dataset submits every patient to its
+process pool at once, and a few large volumes running at the same time can
+exhaust the memory of the node. With a budget, each patient's peak memory is
+estimated from the headers of its files, and jobs are only started while the
+estimates of the running jobs add up to no more than the budget. The largest
+patients start first, so they do not end up as the last jobs of the run.
+"""
+
+import concurrent.futures
+from collections.abc import Callable, Iterator
+from typing import Any, TypeVar
+
+import ants
+import numpy as np
+
+from mist.analyze_data import analyzer_utils
+
+T = TypeVar("T")
+
+
+def estimate_peak_memory(
+    patient: dict[str, Any],
+    image_columns: list[str],
+    target_spacing: list[float],
+    number_of_labels: int,
+    fg_bbox: dict[str, int] | None,
+    compute_dtms: bool,
+) -> int:
+    """Estimate the peak memory of preprocessing one patient in bytes.
+
+    The estimate counts the input images and mask at their cropped size, and,
+    at the resampled size, each image twice (resampled and normalized), the
+    mask, and one DTM per label when DTMs are computed. All volumes are
+    counted as float32.
+
+    Args:
+        patient: Row of the paths dataframe as a dictionary.
+        image_columns: Columns of the image paths.
+        target_spacing: Target spacing of the resampled images.
+        number_of_labels: Number of labels in the dataset.
+        fg_bbox: Foreground bounding box used for cropping, or None.
+        compute_dtms: Whether DTMs are computed.
+
+    Returns:
+        Estimated peak memory in bytes, or 0 if the mask header cannot be
+        read. Such patients fail in the worker, which reports the error.
+    """
+    try:
+        header = ants.image_header_info(patient["mask"])
+    except Exception:
+        return 0
+
+    dimensions = tuple(int(size) for size in header["dimensions"][:3])
+    if fg_bbox:
+        dimensions = tuple(
+            int(fg_bbox[f"{axis}_end"]) - int(fg_bbox[f"{axis}_start"]) + 1 for axis in "xyz"
+        )
+    resampled_dimensions = analyzer_utils.get_resampled_image_dimensions(
+        dimensions, tuple(header["spacing"][:3]), tuple(target_spacing)
+    )
+    number_of_channels = len(image_columns)
+    return analyzer_utils.get_float32_example_memory_size(
+        dimensions, number_of_channels, 1
+    ) + analyzer_utils.get_float32_example_memory_size(
+        resampled_dimensions,
+        2 * number_of_channels,
+        1 + (number_of_labels if compute_dtms else 0),
+    )
+
+
+def run_within_budget(
+    submit: Callable[[T], concurrent.futures.Future],
+    jobs: list[T],
+    estimates: list[int] | None = None,
+    memory_budget: int | None = None,
+    max_in_flight: int | None = None,
+) -> Iterator[tuple[T, concurrent.futures.Future]]:
+    """Submit jobs so that the memory estimates of running jobs fit a budget.
+
+    Jobs are admitted largest estimate first. Whenever a job finishes, the
+    largest pending job that fits in the remaining budget is started. A job
+    whose estimate exceeds the whole budget is started once nothing else is
+    running, so it runs alone. Without a budget, every job is submitted at
+    once in the given order.
+
+    Args:
+        submit: Function that submits one job and returns its future.
+        jobs: Jobs to run.
+        estimates: Estimated peak memory of each job in bytes.
+        memory_budget: Memory budget in bytes, or None for no budget.
+        max_in_flight: Maximum number of jobs running at the same time,
+            usually the number of workers.
+
+    Yields:
+        Each job and its finished future, in order of completion.
+    """
+    if memory_budget is None or estimates is None:
+        futures = {submit(job): job for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future
+        return
+
+    max_in_flight = max_in_flight or len(jobs)
+    pending = [int(i) for i in np.argsort([-e for e in estimates], kind="stable")]
+    running: dict[concurrent.futures.Future, int] = {}
+    in_use = 0
+    while pending or running:
+        # Start the largest pending jobs that fit next to the running ones.
+        for i in list(pending):
+            if len(running) >= max_in_flight:
+                break
+            if running and in_use + estimates[i] > memory_budget:
+                continue
+            pending.remove(i)
+            running[submit(jobs[i])] = i
+            in_use += estimates[i]
+
+        done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            i = running.pop(future)
+            in_use -= estimates[i]
+            yield jobs[i], future
@@ -0,0 +1,281 @@
+"""Storage formats for preprocessed examples.
+
+Preprocessed examples are written under the numpy directory with one file
+per patient in each of images/, labels/, and dtms/. The default "npy" format
+saves the arrays returned by preprocess_example as they are: float32 images
+and DTMs and uint8 labels, all at the full image size.
+
+The "compact" format stores the same examples in about half the space:
+  - Normalized images and DTMs are saved as float16. Images saved without
+    preprocessing and DTMs saved without normalization stay float32, since
+    raw intensities can exceed the float16 range or need more precision.
+    The choice follows the preprocessing options, not the values, so every
+    patient of a dataset has the same dtypes.
+  - Labels are cropped to the bounding box of their foreground. The box is
+    saved in label_boxes/ as a (2, 4) int64 array whose first row is the
+    negated crop start and whose second row is the full label shape, both
+    in (x, y, z, channel) order. Slicing the cropped label with this anchor
+    and shape, padding with zeros, restores the full label. This is what the
+    data loaders do.
+  - A JSON sidecar in meta/ records the shape, spacing, foreground bounding
+    box, label crop, the dtypes of the saved image and DTM, and the number of
+    voxels of each label value.
+
+Readers pick the format from config["preprocessing"]["storage_format"].
+
+Both formats also save a sample of the foreground voxels of each label in
+fg_voxels/, which the data loaders use to center patches on foreground
+without scanning the label. See sample_foreground_voxels.
+
+Every file is written to a temporary name and then renamed, so a file with
+the final name is always complete, even if preprocessing is interrupted.
+"""
+
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
+from mist.utils import io
+
+
+def get_storage_format(config: dict[str, Any]) -> str:
+    """Return the storage format of the preprocessed data.
+
+    Configurations written before the storage format was introduced use the
+    "npy" format.
+    """
+    return config.get("preprocessing", {}).get("storage_format") or "npy"
+
+
+def save_npy(path: str | Path, array: npt.NDArray[Any]) -> None:
+    """Save an array to a .npy file atomically."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + pc.TEMPORARY_FILE_SUFFIX)
+    with open(tmp_path, "wb") as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
+
+
+def save_json(path: str | Path, data: dict[str, Any]) -> None:
+    """Save a dictionary to a JSON file atomically."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + pc.TEMPORARY_FILE_SUFFIX)
+    io.write_json_file(tmp_path, data)
+    os.replace(tmp_path, path)
+
+
+def output_files(patient_id: str, storage_format: str = "npy", with_dtm: bool = False) -> list[str]:
+    """Return the files save_example writes, relative to the numpy directory."""
+    directories = ["images", "labels", "fg_voxels"]
+    if with_dtm:
+        directories.append("dtms")
+    if storage_format == "compact":
+        directories.append("label_boxes")
+    files = [f"{directory}/{patient_id}.npy" for directory in directories]
+    if storage_format == "compact":
+        files.append(f"meta/{patient_id}.json")
+    return files
+
+
+def label_bounding_box(mask: npt.NDArray[Any]) -> tuple[list[int], list[int]]:
+    """Return the start and stop of the nonzero voxels of a label array.
+
+    Args:
+        mask: Label array of shape (x, y, z, 1).
+
+    Returns:
+        Start and stop indices along the three spatial axes. An empty label
+        gives a box of one voxel at the origin.
+    """
+    box = []
+    for axis in range(3):
+        other_axes = tuple(i for i in range(mask.ndim) if i != axis)
+        nonzero = np.flatnonzero(np.any(mask, axis=other_axes))
+        box.append((int(nonzero[0]), int(nonzero[-1]) + 1) if nonzero.size else (0, 1))
+    return [start for start, _ in box], [stop for _, stop in box]
+
+
+def sample_foreground_voxels(
+    mask: npt.NDArray[Any],
+    max_per_class: int = pc.FG_VOXELS_PER_CLASS,
+    seed: int = pc.FG_VOXELS_SEED,
+) -> npt.NDArray[np.int32]:
+    """Sample the voxels of each label value for biased patch sampling.
+
+    Every label value in the mask gets the same number of rows: the voxel
+    count of the largest class, capped at max_per_class. Larger classes are
+    subsampled and smaller ones repeated, so a uniformly random row picks a
+    class with equal weights and then a voxel of that class.
+
+    Args:
+        mask: Label array of shape (x, y, z, 1).
+        max_per_class: Maximum number of voxels kept per class.
+        seed: Seed of the subsampling.
+
+    Returns:
+        Array of shape (n, 6) with one [start, stop) box of one voxel per
+        row, in (x, y, z) order, sorted by label value. A mask without
+        foreground gives a single box that covers the whole volume.
+    """
+    shape = mask.shape[:3]
+    voxels = np.flatnonzero(mask)
+    if voxels.size == 0:
+        return np.array([[0, 0, 0, *shape]], dtype=np.int32)
+
+    values = mask.reshape(-1)[voxels]
+    classes = [voxels[values == value] for value in np.unique(values)]
+    rows = min(max_per_class, max(len(indices) for indices in classes))
+    rng = np.random.default_rng(seed)
+    sampled = np.concatenate(
+        [
+            np.sort(rng.choice(indices, size=rows, replace=False))
+            if len(indices) > rows
+            else np.resize(indices, rows)
+            for indices in classes
+        ]
+    )
+    start = np.stack(np.unravel_index(sampled, shape), axis=1)
+    return np.concatenate([start, start + 1], axis=1).astype(np.int32)
+
+
+def _compact_dtype(normalized: bool) -> type[np.floating]:
+    """Float dtype of an image or DTM in the "compact" format."""
+    return pc.COMPACT_FLOAT_DTYPE if normalized else np.float32
+
+
+def save_example(
+    numpy_dir: str | Path,
+    patient_id: str,
+    result: dict[str, Any],
+    storage_format: str = "npy",
+    normalized_image: bool = True,
+    normalized_dtm: bool = True,
+) -> None:
+    """Save a preprocessed example in the given storage format.
+
+    Args:
+        numpy_dir: Numpy directory with images/, labels/, and dtms/.
+        patient_id: Patient ID used for the file names.
+        result: Output of preprocess_example. DTMs are saved when
+            result["dtm"] is not None.
+        storage_format: "npy" or "compact".
+        normalized_image: Whether the image was normalized. The "compact"
+            format saves normalized images as float16 and others as float32.
+        normalized_dtm: Whether the DTM was normalized, with the same effect
+            on the DTM.
+
+    Raises:
+        ValueError: If the storage format is not supported.
+    """
+    if storage_format not in pc.STORAGE_FORMATS:
+        raise ValueError(
+            f"Unsupported storage format '{storage_format}'. "
+            f"Choose one of {', '.join(pc.STORAGE_FORMATS)}."
+        )
+
+    numpy_dir = Path(numpy_dir)
+    filename = f"{patient_id}.npy"
+    (numpy_dir / "fg_voxels").mkdir(exist_ok=True)
+    save_npy(numpy_dir / "fg_voxels" / filename, sample_foreground_voxels(result["mask"]))
+    if storage_format == "npy":
+        save_npy(numpy_dir / "images" / filename, result["image"])
+        save_npy(numpy_dir / "labels" / filename, result["mask"])
+        if result["dtm"] is not None:
+            save_npy(numpy_dir / "dtms" / filename, result["dtm"])
+        return
+
+    mask = result["mask"]
+    start, stop = label_bounding_box(mask)
+    image = result["image"].astype(_compact_dtype(normalized_image), copy=False)
+    save_npy(numpy_dir / "images" / filename, image)
+    save_npy(
+        numpy_dir / "labels" / filename,
+        np.ascontiguousarray(mask[start[0] : stop[0], start[1] : stop[1], start[2] : stop[2]]),
+    )
+    (numpy_dir / "label_boxes").mkdir(exist_ok=True)
+    save_npy(
+        numpy_dir / "label_boxes" / filename,
+        np.array([[-s for s in start] + [0], list(mask.shape)], dtype=np.int64),
+    )
+    dtm = result["dtm"]
+    if dtm is not None:
+        dtm = dtm.astype(_compact_dtype(normalized_dtm), copy=False)
+        save_npy(numpy_dir / "dtms" / filename, dtm)
+
+    values, counts = np.unique(mask, return_counts=True)
+    fg_bbox = result.get("fg_bbox")
+    metadata = {
+        "storage_format": storage_format,
+        "shape": [int(size) for size in mask.shape[:3]],
+        "spacing": [float(s) for s in result["spacing"]] if result.get("spacing") else None,
+        "fg_bbox": {key: int(value) for key, value in fg_bbox.items()} if fg_bbox else None,
+        "label_bbox": {"start": start, "stop": stop},
+        "image_dtype": image.dtype.name,
+        "dtm_dtype": dtm.dtype.name if dtm is not None else None,
+        "voxel_counts": {str(int(v)): int(c) for v, c in zip(values, counts, strict=True)},
+    }
+    (numpy_dir / "meta").mkdir(exist_ok=True)
+    save_json(numpy_dir / "meta" / f"{patient_id}.json", metadata)
+
+
+def load_metadata(numpy_dir: str | Path, patient_id: str) -> dict[str, Any]:
+    """Read the JSON sidecar of a patient saved in the "compact" format."""
+    return io.read_json_file(Path(numpy_dir) / "meta" / f"{patient_id}.json")
+
+
+def load_example(
+    numpy_dir: str | Path,
+    patient_id: str,
+    storage_format: str = "npy",
+    load_dtm: bool = False,
+) -> dict[str, npt.NDArray[Any] | None]:
+    """Load a preprocessed example as full-size float32 and uint8 arrays.
+
+    Args:
+        numpy_dir: Numpy directory with images/, labels/, and dtms/.
+        patient_id: Patient ID used for the file names.
+        storage_format: "npy" or "compact".
+        load_dtm: Whether to load the DTM.
+
+    Returns:
+        Dictionary with image (float32), mask (uint8), and dtm (float32, or
+        None if load_dtm is False), as saved by save_example.
+    """
+    numpy_dir = Path(numpy_dir)
+    filename = f"{patient_id}.npy"
+    image = np.load(numpy_dir / "images" / filename).astype(np.float32, copy=False)
+    mask = np.load(numpy_dir / "labels" / filename)
+    dtm = None
+    if load_dtm:
+        dtm = np.load(numpy_dir / "dtms" / filename).astype(np.float32, copy=False)
+
+    if storage_format == "compact":
+        mask = restore_label(mask, np.load(numpy_dir / "label_boxes" / filename))
+
+    return {"image": image, "mask": mask, "dtm": dtm}
+
+
+def restore_label(mask: npt.NDArray[Any], label_box: npt.NDArray[Any]) -> npt.NDArray[Any]:
+    """Restore a label saved in the "compact" format to its full size.
+
+    Args:
+        mask: Label cropped to the bounding box of its foreground.
+        label_box: Crop box from label_boxes/, with the negated crop start in
+            the first row and the full label shape in the second.
+
+    Returns:
+        The label at its full size, with zeros outside the crop.
+    """
+    anchor, shape = label_box
+    full_mask = np.zeros(tuple(int(size) for size in shape), dtype=mask.dtype)
+    start = [-int(a) for a in anchor[:3]]
+    full_mask[
+        start[0] : start[0] + mask.shape[0],
+        start[1] : start[1] + mask.shape[1],
+        start[2] : start[2] + mask.shape[2],
+    ] = mask
+    return full_mask
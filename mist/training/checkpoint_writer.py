@@ -0,0 +1,153 @@
+"""Write training checkpoints in a background thread.
+
+Saving a checkpoint with torch.save blocks the training loop until the file is
+written, and with several GPUs the other ranks wait for rank 0 at the next
+barrier. CheckpointWriter copies the state to CPU memory, which is fast, and
+writes the copy in a background thread while training goes on. Writes run in
+the order they were made.
+
+Every file is written under a temporary name, flushed to disk, and renamed,
+so a crash never leaves a partly written file in place of a good one. Writes
+that are still pending when the interpreter exits are finished first, and
+close() waits for them.
+"""
+
+import concurrent.futures
+import contextlib
+import copy
+import os
+import shutil
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import torch
+
+_TEMPORARY_SUFFIX = ".tmp"
+
+# Writes that may wait in the queue. Each one holds a copy of the state in CPU
+# memory, so a slow file system makes save() wait instead of using more memory.
+_MAX_PENDING_WRITES = 1
+
+
+def to_cpu(obj: Any) -> Any:
+    """Return a copy of a nested state with every tensor copied to the CPU.
+
+    Dictionaries keep their type and the _metadata of module state dicts, so
+    the copy loads as the original does.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        copied = type(obj)()
+        for key, value in obj.items():
+            copied[key] = to_cpu(value)
+        if hasattr(obj, "_metadata"):
+            copied._metadata = copy.deepcopy(obj._metadata)
+        return copied
+    if isinstance(obj, list):
+        return [to_cpu(value) for value in obj]
+    if isinstance(obj, tuple):
+        return tuple(to_cpu(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+def save_atomic(obj: Any, path: str | Path) -> None:
+    """Save an object with torch.save under a temporary name, then rename it."""
+    path = Path(path)
+    temporary = path.with_suffix(_TEMPORARY_SUFFIX)
+    with open(temporary, "wb") as file:
+        torch.save(obj, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def link_atomic(source: str | Path, destination: str | Path) -> None:
+    """Make destination a hard link to source, or a copy if links fail.
+
+    The link is made under a temporary name and renamed, so destination is
+    always either its old file or a complete new one.
+    """
+    destination = Path(destination)
+    temporary = destination.with_suffix(_TEMPORARY_SUFFIX)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(temporary)
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    os.replace(temporary, destination)
+
+
+class CheckpointWriter:
+    """Save checkpoints in a background thread, or inline.
+
+    Errors raised by a background write are raised again by the next call to
+    save(), run(), flush(), or close().
+
+    Attributes:
+        asynchronous: Whether writes run in a background thread.
+    """
+
+    def __init__(self, asynchronous: bool = True):
+        self.asynchronous = asynchronous
+        self._executor = (
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="mist-checkpoint-writer"
+            )
+            if asynchronous
+            else None
+        )
+        self._pending: list[concurrent.futures.Future] = []
+
+    def save(self, obj: Any, path: str | Path) -> None:
+        """Save an object to a file after the writes before it.
+
+        In the background, the object is copied to the CPU first, so it can
+        change while the copy is written.
+
+        Args:
+            obj: Object to save with torch.save, such as a state dict.
+            path: File to write.
+        """
+        if self._executor is None:
+            save_atomic(obj, path)
+            return
+        self._wait(_MAX_PENDING_WRITES - 1)
+        self.run(save_atomic, to_cpu(obj), path)
+
+    def run(self, function: Callable[..., Any], *args: Any) -> None:
+        """Call a function, such as one that removes old files, after the writes before it."""
+        if self._executor is None:
+            function(*args)
+            return
+        self._raise_errors()
+        self._pending.append(self._executor.submit(function, *args))
+
+    def flush(self) -> None:
+        """Wait for every pending write."""
+        self._wait(0)
+
+    def close(self) -> None:
+        """Wait for every pending write and stop the background thread."""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+    def _wait(self, max_pending: int) -> None:
+        """Wait until at most max_pending writes are pending."""
+        self._raise_errors()
+        while len(self._pending) > max_pending:
+            # There is one worker, so the oldest write finishes first.
+            concurrent.futures.wait(self._pending[:1])
+            self._raise_errors()
+
+    def _raise_errors(self) -> None:
+        """Raise the error of the first failed write, and forget finished writes."""
+        done = [future for future in self._pending if future.done()]
+        self._pending = [future for future in self._pending if not future.done()]
+        for future in done:
+            future.result()
@@ -30,11 +30,13 @@ from mist.loss_functions.deep_supervision_wrapper import DeepSupervisionLoss
 from mist.loss_functions.loss_registry import get_loss
 from mist.loss_functions.losses.dice import DiceLoss
 from mist.models.model_loader import (
+    compile_model,
     load_pretrained_encoder,
     validate_encoder_compatibility,
 )
 from mist.models.model_registry import get_model_from_registry
-from mist.training import training_utils
+from mist.preprocessing import storage
+from mist.training import checkpoint_writer, training_utils
 from mist.training.lr_schedulers.lr_scheduler_registry import get_lr_scheduler
 from mist.training.optimizers.optimizer_registry import get_optimizer
 from mist.training.trainers.trainer_constants import TrainerConstants
@@ -239,6 +241,11 @@ class BaseTrainer(ABC):
         if getattr(self.mist_args, "warmup_epochs", None) is not None:
             self.config["training"]["warmup_epochs"] = int(self.mist_args.warmup_epochs)
 
+        # Turn torch.compile on or off if specified in command line.
+        if getattr(self.mist_args, "compile", None) is not None:
+            compile_settings = self.config["training"].setdefault("compile", {})
+            compile_settings["enabled"] = bool(self.mist_args.compile)
+
         # Overwrite the validation percentage if specified in command line.
         if self.mist_args.val_percent is not None:
             self.config["training"]["val_percent"] = float(self.mist_args.val_percent)
@@ -400,6 +407,15 @@ class BaseTrainer(ABC):
         # also determine the number of training steps per epoch, which is
         # max(250, len(train_images) // batch_size).
         training = self.config["training"]
+        compact = storage.get_storage_format(self.config) == "compact"
+
+        # Preprocessing samples the foreground voxels of each label, so the
+        # loaders pick crop centers without searching the labels. Data
+        # preprocessed before they were saved falls back to the search.
+        fg_voxels_dir = self.numpy_dir / "fg_voxels"
+        use_fg_voxels = all(
+            (fg_voxels_dir / f"{patient_id}.npy").is_file() for patient_id in self.paths["id"]
+        )
         self.folds = {}
         for fold in range(training["nfolds"]):
             self.folds[fold] = {}
@@ -426,6 +442,26 @@ class BaseTrainer(ABC):
                 patient_ids=test_ids,
             )
 
+            # Labels saved in the compact storage format are cropped to their
+            # foreground. The loaders restore them with their crop boxes.
+            train_label_boxes, val_label_boxes = None, None
+            if compact:
+                train_label_boxes = training_utils.get_npy_paths(
+                    data_dir=self.numpy_dir / "label_boxes",
+                    patient_ids=train_ids,
+                )
+                val_label_boxes = training_utils.get_npy_paths(
+                    data_dir=self.numpy_dir / "label_boxes",
+                    patient_ids=test_ids,
+                )
+
+            train_fg_voxels = None
+            if use_fg_voxels:
+                train_fg_voxels = training_utils.get_npy_paths(
+                    data_dir=fg_voxels_dir,
+                    patient_ids=train_ids,
+                )
+
             # If we are using distance transform maps, get the list of training
             # distance transform maps.
             train_dtms = None
@@ -442,6 +478,10 @@ class BaseTrainer(ABC):
             # set to pick the best model.
             if training["val_percent"] > 0.0:
                 split_inputs = [train_images, train_labels]
+                if compact:
+                    split_inputs.append(train_label_boxes)
+                if use_fg_voxels:
+                    split_inputs.append(train_fg_voxels)
                 if self._use_dtms():
                     split_inputs.append(train_dtms)
 
@@ -451,10 +491,15 @@ class BaseTrainer(ABC):
                     random_state=training["seed"],
                 )
 
-                # Unpack while handling optional DTMs.
-                (train_images, val_images, train_labels, val_labels, *maybe_dtms) = splits
+                # Unpack while handling optional label boxes, foreground
+                # voxels, and DTMs.
+                (train_images, val_images, train_labels, val_labels, *optional) = splits
+                if compact:
+                    train_label_boxes, val_label_boxes, *optional = optional
+                if use_fg_voxels:
+                    train_fg_voxels, _, *optional = optional
                 if self._use_dtms():
-                    train_dtms, _ = maybe_dtms
+                    train_dtms, _ = optional
 
             # Sanity check the fold data.
             training_utils.sanity_check_fold_data(
@@ -472,6 +517,9 @@ class BaseTrainer(ABC):
             self.folds[fold]["val_images"] = val_images
             self.folds[fold]["val_labels"] = val_labels
             self.folds[fold]["train_dtms"] = train_dtms
+            self.folds[fold]["train_label_boxes"] = train_label_boxes
+            self.folds[fold]["val_label_boxes"] = val_label_boxes
+            self.folds[fold]["train_fg_voxels"] = train_fg_voxels
             self.folds[fold]["steps_per_epoch"] = max(
                 training["min_steps_per_epoch"],
                 math.ceil(len(train_images) / max(1, self.batch_size)),
@@ -548,6 +596,10 @@ class BaseTrainer(ABC):
         if use_ddp:
             model = DDP(model, device_ids=[rank])
 
+        # Compile the model if requested. Compiled kernels are cached in the
+        # results directory and reused by later folds and by inference.
+        model = compile_model(model, self.config, cache_dir=self.results_dir / "compile_cache")
+
         # Get loss function. First get the loss function from the registry.
         # We then wrap it in a DeepSupervisionLoss, which will handle
         # deep supervision if the model supports it.
@@ -604,17 +656,60 @@ class BaseTrainer(ABC):
         """Return the checkpoint path for a given fold."""
         return self.checkpoints_dir / f"fold_{fold}_checkpoint.pt"
 
-    def save_checkpoint(self, fold: int, state: dict[str, Any]) -> None:
+    def _epoch_checkpoint_path(self, fold: int, epoch: int) -> Path:
+        """Return the path of the checkpoint kept for an epoch of a fold."""
+        return self.checkpoints_dir / f"fold_{fold}_checkpoint_epoch_{epoch}.pt"
+
+    def _best_checkpoint_path(self, fold: int) -> Path:
+        """Return the path of the checkpoint of the best epoch of a fold."""
+        return self.checkpoints_dir / f"fold_{fold}_checkpoint_best.pt"
+
+    def _remove_old_checkpoints(self, fold: int, keep_last: int) -> None:
+        """Remove all but the keep_last most recent epoch checkpoints of a fold."""
+        paths = sorted(
+            self.checkpoints_dir.glob(f"fold_{fold}_checkpoint_epoch_*.pt"),
+            key=lambda path: (path.stat().st_mtime_ns, int(path.stem.rsplit("_", 1)[1])),
+        )
+        for path in paths[:-keep_last]:
+            path.unlink(missing_ok=True)
+
+    def save_checkpoint(
+        self,
+        fold: int,
+        state: dict[str, Any],
+        writer: checkpoint_writer.CheckpointWriter | None = None,
+        is_best: bool = False,
+    ) -> None:
         """Save a training checkpoint for the given fold (rank 0 only).
 
         Saves the current model weights, optimizer, and LR scheduler states
         alongside training bookkeeping (epoch, global step, best validation
         loss) so that training can be resumed exactly from this point.
 
+        The latest checkpoint is always at _checkpoint_path(fold). Settings
+        in config["training"]["checkpoints"] keep more of them: keep_last
+        keeps the checkpoints of that many recent epochs, and keep_best keeps
+        the checkpoint of the epoch with the best validation loss.
+
         Args:
             fold: The fold index being trained.
             state: The current training state dictionary.
+            writer: Writer that saves the checkpoint, maybe in the
+                background. If None, the checkpoint is saved before returning.
+            is_best: Whether the validation loss of this epoch is the best so
+                far.
+
+        Raises:
+            ValueError: If keep_last is less than 1.
         """
+        settings = self.config["training"].get("checkpoints") or {}
+        keep_last = settings.get("keep_last", TrainerConstants.DEFAULT_KEEP_LAST_CHECKPOINTS)
+        keep_best = settings.get("keep_best", TrainerConstants.DEFAULT_KEEP_BEST_CHECKPOINT)
+        if keep_last < 1:
+            raise ValueError(f"checkpoints.keep_last must be at least 1, got {keep_last}.")
+        if writer is None:
+            writer = checkpoint_writer.CheckpointWriter(asynchronous=False)
+
         model = state["model"]
         unwrapped = model.module if hasattr(model, "module") else model
         checkpoint = {
@@ -626,12 +721,19 @@ class BaseTrainer(ABC):
             "optimizer_state_dict": state["optimizer"].state_dict(),
             "lr_scheduler_state_dict": state["lr_scheduler"].state_dict(),
         }
-        # Write to a temp file then atomically rename so a mid-write SIGKILL
-        # never leaves a corrupted checkpoint on disk.
+        # The writer saves to a temp file then atomically renames it so a
+        # mid-write SIGKILL never leaves a corrupted checkpoint on disk. Kept
+        # checkpoints are hard links to the latest one where possible.
         path = self._checkpoint_path(fold)
-        tmp = path.with_suffix(".tmp")
-        torch.save(checkpoint, tmp)
-        tmp.rename(path)
+        if keep_last > 1:
+            epoch_path = self._epoch_checkpoint_path(fold, state["epoch"])
+            writer.save(checkpoint, epoch_path)
+            writer.run(checkpoint_writer.link_atomic, epoch_path, path)
+            writer.run(self._remove_old_checkpoints, fold, keep_last)
+        else:
+            writer.save(checkpoint, path)
+        if keep_best and is_best:
+            writer.run(checkpoint_writer.link_atomic, path, self._best_checkpoint_path(fold))
 
     def load_checkpoint(self, fold: int, state: dict[str, Any]) -> bool:
         """Load a training checkpoint into state (all ranks).
@@ -687,6 +789,23 @@ class BaseTrainer(ABC):
         if dist.is_initialized():
             dist.destroy_process_group()
 
+    def _read_loss_sum(
+        self, loss_sum: training_utils.LossSum, world_size: int
+    ) -> tuple[float, int]:
+        """Read a loss sum on the host as the sum of the mean loss across ranks.
+
+        This waits for the device. With several ranks, the sums are
+        all-reduced, so every rank must read its sum at the same step.
+
+        Returns:
+            The sum and the number of losses in it.
+        """
+        total, count = loss_sum.pop()
+        if world_size > 1:
+            dist.all_reduce(total, op=dist.ReduceOp.SUM)
+            total = total / world_size
+        return total.item(), count
+
     def train_fold(self, fold: int, rank: int, world_size: int) -> None:
         """Generic training loop for a single fold."""
         # Set up for distributed training.
@@ -707,6 +826,17 @@ class BaseTrainer(ABC):
             )
         val_steps = math.ceil(len(fold_data["val_images"]) / max(1, world_size))
 
+        # Losses are summed on the device and read on the host every
+        # sync_steps steps and at the end of each epoch, not at every step.
+        sync_steps = max(
+            1,
+            self.config["training"].get(
+                "loss_sync_steps", TrainerConstants.DEFAULT_LOSS_SYNC_STEPS
+            ),
+        )
+        train_loss_sum = training_utils.LossSum()
+        val_loss_sum = training_utils.LossSum()
+
         # Build components for the fold.
         state = self.build_components(rank=rank, world_size=world_size)
 
@@ -738,6 +868,16 @@ class BaseTrainer(ABC):
             # Path and name for best model for this fold.
             model_name = str(self.models_dir / f"fold_{fold}.pt")
 
+            # Save checkpoints and best models in the background, so the
+            # other ranks do not wait at the next barrier while they are
+            # written.
+            checkpoint_settings = self.config["training"].get("checkpoints") or {}
+            writer = checkpoint_writer.CheckpointWriter(
+                asynchronous=checkpoint_settings.get(
+                    "async_write", TrainerConstants.DEFAULT_ASYNC_CHECKPOINTS
+                )
+            )
+
         # Stop training flag if we encounter nan or inf losses.
         stop_training = torch.tensor([0], dtype=torch.int, device=f"cuda:{rank}")
 
@@ -766,7 +906,7 @@ class BaseTrainer(ABC):
                 else contextlib.nullcontext()
             )
             with pb_ctx as pb:
-                for _ in range(fold_data["steps_per_epoch"]):
+                for step in range(fold_data["steps_per_epoch"]):
                     # Get a batch of training data.
                     batch = train_loader.next()[0]
 
@@ -776,35 +916,43 @@ class BaseTrainer(ABC):
                     # Update the global step in the state.
                     state["global_step"] += 1
 
-                    # Detach and aggregate across all ranks (mean).
-                    with torch.no_grad():
-                        loss_det = loss.detach()
-                        if use_ddp:
-                            dist.all_reduce(loss_det, op=dist.ReduceOp.SUM)
-                            mean_loss = (loss_det / world_size).item()
-                        else:
-                            mean_loss = loss_det.item()
-
-                    # Check for NaN/Inf and flag for early exit.
-                    if not np.isfinite(mean_loss):
+                    # Add the loss to the sum on the device, and read the sum
+                    # (mean across ranks) every sync_steps steps.
+                    train_loss_sum.add(loss)
+                    if (
+                        train_loss_sum.count == sync_steps
+                        or step == fold_data["steps_per_epoch"] - 1
+                    ):
+                        loss_total, loss_count = self._read_loss_sum(train_loss_sum, world_size)
+
+                        # Check for NaN/Inf and flag for early exit. A NaN or
+                        # inf loss makes the whole sum NaN or inf.
+                        if not np.isfinite(loss_total):
+                            if rank == 0:
+                                print_error("Stopping training: Detected NaN or inf loss value!")
+                            stop_training[0] = 1
+
                         if rank == 0:
-                            print_error("Stopping training: Detected NaN or inf loss value!")
-                        stop_training[0] = 1
+                            running_train_loss.add(loss_total, loss_count)
 
-                    # Update running average and progress bar (rank 0 only).
+                    # Update the progress bar with the last loss read (rank 0
+                    # only).
                     if rank == 0:
-                        train_mean_loss = running_train_loss(mean_loss)
                         pb.update(
-                            loss=train_mean_loss,
+                            loss=running_train_loss.result(),
                             lr=state["optimizer"].param_groups[0]["lr"],
                         )
 
+            if rank == 0:
+                train_mean_loss = running_train_loss.result()
+
             # Broadcast stop flag so all ranks exit together if needed.
             if use_ddp:
                 dist.broadcast(stop_training, src=0)
             if stop_training.item() == 1:
                 if rank == 0:
                     logs_writer.close()
+                    writer.close()
                 self.cleanup()
                 return  # Exit training early.
 
@@ -825,29 +973,30 @@ class BaseTrainer(ABC):
                     else contextlib.nullcontext()
                 )
                 with pbv_ctx as pbv:
-                    for _ in range(val_steps):
+                    for step in range(val_steps):
                         # Get a batch of validation data.
                         batch = val_loader.next()[0]
 
                         # Compute validation loss.
                         val_loss = self.validation_step(state=state, data=batch)
 
-                        # Aggregate mean across ranks.
-                        val_det = val_loss.detach()
-                        if use_ddp:
-                            dist.all_reduce(val_det, op=dist.ReduceOp.SUM)
-                            mean_val = (val_det / world_size).item()
-                        else:
-                            mean_val = val_det.item()
+                        # Sum on the device and read the mean across ranks
+                        # every sync_steps steps, as in training.
+                        val_loss_sum.add(val_loss)
+                        if val_loss_sum.count == sync_steps or step == val_steps - 1:
+                            loss_total, loss_count = self._read_loss_sum(val_loss_sum, world_size)
+                            if rank == 0:
+                                running_val_loss.add(loss_total, loss_count)
 
-                        # Update running average and progress bar (rank 0 only).
+                        # Update progress bar (rank 0 only).
                         if rank == 0:
-                            val_mean_loss = running_val_loss(mean_val)
-                            pbv.update(loss=val_mean_loss)
+                            pbv.update(loss=running_val_loss.result())
 
                 # Check if validation loss improved and save model (rank 0 only).
                 if rank == 0:
-                    if val_mean_loss < state["best_val_loss"]:
+                    val_mean_loss = running_val_loss.result()
+                    improved = val_mean_loss < state["best_val_loss"]
+                    if improved:
                         print_success(
                             f"Validation loss improved from "
                             f"{state['best_val_loss']:.4f} to "
@@ -864,7 +1013,7 @@ class BaseTrainer(ABC):
                             if hasattr(state["model"], "module")
                             else state["model"]
                         )
-                        torch.save(to_save.state_dict(), model_name)
+                        writer.save(to_save.state_dict(), model_name)
                     else:
                         print_info("Validation loss did not improve.")
 
@@ -900,15 +1049,17 @@ class BaseTrainer(ABC):
 
             # Save checkpoint after every epoch (rank 0 only).
             if rank == 0:
-                self.save_checkpoint(fold, state)
+                self.save_checkpoint(fold, state, writer=writer, is_best=improved)
 
             # Wait for all processes to finish before starting the next epoch.
             if use_ddp:
                 dist.barrier()
 
-        # Close the tensorboard writer.
+        # Close the tensorboard writer, and wait for the checkpoints to be
+        # written.
         if rank == 0:
             logs_writer.close()
+            writer.close()
 
         # Clean up distributed processes.
         self.cleanup()
@@ -1,15 +1,80 @@
 """3D patch trainer for MIST built on top of BaseTrainer."""
 
+from types import ModuleType
 from typing import Any
 
 import torch
 from monai.inferers import sliding_window_inference
 
-from mist.data_loading import dali_loader
+from mist.data_loading import shared_cache, torch_loader
+from mist.data_loading.data_loading_constants import DataLoadingConstants as dlc
+from mist.preprocessing import storage
 from mist.training.trainers.base_trainer import BaseTrainer
 from mist.training.trainers.trainer_constants import TrainerConstants as constants
 from mist.utils import hardware
 
+# DALI is optional when training with the PyTorch data loader.
+try:
+    from mist.data_loading import dali_loader
+except ImportError:
+    dali_loader = None  # type: ignore[assignment]
+
+
+def get_data_loader(backend: str) -> ModuleType:
+    """Return the data loader module of a backend.
+
+    Args:
+        backend: "dali" or "torch".
+
+    Returns:
+        dali_loader or torch_loader.
+
+    Raises:
+        ValueError: If the backend is not known.
+        RuntimeError: If the backend is "dali" and DALI is not installed.
+    """
+    if backend not in dlc.DATA_LOADER_BACKENDS:
+        raise ValueError(
+            f"Unknown data loader '{backend}'. Choose from {list(dlc.DATA_LOADER_BACKENDS)}."
+        )
+    if backend == "torch":
+        return torch_loader
+    if dali_loader is None:
+        raise RuntimeError(
+            "NVIDIA DALI is required for the 'dali' data loader. Install with: "
+            "pip install 'mist-medical[train]', or set training.data_loader to 'torch'."
+        )
+    return dali_loader
+
+
+# Lists of files in the fold data that the loaders read through the cache.
+CACHED_FOLD_FILES = ("train_images", "train_labels", "train_dtms", "val_images", "val_labels")
+
+
+def cache_fold_files(
+    cache: shared_cache.SharedFileCache, fold_data: dict[str, Any]
+) -> dict[str, Any]:
+    """Return fold data whose images, labels, and DTMs are read from the cache.
+
+    The DALI readers take fixed lists of files, so caching the files of a
+    fold never removes cached files that the readers of another fold or run
+    may still read. Files that do not fit are read from disk.
+
+    Args:
+        cache: The shared memory cache.
+        fold_data: Fold data from BaseTrainer.
+
+    Returns:
+        A copy of the fold data with the paths of the cached files.
+    """
+    keys = [key for key in CACHED_FOLD_FILES if fold_data.get(key)]
+    paths = cache.get_all([path for key in keys for path in fold_data[key]])
+    cached = dict(fold_data)
+    for key in keys:
+        count = len(fold_data[key])
+        cached[key], paths = paths[:count], paths[count:]
+    return cached
+
 
 class Patch3DTrainer(BaseTrainer):
     """Trainer for 3D patch-based training in MIST."""
@@ -20,13 +85,16 @@ class Patch3DTrainer(BaseTrainer):
         rank: int,
         world_size: int,
     ) -> tuple[Any, Any]:
-        """Build DALI dataloaders for training and validation.
+        """Build dataloaders for training and validation.
 
-        This method constructs the DALI-based training and validation data
-        loaders for MIST's 3D patch training. It uses the provided fold
-        information to access the correct image and label paths, and applies
-        the necessary transformations and augmentations as specified in the
-        configuration.
+        This method constructs the training and validation data loaders for
+        MIST's 3D patch training. It uses the provided fold information to
+        access the correct image and label paths, and applies the necessary
+        transformations and augmentations as specified in the configuration.
+        The loaders use DALI unless training.data_loader is "torch". With
+        training.shared_cache enabled, the PyTorch loaders read files through
+        the cache as they go, and the DALI loaders read the fold's files from
+        it if they all fit.
 
         Args:
             fold_data: Dictionary containing the following key-value pairs:
@@ -35,21 +103,39 @@ class Patch3DTrainer(BaseTrainer):
                 - "train_dtms": List of paths to DTM images (optional).
                 - "val_images": List of paths to validation images.
                 - "val_labels": List of paths to validation labels.
+                - "train_label_boxes", "val_label_boxes": Lists of paths to
+                    the label crop boxes for data saved in the compact
+                    storage format (optional).
+                - "train_fg_voxels": List of paths to the sampled
+                    foreground voxels of the training labels (optional).
             rank: The rank of the current process in distributed training.
             world_size: The total number of processes in distributed training.
 
         Returns:
             Tuple containing:
-                - train_loader: DALI training data loader. This loader will
+                - train_loader: Training data loader. This loader will
                     yield batches of randomly sampled patches from the training
                     images, applying the specified augmentations.
-                - val_loader: DALI validation data loader. This loader will
+                - val_loader: Validation data loader. This loader will
                     yield full images for validation, without random sampling.
+
+        Raises:
+            ValueError: If training.data_loader is not a known backend.
+            RuntimeError: If the DALI backend is selected but DALI is not
+                installed.
         """
         # Build training loader.
         training = self.config["training"]
+        loader = get_data_loader(training.get("data_loader", dlc.DEFAULT_DATA_LOADER))
         train_labels = self.config["dataset_info"]["labels"][1:]
-        train_loader = dali_loader.get_training_dataset(
+        half_precision = storage.get_storage_format(self.config) == "compact"
+        cache = shared_cache.get_shared_cache(training, self.numpy_dir)
+        cache_kwargs = {}
+        if cache is not None and loader is torch_loader:
+            cache_kwargs["cache"] = cache
+        elif cache is not None:
+            fold_data = cache_fold_files(cache, fold_data)
+        train_loader = loader.get_training_dataset(
             extract_patches=True,
             image_paths=fold_data["train_images"],
             label_paths=fold_data["train_labels"],
@@ -69,16 +155,24 @@ class Patch3DTrainer(BaseTrainer):
             use_zoom=training["augmentation"]["transforms"]["zoom"],
             rank=rank,
             world_size=world_size,
+            label_box_paths=fold_data.get("train_label_boxes"),
+            half_precision=half_precision,
+            fg_voxel_paths=fold_data.get("train_fg_voxels"),
+            samples_per_volume=training.get("samples_per_volume", dlc.DEFAULT_SAMPLES_PER_VOLUME),
+            **cache_kwargs,
         )
 
         # Build validation loader.
-        val_loader = dali_loader.get_validation_dataset(
+        val_loader = loader.get_validation_dataset(
             image_paths=fold_data["val_images"],
             label_paths=fold_data["val_labels"],
             seed=training["seed"],
             num_workers=training["hardware"]["num_cpu_workers"],
             rank=rank,
             world_size=world_size,
+            label_box_paths=fold_data.get("val_label_boxes"),
+            half_precision=half_precision,
+            **cache_kwargs,
         )
         return train_loader, val_loader
 
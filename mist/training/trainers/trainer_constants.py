@@ -14,6 +14,18 @@ class TrainerConstants:
     # Gradient clipping value.
     GRAD_CLIP_VALUE: float = 1.0
 
+    # Training steps between reads of the loss on the host, set by
+    # config["training"]["loss_sync_steps"]. Losses are also read at the end
+    # of each epoch.
+    DEFAULT_LOSS_SYNC_STEPS: int = 25
+
+    # Checkpoint defaults, set by config["training"]["checkpoints"]. By
+    # default, checkpoints are written in the background, and only the latest
+    # one is kept.
+    DEFAULT_ASYNC_CHECKPOINTS: bool = True
+    DEFAULT_KEEP_LAST_CHECKPOINTS: int = 1
+    DEFAULT_KEEP_BEST_CHECKPOINT: bool = False
+
     # Loss names that require sddl_spacing_xyz at construction.
     SPACING_AWARE_LOSSES: frozenset[str] = frozenset({"volumetric_sddl", "vessel_sddl"})
 
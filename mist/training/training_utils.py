@@ -4,6 +4,8 @@ from collections.abc import Sequence
 from pathlib import Path
 from typing import Any
 
+import torch
+
 
 def _format_parameter_count(num_params: int) -> str:
     """Format a parameter count as e.g. '0.68M (683,412)'."""
@@ -62,6 +64,12 @@ class RunningMean:
         self.count += 1
         return self.result()
 
+    def add(self, total: float, count: int) -> float:
+        """Update the mean with the sum of several values."""
+        self.total += total
+        self.count += count
+        return self.result()
+
     def result(self) -> float:
         """Return the current mean."""
         return self.total / self.count if self.count != 0 else 0.0
@@ -72,6 +80,41 @@ class RunningMean:
         self.total = 0
 
 
+class LossSum:
+    """Sum of loss values, kept on the device of the losses.
+
+    Reading a loss on the host with loss.item() waits for the device to
+    finish computing it. Adding losses to a sum on the device does not, so
+    trainers read the sum only every few steps.
+
+    Attributes:
+        total: Sum of the losses added since the last pop, or None.
+        count: Number of losses added since the last pop.
+    """
+
+    def __init__(self):
+        self.total: torch.Tensor | None = None
+        self.count = 0
+
+    def add(self, loss: torch.Tensor) -> None:
+        """Add a loss to the sum without reading it."""
+        loss = loss.detach().float()
+        self.total = loss if self.total is None else self.total + loss
+        self.count += 1
+
+    def pop(self) -> tuple[torch.Tensor, int]:
+        """Return the sum and number of losses, and start a new sum.
+
+        Raises:
+            ValueError: If no losses were added.
+        """
+        if self.total is None:
+            raise ValueError("No losses were added to the sum.")
+        total, count = self.total, self.count
+        self.total, self.count = None, 0
+        return total, count
+
+
 def sanity_check_fold_data(
     fold: int,
     train_images: Sequence[str | Path],
@@ -0,0 +1,243 @@
+"""Tests for mist.analyze_data.analysis_cache."""
+
+import os
+from pathlib import Path
+
+import ants
+import numpy as np
+import pytest
+
+from mist.analyze_data import analysis_cache, scan_utils
+from mist.analyze_data.analyzer_constants import AnalyzeConstants
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _write_image(path: Path, arr: np.ndarray) -> str:
+    """Write a numpy array to disk as a NIfTI image and return its path."""
+    ants.image_write(ants.from_numpy(arr.astype(np.float32)), str(path))
+    return str(path)
+
+
+def _make_patient(tmp_path: Path) -> dict:
+    """Write a patient with one mask and one CT image to tmp_path."""
+    mask = np.zeros((10, 10, 10))
+    mask[2:6, 2:6, 2:6] = 1
+    mask[7:9, 7:9, 7:9] = 2
+    ct = np.zeros((10, 10, 10))
+    ct[1:9, 1:9, 1:9] = 40.0
+    return {
+        "id": 3,
+        "fold": 0,
+        "mask": _write_image(tmp_path / "p_mask.nii.gz", mask),
+        "ct": _write_image(tmp_path / "p_ct.nii.gz", ct),
+    }
+
+
+FULL_OPTIONS = analysis_cache.get_scan_options(True, ["ct"], [1, 2])
+BASIC_OPTIONS = analysis_cache.get_scan_options(False, None, None)
+
+
+def _cache_entry(patient: dict, options: dict) -> dict:
+    """Scan a patient and build its cache entry as the Analyzer does."""
+    record = scan_utils.scan_patient(patient, **options)
+    return {
+        "id": str(patient["id"]),
+        "fingerprint": analysis_cache.get_patient_fingerprint(patient),
+        "options": options,
+        "record": analysis_cache.encode_record(record),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+
+
+class TestFingerprint:
+    """Tests for get_patient_fingerprint."""
+
+    def test_stable_for_unchanged_files(self, tmp_path):
+        """Fingerprinting twice without changes gives the same value."""
+        patient = _make_patient(tmp_path)
+        first = analysis_cache.get_patient_fingerprint(patient)
+        assert first is not None
+        assert analysis_cache.get_patient_fingerprint(patient) == first
+
+    def test_changes_with_mtime(self, tmp_path):
+        """Touching a file changes the fingerprint."""
+        patient = _make_patient(tmp_path)
+        before = analysis_cache.get_patient_fingerprint(patient)
+        stat = os.stat(patient["ct"])
+        os.utime(patient["ct"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert analysis_cache.get_patient_fingerprint(patient) != before
+
+    def test_changes_with_content(self, tmp_path):
+        """Rewriting an image with a different header changes the fingerprint."""
+        patient = _make_patient(tmp_path)
+        before = analysis_cache.get_patient_fingerprint(patient)
+        _write_image(Path(patient["ct"]), np.ones((12, 10, 10)))
+        assert analysis_cache.get_patient_fingerprint(patient) != before
+
+    def test_missing_file_gives_none(self, tmp_path):
+        """Patients with missing files cannot be fingerprinted."""
+        patient = _make_patient(tmp_path)
+        patient["ct"] = str(tmp_path / "missing.nii.gz")
+        assert analysis_cache.get_patient_fingerprint(patient) is None
+
+
+# ---------------------------------------------------------------------------
+# Record encoding
+# ---------------------------------------------------------------------------
+
+
+def test_encode_decode_round_trip(tmp_path):
+    """Records survive the JSON round trip with their original types."""
+    patient = _make_patient(tmp_path)
+    record = scan_utils.scan_patient(patient, **FULL_OPTIONS)
+    cache_path = tmp_path / "cache.jsonl"
+    analysis_cache.write_cache(
+        cache_path,
+        [
+            {
+                "id": "3",
+                "fingerprint": "x",
+                "options": FULL_OPTIONS,
+                "record": analysis_cache.encode_record(record),
+            }
+        ],
+    )
+    decoded = analysis_cache.decode_record(analysis_cache.load_cache(cache_path)["3"]["record"])
+
+    assert decoded["labels"] == record["labels"]
+    assert decoded["mask_header"] == record["mask_header"]
+    assert decoded["rai_spacing"] == record["rai_spacing"]
+    assert decoded["image_dims"] == record["image_dims"]
+    assert decoded["fg_bbox"] == record["fg_bbox"]
+    assert decoded["nz_ratio"] == pytest.approx(record["nz_ratio"])
+
+    n, mean, m2, hist, n_out = decoded["ct_stats"]
+    assert (n, n_out) == (record["ct_stats"][0], record["ct_stats"][4])
+    assert mean == pytest.approx(record["ct_stats"][1])
+    assert m2 == pytest.approx(record["ct_stats"][2])
+    assert hist.shape == (AnalyzeConstants.CT_HU_HIST_BINS,)
+    np.testing.assert_array_equal(hist, record["ct_stats"][3])
+
+    dump, expected = decoded["dump_stats"], record["dump_stats"]
+    assert dump["label_voxel_counts"] == expected["label_voxel_counts"]
+    assert set(dump["label_shape_descriptors"]) == {1, 2}
+    assert dump["channel_samples"]["ct"].dtype == np.float32
+    np.testing.assert_array_equal(dump["channel_samples"]["ct"], expected["channel_samples"]["ct"])
+
+
+# ---------------------------------------------------------------------------
+# Loading and writing
+# ---------------------------------------------------------------------------
+
+
+class TestLoadCache:
+    """Tests for load_cache and write_cache."""
+
+    def test_missing_file_is_empty(self, tmp_path):
+        """A missing cache file loads as an empty cache."""
+        assert analysis_cache.load_cache(tmp_path / "nope.jsonl") == {}
+
+    def test_corrupt_file_is_empty(self, tmp_path):
+        """A truncated or corrupt cache is ignored rather than raising."""
+        cache_path = tmp_path / "cache.jsonl"
+        cache_path.write_text("{not json\n", encoding="utf-8")
+        assert analysis_cache.load_cache(cache_path) == {}
+
+    def test_settings_change_invalidates(self, tmp_path, monkeypatch):
+        """Changing a constant that affects the analysis discards the cache."""
+        cache_path = tmp_path / "cache.jsonl"
+        analysis_cache.write_cache(
+            cache_path, [_cache_entry(_make_patient(tmp_path), BASIC_OPTIONS)]
+        )
+        assert "3" in analysis_cache.load_cache(cache_path)
+
+        monkeypatch.setattr(AnalyzeConstants, "CT_HU_HIST_BINS", 2048, raising=True)
+        assert analysis_cache.load_cache(cache_path) == {}
+
+    def test_write_is_atomic(self, tmp_path):
+        """No temporary file is left behind after writing."""
+        cache_path = tmp_path / "cache.jsonl"
+        analysis_cache.write_cache(cache_path, [])
+        assert [p.name for p in tmp_path.iterdir()] == ["cache.jsonl"]
+
+
+# ---------------------------------------------------------------------------
+# scan_patient_cached
+# ---------------------------------------------------------------------------
+
+
+class TestScanPatientCached:
+    """Tests for scan_patient_cached."""
+
+    def _count_reads(self, monkeypatch) -> list:
+        reads = []
+        real_read = ants.image_read
+
+        def _counting_read(path, *args, **kwargs):
+            reads.append(path)
+            return real_read(path, *args, **kwargs)
+
+        monkeypatch.setattr(ants, "image_read", _counting_read, raising=True)
+        return reads
+
+    def test_hit_reads_no_voxel_data(self, tmp_path, monkeypatch):
+        """A current entry is returned without opening any image."""
+        patient = _make_patient(tmp_path)
+        entry = _cache_entry(patient, FULL_OPTIONS)
+        reads = self._count_reads(monkeypatch)
+
+        record, fingerprint, hit = analysis_cache.scan_patient_cached(patient, entry, FULL_OPTIONS)
+        assert hit
+        assert reads == []
+        assert fingerprint == entry["fingerprint"]
+        assert record["id"] == 3
+
+    def test_superset_entry_satisfies_basic_scan(self, tmp_path):
+        """A record with CT and dump statistics serves a plain scan."""
+        patient = _make_patient(tmp_path)
+        entry = _cache_entry(patient, FULL_OPTIONS)
+        _, _, hit = analysis_cache.scan_patient_cached(patient, entry, BASIC_OPTIONS)
+        assert hit
+
+    def test_missing_ct_stats_forces_rescan(self, tmp_path, monkeypatch):
+        """A record without CT statistics cannot serve a CT scan."""
+        patient = _make_patient(tmp_path)
+        entry = _cache_entry(patient, BASIC_OPTIONS)
+        reads = self._count_reads(monkeypatch)
+        record, _, hit = analysis_cache.scan_patient_cached(patient, entry, FULL_OPTIONS)
+        assert not hit
+        assert len(reads) == 2
+        assert record["ct_stats"] is not None
+
+    def test_changed_skeleton_budget_forces_rescan(self, tmp_path):
+        """Dump statistics computed with another skeleton voxel budget are stale."""
+        patient = _make_patient(tmp_path)
+        options = analysis_cache.get_scan_options(True, ["ct"], [1, 2], 1000)
+        entry = _cache_entry(patient, options)
+        _, _, hit = analysis_cache.scan_patient_cached(patient, entry, options)
+        assert hit
+        other = analysis_cache.get_scan_options(True, ["ct"], [1, 2], 2000)
+        _, _, hit = analysis_cache.scan_patient_cached(patient, entry, other)
+        assert not hit
+        # Entries written before the budget was an option are rescanned too.
+        entry["options"] = {
+            key: value for key, value in options.items() if key != "skeleton_voxel_budget"
+        }
+        _, _, hit = analysis_cache.scan_patient_cached(patient, entry, options)
+        assert not hit
+
+    def test_changed_file_forces_rescan(self, tmp_path):
+        """Modifying a file invalidates its patient's entry."""
+        patient = _make_patient(tmp_path)
+        entry = _cache_entry(patient, BASIC_OPTIONS)
+        _write_image(Path(patient["mask"]), np.ones((10, 10, 10)))
+        record, _, hit = analysis_cache.scan_patient_cached(patient, entry, BASIC_OPTIONS)
+        assert not hit
+        assert record["labels"] == [1]
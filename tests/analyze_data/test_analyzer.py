@@ -10,10 +10,12 @@ import numpy as np
 import pandas as pd
 import pytest
 
+from mist.analyze_data import analysis_cache, memory_planner
 from mist.analyze_data import analyzer_utils as au
 
 # MIST imports.
 from mist.analyze_data.analyzer import Analyzer
+from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
 from mist.analyze_data.data_dumper import DataDumper
 from mist.preprocessing import preprocessing_utils
 from mist.utils import io as io_mod
@@ -102,14 +104,9 @@ def fake_get_float32_example_memory_size(dims, nch, _nlabels) -> int:
     return int(np.prod(dims) * max(1, nch) * 4)
 
 
-def fake_image_header_info(_p: str) -> dict:
-    """Return a fake image header."""
-    return {"dimensions": (10, 10, 10), "spacing": (1.0, 1.0, 1.0)}
-
-
-def fake_reorient_image2(image, _orient):
-    """Return image unchanged."""
-    return image
+def fake_image_header_info(_p: str, spacing=(1.0, 1.0, 1.0)) -> dict:
+    """Return a fake image header with identity direction."""
+    return {"dimensions": (10, 10, 10), "spacing": spacing, "direction": np.eye(3)}
 
 
 def fake_get_fg_mask_bbox(_image) -> dict:
@@ -206,7 +203,6 @@ def _patch_env(monkeypatch, tmp_path):
         fake_image_header_info,
         raising=True,
     )
-    monkeypatch.setattr(ants, "reorient_image2", fake_reorient_image2, raising=True)
     monkeypatch.setattr(
         progress_bar,
         "get_progress_bar",
@@ -488,8 +484,8 @@ class TestAnalyzerHelpers:
         """Anisotropic images → target spacing max equals the percentile."""
         monkeypatch.setattr(
             ants,
-            "image_read",
-            lambda _p: make_ants_image(spacing=(1.0, 1.0, 5.0)),
+            "image_header_info",
+            lambda p: fake_image_header_info(p, spacing=(1.0, 1.0, 5.0)),
             raising=True,
         )
         monkeypatch.setattr(np, "percentile", lambda a, q: 3.0, raising=True)
@@ -579,6 +575,139 @@ class TestAnalyzerHelpers:
             a.check_resampled_dims(np.ones((TRAIN_N, 3)) * 5)
 
 
+# ---------------------------------------------------------------------------
+# scan_dataset
+# ---------------------------------------------------------------------------
+
+
+class TestScanDataset:
+    """Tests for the single-pass dataset scan shared by all analysis methods."""
+
+    def test_analysis_reads_each_file_once(self, args, monkeypatch):
+        """Validation plus every analysis method reads each file exactly once."""
+        reads = []
+
+        def _counting_read(path):
+            reads.append(path)
+            return make_ants_image()
+
+        monkeypatch.setattr(ants, "image_read", _counting_read, raising=True)
+        a = Analyzer(args)
+        a.validate_dataset()
+        a.get_target_spacing()
+        a.check_crop_fg()
+        a.check_nz_ratio()
+        a.get_ct_normalization_parameters()
+        assert len(reads) == 2 * TRAIN_N
+        assert len(set(reads)) == 2 * TRAIN_N
+
+    def test_records_are_keyed_by_patient_id(self, args):
+        """scan_dataset stores one record per patient ID."""
+        a = Analyzer(args)
+        a.scan_dataset()
+        assert set(a.scan_records) == set(a.paths_df["id"])
+
+    def test_excluded_patients_are_not_analyzed(self, args, monkeypatch):
+        """Records of patients dropped by validation are ignored afterwards."""
+
+        def _read_dispatch(path: str):
+            if "0_mask.nii.gz" in str(path):
+                raise RuntimeError("corrupted NIfTI header")
+            return make_ants_image()
+
+        monkeypatch.setattr(ants, "image_read", _read_dispatch, raising=True)
+        a = Analyzer(args)
+        a.validate_dataset()
+        # Patient 0 failed to read but was excluded, so analysis succeeds.
+        assert a.get_target_spacing() == [1.0, 1.0, 1.0]
+
+    def test_ct_parameters_require_ct_modality(self, args, monkeypatch):
+        """Non-CT datasets do not collect CT statistics during the scan."""
+
+        def _mr(path):
+            d = fake_dataset_json(path)
+            d["modality"] = "mr"
+            return d
+
+        monkeypatch.setattr(io_mod, "read_json_file", _mr, raising=True)
+        with pytest.raises(RuntimeError, match="No CT statistics"):
+            Analyzer(args).get_ct_normalization_parameters()
+
+    def test_data_dumper_receives_scan_statistics(self, args, monkeypatch):
+        """run() hands the per-patient data dump statistics to DataDumper."""
+        args.data_dump = True
+        captured = {}
+        monkeypatch.setattr(
+            DataDumper,
+            "run",
+            lambda self: captured.update(stats=self.patient_stats),
+            raising=True,
+        )
+        Analyzer(args).run()
+        assert len(captured["stats"]) == TRAIN_N
+        assert all(s["fg_count"] == 1000 for s in captured["stats"])
+
+    def test_process_backend_matches_thread_backend(self, args):
+        """Both executors produce the same records."""
+        args.num_workers_analyze = 2
+        thread_analyzer = Analyzer(args)
+        thread_analyzer.scan_dataset()
+
+        args.analyze_backend = "process"
+        process_analyzer = Analyzer(args)
+        process_analyzer.scan_dataset()
+        assert process_analyzer.backend == "process"
+        assert set(process_analyzer.scan_records) == set(thread_analyzer.scan_records)
+        assert process_analyzer.get_target_spacing() == thread_analyzer.get_target_spacing()
+
+    def test_unknown_backend_raises(self, args):
+        """Only the thread and process backends are supported."""
+        args.analyze_backend = "gpu"
+        with pytest.raises(ValueError, match="Unknown analyze backend"):
+            Analyzer(args)
+
+    def test_second_analysis_uses_cache(self, args, monkeypatch):
+        """Unchanged patients are taken from analysis_cache.jsonl on rerun."""
+        reads = []
+
+        def _counting_read(path):
+            reads.append(path)
+            return make_ants_image()
+
+        monkeypatch.setattr(ants, "image_read", _counting_read, raising=True)
+        monkeypatch.setattr(
+            analysis_cache, "get_patient_fingerprint", lambda p: f"fp-{p['id']}", raising=True
+        )
+        first = Analyzer(args)
+        first.scan_dataset()
+        assert (Path(args.results) / "analysis_cache.jsonl").exists()
+        assert len(reads) == 2 * TRAIN_N
+
+        reads.clear()
+        second = Analyzer(args)
+        second.scan_dataset()
+        assert reads == []
+        assert second.get_target_spacing() == first.get_target_spacing()
+
+    def test_refresh_ignores_cache(self, args, monkeypatch):
+        """--refresh rescans every patient even if the cache is current."""
+        reads = []
+
+        def _counting_read(path):
+            reads.append(path)
+            return make_ants_image()
+
+        monkeypatch.setattr(ants, "image_read", _counting_read, raising=True)
+        monkeypatch.setattr(
+            analysis_cache, "get_patient_fingerprint", lambda p: f"fp-{p['id']}", raising=True
+        )
+        Analyzer(args).scan_dataset()
+        reads.clear()
+        args.refresh = True
+        Analyzer(args).scan_dataset()
+        assert len(reads) == 2 * TRAIN_N
+
+
 # ---------------------------------------------------------------------------
 # get_ct_normalization_parameters
 # ---------------------------------------------------------------------------
@@ -902,6 +1031,22 @@ class TestAnalyzerRun:
         Analyzer(args).run()
         assert called
 
+    def test_run_passes_skeleton_voxel_budget_to_data_dumper(self, args, monkeypatch):
+        """--skeleton-voxel-budget reaches DataDumper; it defaults to the constant."""
+        args.data_dump = True
+        budgets = []
+        monkeypatch.setattr(
+            DataDumper,
+            "run",
+            lambda self: budgets.append(self.skeleton_voxel_budget),
+            raising=True,
+        )
+        Analyzer(args).run()
+        args.skeleton_voxel_budget = 1234
+        args.overwrite = True
+        Analyzer(args).run()
+        assert budgets == [constants.MAX_SKELETON_VOXELS, 1234]
+
 
 # ---------------------------------------------------------------------------
 # validate_dataset
@@ -1186,3 +1331,147 @@ class TestValidateDataset:
             "In 0:" in m and "Mismatch between" in m and "images" in m for m in capture_console
         )
         assert_exclusion_summary(capture_console, 1)
+
+
+# ---------------------------------------------------------------------------
+# Sampled analysis (--analyze-sample)
+# ---------------------------------------------------------------------------
+
+
+class TestSampledAnalysis:
+    """Tests for the --analyze-sample mode."""
+
+    @pytest.fixture
+    def reads(self, monkeypatch):
+        """Record every voxel read."""
+        paths = []
+
+        def _counting_read(path):
+            paths.append(path)
+            return make_ants_image()
+
+        monkeypatch.setattr(ants, "image_read", _counting_read, raising=True)
+        return paths
+
+    def test_only_sampled_patients_are_read(self, args, reads):
+        """Voxel data is read for the sampled patients only."""
+        args.analyze_sample = 2
+        a = Analyzer(args)
+        a.analyze_dataset()
+        assert len(a.sample_ids) == 2
+        assert set(a.scan_records) == a.sample_ids
+        assert len(reads) == 2 * 2
+        assert len(a.cropped_dims) == 2
+        fg_bboxes = pd.read_csv(a.fg_bboxes_csv)
+        assert set(fg_bboxes["id"]) == a.sample_ids
+
+    def test_sample_is_reproducible(self, args):
+        """The same seed draws the same patients."""
+        args.analyze_sample = 3
+        args.analyze_stratify = "spacing"
+        first = Analyzer(args)
+        second = Analyzer(args)
+        assert first._get_sample_ids() == second._get_sample_ids()
+
+    def test_report_has_confidence_intervals(self, args):
+        """analysis_sample.json holds estimates with bracketing intervals."""
+        args.analyze_sample = 3
+        a = Analyzer(args)
+        a.analyze_dataset()
+        report = json.loads(a.sample_json.read_text(encoding="utf-8"))
+        assert report["sample_size"] == 3
+        assert report["num_patients"] == TRAIN_N
+        estimates = report["estimates"]
+        assert {"median_spacing", "volume_reduction", "nonzero_ratio", "ct_window_min"} <= set(
+            estimates
+        )
+        for estimate in estimates.values():
+            lower = np.atleast_1d(estimate["ci_lower"])
+            upper = np.atleast_1d(estimate["ci_upper"])
+            value = np.atleast_1d(estimate["estimate"])
+            assert np.all(lower <= value + 1e-9) and np.all(value <= upper + 1e-9)
+
+    def test_validation_checks_headers_of_all_patients(self, args, monkeypatch, capture_console):
+        """Header errors are found outside the sample and never sampled."""
+
+        def _hdr(path: str):
+            if path.startswith("4_"):
+                return {"dimensions": (10, 10, 10, 2), "spacing": (1.0, 1.0, 1.0, 1.0)}
+            return fake_image_header_info(path)
+
+        monkeypatch.setattr(ants, "image_header_info", _hdr, raising=True)
+        args.analyze_sample = 2
+        a = Analyzer(args)
+        a.validate_dataset()
+        assert len(a.header_records) == TRAIN_N
+        assert 4 not in a.sample_ids
+        assert len(a.paths_df) == TRAIN_N - 1
+        assert_exclusion_summary(capture_console, 1)
+
+    def test_unknown_stratification_raises(self, args):
+        """Only the documented stratification options are accepted."""
+        args.analyze_sample = 2
+        args.analyze_stratify = "scanner"
+        with pytest.raises(ValueError, match="Unknown stratification"):
+            Analyzer(args)
+
+
+# ---------------------------------------------------------------------------
+# Memory planning (--gpu-memory-budget)
+# ---------------------------------------------------------------------------
+
+
+class TestMemoryPlanning:
+    """Tests for the architecture-aware patch planning."""
+
+    @pytest.fixture
+    def plans(self, monkeypatch):
+        """Replace the planner with a stub and record its calls."""
+        calls = []
+        result = {
+            "patch_size": [32, 32, 32],
+            "batch_size": 1,
+            "peak_bytes": 3 * 1024**3,
+            "flops": int(2e12),
+            "fits": True,
+        }
+
+        def _plan(architecture, model_params, dims, spacing, budget, **kwargs):
+            calls.append((architecture, budget, kwargs))
+            return dict(result)
+
+        monkeypatch.setattr(memory_planner, "plan_patch_and_batch_size", _plan, raising=True)
+        return calls, result
+
+    def test_fixed_budget_without_memory_budget(self, args, plans):
+        """Without --gpu-memory-budget the planner is not used."""
+        calls, _ = plans
+        a = Analyzer(args)
+        a.analyze_dataset()
+        assert calls == []
+        assert a.config["spatial_config"]["patch_size"] == [16, 16, 16]
+
+    def test_planned_patch_and_batch_size(self, args, plans, capture_console):
+        """The planned patch and batch size are written to the configuration."""
+        calls, _ = plans
+        args.gpu_memory_budget = 8.0
+        args.plan_model = "mednext-small"
+        a = Analyzer(args)
+        a.analyze_dataset()
+
+        architecture, budget, kwargs = calls[0]
+        assert architecture == "mednext-small"
+        assert budget == 8 * 1024**3
+        assert kwargs["batch_size_per_gpu"] == 2
+        assert a.config["model"]["architecture"] == "mednext-small"
+        assert a.config["spatial_config"]["patch_size"] == [32, 32, 32]
+        assert a.config["training"]["batch_size_per_gpu"] == 1
+        assert any("TFLOPs per step" in m for m in capture_console)
+
+    def test_warns_if_nothing_fits(self, args, plans, capture_console):
+        """A warning is printed when even the smallest patch is too large."""
+        _, result = plans
+        result["fits"] = False
+        args.gpu_memory_budget = 1.0
+        Analyzer(args).analyze_dataset()
+        assert any("exceeds" in m for m in capture_console)
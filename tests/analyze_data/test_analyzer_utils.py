@@ -1,10 +1,12 @@
 """Tests for mist.analyze_data.analyze_utils."""
 
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 from unittest.mock import MagicMock, patch
 
+import ants
 import numpy as np
 import pandas as pd
 import pytest
@@ -99,6 +101,74 @@ class TestIsImage3D:
         assert au.is_image_3d(_make_header(dims=(128, 128))) is False
 
 
+# ---------------------------------------------------------------------------
+# get_rai_spacing_and_dimensions
+# ---------------------------------------------------------------------------
+
+
+class TestGetRaiSpacingAndDimensions:
+    """Tests for analyzer_utils.get_rai_spacing_and_dimensions."""
+
+    def test_identity_direction_is_unchanged(self):
+        """RAI images keep their spacing and dimensions."""
+        header = _make_header(dims=(64, 48, 32), spacing=(1.0, 2.0, 3.0))
+        assert au.get_rai_spacing_and_dimensions(header) == ((1.0, 2.0, 3.0), (64, 48, 32))
+
+    def test_permuted_and_flipped_direction(self):
+        """Axes are permuted to the physical axis they point along; flips are ignored."""
+        # Row i is the direction of voxel axis i: x -> -S, y -> R, z -> A.
+        direction = [[0.0, 0.0, -1.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+        header = _make_header(dims=(5, 7, 9), spacing=(1.0, 2.0, 3.0), direction=direction)
+        assert au.get_rai_spacing_and_dimensions(header) == ((2.0, 3.0, 1.0), (7, 9, 5))
+
+    def test_ambiguous_oblique_direction_returns_none(self):
+        """Two voxel axes dominated by the same physical axis are ambiguous."""
+        direction = np.array([[2.0, -1.0, 2.0], [2.0, 2.0, -1.0], [-1.0, 2.0, 2.0]]) / 3.0
+        header = _make_header(direction=direction)
+        assert au.get_rai_spacing_and_dimensions(header) is None
+
+    @pytest.mark.parametrize("angle", [0.0, 20.0, 44.0, 100.0, 200.0])
+    def test_matches_ants_reorient(self, tmp_path, angle):
+        """Header-only geometry equals ants.reorient_image2 on real files."""
+        a, b = np.deg2rad(angle), np.deg2rad(angle / 3)
+        rot_z = np.array([[np.cos(a), -np.sin(a), 0], [np.sin(a), np.cos(a), 0], [0, 0, 1]])
+        rot_x = np.array([[1, 0, 0], [0, np.cos(b), -np.sin(b)], [0, np.sin(b), np.cos(b)]])
+        image = ants.from_numpy(
+            np.zeros((5, 7, 9), dtype=np.float32),
+            spacing=(1.0, 2.0, 3.0),
+            direction=rot_z @ rot_x,
+        )
+        path = str(tmp_path / "image.nii.gz")
+        ants.image_write(image, path)
+
+        geometry = au.get_rai_spacing_and_dimensions(ants.image_header_info(path))
+        reoriented = ants.reorient_image2(ants.image_read(path), "RAI")
+        assert geometry is not None
+        assert geometry[0] == pytest.approx(reoriented.spacing)
+        assert geometry[1] == tuple(reoriented.shape)
+
+
+# ---------------------------------------------------------------------------
+# get_executor
+# ---------------------------------------------------------------------------
+
+
+class TestGetExecutor:
+    """Tests for get_executor."""
+
+    def test_thread_and_process_backends(self):
+        """Each backend maps to its concurrent.futures executor."""
+        with au.get_executor("thread", 2) as executor:
+            assert isinstance(executor, ThreadPoolExecutor)
+        with au.get_executor("process", 1) as executor:
+            assert isinstance(executor, ProcessPoolExecutor)
+
+    def test_unknown_backend_raises(self):
+        """Unknown backends are rejected."""
+        with pytest.raises(ValueError, match="Unknown analyze backend"):
+            au.get_executor("gpu", 2)
+
+
 # ---------------------------------------------------------------------------
 # get_resampled_image_dimensions
 # ---------------------------------------------------------------------------
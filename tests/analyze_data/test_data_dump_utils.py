@@ -273,11 +273,29 @@ class TestComputeSkeletonRatio:
         mask = np.zeros((5, 5, 5), dtype=bool)
         assert ddu.compute_skeleton_ratio(mask) is None
 
-    def test_oversized_mask_returns_none(self):
-        """Labels exceeding MAX_SKELETON_VOXELS → skipped → returns None."""
-        # 80^3 = 512 000 > MAX_SKELETON_VOXELS (500 000)
-        mask = np.ones((80, 80, 80), dtype=bool)
-        assert ddu.compute_skeleton_ratio(mask) is None
+    def test_oversized_mask_is_downsampled(self, monkeypatch):
+        """Labels exceeding the voxel budget are pooled before skeletonizing."""
+        sizes = []
+        real_skeletonize = ddu.skeletonize
+
+        def _skeletonize(mask):
+            sizes.append(int(np.count_nonzero(mask)))
+            return real_skeletonize(mask)
+
+        monkeypatch.setattr(ddu, "skeletonize", _skeletonize, raising=True)
+        # 81^3 = 531 441 > MAX_SKELETON_VOXELS (500 000)
+        mask = np.ones((81, 81, 81), dtype=bool)
+        result = ddu.compute_skeleton_ratio(mask)
+        assert result is not None and result < 0.2
+        assert sizes and sizes[0] <= constants.MAX_SKELETON_VOXELS
+
+    def test_thin_structure_fits_custom_budget(self):
+        """Pooling keeps a long line thin and within a small voxel budget."""
+        mask = np.zeros((3, 3, 400), dtype=bool)
+        mask[1, 1, :] = True
+        result = ddu.compute_skeleton_ratio(mask, voxel_budget=50)
+        assert result is not None
+        assert result > 0.5
 
     def test_thin_line_has_high_ratio(self):
         """A 1-voxel-wide line → nearly all voxels on skeleton → high ratio."""
@@ -1100,3 +1118,123 @@ class TestCollectPerPatientStats:
         result = self._run(n=2, nan_channel=True)
         # Still collects intensity from patient 1 (valid path).
         assert len(result["channel_intensities"]["t1"]) > 0
+
+    def test_parallel_matches_serial(self):
+        """Several workers give the same statistics as a single worker."""
+        df = _make_paths_df(
+            [f"p{i}_mask.nii.gz" for i in range(4)],
+            {"t1": [f"p{i}_t1.nii.gz" for i in range(4)]},
+        )
+        ds_info = _make_dataset_info(labels=(0, 1, 2), channels=("t1",))
+        serial = ddu.collect_per_patient_stats(df, ds_info)
+        parallel = ddu.collect_per_patient_stats(df, ds_info, num_workers=3)
+        np.testing.assert_array_equal(serial["spacings"], parallel["spacings"])
+        assert serial["label_voxel_counts"] == parallel["label_voxel_counts"]
+        assert serial["channel_intensities"] == parallel["channel_intensities"]
+
+    def test_aggregate_matches_collect(self):
+        """Reducing per-patient stats gives the same result as reading files."""
+        non_bg = [1, 2]
+        patient_stats = []
+        for _ in range(2):
+            mask = _make_mask_image()
+            stats = ddu.compute_patient_label_stats(mask.numpy(), mask.spacing, non_bg)
+            stats["channel_samples"]["t1"] = ddu.sample_foreground_intensities(
+                _make_channel_image().numpy(), mask.numpy() != 0
+            )
+            patient_stats.append(stats)
+
+        ds_info = _make_dataset_info(labels=(0, 1, 2), channels=("t1",))
+        aggregated = ddu.aggregate_per_patient_stats(patient_stats, ds_info)
+        collected = self._run(n=2)
+
+        np.testing.assert_array_equal(aggregated["spacings"], collected["spacings"])
+        np.testing.assert_array_equal(
+            aggregated["foreground_fractions"], collected["foreground_fractions"]
+        )
+        assert aggregated["label_voxel_counts"] == collected["label_voxel_counts"]
+        assert aggregated["label_presence"] == collected["label_presence"]
+        assert aggregated["channel_intensities"] == collected["channel_intensities"]
+
+
+# ---------------------------------------------------------------------------
+# Label counts, bounding boxes, and per-patient label statistics
+# ---------------------------------------------------------------------------
+
+
+def _reference_label_stats(mask_arr, spacing, labels):
+    """Per-label statistics computed on full-volume masks, label by label."""
+    spacing_arr = np.array(spacing, dtype=float)
+    counts, shapes = {}, {}
+    for lbl in labels:
+        lbl_mask = mask_arr == lbl
+        counts[lbl] = int(np.sum(lbl_mask))
+        if counts[lbl] > 0:
+            np.random.seed(0)
+            shape = ddu.compute_shape_descriptors(
+                np.argwhere(lbl_mask).astype(np.float32) * spacing_arr
+            )
+            if shape is not None:
+                shape["compactness"] = ddu.compute_compactness(lbl_mask, spacing_arr)
+                shape["skeleton_ratio"] = ddu.compute_skeleton_ratio(lbl_mask)
+                shapes[lbl] = shape
+    return counts, shapes
+
+
+class TestPatientLabelStats:
+    """Tests for the bincount / find_objects based per-label statistics."""
+
+    @pytest.mark.parametrize("seed", range(4))
+    def test_matches_full_volume_reference(self, seed):
+        """Bounding-box-local statistics equal the full-volume computation."""
+        rng = np.random.default_rng(seed)
+        mask = np.zeros((30, 28, 26), dtype=np.float32)
+        for lbl in (1, 2, 4):
+            lo = rng.integers(0, 15, size=3)
+            hi = lo + rng.integers(2, 12, size=3)
+            region = mask[lo[0] : hi[0], lo[1] : hi[1], lo[2] : hi[2]]
+            region[rng.random(region.shape) < 0.7] = lbl
+        labels = [1, 2, 3, 4]
+        spacing = (0.8, 0.8, 2.5)
+
+        np.random.seed(0)
+        stats = ddu.compute_patient_label_stats(mask, spacing, labels)
+        counts, shapes = _reference_label_stats(mask, spacing, labels)
+
+        assert stats["label_voxel_counts"] == counts
+        assert stats["label_voxel_counts"][3] == 0
+        assert stats["label_shape_descriptors"] == shapes
+        assert stats["fg_count"] == int(np.count_nonzero(mask))
+
+    def test_skeleton_voxel_budget_is_passed_on(self, monkeypatch):
+        """The skeleton voxel budget reaches compute_skeleton_ratio."""
+        budgets = []
+
+        def _ratio(mask, voxel_budget=None):
+            budgets.append(voxel_budget)
+            return 0.5
+
+        monkeypatch.setattr(ddu, "compute_skeleton_ratio", _ratio)
+        mask = np.zeros((8, 8, 8), dtype=np.uint8)
+        mask[1:6, 2:7, 3:5] = 1
+        stats = ddu.compute_patient_label_stats(mask, (1.0, 1.0, 1.0), [1], 123)
+        assert budgets == [123]
+        assert stats["label_shape_descriptors"][1]["skeleton_ratio"] == 0.5
+
+    def test_counts_and_boxes(self):
+        """Counts and boxes for present, absent, and out-of-range labels."""
+        mask = np.zeros((6, 6, 6), dtype=np.uint8)
+        mask[1:3, 2:5, 0:1] = 2
+        mask_int, counts, boxes = ddu.get_label_voxel_counts_and_boxes(mask, [1, 2, 9])
+        assert mask_int.shape == mask.shape
+        assert counts == {1: 0, 2: 6, 9: 0}
+        assert boxes[1] is None and boxes[9] is None
+        assert boxes[2] == (slice(1, 3), slice(2, 5), slice(0, 1))
+
+    def test_negative_values_fall_back(self):
+        """Masks with negative values are counted without np.bincount."""
+        mask = np.full((4, 4, 4), -1, dtype=np.int16)
+        mask[0, 0, :2] = 1
+        _, counts, boxes = ddu.get_label_voxel_counts_and_boxes(mask, [1])
+        assert counts == {1: 2}
+        assert boxes[1] == (slice(0, 4), slice(0, 4), slice(0, 4))
@@ -0,0 +1,108 @@
+"""Tests for mist.analyze_data.memory_planner."""
+
+import numpy as np
+import pytest
+
+from mist.analyze_data import memory_planner as mp
+from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
+
+PARAMS = {"in_channels": 1, "out_channels": 2}
+SPACING = [1.0, 1.0, 1.0]
+
+
+def _estimate(architecture="nnunet-pocket", patch=(32, 32, 32), batch_size=1, amp=True):
+    return mp.estimate_training_step(architecture, PARAMS, list(patch), SPACING, batch_size, amp)
+
+
+class TestEstimateTrainingStep:
+    """Tests for estimate_training_step."""
+
+    def test_reports_memory_and_flops(self):
+        """The estimate has positive memory and compute figures."""
+        estimate = _estimate()
+        assert estimate["patch_size"] == [32, 32, 32]
+        assert estimate["batch_size"] == 1
+        assert estimate["activation_bytes"] > 0
+        assert estimate["flops"] > 0
+        assert estimate["peak_bytes"] > estimate["activation_bytes"]
+
+    def test_scales_with_batch_size(self):
+        """Activations and FLOPs grow linearly with the batch size."""
+        one = _estimate(batch_size=1)
+        two = _estimate(batch_size=2)
+        assert two["activation_bytes"] == pytest.approx(2 * one["activation_bytes"], rel=0.05)
+        assert two["flops"] == pytest.approx(2 * one["flops"], rel=0.05)
+        assert two["parameter_bytes"] == one["parameter_bytes"]
+
+    def test_amp_halves_activations(self):
+        """Half precision activations take about half the memory."""
+        fp16 = _estimate(amp=True)
+        fp32 = _estimate(amp=False)
+        assert fp16["activation_bytes"] == pytest.approx(fp32["activation_bytes"] / 2, rel=0.1)
+
+    def test_depends_on_architecture(self):
+        """A wider network needs more memory for the same patch."""
+        pocket = _estimate("nnunet-pocket")
+        mednext = _estimate("mednext-small")
+        assert mednext["activation_bytes"] > pocket["activation_bytes"]
+
+    def test_models_that_need_cpu_construction(self):
+        """Models that cannot be built on the meta device are moved there."""
+        model = mp._build_meta_model(
+            "swinunetr-small", PARAMS, {"patch_size": [32, 32, 32], "target_spacing": SPACING}
+        )
+        assert all(p.device.type == "meta" for p in model.parameters())
+
+
+class TestPlanPatchAndBatchSize:
+    """Tests for plan_patch_and_batch_size with a synthetic cost model."""
+
+    @pytest.fixture(autouse=True)
+    def linear_cost(self, monkeypatch):
+        """Peak memory of one byte per voxel per batch element."""
+
+        def _fake(architecture, model_params, patch, spacing, batch_size, amp):
+            return {
+                "patch_size": list(patch),
+                "batch_size": batch_size,
+                "peak_bytes": int(np.prod(patch)) * batch_size,
+                "flops": 0,
+            }
+
+        monkeypatch.setattr(mp, "estimate_training_step", _fake, raising=True)
+
+    @staticmethod
+    def _budget(voxels):
+        return voxels / constants.PLANNER_MEMORY_HEADROOM_FRACTION
+
+    def test_largest_fitting_patch(self):
+        """The largest patch within the budget is chosen."""
+        plan = mp.plan_patch_and_batch_size(
+            "nnunet", PARAMS, [256, 256, 256], SPACING, self._budget(2 * 96**3)
+        )
+        assert plan["fits"] is True
+        assert plan["batch_size"] == 2
+        assert plan["patch_size"] == [96, 96, 96]
+
+    def test_patch_is_clamped_to_image(self):
+        """A generous budget gives the median-sized patch."""
+        plan = mp.plan_patch_and_batch_size(
+            "nnunet", PARAMS, [64, 64, 64], SPACING, self._budget(2 * 128**3)
+        )
+        assert plan["patch_size"] == [64, 64, 64]
+
+    def test_reduces_batch_size(self):
+        """The batch size is reduced when no patch fits the preferred one."""
+        plan = mp.plan_patch_and_batch_size(
+            "nnunet", PARAMS, [256, 256, 256], SPACING, self._budget(40_000), batch_size_per_gpu=2
+        )
+        assert plan["fits"] is True
+        assert plan["batch_size"] == 1
+        assert plan["patch_size"] == [32, 32, 32]
+
+    def test_reports_when_nothing_fits(self):
+        """The smallest configuration is returned with fits set to False."""
+        plan = mp.plan_patch_and_batch_size("nnunet", PARAMS, [256, 256, 256], SPACING, 1000)
+        assert plan["fits"] is False
+        assert plan["batch_size"] == 1
+        assert plan["patch_size"] == [32, 32, 32]
@@ -0,0 +1,109 @@
+"""Tests for mist.analyze_data.sampling."""
+
+import numpy as np
+import pytest
+
+from mist.analyze_data import sampling
+
+
+def _header_record(spacing, dims=(10, 10, 10)):
+    """Header record as returned by scan_utils.scan_patient_header."""
+    return {"mask_header": {"spacing": spacing, "dimensions": dims}}
+
+
+class TestGetStrata:
+    """Tests for get_strata."""
+
+    def test_none_is_a_single_stratum(self):
+        """Without stratification every patient is in stratum 0."""
+        records = [_header_record((1.0, 1.0, s)) for s in (1.0, 2.0, 5.0)]
+        np.testing.assert_array_equal(sampling.get_strata(records, "none", 4), [0, 0, 0])
+
+    def test_spacing_bins_by_voxel_volume(self):
+        """Thin and thick slices end up in different strata."""
+        records = [_header_record((1.0, 1.0, s)) for s in (1.0, 1.0, 5.0, 5.0)]
+        strata = sampling.get_strata(records, "spacing", 2)
+        assert strata[0] == strata[1]
+        assert strata[2] == strata[3]
+        assert strata[0] != strata[2]
+
+    def test_size_bins_by_number_of_voxels(self):
+        """Large and small images end up in different strata."""
+        records = [_header_record((1.0, 1.0, 1.0), (d, d, d)) for d in (10, 10, 50, 50)]
+        strata = sampling.get_strata(records, "size", 2)
+        assert strata[0] != strata[2]
+
+    def test_unreadable_headers_get_own_stratum(self):
+        """Patients without a header are kept together in an extra stratum."""
+        records = [_header_record((1.0, 1.0, 1.0)), {"mask_header": None}]
+        strata = sampling.get_strata(records, "spacing", 3)
+        assert strata[1] == 3
+        assert strata[0] != strata[1]
+
+    def test_unknown_option_raises(self):
+        """Unknown options are rejected."""
+        with pytest.raises(ValueError, match="Unknown stratification"):
+            sampling.get_strata([], "scanner", 4)
+
+
+class TestDrawSample:
+    """Tests for draw_sample."""
+
+    def test_sample_size_and_uniqueness(self):
+        """The sample has the requested number of distinct indices."""
+        idx = sampling.draw_sample(np.zeros(100, dtype=int), 10, seed=0)
+        assert len(idx) == 10
+        assert len(set(idx.tolist())) == 10
+        assert np.all(np.diff(idx) > 0)
+
+    def test_allocation_is_proportional(self):
+        """Each stratum gets a share of the sample matching its size."""
+        strata = np.repeat([0, 1, 2], [60, 30, 10])
+        idx = sampling.draw_sample(strata, 10, seed=1)
+        np.testing.assert_array_equal(np.bincount(strata[idx]), [6, 3, 1])
+
+    def test_seed_controls_sample(self):
+        """The same seed gives the same sample; another seed differs."""
+        strata = np.zeros(50, dtype=int)
+        a = sampling.draw_sample(strata, 5, seed=3)
+        np.testing.assert_array_equal(a, sampling.draw_sample(strata, 5, seed=3))
+        assert not np.array_equal(a, sampling.draw_sample(strata, 5, seed=4))
+
+    def test_large_sample_returns_everyone(self):
+        """Asking for at least as many patients as exist returns all of them."""
+        np.testing.assert_array_equal(sampling.draw_sample(np.zeros(4, int), 9, 0), np.arange(4))
+
+
+class TestBootstrapInterval:
+    """Tests for bootstrap_interval."""
+
+    def test_constant_data_has_zero_width(self):
+        """Resampling identical values always gives the same statistic."""
+        values = np.full(20, 3.0)
+        lower, upper = sampling.bootstrap_interval(
+            20, lambda idx: values[idx].mean(), 200, 0.95, seed=0
+        )
+        assert lower == pytest.approx(3.0)
+        assert upper == pytest.approx(3.0)
+
+    def test_interval_covers_mean_and_shrinks_with_n(self):
+        """Larger samples give narrower intervals around the mean."""
+        rng = np.random.default_rng(0)
+        widths = []
+        for n in (20, 500):
+            values = rng.normal(10.0, 2.0, size=n)
+            lower, upper = sampling.bootstrap_interval(
+                n, lambda idx, v=values: v[idx].mean(), 500, 0.95, seed=0
+            )
+            assert lower <= values.mean() <= upper
+            widths.append(upper - lower)
+        assert widths[1] < widths[0]
+
+    def test_vector_statistic(self):
+        """Vector statistics get per-component bounds."""
+        values = np.arange(30, dtype=float).reshape(10, 3)
+        lower, upper = sampling.bootstrap_interval(
+            10, lambda idx: np.median(values[idx], axis=0), 100, 0.9, seed=0
+        )
+        assert lower.shape == (3,) and upper.shape == (3,)
+        assert np.all(lower <= upper)
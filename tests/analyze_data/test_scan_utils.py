@@ -0,0 +1,252 @@
+"""Tests for mist.analyze_data.scan_utils."""
+
+from pathlib import Path
+
+import ants
+import numpy as np
+import pytest
+
+from mist.analyze_data import data_dump_utils, scan_utils
+from mist.analyze_data.analyzer_constants import AnalyzeConstants as constants
+from tests.regression.ants_sitk import fixtures
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _write_image(path: Path, arr: np.ndarray, spacing=(1.0, 1.0, 1.0)) -> str:
+    """Write a numpy array to disk as a NIfTI image and return its path."""
+    img = ants.from_numpy(arr.astype(np.float32))
+    img.set_spacing(spacing)
+    ants.image_write(img, str(path))
+    return str(path)
+
+
+def _make_patient(tmp_path: Path, mask_arr=None, ct_fill=100.0) -> dict:
+    """Write a patient with one mask and one CT image to tmp_path."""
+    if mask_arr is None:
+        mask_arr = np.zeros((12, 12, 12))
+        mask_arr[2:6, 2:6, 2:6] = 1
+        mask_arr[8:10, 8:10, 8:10] = 2
+    ct_arr = np.zeros((12, 12, 12))
+    ct_arr[1:11, 1:11, 1:11] = ct_fill
+    return {
+        "id": "p0",
+        "fold": 0,
+        "mask": _write_image(tmp_path / "p0_mask.nii.gz", mask_arr, (1.0, 1.0, 2.0)),
+        "ct": _write_image(tmp_path / "p0_ct.nii.gz", ct_arr, (1.0, 1.0, 2.0)),
+    }
+
+
+# ---------------------------------------------------------------------------
+# get_image_columns
+# ---------------------------------------------------------------------------
+
+
+def test_get_image_columns_skips_id_fold_and_mask():
+    """Only image columns are returned, in row order."""
+    patient = {"id": 0, "fold": 1, "mask": "m", "t1": "a", "t2": "b"}
+    assert scan_utils.get_image_columns(patient) == ["t1", "t2"]
+
+
+def test_get_image_columns_without_fold():
+    """Rows without a fold column (before fold assignment) work the same."""
+    patient = {"id": 0, "mask": "m", "ct": "a"}
+    assert scan_utils.get_image_columns(patient) == ["ct"]
+
+
+# ---------------------------------------------------------------------------
+# compute_ct_statistics
+# ---------------------------------------------------------------------------
+
+
+def test_compute_ct_statistics_constant_foreground():
+    """Constant foreground gives the right mean, zero M2, and one bin."""
+    image = np.full((10, 10, 10), 50.0)
+    mask = np.ones((10, 10, 10))
+    n, mean, m2, hist, n_out = scan_utils.compute_ct_statistics(image, mask)
+    assert n == 1000 // constants.CT_GATHER_EVERY_ITH_VOXEL_VALUE
+    assert mean == pytest.approx(50.0)
+    assert m2 == pytest.approx(0.0)
+    assert hist.sum() == n
+    assert n_out == 0
+
+
+def test_compute_ct_statistics_empty_foreground():
+    """An empty mask returns zero counts and an empty histogram."""
+    n, mean, m2, hist, n_out = scan_utils.compute_ct_statistics(
+        np.ones((4, 4, 4)), np.zeros((4, 4, 4))
+    )
+    assert (n, mean, m2, n_out) == (0, 0.0, 0.0, 0)
+    assert hist.shape == (constants.CT_HU_HIST_BINS,)
+    assert hist.sum() == 0
+
+
+# ---------------------------------------------------------------------------
+# scan_patient
+# ---------------------------------------------------------------------------
+
+
+class TestScanPatient:
+    """Tests for scan_patient on real files."""
+
+    def test_record_contents(self, tmp_path):
+        """All analysis quantities are computed from one read per file."""
+        patient = _make_patient(tmp_path)
+        record = scan_utils.scan_patient(patient, compute_ct_stats=True)
+
+        assert record["id"] == "p0"
+        assert record["read_error"] is None
+        assert record["header_error"] is None
+        assert record["error"] is None
+        assert record["labels"] == [0, 1, 2]
+        assert record["mask_header"]["dimensions"] == (12, 12, 12)
+        assert record["rai_spacing"] == pytest.approx((1.0, 1.0, 2.0))
+        assert record["image_dims"] == (12, 12, 12)
+        assert record["fg_bbox"]["x_start"] == 1 and record["fg_bbox"]["x_end"] == 10
+        assert record["nz_ratio"] == pytest.approx(1000 / 12**3)
+        assert record["ct_stats"][1] == pytest.approx(100.0)
+        assert record["dump_stats"] is None
+
+    def test_ct_stats_skipped_when_not_requested(self, tmp_path):
+        """CT statistics are only computed on request."""
+        record = scan_utils.scan_patient(_make_patient(tmp_path))
+        assert record["ct_stats"] is None
+
+    def test_each_file_read_once(self, tmp_path, monkeypatch):
+        """The mask and image are each decompressed exactly once."""
+        patient = _make_patient(tmp_path)
+        reads = []
+        real_read = ants.image_read
+
+        def _counting_read(path, *args, **kwargs):
+            reads.append(path)
+            return real_read(path, *args, **kwargs)
+
+        monkeypatch.setattr(ants, "image_read", _counting_read, raising=True)
+        scan_utils.scan_patient(
+            patient, compute_ct_stats=True, dump_channels=["ct"], dump_labels=[1, 2]
+        )
+        assert sorted(reads) == sorted([patient["mask"], patient["ct"]])
+
+    def test_dump_stats(self, tmp_path):
+        """Data dump statistics match the mask contents."""
+        record = scan_utils.scan_patient(
+            _make_patient(tmp_path), dump_channels=["ct"], dump_labels=[1, 2]
+        )
+        dump = record["dump_stats"]
+        assert dump["fg_count"] == 64 + 8
+        assert dump["label_voxel_counts"] == {1: 64, 2: 8}
+        assert dump["spacing"] == pytest.approx([1.0, 1.0, 2.0])
+        assert len(dump["channel_samples"]["ct"]) > 0
+
+    def test_dump_stats_use_the_skeleton_voxel_budget(self, tmp_path, monkeypatch):
+        """The skeleton voxel budget is passed on to the data dump statistics."""
+        calls = []
+        compute = data_dump_utils.compute_patient_label_stats
+
+        def _compute(*args, **kwargs):
+            calls.append(args)
+            return compute(*args, **kwargs)
+
+        monkeypatch.setattr(data_dump_utils, "compute_patient_label_stats", _compute)
+        scan_utils.scan_patient(
+            _make_patient(tmp_path),
+            dump_channels=["ct"],
+            dump_labels=[1, 2],
+            skeleton_voxel_budget=50,
+        )
+        assert calls[0][3] == 50
+
+    def test_unreadable_mask_sets_read_error(self, tmp_path):
+        """A missing mask is recorded as both a read and analysis error."""
+        patient = _make_patient(tmp_path)
+        patient["mask"] = str(tmp_path / "missing.nii.gz")
+        record = scan_utils.scan_patient(patient)
+        assert record["read_error"].startswith("In p0:")
+        assert record["error"] is not None
+        assert record["fg_bbox"] is None
+
+    def test_unreadable_image_sets_error_only(self, tmp_path):
+        """A missing image is an analysis and header error but not a read error."""
+        patient = _make_patient(tmp_path)
+        patient["ct"] = str(tmp_path / "missing.nii.gz")
+        record = scan_utils.scan_patient(patient)
+        assert record["read_error"] is None
+        assert record["header_error"].startswith("In p0:")
+        assert record["error"] is not None
+
+    def test_header_mismatch_is_reported(self, tmp_path):
+        """An image with a different shape than the mask fails header checks."""
+        patient = _make_patient(tmp_path)
+        patient["ct"] = _write_image(tmp_path / "other_ct.nii.gz", np.ones((8, 8, 8)))
+        record = scan_utils.scan_patient(patient)
+        assert "Mismatch between image and mask header information" in record["header_error"]
+
+    @pytest.mark.parametrize("spec", fixtures.FIXTURES, ids=lambda s: s.patient_id)
+    def test_rai_spacing_matches_reorient_on_regression_fixtures(self, tmp_path, spec):
+        """Header-derived RAI spacing matches ants.reorient_image2, incl. oblique."""
+        dataset = fixtures.generate_dataset(tmp_path)
+        patient_dir = dataset.train_data / spec.patient_id
+        patient = {
+            "id": spec.patient_id,
+            "mask": str(patient_dir / "mask.nii.gz"),
+            "ct": str(patient_dir / "image.nii.gz"),
+        }
+        record = scan_utils.scan_patient(patient)
+        expected = ants.reorient_image2(ants.image_read(patient["mask"]), "RAI").spacing
+        assert record["rai_spacing"] == pytest.approx(expected)
+
+    def test_ambiguous_direction_falls_back_to_reorient(self, tmp_path, monkeypatch):
+        """Directions without a unique dominant axis use ants.reorient_image2."""
+        patient = _make_patient(tmp_path)
+        calls = []
+        real_reorient = ants.reorient_image2
+
+        def _counting_reorient(image, orientation):
+            calls.append(orientation)
+            return real_reorient(image, orientation)
+
+        monkeypatch.setattr(ants, "reorient_image2", _counting_reorient, raising=True)
+        scan_utils.scan_patient(patient)
+        assert calls == []
+
+        monkeypatch.setattr(
+            scan_utils.analyzer_utils, "get_rai_spacing_and_dimensions", lambda _h: None
+        )
+        record = scan_utils.scan_patient(patient)
+        assert calls == ["RAI"]
+        assert record["rai_spacing"] == pytest.approx((1.0, 1.0, 2.0))
+
+
+# ---------------------------------------------------------------------------
+# scan_patient_header
+# ---------------------------------------------------------------------------
+
+
+class TestScanPatientHeader:
+    """Tests for the header-only scan used outside the analysis sample."""
+
+    def test_matches_full_scan_without_reading_voxels(self, tmp_path, monkeypatch):
+        """Header fields agree with scan_patient and no image is read."""
+        patient = _make_patient(tmp_path)
+        full = scan_utils.scan_patient(patient)
+
+        def _no_read(*_args, **_kwargs):
+            raise AssertionError("voxel data was read")
+
+        monkeypatch.setattr(ants, "image_read", _no_read, raising=True)
+        record = scan_utils.scan_patient_header(patient)
+        assert record["mask_header"] == full["mask_header"]
+        assert record["rai_spacing"] == full["rai_spacing"]
+        assert record["header_error"] is None and record["read_error"] is None
+        assert record["fg_bbox"] is None and record["labels"] is None
+
+    def test_missing_mask_sets_read_error(self, tmp_path):
+        """A mask whose header cannot be read is reported as a read error."""
+        patient = _make_patient(tmp_path)
+        patient["mask"] = str(tmp_path / "missing.nii.gz")
+        record = scan_utils.scan_patient_header(patient)
+        assert record["read_error"] is not None
+        assert record["mask_header"] is None
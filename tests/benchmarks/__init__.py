@@ -0,0 +1,5 @@
+"""Performance benchmarks for MIST.
+
+Benchmarks are plain modules with a ``main`` entrypoint, run on demand with
+``python -m tests.benchmarks.<name>``. They are not collected by pytest.
+"""
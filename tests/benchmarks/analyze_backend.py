@@ -0,0 +1,65 @@
+"""Benchmark the thread and process backends of the Analyzer's dataset scan.
+
+Writes a synthetic CT dataset, then times Analyzer.scan_dataset for each
+backend and worker count. The analysis cache is bypassed so every run reads
+all files::
+
+    python -m tests.benchmarks.analyze_backend --patients 32 --size 128 --workers 1 4 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from mist.analyze_data.analyzer import Analyzer
+from tests.benchmarks import synthetic
+
+
+def time_scan(dataset_json: Path, results_dir: Path, backend: str, workers: int) -> float:
+    """Time one full dataset scan in seconds."""
+    args = argparse.Namespace(
+        data=str(dataset_json),
+        results=str(results_dir),
+        nfolds=5,
+        overwrite=True,
+        num_workers_analyze=workers,
+        analyze_backend=backend,
+        refresh=True,
+    )
+    analyzer = Analyzer(args)
+    start = time.perf_counter()
+    analyzer.scan_dataset()
+    return time.perf_counter() - start
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=16, help="Number of volumes.")
+    parser.add_argument("--size", type=int, default=96, help="Edge length of each volume.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Worker counts.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        dataset_json = synthetic.write_dataset(
+            tmp_path / "data", args.patients, (args.size, args.size, args.size)
+        )
+        results_dir = tmp_path / "results"
+        results_dir.mkdir()
+
+        print(f"{args.patients} volumes of {args.size}^3 voxels")
+        print(f"{'backend':<10}{'workers':>8}{'seconds':>10}{'speedup':>10}")
+        for backend in ("thread", "process"):
+            baseline = None
+            for workers in args.workers:
+                seconds = time_scan(dataset_json, results_dir, backend, workers)
+                baseline = baseline or seconds
+                print(f"{backend:<10}{workers:>8}{seconds:>10.2f}{baseline / seconds:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+"""Benchmark training steps of MIST models with and without torch.compile.
+
+Each architecture is built with random weights, and forward and backward
+passes on a random patch are timed twice: as is, and after compiling the
+model with model_loader.compile_model, as training does with
+training.compile.enabled. The time of the first compiled step, which
+includes compiling, is shown separately. Compiled kernels are cached in
+--cache-dir, so running the benchmark again with the same directory shows
+how much of that time the cache saves. Runs on the GPU if there is one and
+on the CPU otherwise. SwinUNETR models need patches of at least 64 voxels
+per side::
+
+    python -m tests.benchmarks.compile --models nnunet-pocket mednext-small --patch 32 32 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import tempfile
+import time
+
+import torch
+
+import mist.models  # noqa: F401  Registers the architectures.
+from mist.models import model_loader
+from mist.models.model_registry import get_model_from_registry, list_registered_models
+
+_DEFAULT_MODELS = ["nnunet-pocket", "fmgnet", "mednext-small"]
+
+
+def _step(model: torch.nn.Module, image: torch.Tensor) -> None:
+    """Run one forward and backward pass."""
+    output = model(image)
+    loss = output["prediction"].float().mean()
+    for supervision in output.get("deep_supervision") or []:
+        loss = loss + supervision.float().mean()
+    loss.backward()
+
+
+def _synchronize(device: torch.device) -> None:
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+def _steps_per_second(
+    model: torch.nn.Module, image: torch.Tensor, steps: int, warmup: int
+) -> tuple[float, float]:
+    """Time training steps; return the first step's seconds and the steps/s after warmup."""
+    _synchronize(image.device)
+    start = time.perf_counter()
+    _step(model, image)
+    _synchronize(image.device)
+    first = time.perf_counter() - start
+
+    for _ in range(warmup):
+        _step(model, image)
+    _synchronize(image.device)
+    start = time.perf_counter()
+    for _ in range(steps):
+        _step(model, image)
+    _synchronize(image.device)
+    return first, steps / (time.perf_counter() - start)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list_registered_models(),
+        default=_DEFAULT_MODELS,
+        help="Architectures to benchmark.",
+    )
+    parser.add_argument("--patch", type=int, nargs=3, default=[32, 32, 32], help="Patch size.")
+    parser.add_argument("--batch-size", type=int, default=1, help="Patches per step.")
+    parser.add_argument("--steps", type=int, default=5, help="Timed steps per model.")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed steps after the first.")
+    parser.add_argument("--mode", default="default", help="torch.compile mode.")
+    parser.add_argument(
+        "--cache-dir", help="Compile cache directory. Defaults to a temporary directory."
+    )
+    args = parser.parse_args(argv)
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    image = torch.randn(args.batch_size, 1, *args.patch, device=device)
+    config = {"training": {"compile": {"enabled": True, "mode": args.mode}}}
+
+    print(f"{device.type}, patch {tuple(args.patch)}, batch {args.batch_size}, mode {args.mode}")
+    print(f"{'model':<18}{'eager/s':>9}{'compiled/s':>12}{'speedup':>9}{'compile s':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = args.cache_dir or tmp
+        for name in args.models:
+            torch.manual_seed(0)
+            model = get_model_from_registry(
+                name,
+                in_channels=1,
+                out_channels=2,
+                patch_size=list(args.patch),
+                target_spacing=[1.0, 1.0, 1.0],
+            ).to(device)
+            model.train()
+            compiled = model_loader.compile_model(copy.deepcopy(model), config, cache_dir)
+
+            _, eager = _steps_per_second(model, image, args.steps, args.warmup)
+            compile_seconds, fast = _steps_per_second(compiled, image, args.steps, args.warmup)
+            print(
+                f"{name:<18}{eager:>9.2f}{fast:>12.2f}{fast / eager:>9.2f}{compile_seconds:>11.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
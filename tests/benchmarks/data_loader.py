@@ -0,0 +1,143 @@
+"""Benchmark the throughput of the DALI and PyTorch training loaders.
+
+Synthetic CT-like examples are saved as a numpy directory, and each loader
+draws training batches with the default augmentations. The first batches,
+which include starting the workers, are not timed. Foreground patches are
+centered on the voxels saved in ``fg_voxels/`` unless ``--no-fg-voxels`` is
+given, which searches the labels for objects instead. With several
+``--samples-per-volume`` values, the PyTorch loader is measured with each,
+and the gain over one patch per volume is printed. DALI is only measured
+where it is installed and a GPU is available::
+
+    python -m tests.benchmarks.data_loader --shape 256 256 160 --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from mist.data_loading import torch_loader
+from mist.data_loading.data_loading_constants import DataLoadingConstants as constants
+from mist.preprocessing import storage
+from tests.benchmarks import synthetic
+
+
+def _save_dataset(numpy_dir: Path, shape: tuple[int, int, int], labels: int, patients: int):
+    """Save synthetic examples and return the image, label, and voxel paths."""
+    for name in ("images", "labels"):
+        (numpy_dir / name).mkdir(parents=True)
+    mask = synthetic.make_label_mask(shape, labels)[..., np.newaxis].astype(np.uint8)
+    for i in range(patients):
+        image, _ = synthetic.make_volume(shape, seed=i)
+        example = {
+            "image": ((image - image.mean()) / image.std())[..., np.newaxis].astype(np.float32),
+            "mask": mask,
+            "dtm": None,
+            "fg_bbox": None,
+            "spacing": (1.0, 1.0, 1.0),
+        }
+        storage.save_example(numpy_dir, f"p{i}", example)
+    return (
+        [str(numpy_dir / "images" / f"p{i}.npy") for i in range(patients)],
+        [str(numpy_dir / "labels" / f"p{i}.npy") for i in range(patients)],
+        [str(numpy_dir / "fg_voxels" / f"p{i}.npy") for i in range(patients)],
+    )
+
+
+def _batches_per_second(loader, batches: int, warmup: int) -> float:
+    """Draw batches from a loader and return the rate after the warmup."""
+    for _ in range(warmup):
+        loader.next()
+    start = time.perf_counter()
+    for _ in range(batches):
+        batch = loader.next()[0]
+    if batch["image"].is_cuda:
+        torch.cuda.synchronize()
+    return batches / (time.perf_counter() - start)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[160, 160, 96], help="Volume shape.")
+    parser.add_argument("--patch", type=int, nargs=3, default=[96, 96, 64], help="Patch size.")
+    parser.add_argument("--labels", type=int, default=3, help="Number of labels incl. background.")
+    parser.add_argument("--patients", type=int, default=8, help="Number of examples to save.")
+    parser.add_argument("--batch-size", type=int, default=2, help="Batch size.")
+    parser.add_argument("--batches", type=int, default=20, help="Timed batches per loader.")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed batches per loader.")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[0, 2, 4], help="Worker counts to compare."
+    )
+    parser.add_argument(
+        "--no-fg-voxels", action="store_true", help="Search the labels for foreground objects."
+    )
+    parser.add_argument(
+        "--samples-per-volume",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Patches the PyTorch loader draws from each volume it reads.",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        from mist.data_loading import dali_loader
+    except ImportError:
+        dali_loader = None
+    backends = [("torch", torch_loader)]
+    if dali_loader is not None and torch.cuda.is_available():
+        backends.append(("dali", dali_loader))
+    else:
+        print("DALI or a GPU is not available; only the PyTorch loader is measured.")
+
+    print(
+        f"volume {tuple(args.shape)}, patch {tuple(args.patch)}, "
+        f"batch {args.batch_size}, {args.patients} patients"
+    )
+    print(f"{'loader':<8}{'workers':>8}{'per vol':>9}{'batches/s':>11}{'patches/s':>11}{'gain':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        image_paths, label_paths, fg_voxel_paths = _save_dataset(
+            Path(tmp), tuple(args.shape), args.labels, args.patients
+        )
+        for name, module in backends:
+            for workers in args.workers:
+                if name == "dali" and workers == 0:
+                    continue
+                baseline = None
+                for samples_per_volume in args.samples_per_volume if name == "torch" else [1]:
+                    loader = module.get_training_dataset(
+                        image_paths=image_paths,
+                        label_paths=label_paths,
+                        dtm_paths=None,
+                        batch_size=args.batch_size,
+                        roi_size=tuple(args.patch),
+                        labels=list(range(1, args.labels)),
+                        oversampling=0.6,
+                        seed=42,
+                        num_workers=workers,
+                        rank=0,
+                        world_size=1,
+                        fg_voxel_paths=None if args.no_fg_voxels else fg_voxel_paths,
+                        samples_per_volume=samples_per_volume,
+                    )
+                    # Fill the shuffle buffer before timing.
+                    buffer_size = samples_per_volume * constants.SHUFFLE_BUFFER_VOLUMES
+                    warmup = args.warmup + -(-buffer_size // args.batch_size)
+                    rate = _batches_per_second(loader, args.batches, warmup)
+                    baseline = baseline or rate
+                    print(
+                        f"{name:<8}{workers:>8}{samples_per_volume:>9}{rate:>11.2f}"
+                        f"{rate * args.batch_size:>11.2f}{rate / baseline:>6.2f}x"
+                    )
+                    del loader
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
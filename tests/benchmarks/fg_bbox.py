@@ -0,0 +1,82 @@
+"""Benchmark the streaming foreground bounding box against the reference.
+
+The reference clips the image with np.percentile, thresholds the clipped copy
+with skimage.filters.threshold_otsu, and takes np.nonzero of the mask. Time
+and peak traced memory are reported for the reference, the streaming
+implementation, and its strided preview modes::
+
+    python -m tests.benchmarks.fg_bbox --shape 512 512 300 --strides 2 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import ants
+import numpy as np
+import skimage
+
+from mist.preprocessing import preprocessing_utils as pu
+from tests.benchmarks import synthetic
+
+
+def reference_fg_mask_bbox(img_ants: ants.core.ants_image.ANTsImage) -> dict[str, int]:
+    """Foreground bounding box as computed before streaming."""
+    image_npy = img_ants.numpy()
+    lower, upper = np.percentile(
+        image_npy,
+        [pu.pc.FOREGROUND_BBOX_PERCENTILE_LOW, pu.pc.FOREGROUND_BBOX_PERCENTILE_HIGH],
+    )
+    image_npy = np.clip(image_npy, lower, upper)
+    nz = np.nonzero(image_npy > skimage.filters.threshold_otsu(image_npy))
+    if nz[0].size == 0:
+        return {}
+    return {
+        "x_start": int(np.min(nz[0])),
+        "x_end": int(np.max(nz[0])),
+        "y_start": int(np.min(nz[1])),
+        "y_end": int(np.max(nz[1])),
+        "z_start": int(np.min(nz[2])),
+        "z_end": int(np.max(nz[2])),
+    }
+
+
+def measure(fn: Callable[[], dict[str, int]]) -> tuple[dict[str, int], float, float]:
+    """Run fn once and return its result, seconds, and peak traced MiB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 200], help="Volume shape.")
+    parser.add_argument("--strides", type=int, nargs="*", default=[2, 4], help="Preview strides.")
+    args = parser.parse_args(argv)
+
+    image, _ = synthetic.make_volume(tuple(args.shape), seed=0)
+    img_ants = ants.from_numpy(image)
+    # Materialize the ANTs-to-numpy conversion outside the measured region.
+    img_ants.numpy()
+
+    reference, ref_seconds, ref_mib = measure(lambda: reference_fg_mask_bbox(img_ants))
+    print(f"volume {tuple(args.shape)}, {image.nbytes / 2**20:.0f} MiB")
+    print(f"{'method':<14}{'seconds':>9}{'peak MiB':>10}{'max edge diff':>15}")
+    print(f"{'reference':<14}{ref_seconds:>9.2f}{ref_mib:>10.0f}{0:>15}")
+    for stride in [1, *args.strides]:
+        bbox, seconds, mib = measure(lambda s=stride: pu.get_fg_mask_bbox(img_ants, stride=s))
+        diff = max(abs(bbox[k] - reference[k]) for k in reference) if reference else 0
+        name = "streaming" if stride == 1 else f"stride {stride}"
+        print(f"{name:<14}{seconds:>9.2f}{mib:>10.0f}{diff:>15}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
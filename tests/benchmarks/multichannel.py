@@ -0,0 +1,86 @@
+"""Benchmark multi-channel preprocessing against reading channels one by one.
+
+The reference reads, reorients, and resamples each channel of a BraTS-like
+example in turn, as preprocess_example did before. preprocess_example reads
+the channels at the same time and resamples them as one vector image::
+
+    python -m tests.benchmarks.multichannel --shape 240 240 155 --channels 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import SimpleITK as sitk
+
+from mist.preprocessing import preprocess as pp
+from tests.benchmarks import synthetic
+
+
+def reference_images(config: dict[str, Any], image_paths: list[str]) -> np.ndarray:
+    """Preprocessed image array with the channels handled one at a time."""
+    target_spacing = config["spatial_config"]["target_spacing"]
+    images = []
+    for image_path in image_paths:
+        image = pp._to_standard_space(pp._read_image(image_path), None, crop=False)
+        images.append(pp.resample_image_sitk(image, target_spacing=target_spacing))
+    output = np.zeros((*images[0].GetSize(), len(images)), dtype=np.float32)
+    for i, image in enumerate(images):
+        pp.window_and_normalize(pp._array_view(image), config, out=output[..., i])
+    return output
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[240, 240, 155], help="Volume shape.")
+    parser.add_argument("--channels", type=int, default=4, help="Number of channels.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per method.")
+    args = parser.parse_args(argv)
+
+    config = {
+        "dataset_info": {"modality": "mr", "labels": [0, 1]},
+        "spatial_config": {"target_spacing": [1.0, 1.0, 1.0]},
+        "preprocessing": {
+            "skip": False,
+            "crop_to_foreground": False,
+            "compute_dtms": False,
+            "normalize_dtms": False,
+            "normalize_with_nonzero_mask": True,
+        },
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        image_paths = []
+        for channel in range(args.channels):
+            volume, _ = synthetic.make_volume(tuple(args.shape), seed=channel)
+            image = sitk.GetImageFromArray(volume.T.astype(np.float32))
+            image.SetSpacing((1.2, 1.2, 1.5))
+            image.SetDirection((-1.0, 0.0, 0.0, 0.0, -1.0, 0.0, 0.0, 0.0, 1.0))
+            path = str(Path(tmp) / f"channel_{channel}.nii.gz")
+            sitk.WriteImage(image, path)
+            image_paths.append(path)
+
+        methods = {
+            "per channel": lambda: reference_images(config, image_paths),
+            "vector": lambda: pp.preprocess_example(config, image_paths)["image"],
+        }
+        outputs = {}
+        print(f"volume {tuple(args.shape)}, {args.channels} channels")
+        print(f"{'method':<14}{'seconds':>9}{'max abs diff':>14}")
+        for name, method in methods.items():
+            seconds = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                outputs[name] = method()
+                seconds.append(time.perf_counter() - start)
+            diff = float(np.max(np.abs(outputs[name] - outputs["per channel"])))
+            print(f"{name:<14}{min(seconds):>9.2f}{diff:>14.2e}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+"""Benchmark reading training patches from whole files and patch by patch.
+
+Synthetic examples are saved as a numpy directory. Training patches are then
+read in two ways: by loading the whole image and label and cropping them, as
+the PyTorch loader did before, and by reading only the bytes of the patch
+from each file, as TrainDataset.load_patches does. No augmentations are
+applied. By default the files are dropped from the page cache before every
+patch, so the bytes read from disk per patch are measured (on Linux, from
+/proc/self/io)::
+
+    python -m tests.benchmarks.patch_reader --shape 512 512 320 --patch 128 128 128
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from mist.data_loading import torch_loader
+from mist.preprocessing import storage
+from tests.benchmarks import synthetic
+
+_IO_STATS = Path("/proc/self/io")
+
+
+def _save_dataset(numpy_dir: Path, shape: tuple[int, int, int], patients: int) -> dict:
+    """Save synthetic examples and return their file paths."""
+    for name in ("images", "labels"):
+        (numpy_dir / name).mkdir(parents=True)
+    mask = synthetic.make_label_mask(shape, 3)[..., np.newaxis].astype(np.uint8)
+    rng = np.random.default_rng(0)
+    for i in range(patients):
+        example = {
+            "image": rng.standard_normal((*shape, 1), dtype=np.float32),
+            "mask": mask,
+            "dtm": None,
+            "fg_bbox": None,
+            "spacing": (1.0, 1.0, 1.0),
+        }
+        storage.save_example(numpy_dir, f"p{i}", example)
+    return {
+        name: [str(numpy_dir / name / f"p{i}.npy") for i in range(patients)]
+        for name in ("images", "labels", "fg_voxels")
+    }
+
+
+def _bytes_read() -> int | None:
+    """Bytes this process has read from disk, or None if it is not known."""
+    if not _IO_STATS.exists():
+        return None
+    for line in _IO_STATS.read_text().splitlines():
+        if line.startswith("read_bytes:"):
+            return int(line.split()[1])
+    return None
+
+
+def _drop_from_cache(paths: list[str]) -> None:
+    """Ask the kernel to drop files from the page cache."""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[320, 320, 200], help="Volume shape.")
+    parser.add_argument("--patch", type=int, nargs=3, default=[96, 96, 64], help="Patch size.")
+    parser.add_argument("--patients", type=int, default=2, help="Number of examples to save.")
+    parser.add_argument("--patches", type=int, default=20, help="Patches read per reader.")
+    parser.add_argument(
+        "--warm", action="store_true", help="Keep the files in the page cache between patches."
+    )
+    args = parser.parse_args(argv)
+    cold = not args.warm and hasattr(os, "posix_fadvise")
+
+    print(
+        f"volume {tuple(args.shape)}, patch {tuple(args.patch)}, {args.patients} patients, "
+        f"{'cold' if cold else 'warm'} page cache"
+    )
+    print(f"{'reader':<8}{'MiB/patch':>11}{'patches/s':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _save_dataset(Path(tmp), tuple(args.shape), args.patients)
+        dataset = torch_loader.TrainDataset(
+            paths["images"],
+            paths["labels"],
+            None,
+            tuple(args.patch),
+            [1, 2],
+            0.6,
+            42,
+            0,
+            1,
+            fg_voxel_paths=paths["fg_voxels"],
+        )
+
+        def whole(rng: np.random.Generator, index: int) -> list[np.ndarray]:
+            return torch_loader.biased_crop_fn(
+                rng,
+                dataset.load(index),
+                dataset.roi_size,
+                dataset.oversampling,
+                fg_voxels=np.load(dataset.fg_voxel_paths[index]),
+            )
+
+        for name, read in (("whole", whole), ("patch", dataset.load_patches)):
+            rng = np.random.default_rng(0)
+            seconds = 0.0
+            bytes_read = 0
+            for i in range(args.patches):
+                index = i % args.patients
+                if cold:
+                    _drop_from_cache([paths["images"][index], paths["labels"][index]])
+                before = _bytes_read()
+                start = time.perf_counter()
+                read(rng, index)
+                seconds += time.perf_counter() - start
+                after = _bytes_read()
+                if before is not None and after is not None:
+                    bytes_read += after - before
+            measured = cold and _bytes_read() is not None
+            mib = f"{bytes_read / args.patches / 2**20:>11.1f}" if measured else f"{'n/a':>11}"
+            print(f"{name:<8}{mib}{args.patches / seconds:>11.1f}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
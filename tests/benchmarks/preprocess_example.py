@@ -0,0 +1,178 @@
+"""Benchmark preprocess_example against the ANTs/SimpleITK round-trip path.
+
+The reference reads with ANTs, converts every volume to SimpleITK and back
+for each resampling step, builds one full-size float image per label for the
+mask and again for the DTMs, and joins them into 4D images before taking the
+argmax. preprocess_example keeps every volume in one SimpleITK image from
+read to write. Each method runs in a fresh process so the peak resident set
+size of the process, which includes ITK allocations, can be compared::
+
+    python -m tests.benchmarks.preprocess_example --shape 256 256 160 --labels 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import ants
+import numpy as np
+import SimpleITK as sitk
+
+from mist.preprocessing import preprocess as pp
+from mist.preprocessing import preprocessing_utils as pu
+from tests.benchmarks import synthetic
+
+
+def _reference_resample_mask(mask, labels, target_spacing):
+    """Mask resampling as done before preprocess_example kept one representation."""
+    masks_sitk = pu.make_onehot(mask, labels)
+    new_size = pp.analyzer_utils.get_resampled_image_dimensions(
+        masks_sitk[0].GetSize(), masks_sitk[0].GetSpacing(), target_spacing
+    )
+    aniso = pu.check_anisotropic(masks_sitk[0])
+    for i in range(len(labels)):
+        if aniso["is_anisotropic"]:
+            masks_sitk[i] = pu.aniso_intermediate_resample(
+                masks_sitk[i], new_size, target_spacing, aniso["low_resolution_axis"]
+            )
+        masks_sitk[i] = sitk.Resample(
+            masks_sitk[i],
+            size=np.array(new_size).tolist(),
+            transform=sitk.Transform(),
+            interpolator=sitk.sitkLinear,
+            outputOrigin=masks_sitk[i].GetOrigin(),
+            outputSpacing=target_spacing,
+            outputDirection=masks_sitk[i].GetDirection(),
+            defaultPixelValue=0,
+            outputPixelType=masks_sitk[i].GetPixelID(),
+        )
+    out = np.argmax(pu.sitk_to_ants(sitk.JoinSeries(masks_sitk)).numpy(), axis=-1)
+    out = ants.from_numpy(data=out.astype(np.float32))
+    out.set_spacing(target_spacing)
+    out.set_origin(mask.origin)
+    out.set_direction(mask.direction)
+    return out
+
+
+def _reference_dtm(mask, labels):
+    """Normalized DTMs as computed before, via one-hot images and JoinSeries."""
+    dtms = []
+    for onehot in pu.make_onehot(mask, labels):
+        dtm_i = sitk.SignedMaurerDistanceMap(
+            sitk.Cast(onehot, sitk.sitkUInt8), squaredDistance=False, useImageSpacing=False
+        )
+        dtm_int = sitk.Cast(dtm_i < 0, sitk.sitkFloat32) * dtm_i
+        dtm_ext = sitk.Cast(dtm_i > 0, sitk.sitkFloat32) * dtm_i
+        int_min = pu.sitk_get_min_max(dtm_int)[0] or -1
+        ext_max = pu.sitk_get_min_max(dtm_ext)[1] or 1
+        dtm_i = sitk.Cast((dtm_ext / ext_max) - (dtm_int / int_min), sitk.sitkFloat32)
+        dtm_i.CopyInformation(onehot)
+        dtms.append(dtm_i)
+    return pu.sitk_to_ants(sitk.JoinSeries(dtms)).numpy()
+
+
+def reference_preprocess_example(config: dict[str, Any], image_path: str, mask_path: str) -> dict:
+    """preprocess_example as it was before, for a single-channel example."""
+    target_spacing = config["spatial_config"]["target_spacing"]
+    labels = config["dataset_info"]["labels"]
+    image = ants.image_read(image_path)
+    fg_bbox = pu.get_fg_mask_bbox(image)
+    image = ants.reorient_image2(pu.crop_to_fg(image, fg_bbox), "RAI")
+    image.set_direction(pu.pc.RAI_ANTS_DIRECTION)
+    image = pu.sitk_to_ants(
+        pp.resample_image_sitk(pu.ants_to_sitk(image), target_spacing=target_spacing)
+    )
+
+    mask = ants.image_read(mask_path)
+    mask = ants.reorient_image2(pu.crop_to_fg(mask, fg_bbox), "RAI")
+    mask.set_direction(pu.pc.RAI_ANTS_DIRECTION)
+    mask = _reference_resample_mask(mask, labels, target_spacing)
+    dtm = _reference_dtm(mask, labels).astype(np.float32)
+
+    out = np.zeros((*image.shape, 1), dtype=np.float32)
+    out[..., 0] = pp.window_and_normalize(image.numpy(), config)
+    return {
+        "image": out,
+        "mask": np.expand_dims(mask.numpy(), axis=-1).astype(np.uint8),
+        "dtm": dtm,
+    }
+
+
+def _run(method: str, config: dict[str, Any], image_path: str, mask_path: str, queue) -> None:
+    """Run one method in this (fresh) process and report time and memory."""
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if method == "reference":
+        result = reference_preprocess_example(config, image_path, mask_path)
+    else:
+        result = pp.preprocess_example(config, [image_path], mask_path)
+    seconds = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    checksum = [float(np.sum(result[key], dtype=np.float64)) for key in ("image", "mask", "dtm")]
+    queue.put((seconds, (peak_kib - baseline_kib) / 1024, checksum))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[192, 192, 120], help="Volume shape.")
+    parser.add_argument("--labels", type=int, default=4, help="Number of labels incl. background.")
+    parser.add_argument(
+        "--spacing", type=float, nargs=3, default=[0.8, 0.8, 2.5], help="Voxel spacing."
+    )
+    args = parser.parse_args(argv)
+
+    image, lesion = synthetic.make_volume(tuple(args.shape), seed=0)
+    # Split the lesion into slabs so that every foreground label is present.
+    mask = np.zeros_like(lesion)
+    slabs = np.array_split(np.flatnonzero(lesion.any(axis=(1, 2))), args.labels - 1)
+    for label, rows in enumerate(slabs, start=1):
+        mask[rows] = lesion[rows] * label
+    config = {
+        "dataset_info": {"modality": "ct", "labels": list(range(args.labels))},
+        "spatial_config": {"target_spacing": [1.0, 1.0, 1.0]},
+        "preprocessing": {
+            "skip": False,
+            "crop_to_foreground": True,
+            "compute_dtms": True,
+            "normalize_dtms": True,
+            "normalize_with_nonzero_mask": False,
+            "ct_normalization": {
+                "window_min": -100.0,
+                "window_max": 200.0,
+                "z_score_mean": 40.0,
+                "z_score_std": 30.0,
+            },
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for name, arr in (("image", image), ("mask", mask)):
+            path = str(Path(tmp) / f"{name}.nii.gz")
+            ants.image_write(ants.from_numpy(arr.astype(np.float32), spacing=args.spacing), path)
+            paths.append(path)
+
+        context = multiprocessing.get_context("spawn")
+        print(f"volume {tuple(args.shape)}, spacing {tuple(args.spacing)}, {args.labels} labels")
+        print(f"{'method':<12}{'seconds':>9}{'peak MiB':>10}")
+        results = {}
+        for method in ("reference", "single"):
+            queue = context.Queue()
+            process = context.Process(target=_run, args=(method, config, *paths, queue))
+            process.start()
+            seconds, mib, checksum = queue.get()
+            process.join()
+            results[method] = checksum
+            print(f"{method:<12}{seconds:>9.2f}{mib:>10.0f}")
+        print(f"outputs match: {results['reference'] == results['single']}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,67 @@
+"""Benchmark resampling masks per label inside bounding boxes.
+
+resample_mask_sitk resamples each label on its own. With crop_to_labels it
+only resamples each label inside its padded bounding box; without it, every
+label is resampled over the whole mask. The mask has one background label and
+a number of organ-sized foreground labels. Both directions are timed: to the
+target spacing (preprocessing) and back to the original spacing (restoring
+predictions in inference)::
+
+    python -m tests.benchmarks.resample_mask --shape 256 256 160 --labels 14
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import SimpleITK as sitk
+
+from mist.preprocessing import preprocess as pp
+from tests.benchmarks import synthetic
+
+
+def _time(mask: sitk.Image, labels: list[int], spacing, crop: bool, repeats: int):
+    """Best time of repeats and the resampled mask."""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = pp.resample_mask_sitk(mask, labels, spacing, crop_to_labels=crop)
+        best = min(best, time.perf_counter() - start)
+    return best, sitk.GetArrayFromImage(out)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[192, 192, 120], help="Mask shape.")
+    parser.add_argument("--labels", type=int, default=8, help="Number of labels incl. background.")
+    parser.add_argument(
+        "--spacing", type=float, nargs=3, default=[0.8, 0.8, 2.5], help="Voxel spacing."
+    )
+    parser.add_argument(
+        "--target-spacing", type=float, nargs=3, default=[1.0, 1.0, 1.0], help="Target spacing."
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Repeats per method.")
+    args = parser.parse_args(argv)
+
+    labels = list(range(args.labels))
+    mask = sitk.GetImageFromArray(synthetic.make_label_mask(tuple(args.shape), args.labels).T)
+    mask.SetSpacing(args.spacing)
+
+    print(f"mask {tuple(args.shape)}, {args.labels} labels")
+    print(f"{'direction':<12}{'whole s':>9}{'bbox s':>9}{'speedup':>9}  match")
+    forward = pp.resample_mask_sitk(mask, labels, args.target_spacing)
+    for name, source, spacing in (
+        ("forward", mask, args.target_spacing),
+        ("restore", forward, args.spacing),
+    ):
+        whole, expected = _time(source, labels, spacing, False, args.repeats)
+        cropped, result = _time(source, labels, spacing, True, args.repeats)
+        match = np.array_equal(expected, result)
+        print(f"{name:<12}{whole:>9.2f}{cropped:>9.2f}{whole / cropped:>8.1f}x  {match}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
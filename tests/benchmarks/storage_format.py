@@ -0,0 +1,82 @@
+"""Benchmark the disk footprint and read time of the storage formats.
+
+A synthetic CT-like example is preprocessed once and saved in the "npy" and
+"compact" formats. The size of each file type and the time to read an
+epoch's worth of files (images, labels, and DTMs, as the DALI loaders do) are
+compared::
+
+    python -m tests.benchmarks.storage_format --shape 256 256 160 --labels 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import SimpleITK as sitk
+
+from mist.preprocessing import preprocess as pp
+from mist.preprocessing import storage
+from tests.benchmarks import synthetic
+
+_DIRECTORIES = ("images", "labels", "dtms")
+
+
+def _read_all(numpy_dir: Path, patient_ids: list[str]) -> float:
+    """Seconds to read every image, label, and DTM file once."""
+    start = time.perf_counter()
+    for patient_id in patient_ids:
+        for name in _DIRECTORIES:
+            np.load(numpy_dir / name / f"{patient_id}.npy")
+    return time.perf_counter() - start
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[192, 192, 120], help="Volume shape.")
+    parser.add_argument("--labels", type=int, default=4, help="Number of labels incl. background.")
+    parser.add_argument("--patients", type=int, default=4, help="Copies of the example to save.")
+    args = parser.parse_args(argv)
+
+    image, _ = synthetic.make_volume(tuple(args.shape), seed=0)
+    mask = synthetic.make_label_mask(tuple(args.shape), args.labels)
+    labels = list(range(args.labels))
+    mask_sitk = sitk.GetImageFromArray(mask.T)
+    example = {
+        "image": ((image - image.mean()) / image.std())[..., np.newaxis].astype(np.float32),
+        "mask": mask[..., np.newaxis].astype(np.uint8),
+        "dtm": pp.compute_dtm_sitk(mask_sitk, labels, normalize_dtm=True),
+        "fg_bbox": None,
+        "spacing": (1.0, 1.0, 1.0),
+    }
+    patient_ids = [f"p{i}" for i in range(args.patients)]
+
+    print(f"volume {tuple(args.shape)}, {args.labels} labels, {args.patients} patients")
+    print(f"{'format':<10}" + "".join(f"{name + ' MiB':>12}" for name in _DIRECTORIES), end="")
+    print(f"{'total MiB':>12}{'read s':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage_format in ("npy", "compact"):
+            numpy_dir = Path(tmp) / storage_format
+            for name in _DIRECTORIES:
+                (numpy_dir / name).mkdir(parents=True)
+            for patient_id in patient_ids:
+                storage.save_example(numpy_dir, patient_id, example, storage_format)
+
+            sizes = [
+                sum(path.stat().st_size for path in (numpy_dir / name).iterdir()) / 2**20
+                for name in _DIRECTORIES
+            ]
+            seconds = _read_all(numpy_dir, patient_ids)
+            print(
+                f"{storage_format:<10}"
+                + "".join(f"{size:>12.1f}" for size in sizes)
+                + f"{sum(sizes):>12.1f}{seconds:>9.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+"""Synthetic datasets for the benchmarks.
+
+Volumes are random but seeded, with a single spherical foreground label
+inside a body-like ellipsoid, so analysis and preprocessing do realistic
+amounts of work on them. Multi-label masks have organ-sized ellipsoids.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import ants
+import numpy as np
+
+
+def make_volume(
+    shape: tuple[int, int, int],
+    seed: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Create a CT-like image and a matching binary mask.
+
+    Args:
+        shape: Volume shape.
+        seed: Random seed.
+
+    Returns:
+        Tuple of (image, mask) as float32 and uint8 arrays.
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.meshgrid(*[np.linspace(-1.0, 1.0, s) for s in shape], indexing="ij")
+    radius = np.sqrt(sum(g**2 for g in grid))
+    body = radius < 0.9
+    image = np.where(body, rng.normal(40.0, 20.0, shape), -1024.0).astype(np.float32)
+
+    center = rng.uniform(-0.3, 0.3, size=3)
+    lesion = np.sqrt(sum((g - c) ** 2 for g, c in zip(grid, center, strict=True))) < 0.2
+    image[lesion] += 80.0
+    return image, lesion.astype(np.uint8)
+
+
+def make_label_mask(shape: tuple[int, int, int], num_labels: int, seed: int = 0) -> np.ndarray:
+    """Create a mask with num_labels - 1 ellipsoids of a few percent of the volume.
+
+    Args:
+        shape: Volume shape.
+        num_labels: Number of labels, including the background.
+        seed: Random seed.
+
+    Returns:
+        Mask as a float32 array with values in range(num_labels).
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.ogrid[tuple(slice(0, n) for n in shape)]
+    mask = np.zeros(shape, dtype=np.float32)
+    for label in range(1, num_labels):
+        radii = rng.uniform(0.06, 0.14, 3) * np.array(shape)
+        center = rng.uniform(radii, np.array(shape) - radii)
+        distance = sum(((g - c) / r) ** 2 for g, c, r in zip(grid, center, radii, strict=True))
+        mask[distance <= 1] = label
+    return mask
+
+
+def write_dataset(
+    root: Path,
+    n_patients: int,
+    shape: tuple[int, int, int],
+    spacing: tuple[float, float, float] = (1.0, 1.0, 2.5),
+) -> Path:
+    """Write a synthetic CT dataset in MIST layout and return its dataset JSON.
+
+    Args:
+        root: Directory to write the dataset to.
+        n_patients: Number of patients.
+        shape: Shape of every volume.
+        spacing: Voxel spacing of every volume.
+
+    Returns:
+        Path to the dataset JSON file.
+    """
+    root = Path(root)
+    train_data = root / "train-data"
+    for i in range(n_patients):
+        patient_dir = train_data / f"patient_{i:04d}"
+        patient_dir.mkdir(parents=True, exist_ok=True)
+        image, mask = make_volume(shape, seed=i)
+        for name, arr in (("image", image), ("mask", mask)):
+            img = ants.from_numpy(arr.astype(np.float32), spacing=spacing)
+            ants.image_write(img, str(patient_dir / f"{name}.nii.gz"))
+
+    dataset_json = root / "dataset.json"
+    dataset_json.write_text(
+        json.dumps(
+            {
+                "task": "benchmark",
+                "modality": "ct",
+                "train-data": "train-data",
+                "mask": ["mask.nii.gz"],
+                "images": {"ct": ["image.nii.gz"]},
+                "labels": [0, 1],
+                "final_classes": {"lesion": [1]},
+            },
+            indent=2,
+        )
+    )
+    return dataset_json
@@ -0,0 +1,98 @@
+"""Benchmark the in-place window_and_normalize against the reference.
+
+The reference computes each percentile with its own np.percentile call, takes
+the mean and standard deviation in separate passes, builds a float32 copy of
+the nonzero mask, and allocates a new array for each of the clip, z-score,
+mask, and cast steps. It then copies the result into the channel of the
+preallocated image, as preprocess_example did. Time and peak traced memory
+are reported for each modality and masking setting::
+
+    python -m tests.benchmarks.window_normalize --shape 512 512 300
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import Any
+
+import numpy as np
+
+from mist.preprocessing import preprocess as pp
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
+from tests.benchmarks import synthetic
+from tests.benchmarks.fg_bbox import measure
+
+
+def reference_window_and_normalize(image: np.ndarray, config: dict[str, Any]) -> np.ndarray:
+    """Windowing and normalization as computed before the in-place version."""
+    if config["preprocessing"]["normalize_with_nonzero_mask"]:
+        nonzero_mask = (image != 0).astype(np.float32)
+        nonzeros = image[nonzero_mask != 0]
+    if config["dataset_info"]["modality"] == "ct":
+        ct = config["preprocessing"]["ct_normalization"]
+        lower, upper = ct["window_min"], ct["window_max"]
+        mean, std = ct["z_score_mean"], ct["z_score_std"]
+    else:
+        values = image
+        if config["preprocessing"]["normalize_with_nonzero_mask"] and len(nonzeros) > 0:
+            values = nonzeros
+        lower = np.percentile(values, pc.WINDOW_PERCENTILE_LOW)
+        upper = np.percentile(values, pc.WINDOW_PERCENTILE_HIGH)
+        mean = np.mean(values)
+        std = np.std(values)
+    image = np.clip(image, lower, upper)
+    if std == 0:
+        return np.zeros_like(image, dtype=np.float32)
+    image = (image - mean) / std
+    if config["preprocessing"]["normalize_with_nonzero_mask"]:
+        image *= nonzero_mask
+    return image.astype(np.float32)
+
+
+def _config(modality: str, nonzero: bool) -> dict[str, Any]:
+    return {
+        "dataset_info": {"modality": modality},
+        "preprocessing": {
+            "normalize_with_nonzero_mask": nonzero,
+            "ct_normalization": {
+                "window_min": -200.0,
+                "window_max": 400.0,
+                "z_score_mean": 60.0,
+                "z_score_std": 120.0,
+            },
+        },
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 200], help="Volume shape.")
+    args = parser.parse_args(argv)
+
+    image, _ = synthetic.make_volume(tuple(args.shape), seed=0)
+    image = image.astype(np.float32)
+    output = np.zeros((*image.shape, 1), dtype=np.float32)
+
+    def reference(config):
+        output[..., 0] = reference_window_and_normalize(image, config)
+        return output[..., 0].copy()
+
+    def fused(config):
+        return pp.window_and_normalize(image, config, out=output[..., 0])
+
+    print(f"volume {tuple(args.shape)}, {image.nbytes / 2**20:.0f} MiB")
+    print(f"{'setting':<16}{'method':<11}{'seconds':>9}{'peak MiB':>10}{'max abs diff':>14}")
+    for modality in ("ct", "mr"):
+        for nonzero in (False, True):
+            config = _config(modality, nonzero)
+            setting = f"{modality}{', nonzero' if nonzero else ''}"
+            expected, seconds, mib = measure(lambda c=config: reference(c))
+            print(f"{setting:<16}{'reference':<11}{seconds:>9.2f}{mib:>10.0f}{0:>14}")
+            result, seconds, mib = measure(lambda c=config: fused(c))
+            diff = float(np.max(np.abs(result - expected)))
+            print(f"{'':<16}{'in place':<11}{seconds:>9.2f}{mib:>10.0f}{diff:>14.2e}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
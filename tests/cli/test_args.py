@@ -195,8 +195,16 @@ def test_add_analyzer_args_defaults_and_parsing():
     assert ns.data is None
     assert ns.results is None
     assert ns.nfolds is None
+    assert ns.analyze_backend == "thread"
+    assert ns.analyze_sample is None
+    assert ns.analyze_stratify == "none"
+    assert ns.analyze_seed == 42
+    assert ns.gpu_memory_budget is None
+    assert ns.plan_model is None
     assert ns.verify is False
     assert ns.data_dump is False
+    assert ns.skeleton_voxel_budget is None
+    assert ns.refresh is False
     assert ns.overwrite is False
 
     # Explicit values.
@@ -208,16 +216,39 @@ def test_add_analyzer_args_defaults_and_parsing():
             "out",
             "--nfolds",
             "3",
+            "--analyze-backend",
+            "process",
+            "--analyze-sample",
+            "200",
+            "--analyze-stratify",
+            "spacing",
+            "--analyze-seed",
+            "7",
+            "--gpu-memory-budget",
+            "24",
+            "--plan-model",
+            "mednext-small",
             "--verify",
             "--data-dump",
+            "--skeleton-voxel-budget",
+            "100000",
+            "--refresh",
             "--overwrite",
         ]
     )
     assert ns.data == "path/to/dataset.json"
     assert ns.results == "out"
     assert ns.nfolds == 3
+    assert ns.analyze_backend == "process"
+    assert ns.analyze_sample == 200
+    assert ns.analyze_stratify == "spacing"
+    assert ns.analyze_seed == 7
+    assert ns.gpu_memory_budget == 24.0
+    assert ns.plan_model == "mednext-small"
     assert ns.verify is True
     assert ns.data_dump is True
+    assert ns.skeleton_voxel_budget == 100000
+    assert ns.refresh is True
     assert ns.overwrite is True
 
 
@@ -237,6 +268,11 @@ def test_add_preprocess_args_defaults_and_parsing():
     assert ns.numpy is None
     assert ns.no_preprocess is False
     assert ns.compute_dtms is False
+    assert ns.dtm_band is None
+    assert ns.dtm_threads == 1
+    assert ns.preprocess_memory_budget is None
+    assert ns.storage_format is None
+    assert ns.profile_preprocess is False
     assert ns.overwrite is False
 
     # Explicit.
@@ -248,6 +284,15 @@ def test_add_preprocess_args_defaults_and_parsing():
             "npdir",
             "--no-preprocess",
             "--compute-dtms",
+            "--dtm-band",
+            "8",
+            "--dtm-threads",
+            "4",
+            "--preprocess-memory-budget",
+            "12.5",
+            "--storage-format",
+            "compact",
+            "--profile-preprocess",
             "--overwrite",
         ]
     )
@@ -255,6 +300,11 @@ def test_add_preprocess_args_defaults_and_parsing():
     assert ns.numpy == "npdir"
     assert ns.no_preprocess is True
     assert ns.compute_dtms is True
+    assert ns.dtm_band == 8
+    assert ns.dtm_threads == 4
+    assert ns.preprocess_memory_budget == 12.5
+    assert ns.storage_format == "compact"
+    assert ns.profile_preprocess is True
     assert ns.overwrite is True
 
     # Explicit boolean_flag false.
@@ -310,6 +360,7 @@ def test_add_train_args_defaults_and_basic_parse(patched_registries):
     assert ns.learning_rate is None
     assert ns.lr_scheduler is None
     assert ns.warmup_epochs is None
+    assert ns.compile is None
     assert ns.optimizer is None
     assert ns.l2_penalty is None
     assert ns.folds is None
@@ -357,6 +408,7 @@ def test_add_train_args_full_parse_success(patched_registries):
         "4",
         "--overwrite",
         "--resume",
+        "--compile",
     ]
     ns = parser.parse_args(argv)
 
@@ -376,6 +428,7 @@ def test_add_train_args_full_parse_success(patched_registries):
     assert ns.folds == [0, 2, 4]
     assert ns.overwrite is True
     assert ns.resume is True
+    assert ns.compile is True
 
 
 def test_add_train_args_enforces_choices(patched_registries):
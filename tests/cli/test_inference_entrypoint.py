@@ -261,6 +261,42 @@ def test_run_inference_calls_infer_with_expected_args(tmp_path, monkeypatch):
     assert captured["output_probs"] is True
 
 
+def test_run_inference_compile_enables_compile_in_config(tmp_path, monkeypatch):
+    """Test run_inference with --compile turns on training.compile."""
+    models = tmp_path / "models"
+    models.mkdir(parents=True, exist_ok=True)
+    cfg = tmp_path / "config.json"
+    _touch_json(cfg, {"training": {"compile": {"enabled": False, "mode": "default"}}})
+    paths = tmp_path / "paths.csv"
+    _touch_csv(paths)
+
+    monkeypatch.setattr(entry.inference_utils, "validate_paths_dataframe", lambda df: None)
+    captured = {}
+    monkeypatch.setattr(
+        entry.inference_runners, "infer_from_dataframe", lambda **kwargs: captured.update(kwargs)
+    )
+
+    ns = entry._parse_inference_args(
+        [
+            "--models-dir",
+            str(models),
+            "--config",
+            str(cfg),
+            "--paths-csv",
+            str(paths),
+            "--output",
+            str(tmp_path / "out"),
+            "--device",
+            "cpu",
+            "--compile",
+        ]
+    )
+    entry.run_inference(ns)
+
+    compile_settings = captured["mist_configuration"]["training"]["compile"]
+    assert compile_settings == {"enabled": True, "mode": "default"}
+
+
 def test_run_inference_with_postprocess_strategy(tmp_path, monkeypatch):
     """Test run_inference with postprocess strategy."""
     # Files and dirs.
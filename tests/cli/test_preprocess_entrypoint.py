@@ -81,6 +81,18 @@ def test_prepare_preprocess_dirs_allows_overwrite_on_nonempty(tmp_path):
     assert numpy_dir.exists()
 
 
+def test_prepare_preprocess_dirs_resumes_previous_run(tmp_path):
+    """A non-empty numpy dir with a manifest is resumed without --overwrite."""
+    numpy_dir = tmp_path / "np_out"
+    numpy_dir.mkdir(parents=True, exist_ok=True)
+    _touch(numpy_dir / "images" / "p1.npy", "x")
+    _touch(numpy_dir / "manifest.json", "{}")
+    ns = argparse.Namespace(numpy=str(numpy_dir), overwrite=False)
+
+    entry._prepare_preprocess_dirs(ns)  # should not raise
+    assert (numpy_dir / "images" / "p1.npy").exists()
+
+
 def test_ensure_analyze_artifacts_success(tmp_path):
     """_ensure_analyze_artifacts succeeds when required files are present."""
     results = _mk_results_with_required_artifacts(tmp_path)
@@ -153,6 +153,16 @@ def test_parse_run_all_args_explicit_values(monkeypatch, tmp_path):
     assert ns.batch_size_per_gpu == 2
 
 
+def test_parse_run_all_args_plans_for_trained_model(monkeypatch):
+    """--model sets the architecture for the memory planner unless overridden."""
+    _patch_minimal_cli(monkeypatch)
+    ns = entry._parse_run_all_args(argv=["--data", "d.json", "--model", "mednext-small"])
+    assert ns.plan_model == "mednext-small"
+
+    ns = entry._parse_run_all_args(argv=["--data", "d.json"])
+    assert getattr(ns, "plan_model", None) is None
+
+
 # =============================================================================
 # Tests for run_all_entry.
 # =============================================================================
@@ -226,8 +236,16 @@ def test_run_all_entry_forwards_subsets_correctly(monkeypatch, tmp_path):
         "results",
         "nfolds",
         "num_workers_analyze",
+        "analyze_backend",
+        "analyze_sample",
+        "analyze_stratify",
+        "analyze_seed",
+        "gpu_memory_budget",
+        "plan_model",
         "verify",
         "data_dump",
+        "skeleton_voxel_budget",
+        "refresh",
         "overwrite",
     ]
     preprocess_keys = [
@@ -236,6 +254,11 @@ def test_run_all_entry_forwards_subsets_correctly(monkeypatch, tmp_path):
         "num_workers_preprocess",
         "no_preprocess",
         "compute_dtms",
+        "dtm_band",
+        "dtm_threads",
+        "preprocess_memory_budget",
+        "storage_format",
+        "profile_preprocess",
         "overwrite",
     ]
     train_keys = [
@@ -303,6 +326,11 @@ def test_run_all_entry_handles_false_flags_and_empty_lists(monkeypatch):
         "num_workers_preprocess",
         "no_preprocess",
         "compute_dtms",
+        "dtm_band",
+        "dtm_threads",
+        "preprocess_memory_budget",
+        "storage_format",
+        "profile_preprocess",
         "overwrite",
     ]
     train_keys = [
@@ -2,6 +2,7 @@
 
 from unittest import mock
 
+import numpy as np
 import pytest
 
 import mist.data_loading.data_loading_utils as utils
@@ -112,6 +113,101 @@ class TestLoadData:
             mock_reshape.assert_called_with("mock_label", layout="DHWC")
 
 
+class TestCompactStorage:
+    """Tests for reading data saved in the compact storage format."""
+
+    def test_reads_label_boxes(self, base_pipeline_args):
+        """A label box reader is created only when label box paths are given."""
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args)
+        assert pipeline.has_label_boxes is False
+        assert not hasattr(pipeline, "input_label_boxes")
+
+        pipeline = dali_loader.TrainPipeline(
+            **base_pipeline_args, label_box_paths=["box.npy"], half_precision=True
+        )
+        assert pipeline.has_label_boxes is True
+        assert pipeline.half_precision is True
+        assert hasattr(pipeline, "input_label_boxes")
+
+    def test_invalid_label_boxes_raise(self, monkeypatch, base_pipeline_args):
+        """Raises ValueError when the label box paths fail validation."""
+        monkeypatch.setattr(
+            utils, "is_valid_generic_pipeline_input", lambda files: files != ["box.npy"]
+        )
+        with pytest.raises(ValueError, match="Input label boxes are not valid"):
+            dali_loader.TrainPipeline(**base_pipeline_args, label_box_paths=["box.npy"])
+
+    @mock.patch("mist.data_loading.dali_loader.fn.slice", return_value="full_label")
+    def test_restore_label_pads_crop_to_full_shape(self, mock_slice, base_pipeline_args):
+        """Cropped labels are sliced with the box anchor and shape and padded."""
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args, label_box_paths=["box.npy"])
+        box = mock.MagicMock()
+        box.__getitem__.side_effect = lambda i: ("anchor", "shape")[i]
+        pipeline.input_label_boxes = mock.Mock(return_value=box)
+
+        assert pipeline.restore_label("label") == "full_label"
+        mock_slice.assert_called_once_with(
+            "label",
+            "anchor",
+            "shape",
+            axes=[0, 1, 2, 3],
+            out_of_bounds_policy="pad",
+            fill_values=0,
+        )
+
+    @mock.patch("mist.data_loading.dali_loader.fn.slice")
+    @mock.patch("mist.data_loading.dali_loader.fn.cast")
+    def test_npy_data_is_unchanged(self, mock_cast, mock_slice, base_pipeline_args):
+        """Without the compact format, labels and images pass through."""
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args)
+        assert pipeline.restore_label("label") == "label"
+        assert pipeline.to_float("image") == "image"
+        mock_slice.assert_not_called()
+        mock_cast.assert_not_called()
+
+    @mock.patch("mist.data_loading.dali_loader.fn.cast", return_value="float_image")
+    def test_to_float_casts_half_precision(self, mock_cast, base_pipeline_args):
+        """Half precision images are cast to float32."""
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args, half_precision=True)
+        assert pipeline.to_float("image") == "float_image"
+        mock_cast.assert_called_once_with("image", dtype=dali_loader.types.FLOAT)
+
+    @mock.patch("mist.data_loading.dali_loader.DALIGenericIterator")
+    @mock.patch("mist.data_loading.dali_loader.TestPipeline")
+    @mock.patch("mist.data_loading.dali_loader.EvalPipeline")
+    @mock.patch("mist.data_loading.dali_loader.TrainPipeline")
+    def test_dataset_builders_forward_compact_options(
+        self, mock_train, mock_eval, mock_test, mock_dali_iter
+    ):
+        """Label box paths and half precision reach every pipeline."""
+        common = {"seed": 1, "num_workers": 1, "rank": 0, "world_size": 1}
+        dali_loader.get_training_dataset(
+            image_paths=["image.npy"],
+            label_paths=["label.npy"],
+            dtm_paths=None,
+            batch_size=1,
+            roi_size=(8, 8, 8),
+            labels=[1],
+            oversampling=0.5,
+            label_box_paths=["box.npy"],
+            half_precision=True,
+            **common,
+        )
+        dali_loader.get_validation_dataset(
+            image_paths=["image.npy"],
+            label_paths=["label.npy"],
+            label_box_paths=["box.npy"],
+            half_precision=True,
+            **common,
+        )
+        dali_loader.get_test_dataset(image_paths=["image.npy"], half_precision=True, **common)
+
+        for pipeline in (mock_train, mock_eval):
+            assert pipeline.call_args.kwargs["label_box_paths"] == ["box.npy"]
+        for pipeline in (mock_train, mock_eval, mock_test):
+            assert pipeline.call_args.kwargs["half_precision"] is True
+
+
 class TestBiasedCropFn:
     """Tests for TrainPipeline.biased_crop_fn."""
 
@@ -147,6 +243,109 @@ class TestBiasedCropFn:
         assert out == expected
 
 
+class TestFgVoxels:
+    """Tests for picking crop centers from sampled foreground voxels."""
+
+    def test_reads_fg_voxels(self, monkeypatch, base_pipeline_args):
+        """A reader is created only for given paths, and invalid paths raise."""
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args)
+        assert pipeline.has_fg_voxels is False
+        assert not hasattr(pipeline, "input_fg_voxels")
+
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args, fg_voxel_paths=["fg.npy"])
+        assert pipeline.has_fg_voxels is True
+        assert hasattr(pipeline, "input_fg_voxels")
+
+        monkeypatch.setattr(
+            utils, "is_valid_generic_pipeline_input", lambda files: files != ["fg.npy"]
+        )
+        with pytest.raises(ValueError, match="Input foreground voxels are not valid"):
+            dali_loader.TrainPipeline(**base_pipeline_args, fg_voxel_paths=["fg.npy"])
+
+    @mock.patch("mist.data_loading.dali_loader.fn.slice")
+    @mock.patch("mist.data_loading.dali_loader.fn.roi_random_crop", return_value="anchor")
+    @mock.patch("mist.data_loading.dali_loader.fn.segmentation.random_object_bbox")
+    @mock.patch("mist.data_loading.dali_loader.fn.pad", return_value="padded")
+    def test_biased_crop_uses_fg_voxels(
+        self, mock_pad, mock_bbox, mock_crop, mock_slice, base_pipeline_args
+    ):
+        """The ROI comes from the sampled voxels instead of an object search."""
+        args = {**base_pipeline_args, "dtm_paths": None, "fg_voxel_paths": ["fg.npy"]}
+        pipeline = dali_loader.TrainPipeline(**args)
+        pipeline.fg_voxel_roi = mock.Mock(return_value=("fg_start", "fg_end"))
+        dummy = mock.MagicMock()
+        mock_slice.return_value = (dummy, dummy)
+
+        pipeline.biased_crop_fn("image", "label")
+
+        pipeline.fg_voxel_roi.assert_called_once_with("padded")
+        mock_bbox.assert_not_called()
+        assert mock_crop.call_args.kwargs["roi_start"] == "fg_start"
+        assert mock_crop.call_args.kwargs["roi_end"] == "fg_end"
+
+    @mock.patch("mist.data_loading.dali_loader.fn.random.coin_flip")
+    def test_fg_voxel_roi_flips_coin_with_oversampling(self, mock_coin, base_pipeline_args):
+        """The foreground is chosen with the oversampling probability."""
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args, fg_voxel_paths=["fg.npy"])
+        pipeline.input_fg_voxels = mock.MagicMock()
+
+        roi_start, roi_end = pipeline.fg_voxel_roi("label")
+
+        pipeline.input_fg_voxels.assert_called_once_with(name="fg_voxels_reader")
+        assert mock_coin.call_args.kwargs["probability"] == base_pipeline_args["oversampling"]
+        assert roi_start is not None and roi_end is not None
+
+    @pytest.mark.parametrize("use_foreground", [0, 1])
+    def test_fg_voxel_roi_matches_crop_shape(self, monkeypatch, base_pipeline_args, use_foreground):
+        """The ROI bounds have a channel entry, like the crop shape, and span all channels."""
+        # Run the DALI operators used by fg_voxel_roi on numpy arrays.
+        monkeypatch.setattr(
+            dali_loader.fn, "shapes", lambda data, dtype=None: np.array(data.shape, np.int32)
+        )
+        monkeypatch.setattr(dali_loader.fn, "cast", lambda data, dtype: np.int32(data))
+        monkeypatch.setattr(dali_loader.fn, "cat", lambda *data, axis: np.concatenate(data, axis))
+        monkeypatch.setattr(dali_loader.fn.random, "uniform", lambda range: np.float32(0.6))
+        monkeypatch.setattr(
+            dali_loader.fn.random, "coin_flip", lambda **kwargs: np.int32(use_foreground)
+        )
+        monkeypatch.setattr(dali_loader.math, "clamp", np.clip)
+        pipeline = dali_loader.TrainPipeline(**base_pipeline_args, fg_voxel_paths=["fg.npy"])
+        fg_voxels = np.array([[1, 2, 3, 2, 3, 4], [5, 6, 7, 6, 7, 8]], dtype=np.int32)
+        pipeline.input_fg_voxels = mock.Mock(return_value=fg_voxels)
+        label = np.zeros((70, 80, 90, 1), dtype=np.uint8)
+
+        roi_start, roi_end = pipeline.fg_voxel_roi(label)
+
+        crop_shape = [*pipeline.roi_size, 1]
+        assert len(roi_start) == len(roi_end) == len(crop_shape)
+        if use_foreground:
+            np.testing.assert_array_equal(roi_start, [5, 6, 7, 0])
+            np.testing.assert_array_equal(roi_end, [6, 7, 8, 1])
+        else:
+            np.testing.assert_array_equal(roi_start, [0, 0, 0, 0])
+            np.testing.assert_array_equal(roi_end, [70, 80, 90, 1])
+
+    @mock.patch("mist.data_loading.dali_loader.DALIGenericIterator")
+    @mock.patch("mist.data_loading.dali_loader.TrainPipeline")
+    def test_training_dataset_forwards_fg_voxels(self, mock_train, mock_dali_iter):
+        """get_training_dataset passes the voxel paths to the pipeline."""
+        dali_loader.get_training_dataset(
+            image_paths=["image.npy"],
+            label_paths=["label.npy"],
+            dtm_paths=None,
+            batch_size=1,
+            roi_size=(8, 8, 8),
+            labels=[1],
+            oversampling=0.5,
+            seed=1,
+            num_workers=1,
+            rank=0,
+            world_size=1,
+            fg_voxel_paths=["fg.npy"],
+        )
+        assert mock_train.call_args.kwargs["fg_voxel_paths"] == ["fg.npy"]
+
+
 class TestFlipsFn:
     """Tests for TrainPipeline.flips_fn."""
 
@@ -413,6 +612,27 @@ class TestGetTrainingDataset:
         mock_dali_iter.assert_called_once_with(mock_train_pipeline.return_value, expected_keys)
         assert result == mock_dali_iter.return_value
 
+    @mock.patch("mist.data_loading.dali_loader.TrainPipeline")
+    @mock.patch("mist.data_loading.data_loading_utils.validate_train_and_eval_inputs")
+    def test_several_samples_per_volume_raise(self, mock_validate, mock_train_pipeline):
+        """DALI draws one patch per volume."""
+        with pytest.raises(ValueError, match="one patch per volume"):
+            dali_loader.get_training_dataset(
+                image_paths=["image.npy"],
+                label_paths=["label.npy"],
+                dtm_paths=None,
+                batch_size=1,
+                roi_size=(64, 64, 64),
+                labels=[0, 1],
+                oversampling=0.25,
+                seed=42,
+                num_workers=1,
+                rank=0,
+                world_size=1,
+                samples_per_volume=4,
+            )
+        mock_train_pipeline.assert_not_called()
+
 
 class TestGetValidationDataset:
     """Tests for dali_loader.get_validation_dataset."""
@@ -0,0 +1,149 @@
+"""Tests for the shared memory cache of preprocessed files."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from mist.data_loading import shared_cache
+
+
+def _write(path: Path, size: int) -> str:
+    """Write a file of a given size and return its path."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def _cached_files(cache: shared_cache.SharedFileCache) -> set[str]:
+    return {path.name for path in cache.directory.iterdir() if path.name != ".lock"}
+
+
+class TestSharedFileCache:
+    """Tests for SharedFileCache."""
+
+    def test_get_copies_the_file_once(self, tmp_path):
+        """The first read copies a file, and later reads return the copy."""
+        original = _write(tmp_path / "data" / "p0.npy", 100)
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=1000)
+        cached = cache.get(original)
+        assert Path(cached).parent == cache.directory
+        assert Path(cached).suffix == ".npy"
+        assert Path(cached).read_bytes() == Path(original).read_bytes()
+        assert cache.get(original) == cached
+        assert len(_cached_files(cache)) == 1
+
+    def test_least_recently_read_files_are_removed(self, tmp_path):
+        """Adding a file past the cap removes the files read longest ago."""
+        paths = [_write(tmp_path / "data" / f"p{i}.npy", 100) for i in range(4)]
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=300)
+        cached = [cache.get(path) for path in paths[:3]]
+        # Read p0 again after p1 and p2, so that p1 is read longest ago.
+        os.utime(cached[1], ns=(1, 1))
+        os.utime(cached[2], ns=(2, 2))
+        cache.get(paths[0])
+
+        cache.get(paths[3])
+        assert not Path(cached[1]).exists()
+        assert Path(cached[0]).exists() and Path(cached[2]).exists()
+        assert sum(path.stat().st_size for path in cache.directory.glob("*.npy")) <= 300
+
+    def test_files_larger_than_the_cache_are_read_from_disk(self, tmp_path):
+        """A file that cannot fit is not cached and nothing is removed."""
+        small = _write(tmp_path / "data" / "small.npy", 100)
+        large = _write(tmp_path / "data" / "large.npy", 500)
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=300)
+        cached_small = cache.get(small)
+        assert cache.get(large) == large
+        assert Path(cached_small).exists()
+
+    def test_changed_files_are_cached_again(self, tmp_path):
+        """Preprocessing a file again gives it a new cached copy."""
+        original = _write(tmp_path / "data" / "p0.npy", 100)
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=1000)
+        first = cache.get(original)
+        _write(Path(original), 120)
+        second = cache.get(original)
+        assert second != first
+        assert Path(second).read_bytes() == Path(original).read_bytes()
+
+    def test_get_all_caches_what_fits(self, tmp_path):
+        """Files past the cap are read from disk, with a warning."""
+        paths = [_write(tmp_path / "data" / f"p{i}.npy", 100) for i in range(4)]
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=300)
+        with pytest.warns(UserWarning, match="1 of 4 files do not fit"):
+            cached = cache.get_all(paths)
+        assert all(Path(path).parent == cache.directory for path in cached[:3])
+        assert cached[3] == paths[3]
+        assert cache.get_all(paths[:3]) == cached[:3]
+
+    def test_get_all_never_removes_files(self, tmp_path):
+        """A second list of files does not remove the files of the first."""
+        first_paths = [_write(tmp_path / "data" / f"p{i}.npy", 100) for i in range(2)]
+        second_paths = [_write(tmp_path / "data" / f"q{i}.npy", 100) for i in range(2)]
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=300)
+        first = cache.get_all(first_paths)
+        with pytest.warns(UserWarning, match="1 of 2 files do not fit"):
+            second = cache.get_all(second_paths)
+
+        assert all(Path(path).exists() for path in first)
+        assert all(Path(path).parent == cache.directory for path in first)
+        assert Path(second[0]).parent == cache.directory
+        assert second[1] == second_paths[1]
+        assert len(_cached_files(cache)) == 3
+
+    def test_get_never_removes_pinned_files(self, tmp_path):
+        """Files returned by get_all stay when get makes room for other files."""
+        pinned_paths = [_write(tmp_path / "data" / f"p{i}.npy", 100) for i in range(2)]
+        other_paths = [_write(tmp_path / "data" / f"q{i}.npy", 100) for i in range(2)]
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=300)
+        pinned = cache.get_all(pinned_paths)
+        first = cache.get(other_paths[0])
+        os.utime(first, ns=(1, 1))
+        for path in pinned:
+            os.utime(path, ns=(0, 0))
+
+        second = cache.get(other_paths[1])
+        assert all(Path(path).exists() for path in pinned)
+        assert not Path(first).exists()
+        assert Path(second).parent == cache.directory
+        assert cache.get(pinned_paths[0]) == pinned[0]
+
+    def test_get_all_pins_files_cached_by_get(self, tmp_path):
+        """A file cached by get is pinned without a second copy."""
+        original = _write(tmp_path / "data" / "p0.npy", 100)
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=100)
+        cached = cache.get(original)
+        (pinned,) = cache.get_all([original])
+        assert pinned != cached and not Path(cached).exists()
+        assert Path(pinned).read_bytes() == Path(original).read_bytes()
+        assert _cached_files(cache) == {Path(pinned).name}
+        assert cache.get(original) == pinned
+
+    def test_cached_arrays_load(self, tmp_path):
+        """Cached numpy files load as the originals do."""
+        array = np.arange(24, dtype=np.float32).reshape(2, 3, 4, 1)
+        np.save(tmp_path / "p0.npy", array)
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=2**20)
+        np.testing.assert_array_equal(np.load(cache.get(str(tmp_path / "p0.npy"))), array)
+
+
+class TestGetSharedCache:
+    """Tests for get_shared_cache."""
+
+    def test_disabled_by_default(self, tmp_path):
+        """Without the config section, there is no cache."""
+        assert shared_cache.get_shared_cache({}, tmp_path) is None
+        assert shared_cache.get_shared_cache({"shared_cache": {"enabled": False}}, tmp_path) is None
+
+    def test_directory_is_named_after_the_numpy_directory(self, tmp_path):
+        """Runs on the same data share a directory, and other data does not."""
+        config = {"shared_cache": {"enabled": True, "max_size_gb": 0.5, "directory": str(tmp_path)}}
+        first = shared_cache.get_shared_cache(config, tmp_path / "numpy")
+        again = shared_cache.get_shared_cache(config, tmp_path / "numpy")
+        other = shared_cache.get_shared_cache(config, tmp_path / "other")
+        assert first.directory == again.directory != other.directory
+        assert first.directory.parent == tmp_path
+        assert first.directory.name.startswith("mist-cache-")
+        assert first.max_bytes == 2**29
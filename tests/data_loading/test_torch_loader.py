@@ -0,0 +1,497 @@
+"""Tests for the PyTorch data loading module in MIST."""
+
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from mist.data_loading import shared_cache, torch_loader
+from mist.data_loading.data_loading_constants import DataLoadingConstants as constants
+from mist.preprocessing import storage
+
+
+def _example(rng: np.random.Generator, shape=(24, 20, 16)) -> dict:
+    """An example with one object of label 1 and two objects of label 2."""
+    mask = np.zeros((*shape, 1), dtype=np.uint8)
+    mask[2:5, 3:6, 1:4] = 1
+    mask[15:18, 14:18, 10:14] = 2
+    mask[20:22, 2:4, 12:14] = 2
+    return {
+        "image": rng.normal(size=(*shape, 2)).astype(np.float32),
+        "mask": mask,
+        "dtm": rng.uniform(-1, 1, size=(*shape, 2)).astype(np.float32),
+        "fg_bbox": None,
+        "spacing": (1.0, 1.0, 1.0),
+    }
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Three examples saved in each storage format, with their file paths."""
+
+    def _save(storage_format: str) -> dict[str, list[str]]:
+        numpy_dir = tmp_path / storage_format
+        for name in ("images", "labels", "dtms"):
+            (numpy_dir / name).mkdir(parents=True)
+        rng = np.random.default_rng(0)
+        patient_ids = ["p0", "p1", "p2"]
+        for patient_id in patient_ids:
+            storage.save_example(numpy_dir, patient_id, _example(rng), storage_format)
+        paths = {
+            name: [str(numpy_dir / name / f"{pid}.npy") for pid in patient_ids]
+            for name in ("images", "labels", "dtms")
+        }
+        paths["label_boxes"] = (
+            [str(numpy_dir / "label_boxes" / f"{pid}.npy") for pid in patient_ids]
+            if storage_format == "compact"
+            else None
+        )
+        paths["numpy_dir"] = numpy_dir
+        return paths
+
+    return _save
+
+
+def _train_kwargs(paths: dict, **overrides) -> dict:
+    kwargs = {
+        "image_paths": paths["images"],
+        "label_paths": paths["labels"],
+        "dtm_paths": None,
+        "batch_size": 2,
+        "roi_size": (8, 8, 8),
+        "labels": [1, 2],
+        "oversampling": 1.0,
+        "seed": 42,
+        "num_workers": 0,
+        "rank": 0,
+        "world_size": 1,
+        "label_box_paths": paths["label_boxes"],
+    }
+    return {**kwargs, **overrides}
+
+
+class TestSampling:
+    """Tests for sharding, object boxes, and the biased crop."""
+
+    @pytest.mark.parametrize("num_files,world_size", [(10, 1), (10, 3), (7, 4)])
+    def test_shards_are_contiguous_and_cover_all_files(self, num_files, world_size):
+        """Shards split the files into contiguous blocks, as DALI does."""
+        shards = [
+            torch_loader.shard_indices(num_files, rank, world_size) for rank in range(world_size)
+        ]
+        assert sum(shards, []) == list(range(num_files))
+        assert max(map(len, shards)) - min(map(len, shards)) <= 1
+
+    def test_find_object_boxes(self):
+        """Each connected object of each class gets its own box."""
+        boxes = torch_loader.find_object_boxes(
+            _example(np.random.default_rng(0))["mask"], [1, 2, 3]
+        )
+        assert sorted(boxes) == [1, 2]
+        np.testing.assert_array_equal(boxes[1][0][0], [2, 3, 1])
+        np.testing.assert_array_equal(boxes[1][0][1], [5, 6, 4])
+        assert len(boxes[2]) == 2
+
+    def test_random_crop_start_contains_small_roi(self):
+        """A crop larger than the ROI contains it and stays in the volume."""
+        rng = np.random.default_rng(0)
+        shape, crop = np.array([20, 20, 20]), np.array([8, 8, 8])
+        roi_start, roi_end = np.array([0, 9, 17]), np.array([2, 11, 20])
+        for _ in range(100):
+            start = torch_loader.random_crop_start(rng, roi_start, roi_end, crop, shape)
+            assert np.all(start <= roi_start) and np.all(start + crop >= roi_end)
+            assert np.all(start >= 0) and np.all(start + crop <= shape)
+
+    def test_random_crop_start_lies_within_large_roi(self):
+        """A crop smaller than the ROI lies within it."""
+        rng = np.random.default_rng(0)
+        shape, crop = np.array([40, 40, 40]), np.array([8, 8, 8])
+        roi_start, roi_end = np.array([5, 5, 5]), np.array([30, 30, 30])
+        starts = np.array(
+            [
+                torch_loader.random_crop_start(rng, roi_start, roi_end, crop, shape)
+                for _ in range(200)
+            ]
+        )
+        assert starts.min() >= 5 and starts.max() <= 22
+        assert starts.min() == 5 and starts.max() == 22
+
+    @pytest.mark.parametrize("oversampling,minimum_fraction", [(1.0, 1.0), (0.0, 0.0)])
+    def test_biased_crop_finds_foreground(self, oversampling, minimum_fraction):
+        """With oversampling 1, every patch contains foreground."""
+        rng = np.random.default_rng(0)
+        example = _example(rng)
+        boxes = torch_loader.find_object_boxes(example["mask"], [1, 2])
+        patches = [
+            torch_loader.biased_crop_fn(
+                rng, [example["image"], example["mask"]], (6, 6, 6), oversampling, boxes
+            )
+            for _ in range(50)
+        ]
+        assert all(image.shape == (6, 6, 6, 2) for image, _ in patches)
+        assert np.mean([label.any() for _, label in patches]) >= minimum_fraction
+
+    def test_biased_crop_from_fg_voxels(self):
+        """Sampled voxels center patches on each class with equal weights."""
+        rng = np.random.default_rng(0)
+        example = _example(rng)
+        fg_voxels = storage.sample_foreground_voxels(example["mask"])
+        patches = [
+            torch_loader.biased_crop_fn(
+                rng, [example["mask"]], (4, 4, 4), 1.0, fg_voxels=fg_voxels
+            )[0]
+            for _ in range(400)
+        ]
+        has_class = np.array([[(patch == value).any() for value in (1, 2)] for patch in patches])
+        assert has_class.any(axis=1).all()
+        assert has_class.mean(axis=0) == pytest.approx([0.5, 0.5], abs=0.1)
+
+    def test_biased_crop_pads_small_volumes(self):
+        """Volumes smaller than the patch are padded with zeros at the end."""
+        rng = np.random.default_rng(0)
+        image = np.ones((4, 10, 6, 1), dtype=np.float32)
+        (patch,) = torch_loader.biased_crop_fn(rng, [image], (8, 8, 8), 0.0, {})
+        assert patch.shape == (8, 8, 8, 1)
+        assert patch[:4, :, :6].all() and not patch[4:].any() and not patch[:, :, 6:].any()
+
+
+class TestPatchReader:
+    """Tests for reading patches from numpy files."""
+
+    @pytest.mark.parametrize("version,order", [((1, 0), "C"), ((2, 0), "C"), ((1, 0), "F")])
+    @pytest.mark.parametrize("start", [(0, 0, 0), (3, 2, 1), (-2, 5, 4), (8, 0, 0), (-4, 0, 0)])
+    def test_read_patch_matches_padded_crop(self, tmp_path, version, order, start):
+        """Patches match crops of the volume, with zeros outside of it."""
+        volume = np.arange(10 * 8 * 6 * 2, dtype=np.float16).reshape(10, 8, 6, 2) + 1
+        path = tmp_path / "volume.npy"
+        with open(path, "wb") as file:
+            np.lib.format.write_array(file, np.asarray(volume, order=order), version=version)
+        assert torch_loader.array_shape(str(path)) == volume.shape
+
+        patch = torch_loader.read_patch(str(path), np.array(start), (4, 4, 4))
+        padded = np.pad(volume, [(4, 4), (0, 4), (0, 4), (0, 0)])
+        begin = [s + pad for s, pad in zip(start, (4, 0, 0), strict=True)]
+        assert patch.dtype == volume.dtype
+        np.testing.assert_array_equal(patch, padded[tuple(slice(b, b + 4) for b in begin)])
+
+    def test_read_patch_truncated_file_raises(self, tmp_path):
+        """Files shorter than their header raise a ValueError."""
+        path = tmp_path / "volume.npy"
+        np.save(path, np.ones((6, 6, 6, 1), dtype=np.float32))
+        path.write_bytes(path.read_bytes()[:-100])
+        with pytest.raises(ValueError, match="shorter than its header"):
+            torch_loader.read_patch(str(path), np.array([2, 2, 2]), (4, 4, 4))
+
+    @pytest.mark.parametrize("storage_format", ["npy", "compact"])
+    @pytest.mark.parametrize("use_fg_voxels", [False, True])
+    def test_patches_match_crops_of_the_whole_example(self, dataset, storage_format, use_fg_voxels):
+        """Reading only the patch gives the crop of the loaded and padded example."""
+        paths = dataset(storage_format)
+        fg_voxel_paths = [str(paths["numpy_dir"] / "fg_voxels" / f"p{i}.npy") for i in range(3)]
+        train = torch_loader.TrainDataset(
+            paths["images"],
+            paths["labels"],
+            paths["dtms"],
+            (12, 12, 20),
+            [1, 2],
+            0.6,
+            42,
+            0,
+            1,
+            label_box_paths=paths["label_boxes"],
+            half_precision=storage_format == "compact",
+            fg_voxel_paths=fg_voxel_paths if use_fg_voxels else None,
+        )
+        for index in range(3):
+            for seed in range(5):
+                patches = train.load_patches(np.random.default_rng(seed), index)
+                expected = torch_loader.biased_crop_fn(
+                    np.random.default_rng(seed),
+                    train.load(index),
+                    (12, 12, 20),
+                    0.6,
+                    object_boxes=train.object_boxes.get(index),
+                    fg_voxels=np.load(fg_voxel_paths[index]) if use_fg_voxels else None,
+                )
+                for patch, crop in zip(patches, expected, strict=True):
+                    assert patch.dtype == crop.dtype
+                    np.testing.assert_array_equal(patch, crop)
+
+
+class TestAugmentations:
+    """Tests for the augmentations."""
+
+    def test_flips_match_between_image_and_label(self):
+        """The image, label, and DTM are flipped along the same axes."""
+        rng = np.random.default_rng(0)
+        image = np.arange(4 * 5 * 6, dtype=np.float32).reshape(4, 5, 6, 1)
+        flipped = [torch_loader.flips_fn(rng, [image, image.copy()]) for _ in range(20)]
+        assert all(np.array_equal(a, b) for a, b in flipped)
+        assert len({a.tobytes() for a, _ in flipped}) > 1
+
+    def test_zoom_keeps_shape_and_labels(self, monkeypatch):
+        """Zoomed patches keep their shape and only contain existing labels."""
+        monkeypatch.setattr(constants, "ZOOM_FN_PROBABILITY", 1.0)
+        rng = np.random.default_rng(0)
+        example = _example(rng)
+        image, label = torch_loader.zoom_fn(rng, example["image"], example["mask"])
+        assert image.shape == example["image"].shape and label.shape == example["mask"].shape
+        assert set(np.unique(label)) <= {0, 1, 2}
+        assert not np.array_equal(image, example["image"])
+
+    @pytest.mark.parametrize(
+        "function,name",
+        [
+            (torch_loader.noise_fn, "NOISE"),
+            (torch_loader.blur_fn, "BLUR"),
+            (torch_loader.brightness_fn, "BRIGHTNESS"),
+            (torch_loader.contrast_fn, "CONTRAST"),
+        ],
+    )
+    def test_intensity_augmentations(self, function, name):
+        """Augmentations apply at their probability and keep clamped ranges."""
+        rng = np.random.default_rng(0)
+        image = rng.normal(size=(6, 6, 6, 1)).astype(np.float32)
+        outputs = [function(rng, image) for _ in range(2000)]
+        changed = [out for out in outputs if out is not image]
+        assert len(changed) / len(outputs) == pytest.approx(
+            getattr(constants, f"{name}_FN_PROBABILITY"), abs=0.03
+        )
+        assert all(out.shape == image.shape and out.dtype == np.float32 for out in changed)
+        if name != "BRIGHTNESS":
+            assert all(out.min() >= image.min() and out.max() <= image.max() for out in changed)
+
+
+class TestTrainingDataset:
+    """Tests for get_training_dataset."""
+
+    @pytest.mark.parametrize("storage_format", ["npy", "compact"])
+    def test_batches(self, dataset, storage_format):
+        """Batches are CDHW patches, with foreground when oversampling is 1."""
+        paths = dataset(storage_format)
+        loader = torch_loader.get_training_dataset(
+            **_train_kwargs(paths, half_precision=storage_format == "compact")
+        )
+        for _ in range(4):
+            (batch,) = loader.next()
+            assert batch["image"].shape == (2, 2, 8, 8, 8)
+            assert batch["image"].dtype == torch.float32
+            assert batch["label"].shape == (2, 1, 8, 8, 8)
+            assert batch["label"].dtype == torch.uint8
+            assert all(label.any() for label in batch["label"])
+        loader.reset()
+        assert loader.next()[0]["image"].shape == (2, 2, 8, 8, 8)
+
+    def test_fg_voxels_replace_the_object_search(self, dataset, monkeypatch):
+        """With sampled voxels, labels are not searched for objects."""
+        paths = dataset("npy")
+        monkeypatch.setattr(torch_loader, "find_object_boxes", None)
+        fg_voxel_paths = [str(paths["numpy_dir"] / "fg_voxels" / f"p{i}.npy") for i in range(3)]
+        loader = torch_loader.get_training_dataset(
+            **_train_kwargs(paths, fg_voxel_paths=fg_voxel_paths, use_zoom=False)
+        )
+        for _ in range(4):
+            assert all(label.any() for label in loader.next()[0]["label"])
+
+    def test_dtms_are_cropped_with_the_image(self, dataset):
+        """DTMs are cropped and flipped like the image and label."""
+        paths = dataset("npy")
+        loader = torch_loader.get_training_dataset(
+            **_train_kwargs(paths, dtm_paths=paths["dtms"], use_noise=False, use_blur=False)
+        )
+        batch = loader.next()[0]
+        assert batch["dtm"].shape == (2, 2, 8, 8, 8)
+        assert not loader.loader.dataset.use_zoom
+
+    def test_without_augmentation_patches_match_the_data(self, dataset):
+        """Without augmentation, each patch is a crop of its example."""
+        paths = dataset("npy")
+        loader = torch_loader.get_training_dataset(
+            **_train_kwargs(paths, use_augmentation=False, batch_size=1)
+        )
+        images = [np.load(path) for path in paths["images"]]
+        for _ in range(6):
+            patch = loader.next()[0]["image"][0].numpy()
+            assert any(_is_crop(patch, np.moveaxis(image, -1, 0)) for image in images)
+
+    def test_file_order_covers_each_file_once_per_epoch(self):
+        """Workers together read every file of the shard once per epoch."""
+        dataset = torch_loader.TrainDataset(
+            [f"{i}.npy" for i in range(5)], [], None, (8, 8, 8), [1], 0.5, 42, 0, 1
+        )
+        streams = [dataset.file_order(worker, 2) for worker in range(2)]
+        order = [next(streams[position % 2]) for position in range(15)]
+        for epoch in range(3):
+            assert sorted(order[5 * epoch : 5 * epoch + 5]) == list(range(5))
+        assert order[:5] != order[5:10]
+
+    def test_invalid_inputs_raise(self, dataset):
+        """Missing or mismatched files are rejected."""
+        paths = dataset("npy")
+        with pytest.raises(ValueError, match="Number of images and labels do not match"):
+            torch_loader.get_training_dataset(
+                **_train_kwargs(paths, label_paths=paths["labels"][:1])
+            )
+        with pytest.raises(ValueError, match="Input images are not valid"):
+            torch_loader.get_training_dataset(
+                **_train_kwargs(paths, image_paths=[*paths["images"][:2], "missing.npy"])
+            )
+
+    def test_samples_per_volume(self, dataset, monkeypatch):
+        """Each load gives several patches, which are mixed across files."""
+        paths = dataset("npy")
+        # Fill each image with its file index to tell the patches apart.
+        for index, path in enumerate(paths["images"]):
+            np.save(path, np.full_like(np.load(path), index))
+        train = torch_loader.TrainDataset(
+            paths["images"],
+            paths["labels"],
+            None,
+            (8, 8, 8),
+            [1, 2],
+            1.0,
+            42,
+            0,
+            1,
+            use_zoom=False,
+            use_noise=False,
+            use_blur=False,
+            use_brightness=False,
+            use_contrast=False,
+            samples_per_volume=3,
+        )
+        assert train.shuffle_buffer_size == 3 * constants.SHUFFLE_BUFFER_VOLUMES
+        loads = []
+        load = train.load
+        monkeypatch.setattr(train, "load", lambda index: loads.append(index) or load(index))
+
+        stream = iter(train)
+        samples = [next(stream) for _ in range(12)]
+        assert len(loads) == (12 + train.shuffle_buffer_size) // 3
+        assert all(sample["label"].any() for sample in samples)
+        sources = [int(sample["image"].flatten()[0]) for sample in samples]
+        assert len(set(sources[:3])) > 1 or len(set(sources[3:6])) > 1
+
+    def test_reads_through_the_shared_cache(self, dataset, tmp_path):
+        """With a cache, training and validation files are read from it."""
+        paths = dataset("compact")
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=2**30)
+        loader = torch_loader.get_training_dataset(
+            **_train_kwargs(paths, half_precision=True, cache=cache)
+        )
+        for _ in range(3):
+            assert all(label.any() for label in loader.next()[0]["label"])
+        cached = {cache.cached_path(path) for path in paths["images"] + paths["labels"]}
+        assert cached <= set(cache.directory.iterdir())
+
+        val_cache = shared_cache.SharedFileCache(tmp_path / "val_cache", max_bytes=2**30)
+        val_loader = torch_loader.get_validation_dataset(
+            paths["images"],
+            paths["labels"],
+            seed=42,
+            num_workers=0,
+            rank=0,
+            world_size=1,
+            label_box_paths=paths["label_boxes"],
+            half_precision=True,
+            cache=val_cache,
+        )
+        example = storage.load_example(paths["numpy_dir"], "p0", "compact")
+        batch = val_loader.next()[0]
+        np.testing.assert_array_equal(batch["label"][0, 0].numpy(), example["mask"][..., 0])
+        assert val_cache.cached_path(paths["images"][0]).exists()
+
+    def test_reads_files_removed_from_the_shared_cache(self, dataset, tmp_path, monkeypatch):
+        """Files removed from the cache after get returns them are read from disk."""
+        paths = dataset("compact")
+        cache = shared_cache.SharedFileCache(tmp_path / "cache", max_bytes=2**30)
+        get = cache.get
+
+        def get_and_remove(path):
+            # Another process removes the cached copy before it is read.
+            cached = get(path)
+            os.unlink(cached)
+            return cached
+
+        monkeypatch.setattr(cache, "get", get_and_remove)
+        loader = torch_loader.get_training_dataset(
+            **_train_kwargs(paths, half_precision=True, cache=cache)
+        )
+        for _ in range(3):
+            assert all(label.any() for label in loader.next()[0]["label"])
+
+        path = paths["images"][0]
+        np.testing.assert_array_equal(
+            torch_loader.read_file(path, cache, torch_loader.load_array), np.load(path)
+        )
+        with pytest.raises(FileNotFoundError):
+            torch_loader.read_file(str(tmp_path / "missing.npy"), None, np.load)
+
+    def test_samples_per_volume_must_be_positive(self, dataset):
+        """Fewer than one patch per volume raises a ValueError."""
+        paths = dataset("npy")
+        with pytest.raises(ValueError, match="samples_per_volume must be at least 1"):
+            torch_loader.get_training_dataset(**_train_kwargs(paths, samples_per_volume=0))
+
+
+def _is_crop(patch: np.ndarray, image: np.ndarray) -> bool:
+    """Whether a CDHW patch is a crop of a CDHW image."""
+    windows = np.lib.stride_tricks.sliding_window_view(image, patch.shape)
+    return bool((windows == patch).all(axis=(-4, -3, -2, -1)).any())
+
+
+class TestEvalDatasets:
+    """Tests for get_validation_dataset and get_test_dataset."""
+
+    def test_validation_streams_whole_examples_in_order(self, dataset):
+        """Validation batches are whole examples of the rank, in order."""
+        paths = dataset("compact")
+        loader = torch_loader.get_validation_dataset(
+            paths["images"],
+            paths["labels"],
+            seed=42,
+            num_workers=0,
+            rank=0,
+            world_size=1,
+            label_box_paths=paths["label_boxes"],
+            half_precision=True,
+        )
+        for patient_id in ("p0", "p1", "p2", "p0"):
+            batch = loader.next()[0]
+            example = storage.load_example(paths["numpy_dir"], patient_id, "compact")
+            np.testing.assert_array_equal(batch["label"][0, 0].numpy(), example["mask"][..., 0])
+            np.testing.assert_array_equal(
+                batch["image"][0].numpy(), np.moveaxis(example["image"], -1, 0)
+            )
+        loader.reset()
+        np.testing.assert_array_equal(
+            loader.next()[0]["image"][0].numpy(),
+            np.moveaxis(storage.load_example(paths["numpy_dir"], "p0", "compact")["image"], -1, 0),
+        )
+
+    def test_validation_shards_are_padded(self, dataset):
+        """Each rank gets the same number of examples."""
+        paths = dataset("npy")
+        lengths = [
+            len(
+                torch_loader.get_validation_dataset(
+                    paths["images"], paths["labels"], 42, 0, rank, 2
+                ).loader.dataset
+            )
+            for rank in range(2)
+        ]
+        assert lengths == [2, 2]
+
+    def test_test_dataset(self, dataset):
+        """Test batches hold only the image, in the order of the paths."""
+        paths = dataset("npy")
+        loader = torch_loader.get_test_dataset(paths["images"][::-1], seed=42, num_workers=0)
+        for path in paths["images"][::-1]:
+            batch = loader.next()[0]
+            assert list(batch) == ["image"]
+            np.testing.assert_array_equal(
+                batch["image"][0].numpy(), np.moveaxis(np.load(path), -1, 0)
+            )
+        with pytest.raises(ValueError, match="No images found"):
+            torch_loader.get_test_dataset([], seed=42, num_workers=0)
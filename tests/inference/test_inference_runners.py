@@ -276,6 +276,7 @@ def fold_runner(mock_mist_config, monkeypatch, tmp_path):
         image_write=image_write,
         predict_single=predict_single,
         printed=printed,
+        get_test_dataset=mock_get_test_dataset,
     )
 
 
@@ -634,6 +635,21 @@ def test_test_on_fold_raises_if_dali_not_available(monkeypatch, tmp_path, mock_m
         ir.test_on_fold(mist_args=mist_args, fold_number=0, device=torch.device("cpu"))
 
 
+def test_test_on_fold_uses_torch_loader_without_dali(fold_runner, mock_mist_config, monkeypatch):
+    """test_on_fold streams images with the PyTorch loader when configured."""
+    cfg = copy.deepcopy(mock_mist_config)
+    cfg["training"]["data_loader"] = "torch"
+    get_test_dataset = MagicMock(return_value=_DummyLoader(n=1))
+    monkeypatch.setattr(ir, "dali_loader", None)
+    monkeypatch.setattr(ir.torch_loader, "get_test_dataset", get_test_dataset)
+
+    fold_runner.run(fold=0, cfg=cfg, device=torch.device("cpu"))
+
+    get_test_dataset.assert_called_once()
+    fold_runner.get_test_dataset.assert_not_called()
+    fold_runner.image_write.assert_called_once()
+
+
 def test_dali_import_error_sets_dali_loader_none():
     """inference_runners.dali_loader is None when the DALI import fails."""
     import mist.data_loading
@@ -690,6 +706,25 @@ def test_test_on_fold_crop_to_foreground_bbox_passed(fold_runner, mock_mist_conf
     assert call_kwargs["foreground_bounding_box"] == bbox_df.iloc[0].to_dict()
 
 
+def test_test_on_fold_reads_compact_storage_format(fold_runner, mock_mist_config, monkeypatch):
+    """Compact data: float16 images are cast and the bbox comes from the sidecar."""
+    cfg = copy.deepcopy(mock_mist_config)
+    cfg["preprocessing"]["crop_to_foreground"] = True
+    cfg["preprocessing"]["skip"] = False
+    cfg["preprocessing"]["storage_format"] = "compact"
+    cfg["inference"]["tta"]["enabled"] = False
+    sidecar_bbox = {"x0": 2, "x1": 5, "y0": 1, "y1": 4, "z0": 0, "z1": 3}
+    load_metadata = MagicMock(return_value={"fg_bbox": sidecar_bbox})
+    monkeypatch.setattr(ir.storage, "load_metadata", load_metadata)
+
+    fold_runner.run(fold=0, cfg=cfg)
+
+    assert fold_runner.get_test_dataset.call_args.kwargs["half_precision"] is True
+    assert load_metadata.call_args.args[1] == "p1"
+    call_kwargs = fold_runner.predict_single.call_args.kwargs
+    assert call_kwargs["foreground_bounding_box"] == sidecar_bbox
+
+
 def test_test_on_fold_error_message_collected_and_printed_single(fold_runner, mock_mist_config):
     """If prediction fails for a case, the formatted error is printed."""
     fold_runner.predict_single.side_effect = RuntimeError("boom")
@@ -1,5 +1,6 @@
 """Unit tests for model construction and loading utilities."""
 
+import os
 from collections import OrderedDict
 from unittest.mock import MagicMock, patch
 
@@ -9,6 +10,7 @@ import torch
 # MIST imports.
 from mist.models.model_loader import (
     average_fold_weights,
+    compile_model,
     load_model_from_config,
     load_pretrained_encoder,
     validate_encoder_compatibility,
@@ -582,3 +584,108 @@ def test_load_pretrained_encoder_incompatible_shape_is_skipped(nnunet_source, so
 
     _, summary = load_pretrained_encoder(_IncompatibleModel(), source_checkpoint)
     assert first_key in summary["skipped"]
+
+
+# ---------------------------------------------------------------------------
+# compile_model tests
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def compile_env(monkeypatch):
+    """Restore the global settings that compile_model may change."""
+    monkeypatch.setattr(torch._dynamo.config, "suppress_errors", False)
+    monkeypatch.delenv("TORCHINDUCTOR_CACHE_DIR", raising=False)
+    yield
+    torch._dynamo.reset()
+
+
+def _compile_config(**settings) -> dict:
+    return {"training": {"compile": {"enabled": True, "backend": "eager", **settings}}}
+
+
+def test_compile_model_disabled_by_default(compile_env):
+    """Without training.compile.enabled, the model is not compiled."""
+    model = torch.nn.Linear(2, 2)
+    assert compile_model(model, {"training": {}}) is model
+    assert model._compiled_call_impl is None
+    assert "TORCHINDUCTOR_CACHE_DIR" not in os.environ
+
+
+def test_compile_model_keeps_outputs_and_state_dict_keys(compile_env, tmp_path):
+    """A compiled model gives the same outputs and saves the same keys."""
+    model = torch.nn.Sequential(torch.nn.Conv3d(1, 2, 3, padding=1), torch.nn.ReLU())
+    expected = model(torch.ones(1, 1, 4, 4, 4))
+    keys = list(model.state_dict())
+
+    compiled = compile_model(model, _compile_config(), cache_dir=tmp_path / "cache")
+
+    assert compiled is model and model._compiled_call_impl is not None
+    assert list(model.state_dict()) == keys
+    torch.testing.assert_close(model(torch.ones(1, 1, 4, 4, 4)), expected)
+    # Edge batches of sliding window inference have fewer patches.
+    assert model(torch.ones(3, 1, 4, 4, 4)).shape == (3, 2, 4, 4, 4)
+    assert os.environ["TORCHINDUCTOR_CACHE_DIR"] == str((tmp_path / "cache").resolve())
+    assert (tmp_path / "cache").is_dir()
+
+
+def test_compile_model_cache_dir_from_config(compile_env, tmp_path):
+    """training.compile.cache_dir overrides the caller's directory."""
+    compile_model(
+        torch.nn.Linear(2, 2),
+        _compile_config(cache_dir=str(tmp_path / "configured")),
+        cache_dir=tmp_path / "default",
+    )
+    assert os.environ["TORCHINDUCTOR_CACHE_DIR"] == str((tmp_path / "configured").resolve())
+    assert not (tmp_path / "default").exists()
+
+
+def test_compile_model_falls_back_when_backend_fails(compile_env):
+    """If compiling fails on the first call, the model runs without it."""
+
+    def failing_backend(graph_module, example_inputs):
+        raise RuntimeError("compilation failed")
+
+    model = torch.nn.Linear(2, 2)
+    inputs = torch.ones(3, 2)
+    expected = model(inputs)
+    compile_model(model, _compile_config(backend=failing_backend))
+    torch.testing.assert_close(model(inputs), expected)
+    assert torch._dynamo.config.suppress_errors is False
+
+
+def test_compile_model_does_not_suppress_other_errors(compile_env):
+    """Compile errors outside of the model's calls still raise."""
+
+    def failing_backend(graph_module, example_inputs):
+        raise RuntimeError("compilation failed")
+
+    compile_model(torch.nn.Linear(2, 2), _compile_config())
+    function = torch.compile(lambda x: x + 1, backend=failing_backend)
+    with pytest.raises(Exception, match="compilation failed"):
+        function(torch.ones(2))
+
+
+def test_compile_model_keeps_user_cache_dir(compile_env, monkeypatch, tmp_path):
+    """A cache directory set in the environment wins over the caller's default."""
+    monkeypatch.setenv("TORCHINDUCTOR_CACHE_DIR", str(tmp_path / "user"))
+    compile_model(torch.nn.Linear(2, 2), _compile_config(), cache_dir=tmp_path / "default")
+    assert os.environ["TORCHINDUCTOR_CACHE_DIR"] == str(tmp_path / "user")
+    assert not (tmp_path / "default").exists()
+
+
+def test_compile_model_warns_when_compile_raises(compile_env):
+    """Invalid settings warn and leave the model uncompiled."""
+    model = torch.nn.Linear(2, 2)
+    with pytest.warns(UserWarning, match="Could not compile the model"):
+        assert compile_model(model, _compile_config(backend="no-such-backend")) is model
+    assert model._compiled_call_impl is None
+
+
+def test_compile_model_warns_when_unsupported(compile_env, monkeypatch):
+    """Platforms without torch.compile support run the model as is."""
+    monkeypatch.setattr(torch._dynamo, "is_dynamo_supported", lambda: False)
+    model = torch.nn.Linear(2, 2)
+    with pytest.warns(UserWarning, match="not supported"):
+        assert compile_model(model, _compile_config()) is model
+    assert model._compiled_call_impl is None
@@ -0,0 +1,152 @@
+"""Tests for mist.preprocessing.manifest."""
+
+import json
+import os
+
+import pytest
+
+from mist.preprocessing import manifest
+from mist.preprocessing.preprocessing_constants import PreprocessingConstants as pc
+
+
+@pytest.fixture
+def config():
+    """Minimal configuration with the keys that enter the digest."""
+    return {
+        "dataset_info": {"labels": [0, 1], "images": ["ct"], "modality": "ct"},
+        "spatial_config": {"target_spacing": [1.0, 1.0, 1.0], "patch_size": [64, 64, 64]},
+        "preprocessing": {"skip": False, "crop_to_foreground": True, "compute_dtms": False},
+        "training": {"epochs": 100},
+    }
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """Two input files."""
+    paths = []
+    for name in ("image.nii.gz", "mask.nii.gz"):
+        path = tmp_path / name
+        path.write_bytes(b"data")
+        paths.append(str(path))
+    return paths
+
+
+def _digest(inputs, config, fg_bbox=None, compute_dtms=False):
+    return manifest.patient_digest(inputs, manifest.config_subset(config), fg_bbox, compute_dtms)
+
+
+class TestPatientDigest:
+    """Tests for patient_digest."""
+
+    def test_is_stable(self, inputs, config):
+        """The same inputs and settings give the same digest."""
+        assert _digest(inputs, config) == _digest(list(inputs), json.loads(json.dumps(config)))
+
+    def test_changes_with_input_files(self, inputs, config):
+        """Rewriting an input file changes the digest."""
+        before = _digest(inputs, config)
+        with open(inputs[1], "wb") as file:
+            file.write(b"other data")
+        assert _digest(inputs, config) != before
+
+    def test_changes_with_modification_time(self, inputs, config):
+        """Touching an input file changes the digest."""
+        before = _digest(inputs, config)
+        stat = os.stat(inputs[0])
+        os.utime(inputs[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert _digest(inputs, config) != before
+
+    @pytest.mark.parametrize(
+        "section,key,value",
+        [
+            ("spatial_config", "target_spacing", [1.0, 1.0, 2.0]),
+            ("preprocessing", "crop_to_foreground", False),
+            ("preprocessing", "compute_dtms", True),
+            ("dataset_info", "labels", [0, 1, 2]),
+        ],
+    )
+    def test_changes_with_preprocessing_settings(self, inputs, config, section, key, value):
+        """Settings that change the saved arrays change the digest."""
+        before = _digest(inputs, config)
+        config[section][key] = value
+        assert _digest(inputs, config) != before
+
+    def test_ignores_unrelated_settings(self, inputs, config):
+        """Training settings and the patch size do not change the digest."""
+        before = _digest(inputs, config)
+        config["training"]["epochs"] = 5
+        config["spatial_config"]["patch_size"] = [32, 32, 32]
+        assert _digest(inputs, config) == before
+
+    def test_changes_with_bbox_and_dtms(self, inputs, config):
+        """The foreground box and whether DTMs are saved change the digest."""
+        bbox = {"x0": 0, "x1": 4, "y0": 0, "y1": 4, "z0": 0, "z1": 4}
+        digests = {
+            _digest(inputs, config),
+            _digest(inputs, config, fg_bbox=bbox),
+            _digest(inputs, config, fg_bbox={**bbox, "x1": 5}),
+            _digest(inputs, config, compute_dtms=True),
+        }
+        assert len(digests) == 4
+
+    def test_missing_input_file(self, tmp_path, config):
+        """Missing input files still give a digest."""
+        assert manifest.file_fingerprint(tmp_path / "missing") == [
+            str(tmp_path / "missing"),
+            None,
+            None,
+        ]
+        assert _digest([str(tmp_path / "missing")], config)
+
+
+class TestManifestFile:
+    """Tests for reading and writing the manifest."""
+
+    def test_round_trip(self, tmp_path):
+        """A written manifest is read back unchanged."""
+        data = {"version": pc.MANIFEST_VERSION, "patients": {"p1": {"digest": "d", "files": []}}}
+        manifest.write_manifest(tmp_path, data)
+        assert manifest.read_manifest(tmp_path) == data
+        assert not list(tmp_path.glob(f"*{pc.TEMPORARY_FILE_SUFFIX}"))
+
+    @pytest.mark.parametrize(
+        "content",
+        [None, "{not json", json.dumps({"version": -1, "patients": {"p1": {}}})],
+    )
+    def test_missing_corrupt_or_old_manifest_is_empty(self, tmp_path, content):
+        """Missing, unreadable, or old manifests are treated as empty."""
+        if content is not None:
+            (tmp_path / pc.MANIFEST_FILENAME).write_text(content)
+        assert manifest.read_manifest(tmp_path) == {
+            "version": pc.MANIFEST_VERSION,
+            "patients": {},
+        }
+
+    def test_is_up_to_date(self, tmp_path):
+        """Entries are up to date when the digest matches and files exist."""
+        (tmp_path / "images").mkdir()
+        (tmp_path / "images" / "p1.npy").write_bytes(b"")
+        entry = {"digest": "abc", "files": ["images/p1.npy"]}
+        assert manifest.is_up_to_date(tmp_path, entry, "abc")
+        assert not manifest.is_up_to_date(tmp_path, entry, "def")
+        assert not manifest.is_up_to_date(tmp_path, None, "abc")
+        (tmp_path / "images" / "p1.npy").unlink()
+        assert not manifest.is_up_to_date(tmp_path, entry, "abc")
+
+    def test_remove_files_and_temporary_files(self, tmp_path):
+        """Listed files and leftover temporary files are removed."""
+        (tmp_path / "images").mkdir()
+        kept = tmp_path / "images" / "p2.npy"
+        for path in (tmp_path / "images" / "p1.npy", kept):
+            path.write_bytes(b"")
+        temporary = [
+            tmp_path / "images" / f"p3.npy{pc.TEMPORARY_FILE_SUFFIX}",
+            tmp_path / f"{pc.MANIFEST_FILENAME}{pc.TEMPORARY_FILE_SUFFIX}",
+        ]
+        for path in temporary:
+            path.write_bytes(b"partial")
+
+        manifest.remove_files(tmp_path, ["images/p1.npy", "labels/p1.npy"])
+        manifest.remove_temporary_files(tmp_path)
+
+        assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [kept.name]
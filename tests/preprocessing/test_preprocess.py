@@ -8,12 +8,15 @@ from pathlib import Path
 from types import SimpleNamespace
 from typing import Any
 
+import ants
 import numpy as np
 import pandas as pd
 import pytest
+import SimpleITK as sitk
 
 # MIST imports.
 from mist.preprocessing import preprocess as pp
+from mist.preprocessing import profiling
 from mist.utils import console as console_mod
 
 
@@ -173,57 +176,6 @@ class _DummySitkImage:
         )
 
 
-class _DummyDTM:
-    """SITK-like DTM image that records divisors for zero-guard tests."""
-
-    def __init__(self, tag, divlog):
-        self.tag = tag  # 'dtm', 'int', 'ext', etc.
-        self._divlog = divlog
-        self._spacing = (1.0, 1.0, 1.0)
-        self._origin = (0.0, 0.0, 0.0)
-        self._direction = (1.0,) * 9
-
-    def __lt__(self, other):
-        """Element-wise comparison returning a mask image, like SimpleITK."""
-        return _DummyDTM("int_mask", self._divlog)
-
-    def __gt__(self, other):
-        """Element-wise comparison returning a mask image, like SimpleITK."""
-        return _DummyDTM("ext_mask", self._divlog)
-
-    __le__ = __lt__
-    __ge__ = __gt__
-
-    def __imul__(self, other):
-        """In-place multiplication for scaling."""
-        if "int_mask" in self.tag:
-            self.tag = "int"
-        elif "ext_mask" in self.tag:
-            self.tag = "ext"
-        return self
-
-    def __truediv__(self, other):
-        """True division operator for scaling."""
-        self._divlog.append((self.tag, other))
-        return _DummyDTM(f"{self.tag}_div", self._divlog)
-
-    def __sub__(self, other):
-        """Subtraction operator for images."""
-        return _DummyDTM("result", self._divlog)
-
-    def SetSpacing(self, s):
-        """Set the spacing of the image."""
-        self._spacing = s
-
-    def SetOrigin(self, o):
-        """Set the origin of the image."""
-        self._origin = o
-
-    def SetDirection(self, d):
-        """Set the direction of the image."""
-        self._direction = d
-
-
 class _PB:
     """Very small progress-bar stub used by tests."""
 
@@ -360,6 +312,44 @@ def test_window_and_normalize_zero_std_returns_zeros():
     np.testing.assert_array_equal(out, np.zeros(5, dtype=np.float32))
 
 
+@pytest.mark.parametrize("nonzero", [False, True])
+def test_window_and_normalize_matches_reference_across_chunks(monkeypatch, nonzero):
+    """Chunked statistics and in-place updates match the direct computation."""
+    monkeypatch.setattr(pp.pc, "NORMALIZATION_CHUNK_VOXELS", 100)
+    rng = np.random.default_rng(0)
+    img = rng.normal(50.0, 20.0, size=(9, 8, 7)).astype(np.float32)
+    img[:3] = 0
+    cfg = {
+        "dataset_info": {"modality": "mr"},
+        "preprocessing": {"normalize_with_nonzero_mask": nonzero},
+    }
+    out = pp.window_and_normalize(img.T, cfg)
+
+    values = img[img != 0] if nonzero else img
+    lower, upper = np.percentile(values, [0.5, 99.5])
+    expected = (np.clip(img, lower, upper) - values.mean()) / values.std()
+    if nonzero:
+        expected *= img != 0
+    np.testing.assert_allclose(out, expected.T, rtol=1e-5, atol=1e-5)
+    assert out.dtype == np.float32
+
+
+def test_window_and_normalize_writes_into_out():
+    """The result is written into the given output array and returned."""
+    img = np.array([[0.0, 1.0], [2.0, 3.0]], dtype=np.float32)
+    cfg = {
+        "dataset_info": {"modality": "mr"},
+        "preprocessing": {"normalize_with_nonzero_mask": True},
+    }
+    channels = np.full((2, 2, 2), 7.0, dtype=np.float32)
+    out = pp.window_and_normalize(img, cfg, out=channels[..., 1])
+
+    assert np.shares_memory(out, channels)
+    np.testing.assert_array_equal(channels[..., 1], pp.window_and_normalize(img, cfg))
+    np.testing.assert_array_equal(channels[..., 0], np.full((2, 2), 7.0))
+    assert channels[0, 0, 1] == 0
+
+
 def test_resample_image_calls_utils_and_resample(monkeypatch):
     """Resample path converts to/from SITK and calls sitk.Resample."""
     dummy_sitk = _DummySitkImage(size=(2, 2, 2), spacing=(2.0, 2.0, 2.0))
@@ -483,74 +473,74 @@ def test_resample_image_aniso_intermediate_called(monkeypatch):
     assert out is final_ants
 
 
-def test_resample_mask_happy_path(monkeypatch):
-    """Resample mask happy path with label series and join."""
-    labels = [0, 1, 2]
-    onehots = [_DummySitkImage(size=(3, 3, 3)) for _ in labels]
-    src_ants = _DummyAntsImage(
-        np.zeros((2, 2, 2), dtype=np.float32),
-        spacing=(2, 2, 2),
-        origin=(1, 2, 3),
-        direction=(1,) * 9,
-    )
+def _sitk_image(
+    arr: np.ndarray,
+    spacing: tuple[float, float, float] = (1.0, 1.0, 1.0),
+    origin: tuple[float, float, float] = (0.0, 0.0, 0.0),
+    direction: tuple[float, ...] = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0),
+) -> sitk.Image:
+    """Create a float32 SimpleITK image from an (x, y, z) array."""
+    img = sitk.GetImageFromArray(np.asarray(arr, dtype=np.float32).T)
+    img.SetSpacing(spacing)
+    img.SetOrigin(origin)
+    img.SetDirection(direction)
+    return img
 
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "make_onehot",
-        lambda _m, _lbls: onehots,
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.analyzer_utils,
-        "get_resampled_image_dimensions",
-        lambda size, sp, tgt: (3, 3, 3),
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "check_anisotropic",
-        lambda _s: {"is_anisotropic": False},
-        raising=True,
-    )
-    monkeypatch.setattr(pp.sitk, "Resample", lambda *a, **k: a[0], raising=True)
-    monkeypatch.setattr(pp.sitk, "JoinSeries", lambda seq: object(), raising=True)
 
-    def _sitk_to_ants(_):
-        arr = np.zeros((3, 3, 3, len(labels)), dtype=np.float32)
-        return _DummyAntsImage(arr)
+def _write_image(path: Path, arr: np.ndarray, **kwargs) -> str:
+    """Write an (x, y, z) array to a NIfTI file and return its path."""
+    sitk.WriteImage(_sitk_image(arr, **kwargs), str(path))
+    return str(path)
 
-    monkeypatch.setattr(pp.preprocessing_utils, "sitk_to_ants", _sitk_to_ants, raising=True)
-    monkeypatch.setattr(
-        pp.ants,
-        "from_numpy",
-        lambda data: _DummyAntsImage(np.asarray(data)),
-        raising=True,
-    )
+
+def test_resample_mask_happy_path():
+    """Resampled mask has target spacing, source geometry, and argmax labels."""
+    labels = [0, 1, 2]
+    arr = np.zeros((4, 4, 4), dtype=np.float32)
+    arr[:2] = 1
+    arr[2:, 2:] = 2
+    src_ants = ants.from_numpy(arr, origin=(1.0, 2.0, 3.0), spacing=(2.0, 2.0, 2.0))
 
     out = pp.resample_mask(src_ants, labels=labels, target_spacing=(1.0, 1.0, 1.0))
-    assert isinstance(out, _DummyAntsImage)
     assert out.spacing == (1.0, 1.0, 1.0)
     assert out.origin == src_ants.origin
-    assert out.direction == src_ants.direction
-    assert out.numpy().shape == (3, 3, 3)
+    np.testing.assert_array_equal(out.direction, src_ants.direction)
+    assert out.numpy().shape == (8, 8, 8)
     assert out.numpy().dtype == np.float32
+    assert set(np.unique(out.numpy())) == {0.0, 1.0, 2.0}
+    np.testing.assert_array_equal(out.numpy()[:2, :2, :2], 1)
+
+
+def test_resample_mask_sitk_matches_argmax_over_labels():
+    """The running argmax equals np.argmax over all resampled labels."""
+    rng = np.random.default_rng(0)
+    labels = [0, 3, 7]
+    arr = rng.choice(labels, size=(6, 5, 4)).astype(np.float32)
+    mask = _sitk_image(arr, spacing=(1.5, 1.5, 1.5))
+
+    out = pp.resample_mask_sitk(mask, labels, (1.0, 1.0, 1.0))
+    onehots = []
+    for label in labels:
+        onehot = sitk.Resample(
+            sitk.Cast(mask == label, sitk.sitkFloat32),
+            size=list(out.GetSize()),
+            transform=sitk.Transform(),
+            interpolator=sitk.sitkLinear,
+            outputOrigin=mask.GetOrigin(),
+            outputSpacing=(1.0, 1.0, 1.0),
+            outputDirection=mask.GetDirection(),
+            defaultPixelValue=0,
+            outputPixelType=sitk.sitkFloat32,
+        )
+        onehots.append(sitk.GetArrayFromImage(onehot))
+    np.testing.assert_array_equal(
+        sitk.GetArrayFromImage(out), np.argmax(np.stack(onehots, axis=-1), axis=-1)
+    )
+    assert out.GetSpacing() == (1.0, 1.0, 1.0)
 
 
 def test_resample_mask_aniso_axis_not_int_raises(monkeypatch):
     """Anisotropic resample with non-int axis raises ValueError."""
-    masks = [_DummySitkImage()]
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "make_onehot",
-        lambda _m, _l: masks,
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.analyzer_utils,
-        "get_resampled_image_dimensions",
-        lambda size, spacing, tgt: (8, 8, 8),
-        raising=True,
-    )
     monkeypatch.setattr(
         pp.preprocessing_utils,
         "check_anisotropic",
@@ -560,282 +550,175 @@ def test_resample_mask_aniso_axis_not_int_raises(monkeypatch):
 
     with pytest.raises(ValueError, match="low resolution axis must be an integer"):
         pp.resample_mask(
-            mask_ants=SimpleNamespace(origin=(1, 2, 3), direction=(1.0,) * 9),
+            mask_ants=ants.from_numpy(np.zeros((4, 4, 4), dtype=np.float32)),
             labels=[0, 1],
             target_spacing=(1.0, 1.0, 1.0),
         )
 
 
-def test_resample_mask_aniso_intermediate_called_for_each_label(monkeypatch):
-    """Anisotropic mask calls intermediate resample for each label."""
-    m0, m1 = _DummySitkImage(), _DummySitkImage()
-    masks = [m0, m1]
-    labels = [0, 1]
-    new_size = (10, 12, 14)
-    target_spacing = (1.0, 1.0, 1.0)
-
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "make_onehot",
-        lambda _m, _lbls: masks,
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.analyzer_utils,
-        "get_resampled_image_dimensions",
-        lambda size, spacing, tgt: new_size,
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "check_anisotropic",
-        lambda _img: {"is_anisotropic": True, "low_resolution_axis": 2},
-        raising=True,
-    )
-
-    calls: list[tuple[Any, Any, Any, Any]] = []
-
-    def _aniso(img, ns, tgt, axis):
-        calls.append((img, ns, tgt, axis))
-        return img
-
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "aniso_intermediate_resample",
-        _aniso,
-        raising=True,
-    )
-    monkeypatch.setattr(pp.sitk, "Resample", lambda *a, **k: a[0], raising=True)
-    monkeypatch.setattr(pp.sitk, "JoinSeries", lambda seq: seq, raising=True)
-
-    def _sitk_to_ants(seq):
-        arr = np.stack(
-            [
-                np.zeros((5, 6, 7), dtype=np.float32),
-                np.ones((5, 6, 7), dtype=np.float32),
-            ],
-            axis=-1,
-        )
-        return SimpleNamespace(numpy=lambda: arr)
-
-    monkeypatch.setattr(pp.preprocessing_utils, "sitk_to_ants", _sitk_to_ants, raising=True)
-
-    class _Out:
-        """Simple ANTs-like output holder."""
-
-        def __init__(self) -> None:
-            self.spacing = None
-            self.origin = None
-            self.direction = None
-
-        def set_spacing(self, s):
-            """Set the spacing of the output image."""
-            self.spacing = s
-
-        def set_origin(self, o):
-            """Set the origin of the output image."""
-            self.origin = o
+def _random_label_mask(shape: tuple[int, int, int], labels: list[int], seed: int) -> np.ndarray:
+    """Mask with one random box per foreground label and scattered voxels."""
+    rng = np.random.default_rng(seed)
+    arr = np.zeros(shape, dtype=np.float32)
+    for label in labels[1:]:
+        center = [rng.integers(0, n) for n in shape]
+        radius = [rng.integers(1, 5) for _ in shape]
+        box = tuple(slice(max(0, c - r), c + r) for c, r in zip(center, radius, strict=True))
+        arr[box] = label
+    arr[rng.random(shape) < 0.01] = labels[-1]
+    return arr
+
+
+@pytest.mark.parametrize(
+    "spacing, target_spacing, direction",
+    [
+        ((1.0, 1.0, 1.0), (0.7, 1.3, 0.9), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)),
+        ((0.8, 0.8, 3.0), (1.0, 1.0, 1.5), (-1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)),
+        ((3.0, 0.7, 0.8), (1.5, 1.0, 0.6), (0.0, 1.0, 0.0, -1.0, 0.0, 0.0, 0.0, 0.0, -1.0)),
+        ((0.5, 2.0, 1.3), (1.5, 0.6, 0.6), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)),
+    ],
+)
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_resample_mask_crop_to_labels_matches_whole_mask(spacing, target_spacing, direction, seed):
+    """Resampling each label in its bounding box matches the whole-mask result."""
+    labels = [0, 1, 2, 4]
+    arr = _random_label_mask((24, 20, 16), labels, seed)
+    mask = _sitk_image(arr, spacing=spacing, origin=(3.0, -7.5, 12.25), direction=direction)
+
+    cropped = pp.resample_mask_sitk(mask, labels, target_spacing, crop_to_labels=True)
+    whole = pp.resample_mask_sitk(mask, labels, target_spacing, crop_to_labels=False)
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(cropped), sitk.GetArrayFromImage(whole))
+    assert cropped.GetOrigin() == whole.GetOrigin()
+    assert cropped.GetSpacing() == whole.GetSpacing()
+    assert cropped.GetDirection() == whole.GetDirection()
+
+
+def test_resample_mask_crop_to_labels_resamples_label_regions(monkeypatch):
+    """Small labels are resampled in small regions and absent labels are skipped."""
+    labels = [0, 1, 2]
+    arr = np.zeros((40, 40, 40), dtype=np.float32)
+    arr[18:22, 18:22, 18:22] = 1
+    mask = _sitk_image(arr)
 
-        def set_direction(self, d):
-            """Set the direction of the output image."""
-            self.direction = d
+    sizes = []
+    original = pp.sitk.Resample
 
-    out_img = _Out()
-    monkeypatch.setattr(pp.ants, "from_numpy", lambda data: out_img, raising=True)
+    def _resample(*args, **kwargs):
+        sizes.append(tuple(kwargs["size"]))
+        return original(*args, **kwargs)
 
-    src_mask = SimpleNamespace(origin=(9, 9, 9), direction=(1.0,) * 9)
-    result = pp.resample_mask(
-        mask_ants=src_mask,
-        labels=labels,
-        target_spacing=target_spacing,
-    )
+    monkeypatch.setattr(pp.sitk, "Resample", _resample, raising=True)
+    out = pp.resample_mask_sitk(mask, labels, (1.0, 1.0, 1.0))
 
-    assert len(calls) == len(labels)
-    assert calls[0] == (m0, new_size, target_spacing, 2)
-    assert calls[1] == (m1, new_size, target_spacing, 2)
-    assert result is out_img
-    assert out_img.spacing == target_spacing
-    assert out_img.origin == src_mask.origin
-    assert out_img.direction == src_mask.direction
+    # Background covers the mask, label 1 its padded box, and label 2 nothing.
+    assert len(sizes) == 2
+    assert sizes[0] == (40, 40, 40)
+    assert all(n < 40 for n in sizes[1])
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(out).T, arr)
 
 
-def test_compute_dtm_shapes_and_types(monkeypatch):
+def test_compute_dtm_shapes_and_types():
     """compute_dtm returns expected shape/dtype with one empty class."""
-    labels = [0, 1]
-    src_mask = _DummyAntsImage(np.zeros((5, 6, 7), dtype=np.float32))
-
-    onehots = [_DummySitkImage(size=(5, 6, 7)), _DummySitkImage(size=(5, 6, 7))]
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "make_onehot",
-        lambda _m, _lbls: onehots,
-        raising=True,
-    )
-
-    sums = iter([1, 0])  # First non-empty, second empty.
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "sitk_get_sum",
-        lambda _m: next(sums),
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.sitk,
-        "SignedMaurerDistanceMap",
-        lambda *_a, **_k: _DummySitkImage(size=(5, 6, 7)),
-        raising=True,
-    )
-    monkeypatch.setattr(pp.sitk, "Cast", lambda img, _t: img, raising=True)
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "sitk_get_min_max",
-        lambda _img: (-2.0, 3.0),
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.sitk,
-        "GetImageFromArray",
-        lambda arr: _DummySitkImage(size=(arr.shape[0], arr.shape[1], arr.shape[2])),
-        raising=True,
-    )
-    monkeypatch.setattr(pp.sitk, "JoinSeries", lambda seq: object(), raising=True)
-
-    def _sitk_to_ants(_x):
-        arr = np.zeros((5, 6, 7, len(labels)), dtype=np.float32)
-        return _DummyAntsImage(arr)
-
-    monkeypatch.setattr(pp.preprocessing_utils, "sitk_to_ants", _sitk_to_ants, raising=True)
-
-    out = pp.compute_dtm(mask_ants=src_mask, labels=labels, normalize_dtm=True)
+    labels = [0, 1, 2]
+    arr = np.zeros((5, 6, 7), dtype=np.float32)
+    arr[1:4, 1:5, 2:6] = 1
+    out = pp.compute_dtm(mask_ants=ants.from_numpy(arr), labels=labels, normalize_dtm=True)
     assert isinstance(out, np.ndarray)
-    assert out.shape == (5, 6, 7, 2)
+    assert out.shape == (5, 6, 7, 3)
     assert out.dtype == np.float32
+    assert out[..., 1].min() == -1.0
+    assert out[..., 1].max() == 1.0
+    assert (out[..., 1][arr == 1] <= 0).all()
+    np.testing.assert_array_equal(out[..., 2], 1.0)
 
 
-def test_compute_dtm_zero_guards_combined(monkeypatch):
+def test_compute_dtm_zero_guards_combined():
     """ext_max==0 → 1 and int_min==0 → -1 are guarded correctly."""
-    labels = [0]
-    masks = [_DummySitkImage()]
-
-    monkeypatch.setattr(pp.preprocessing_utils, "make_onehot", lambda *_: masks, raising=True)
-    monkeypatch.setattr(pp.preprocessing_utils, "sitk_get_sum", lambda _m: 1, raising=True)
-    monkeypatch.setattr(pp.sitk, "Cast", lambda img, *_a, **_k: img, raising=True)
-    monkeypatch.setattr(pp.sitk, "JoinSeries", lambda seq: seq, raising=True)
-
-    class _AntsArray:
-        def numpy(self):
-            return np.zeros((2, 2, 2, len(labels)), dtype=np.float32)
+    # Label 1 fills the image, so it has no exterior; label 0 is one voxel
+    # thick, so its interior distances are all zero.
+    full = np.ones((4, 4, 4), dtype=np.float32)
+    out = pp.compute_dtm(mask_ants=ants.from_numpy(full), labels=[1], normalize_dtm=True)
+    assert np.isfinite(out).all()
+    assert out.max() <= 0.0
+    assert out.min() == -1.0
+
+    thin = np.ones((4, 4, 4), dtype=np.float32)
+    thin[:, :, 0] = 0
+    out = pp.compute_dtm(mask_ants=ants.from_numpy(thin), labels=[0], normalize_dtm=True)
+    assert np.isfinite(out).all()
+    assert out.max() == 1.0
+    unnormalized = pp.compute_dtm(mask_ants=ants.from_numpy(thin), labels=[0], normalize_dtm=False)
+    np.testing.assert_array_equal(out[..., 0][:, :, 0], unnormalized[..., 0][:, :, 0])
+
+
+def test_compute_dtm_empty_mask_diagonal_distance():
+    """Empty mask with normalize_dtm=False uses diagonal distance."""
+    d, h, w = 2, 3, 4
+    expected = np.float32(np.sqrt(d**2 + w**2 + h**2))
 
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "sitk_to_ants",
-        lambda s: _AntsArray(),
-        raising=True,
-    )
+    labels = [1, 2]
+    mask = ants.from_numpy(np.zeros((w, h, d), dtype=np.float32))
+    out = pp.compute_dtm(mask_ants=mask, labels=labels, normalize_dtm=False)
+    assert out.shape == (w, h, d, len(labels))
+    assert out.dtype == np.float32
+    assert np.allclose(out[..., 0], expected)
+    assert np.allclose(out[..., 1], expected)
 
-    # Scenario A: ext_max == 0 → guard to 1.
-    recorder: list[tuple[str, float]] = []
-    monkeypatch.setattr(
-        pp.sitk,
-        "SignedMaurerDistanceMap",
-        lambda *_a, **_k: _DummyDTM("dtm", recorder),
-        raising=False,
-    )
 
-    def _minmax_ext_zero(img):
-        if isinstance(img, _DummyDTM):
-            if img.tag == "int":
-                return (-2.0, -0.1)
-            if img.tag == "ext":
-                return (0.0, 0.0)
-        return (0.0, 1.0)
+@pytest.mark.parametrize("normalize", [True, False])
+def test_compute_dtm_threads_match_serial(normalize):
+    """Computing labels concurrently gives the same DTMs as one at a time."""
+    labels = [0, 1, 2, 4]
+    mask = _sitk_image(_random_label_mask((20, 18, 16), labels, seed=3))
+    serial = pp.compute_dtm_sitk(mask, labels, normalize, num_threads=1)
+    threaded = pp.compute_dtm_sitk(mask, labels, normalize, num_threads=3)
+    np.testing.assert_array_equal(serial, threaded)
 
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "sitk_get_min_max",
-        _minmax_ext_zero,
-        raising=True,
-    )
 
-    out = pp.compute_dtm(mask_ants=SimpleNamespace(), labels=labels, normalize_dtm=True)
-    assert isinstance(out, np.ndarray) and out.dtype == np.float32
-    ext_divs = [d for tag, d in recorder if tag == "ext"]
-    int_divs = [d for tag, d in recorder if tag == "int"]
-    assert ext_divs and ext_divs[0] == 1
-    assert int_divs and int_divs[0] == -2.0
+def test_compute_dtm_band_exact_near_labels():
+    """Banded DTMs are exact near each label and a lower bound further away."""
+    rng = np.random.default_rng(0)
+    arr = np.zeros((40, 36, 30), dtype=np.float32)
+    arr[5:11, 6:14, 4:9] = 1  # A box, where the bounding box distance is exact.
+    arr[25:33, 20:30, 15:25] = 2 * (rng.random((8, 10, 10)) < 0.5)
+    mask = _sitk_image(arr)
+    labels = [0, 1, 2]
 
-    # Scenario B: int_min == 0 -> guard to -1.
-    recorder.clear()
+    exact = pp.compute_dtm_sitk(mask, labels, normalize_dtm=False)
+    banded = pp.compute_dtm_sitk(mask, labels, normalize_dtm=False, band=3)
+    np.testing.assert_array_equal(banded[..., :2], exact[..., :2])
 
-    def _minmax_int_zero(img):
-        if isinstance(img, _DummyDTM):
-            if img.tag == "int":
-                return (0.0, 0.0)
-            if img.tag == "ext":
-                return (0.1, 5.0)
-        return (0.0, 1.0)
+    near = (slice(22, 36), slice(17, 33), slice(12, 28))
+    np.testing.assert_array_equal(banded[near + (2,)], exact[near + (2,)])
+    assert (banded[..., 2] <= exact[..., 2]).all()
 
-    monkeypatch.setattr(
-        pp.preprocessing_utils,
-        "sitk_get_min_max",
-        _minmax_int_zero,
-        raising=True,
+    normalized = pp.compute_dtm_sitk(mask, labels, normalize_dtm=True, band=3)
+    assert normalized.min() == -1.0
+    assert normalized.max() == 1.0
+    np.testing.assert_allclose(
+        normalized[..., 1], pp.compute_dtm_sitk(mask, labels, True)[..., 1], atol=1e-6
     )
 
-    out = pp.compute_dtm(mask_ants=SimpleNamespace(), labels=labels, normalize_dtm=True)
-    assert isinstance(out, np.ndarray) and out.dtype == np.float32
-    ext_divs = [d for tag, d in recorder if tag == "ext"]
-    int_divs = [d for tag, d in recorder if tag == "int"]
-    assert int_divs and int_divs[0] == -1
-    assert ext_divs and ext_divs[0] == 5.0
-
-
-def test_compute_dtm_empty_mask_diagonal_distance(monkeypatch):
-    """Empty mask with normalize_dtm=False uses diagonal distance."""
-    d, h, w = 2, 2, 2
-    expected = np.sqrt(d**2 + w**2 + h**2).astype(np.float32)
-
-    class _ArrayImage:
-        """Wrapper returned by sitk.GetImageFromArray."""
-
-        def __init__(self, arr):
-            self._arr = np.asarray(arr, dtype=np.float32)
 
-        def SetSpacing(self, *_a, **_k):
-            """Set spacing of the image."""
-            return None
+def test_preprocess_example_passes_dtm_band_and_threads(tmp_path, monkeypatch):
+    """The DTM band comes from the config and the thread count from the caller."""
+    image_path = _write_image(tmp_path / "i.nii.gz", np.zeros((4, 4, 4)))
+    mask_path = _write_image(tmp_path / "m.nii.gz", np.zeros((4, 4, 4)))
+    observed = {}
 
-        def SetOrigin(self, *_a, **_k):
-            """Set origin of the image."""
-            return None
+    def _dtm(mask, labels, normalize_dtm, band, num_threads):
+        observed.update(band=band, num_threads=num_threads)
+        return np.zeros((*mask.GetSize(), len(labels)), dtype=np.float32)
 
-        def SetDirection(self, *_a, **_k):
-            """Set direction of the image."""
-            return None
+    monkeypatch.setattr(pp, "compute_dtm_sitk", _dtm, raising=True)
+    cfg = _example_config(skip=True, compute_dtms=True, dtm_band=5)
+    pp.preprocess_example(cfg, [image_path], mask_path, dtm_threads=3)
+    assert observed == {"band": 5, "num_threads": 3}
 
-    labels = [0, 1]
-    masks = [_DummySitkImage() for _ in labels]
-    monkeypatch.setattr(pp.preprocessing_utils, "make_onehot", lambda *_: masks, raising=True)
-    monkeypatch.setattr(pp.preprocessing_utils, "sitk_get_sum", lambda _m: 0, raising=True)
-    monkeypatch.setattr(pp.sitk, "GetImageFromArray", lambda arr: _ArrayImage(arr), raising=True)
-    monkeypatch.setattr(pp.sitk, "Cast", lambda img, *_a, **_k: img, raising=True)
-    monkeypatch.setattr(pp.sitk, "JoinSeries", lambda seq: seq, raising=True)
-
-    def _sitk_to_ants(seq):
-        return SimpleNamespace(numpy=lambda: np.stack([im._arr for im in seq], axis=-1))
-
-    monkeypatch.setattr(pp.preprocessing_utils, "sitk_to_ants", _sitk_to_ants, raising=True)
-
-    out = pp.compute_dtm(mask_ants=SimpleNamespace(), labels=labels, normalize_dtm=False)
-    assert out.shape == (d, h, w, len(labels))
-    assert out.dtype == np.float32
-    assert np.allclose(out[..., 0], expected)
-    assert np.allclose(out[..., 1], expected)
 
-
-def test_preprocess_example_full_flow_no_skip_with_crop_and_dtm(monkeypatch):
-    """Full flow: crop, resample, normalize, and compute DTM."""
-    cfg = {
+def _example_config(**preprocessing) -> dict[str, Any]:
+    """Config for preprocess_example tests with preprocessing overrides."""
+    return {
         "dataset_info": {"labels": [0, 1], "modality": "ct"},
         "spatial_config": {
             "target_spacing": (1.0, 1.0, 1.0),
@@ -844,7 +727,7 @@ def test_preprocess_example_full_flow_no_skip_with_crop_and_dtm(monkeypatch):
         "preprocessing": {
             "skip": False,
             "crop_to_foreground": True,
-            "compute_dtms": True,
+            "compute_dtms": False,
             "normalize_dtms": True,
             "normalize_with_nonzero_mask": False,
             "ct_normalization": {
@@ -853,83 +736,162 @@ def test_preprocess_example_full_flow_no_skip_with_crop_and_dtm(monkeypatch):
                 "z_score_mean": 0.0,
                 "z_score_std": 1.0,
             },
+            **preprocessing,
         },
     }
 
-    img0 = _DummyAntsImage(np.ones((2, 2, 2), dtype=np.float32), spacing=(2.0, 2.0, 2.0))
-    img1 = _DummyAntsImage(2 * np.ones((2, 2, 2), dtype=np.float32), spacing=(2.0, 2.0, 2.0))
-    mask_img = _DummyAntsImage(np.zeros((2, 2, 2), dtype=np.float32), spacing=(2.0, 2.0, 2.0))
 
-    seq = iter([img0, img1, mask_img])
-    monkeypatch.setattr(pp.ants, "image_read", lambda _p: next(seq), raising=True)
-    fg_bbox = {"x0": 0, "x1": 2, "y0": 0, "y1": 2, "z0": 0, "z1": 2}
-    monkeypatch.setattr(pp.ants, "reorient_image2", lambda im, _ori: im, raising=True)
-    monkeypatch.setattr(pp.pc, "RAI_ANTS_DIRECTION", (1.0,) * 9, raising=True)
+def test_preprocess_example_records_stage_timings(tmp_path):
+    """A timer records every stage that runs and leaves the outputs unchanged."""
+    cfg = _example_config(compute_dtms=True)
+    img = np.zeros((6, 6, 6), dtype=np.float32)
+    img[2:4, 2:4, 2:4] = 50.0
+    geometry = {"spacing": (2.0, 2.0, 2.0)}
+    image_path = _write_image(tmp_path / "i.nii.gz", img, **geometry)
+    mask_path = _write_image(tmp_path / "m.nii.gz", (img > 0).astype(np.float32), **geometry)
+
+    timer = profiling.StageTimer()
+    out = pp.preprocess_example(cfg, [image_path], mask_path, timer=timer)
+
+    assert set(timer.seconds) == {
+        "read",
+        "foreground_bbox",
+        "reorient_crop",
+        "resample",
+        "dtm",
+        "normalize",
+    }
+    assert all(seconds >= 0 for seconds in timer.seconds.values())
+    expected = pp.preprocess_example(cfg, [image_path], mask_path)
+    for key in ("image", "mask", "dtm"):
+        np.testing.assert_array_equal(out[key], expected[key])
+
+
+def test_preprocess_example_full_flow_no_skip_with_crop_and_dtm(tmp_path, monkeypatch):
+    """Full flow: crop, reorient, resample, normalize, and compute DTM."""
+    cfg = _example_config(compute_dtms=True)
+    flipped = (-1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+    geometry = {"spacing": (2.0, 2.0, 2.0), "direction": flipped}
+    img = np.zeros((4, 4, 4), dtype=np.float32)
+    img[1:3, 1:3, 1:3] = 50.0
+    mask = (img > 0).astype(np.float32)
+    paths = [
+        _write_image(tmp_path / "i0.nii.gz", img, **geometry),
+        _write_image(tmp_path / "i1.nii.gz", 2 * img, **geometry),
+    ]
+    mask_path = _write_image(tmp_path / "m.nii.gz", mask, **geometry)
+    fg_bbox = {"x_start": 1, "x_end": 2, "y_start": 1, "y_end": 2, "z_start": 0, "z_end": 3}
 
     calls = {"crop_calls": 0}
+    original_crop = pp.preprocessing_utils.crop_to_fg_sitk
 
-    def _crop(im, _bb):
+    def _crop(im, bb):
         calls["crop_calls"] += 1
-        return im
-
-    monkeypatch.setattr(pp.preprocessing_utils, "crop_to_fg", _crop, raising=True)
-    monkeypatch.setattr(pp, "resample_image", lambda im, target_spacing: im, raising=True)
-    monkeypatch.setattr(pp, "resample_mask", lambda m, labels, target_spacing: m, raising=True)
-    monkeypatch.setattr(pp, "window_and_normalize", lambda arr, cfg_: arr, raising=True)
+        return original_crop(im, bb)
 
-    def _compute_dtm(_m, labels, normalize_dtm):
-        return np.ones((2, 2, 2, len(labels)), dtype=np.float32)
+    monkeypatch.setattr(pp.preprocessing_utils, "crop_to_fg_sitk", _crop, raising=True)
 
-    monkeypatch.setattr(pp, "compute_dtm", _compute_dtm, raising=True)
+    out = pp.preprocess_example(cfg, image_paths_list=paths, mask_path=mask_path, fg_bbox=fg_bbox)
 
-    out = pp.preprocess_example(
-        cfg,
-        image_paths_list=["i0", "i1"],
-        mask_path="m.nii.gz",
-        fg_bbox=fg_bbox,
-    )
-
-    assert out["image"].shape == (2, 2, 2, 2)
+    assert out["image"].shape == (4, 4, 8, 2)
     assert out["image"].dtype == np.float32
-    assert out["mask"].shape == (2, 2, 2, 1)
+    assert out["image"].max() == 100.0
+    assert out["mask"].shape == (4, 4, 8, 1)
     assert out["mask"].dtype == np.uint8
-    assert out["dtm"].shape == (2, 2, 2, 2)
+    assert out["dtm"].shape == (4, 4, 8, 2)
     assert out["dtm"].dtype == np.float32
-    assert calls["crop_calls"] == 3  # Two images + one mask.
-
+    assert out["fg_bbox"] == fg_bbox
+    assert calls["crop_calls"] == 2  # One vector image of both channels + one mask.
+
+
+@pytest.mark.parametrize("spacing", [(2.0, 2.0, 2.0), (0.8, 0.8, 3.0)])
+def test_preprocess_example_vector_channels_match_per_channel(tmp_path, monkeypatch, spacing):
+    """Channels resampled as one vector image match channels resampled alone."""
+    cfg = _example_config(crop_to_foreground=False)
+    cfg["dataset_info"]["modality"] = "mr"
+    rng = np.random.default_rng(0)
+    direction = (0.0, 1.0, 0.0, -1.0, 0.0, 0.0, 0.0, 0.0, -1.0)
+    paths = [
+        _write_image(
+            tmp_path / f"i{c}.nii.gz",
+            rng.normal(size=(6, 7, 5)).astype(np.float32) + c,
+            spacing=spacing,
+            direction=direction,
+        )
+        for c in range(3)
+    ]
 
-def test_preprocess_example_skip_true_no_resample_no_normalize(monkeypatch):
+    stacked = []
+    original_stack = pp._stack_channels
+    monkeypatch.setattr(
+        pp, "_stack_channels", lambda images: stacked.append(1) or original_stack(images)
+    )
+    out = pp.preprocess_example(cfg, image_paths_list=paths)
+    monkeypatch.setattr(pp, "_stack_channels", lambda images: images)
+    expected = pp.preprocess_example(cfg, image_paths_list=paths)
+
+    assert stacked == [1]
+    assert out["image"].shape == expected["image"].shape
+    assert out["image"].shape[-1] == 3
+    np.testing.assert_array_equal(out["image"], expected["image"])
+    assert out["spacing"] == expected["spacing"]
+
+
+def test_stack_channels_keeps_channels_with_different_geometry():
+    """Only channels with identical geometry are stacked."""
+    a = sitk.Image([4, 4, 4], sitk.sitkFloat32)
+    b = sitk.Image([4, 4, 4], sitk.sitkFloat32)
+    stacked = pp._stack_channels([a, b])
+    assert len(stacked) == 1
+    assert stacked[0].GetNumberOfComponentsPerPixel() == 2
+
+    b.SetOrigin((1.0, 0.0, 0.0))
+    assert pp._stack_channels([a, b]) == [a, b]
+    assert pp._stack_channels([a]) == [a]
+
+
+def test_read_images_keeps_channel_order(tmp_path):
+    """Channels read at the same time are returned in input order."""
+    paths = [
+        _write_image(tmp_path / f"i{c}.nii.gz", np.full((3, 3, 3), float(c))) for c in range(4)
+    ]
+    images = pp._read_images(paths)
+    assert [float(pp._array_view(img)[0, 0, 0]) for img in images] == [0.0, 1.0, 2.0, 3.0]
+    assert all(img.GetPixelID() == sitk.sitkFloat32 for img in images)
+
+
+def test_preprocess_example_matches_ants_reorientation(tmp_path):
+    """Reorienting with SimpleITK gives the same voxels as ants.reorient_image2."""
+    rng = np.random.default_rng(0)
+    arr = rng.normal(size=(5, 6, 7)).astype(np.float32)
+    direction = (0.0, 1.0, 0.0, -1.0, 0.0, 0.0, 0.0, 0.0, -1.0)
+    path = _write_image(tmp_path / "i.nii.gz", arr, direction=direction)
+    cfg = _example_config(skip=False, crop_to_foreground=False)
+    cfg["dataset_info"]["modality"] = "mr"
+
+    out = pp.preprocess_example(cfg, image_paths_list=[path])
+    expected = ants.reorient_image2(ants.image_read(path), "RAI").numpy()
+    np.testing.assert_array_equal(out["image"][..., 0], pp.window_and_normalize(expected, cfg))
+
+
+def test_preprocess_example_skip_true_no_resample_no_normalize(tmp_path, monkeypatch):
     """skip=True is a pure pass-through: no reorient, resample, or normalize."""
-    cfg = {
-        "dataset_info": {"labels": [0, 1], "modality": "mri"},
-        "spatial_config": {
-            "target_spacing": (1.0, 1.0, 1.0),
-            "patch_size": [64, 64, 64],
-        },
-        "preprocessing": {
-            "skip": True,
-            "crop_to_foreground": False,
-            "compute_dtms": False,
-            "normalize_dtms": False,
-            "normalize_with_nonzero_mask": False,
-        },
-    }
-
-    img0 = _DummyAntsImage(np.ones((2, 2, 2), dtype=np.float32), spacing=(1.5, 1.5, 1.5))
-    mask_img = _DummyAntsImage(np.zeros((2, 2, 2), dtype=np.float32))
+    cfg = _example_config(skip=True, crop_to_foreground=False)
+    cfg["dataset_info"]["modality"] = "mri"
+    img = np.arange(8, dtype=np.float32).reshape(2, 2, 2)
+    image_path = _write_image(tmp_path / "i0.nii.gz", img, spacing=(1.5, 1.5, 1.5))
+    mask_path = _write_image(tmp_path / "m.nii.gz", np.zeros((2, 2, 2)))
 
-    seq = iter([img0, mask_img])
-    monkeypatch.setattr(pp.ants, "image_read", lambda _p: next(seq), raising=True)
     monkeypatch.setattr(
-        pp.ants,
-        "reorient_image2",
-        lambda *_a, **_k: pytest.fail("reorient_image2 must not be called when skip=True."),
+        pp.sitk,
+        "DICOMOrient",
+        lambda *_a, **_k: pytest.fail("DICOMOrient must not be called when skip=True."),
         raising=True,
     )
     monkeypatch.setattr(
         pp,
-        "resample_image",
-        lambda *_a, **_k: pytest.fail("resample_image must not be called when skip=True."),
+        "resample_image_sitk",
+        lambda *_a, **_k: pytest.fail("resample_image_sitk must not be called when skip=True."),
     )
     monkeypatch.setattr(
         pp,
@@ -937,37 +899,20 @@ def test_preprocess_example_skip_true_no_resample_no_normalize(monkeypatch):
         lambda *_a, **_k: pytest.fail("window_and_normalize must not be called when skip=True."),
     )
 
-    out = pp.preprocess_example(cfg, image_paths_list=["i0"], mask_path="m.nii.gz", fg_bbox=None)
+    out = pp.preprocess_example(
+        cfg, image_paths_list=[image_path], mask_path=mask_path, fg_bbox=None
+    )
     assert out["image"].shape == (2, 2, 2, 1)
+    np.testing.assert_array_equal(out["image"][..., 0], img)
     assert out["mask"].shape == (2, 2, 2, 1)
     assert out["dtm"] is None
     assert out["fg_bbox"] is None
 
 
-def test_preprocess_example_crop_requires_bbox_error(monkeypatch):
+def test_preprocess_example_crop_requires_bbox_error(tmp_path, monkeypatch):
     """skip=False + crop=True + get_fg_mask_bbox returns None raises ValueError."""
-    cfg = {
-        "dataset_info": {"labels": [0, 1], "modality": "ct"},
-        "spatial_config": {
-            "target_spacing": (1, 1, 1),
-            "patch_size": [64, 64, 64],
-        },
-        "preprocessing": {
-            "skip": False,
-            "crop_to_foreground": True,
-            "compute_dtms": False,
-            "normalize_dtms": False,
-            "normalize_with_nonzero_mask": False,
-            "ct_normalization": {
-                "window_min": -100,
-                "window_max": 100,
-                "z_score_mean": 0.0,
-                "z_score_std": 1.0,
-            },
-        },
-    }
-
-    monkeypatch.setattr(pp.ants, "image_read", lambda _p: _DummyAntsImage(), raising=True)
+    cfg = _example_config()
+    path = _write_image(tmp_path / "img.nii.gz", np.zeros((2, 2, 2)))
     monkeypatch.setattr(
         pp.preprocessing_utils,
         "get_fg_mask_bbox",
@@ -976,37 +921,18 @@ def test_preprocess_example_crop_requires_bbox_error(monkeypatch):
     )
 
     with pytest.raises(ValueError, match="Foreground bounding box is required"):
-        pp.preprocess_example(cfg, image_paths_list=["img.nii.gz"], mask_path=None, fg_bbox=None)
+        pp.preprocess_example(cfg, image_paths_list=[path], mask_path=None, fg_bbox=None)
 
 
-def test_preprocess_example_skip_true_crop_flag_ignored(monkeypatch):
+def test_preprocess_example_skip_true_crop_flag_ignored(tmp_path, monkeypatch):
     """skip=True ignores crop_to_foreground: no crop, no reorient, fg_bbox=None."""
-    cfg = {
-        "dataset_info": {"labels": [0, 1], "modality": "ct"},
-        "spatial_config": {
-            "target_spacing": (1.0, 1.0, 1.0),
-            "patch_size": [64, 64, 64],
-        },
-        "preprocessing": {
-            "skip": True,
-            "crop_to_foreground": True,
-            "compute_dtms": False,
-            "normalize_dtms": False,
-            "normalize_with_nonzero_mask": False,
-            "ct_normalization": {
-                "window_min": -100,
-                "window_max": 100,
-                "z_score_mean": 0.0,
-                "z_score_std": 1.0,
-            },
-        },
-    }
+    cfg = _example_config(skip=True, crop_to_foreground=True)
+    path = _write_image(tmp_path / "img.nii.gz", np.zeros((2, 2, 2)))
 
-    monkeypatch.setattr(pp.ants, "image_read", lambda _p: _DummyAntsImage(), raising=True)
     monkeypatch.setattr(
-        pp.ants,
-        "reorient_image2",
-        lambda *_a, **_k: pytest.fail("reorient_image2 must not be called when skip=True."),
+        pp.sitk,
+        "DICOMOrient",
+        lambda *_a, **_k: pytest.fail("DICOMOrient must not be called when skip=True."),
         raising=True,
     )
     monkeypatch.setattr(
@@ -1017,60 +943,29 @@ def test_preprocess_example_skip_true_crop_flag_ignored(monkeypatch):
     )
     monkeypatch.setattr(
         pp.preprocessing_utils,
-        "crop_to_fg",
-        lambda *_a, **_k: pytest.fail("crop_to_fg must not be called when skip=True."),
+        "crop_to_fg_sitk",
+        lambda *_a, **_k: pytest.fail("crop_to_fg_sitk must not be called when skip=True."),
         raising=True,
     )
 
-    out = pp.preprocess_example(cfg, image_paths_list=["img.nii.gz"], mask_path=None, fg_bbox=None)
+    out = pp.preprocess_example(cfg, image_paths_list=[path], mask_path=None, fg_bbox=None)
     assert out["fg_bbox"] is None
     assert out["image"].shape == (2, 2, 2, 1)
 
 
-def test_preprocess_example_inference_mode_sets_mask_and_dtm_none(monkeypatch):
+def test_preprocess_example_inference_mode_sets_mask_and_dtm_none(tmp_path, monkeypatch):
     """Inference mode sets mask=None and dtm=None and does not compute DTM."""
-    monkeypatch.setattr(
-        pp.ants,
-        "image_read",
-        lambda _p: _DummyAntsImage(np.zeros((4, 5, 6))),
-        raising=True,
-    )
-    monkeypatch.setattr(
-        pp.ants,
-        "reorient_image2",
-        lambda *_a, **_k: pytest.fail("reorient_image2 must not be called when skip=True."),
-        raising=True,
-    )
+    path = _write_image(tmp_path / "image.nii.gz", np.zeros((4, 5, 6)))
 
     def _no_compute_dtm(*_a, **_k):
-        pytest.fail("compute_dtm should not be called in inference mode.")
+        pytest.fail("compute_dtm_sitk should not be called in inference mode.")
 
-    monkeypatch.setattr(pp, "compute_dtm", _no_compute_dtm, raising=True)
-
-    config = {
-        "dataset_info": {"labels": [0, 1], "modality": "ct"},
-        "spatial_config": {
-            "target_spacing": (1.0, 1.0, 1.0),
-            "patch_size": [64, 64, 64],
-        },
-        "preprocessing": {
-            "skip": True,
-            "crop_to_foreground": False,
-            "compute_dtms": True,
-            "normalize_dtms": True,
-            "normalize_with_nonzero_mask": False,
-            "ct_normalization": {
-                "window_min": -100.0,
-                "window_max": 100.0,
-                "z_score_mean": 0.0,
-                "z_score_std": 1.0,
-            },
-        },
-    }
+    monkeypatch.setattr(pp, "compute_dtm_sitk", _no_compute_dtm, raising=True)
 
+    config = _example_config(skip=True, crop_to_foreground=False, compute_dtms=True)
     out = pp.preprocess_example(
         config=config,
-        image_paths_list=["/fake/image.nii.gz"],
+        image_paths_list=[path],
         mask_path=None,
         fg_bbox=None,
     )
@@ -1113,7 +1008,7 @@ def test_preprocess_dataset_end_to_end_saves_arrays_and_updates_config(
     monkeypatch.setattr(pp.progress_bar, "get_progress_bar", lambda *_: _PB(), raising=True)
     monkeypatch.setattr(pp.concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor)
 
-    def _pe(config, image_paths_list, mask_path, fg_bbox):
+    def _pe(config, image_paths_list, mask_path, fg_bbox, dtm_threads=1, timer=None):
         img = np.ones((2, 2, 2, 1), dtype=np.float32)
         mask = np.zeros((2, 2, 2, 1), dtype=np.uint8)
         dtm = np.full((2, 2, 2, 2), 2.0, dtype=np.float32)
@@ -1127,6 +1022,8 @@ def test_preprocess_dataset_end_to_end_saves_arrays_and_updates_config(
         compute_dtms=True,
         no_preprocess=True,
         num_workers_preprocess=None,
+        dtm_band=6,
+        dtm_threads=2,
     )
     pp.preprocess_dataset(ns)
 
@@ -1142,9 +1039,247 @@ def test_preprocess_dataset_end_to_end_saves_arrays_and_updates_config(
 
     cfg = json.loads((results / "config.json").read_text(encoding="utf-8"))
     assert cfg["preprocessing"]["compute_dtms"] is True
+    assert cfg["preprocessing"]["dtm_band"] == 6
     assert cfg["preprocessing"]["skip"] is True
 
 
+def test_preprocess_dataset_compact_storage_format(tmp_path, monkeypatch, base_config):
+    """--storage-format compact writes compact arrays and updates config."""
+    results = tmp_path / "results"
+    numpy_dir = tmp_path / "numpy"
+    (results / "models").mkdir(parents=True, exist_ok=True)
+    _write_json(results / "config.json", base_config)
+    _write_csv(
+        results / "train_paths.csv",
+        pd.DataFrame(
+            [{"id": "p1", "fold": 0, "image": "/tmp/p1.nii.gz", "mask": "/tmp/p1_mask.nii.gz"}]
+        ),
+    )
+    _write_csv(
+        results / "fg_bboxes.csv",
+        pd.DataFrame([{"id": "p1", "x0": 0, "x1": 2, "y0": 0, "y1": 2, "z0": 0, "z1": 2}]),
+    )
+
+    monkeypatch.setattr(pp.progress_bar, "get_progress_bar", lambda *_: _PB(), raising=True)
+    monkeypatch.setattr(pp.concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    def _pe(config, image_paths_list, mask_path, fg_bbox, dtm_threads=1, timer=None):
+        mask = np.zeros((4, 4, 4, 1), dtype=np.uint8)
+        mask[1:3, 2, 1] = 1
+        return {
+            "image": np.ones((4, 4, 4, 1), dtype=np.float32),
+            "mask": mask,
+            "dtm": np.full((4, 4, 4, 2), 2.0, dtype=np.float32),
+            "fg_bbox": fg_bbox,
+            "spacing": (1.0, 1.0, 2.0),
+        }
+
+    monkeypatch.setattr(pp, "preprocess_example", _pe, raising=True)
+
+    ns = argparse.Namespace(
+        results=str(results),
+        numpy=str(numpy_dir),
+        compute_dtms=True,
+        no_preprocess=False,
+        num_workers_preprocess=None,
+        storage_format="compact",
+    )
+    pp.preprocess_dataset(ns)
+
+    assert np.load(numpy_dir / "images" / "p1.npy").dtype == np.float16
+    assert np.load(numpy_dir / "dtms" / "p1.npy").dtype == np.float16
+    assert np.load(numpy_dir / "labels" / "p1.npy").shape == (2, 1, 1, 1)
+    assert (numpy_dir / "label_boxes" / "p1.npy").exists()
+    meta = json.loads((numpy_dir / "meta" / "p1.json").read_text(encoding="utf-8"))
+    assert meta["spacing"] == [1.0, 1.0, 2.0]
+    assert meta["voxel_counts"] == {"0": 62, "1": 2}
+
+    cfg = json.loads((results / "config.json").read_text(encoding="utf-8"))
+    assert cfg["preprocessing"]["storage_format"] == "compact"
+
+
+@pytest.fixture
+def resumable_dataset(tmp_path, monkeypatch, base_config):
+    """A two-patient dataset with real input files and a counting preprocessor."""
+    results = tmp_path / "results"
+    numpy_dir = tmp_path / "numpy"
+    inputs = tmp_path / "inputs"
+    results.mkdir()
+    inputs.mkdir()
+    _write_json(results / "config.json", base_config)
+
+    rows = []
+    for pid in ("p1", "p2"):
+        for name in ("img", "msk"):
+            (inputs / f"{pid}_{name}.nii.gz").write_bytes(b"data")
+        rows.append(
+            {
+                "id": pid,
+                "fold": 0,
+                "image": str(inputs / f"{pid}_img.nii.gz"),
+                "mask": str(inputs / f"{pid}_msk.nii.gz"),
+            }
+        )
+    _write_csv(results / "train_paths.csv", pd.DataFrame(rows))
+    _write_csv(
+        results / "fg_bboxes.csv",
+        pd.DataFrame(
+            [
+                {"id": pid, "x0": 0, "x1": 2, "y0": 0, "y1": 2, "z0": 0, "z1": 2}
+                for pid in ("p1", "p2")
+            ]
+        ),
+    )
+
+    monkeypatch.setattr(pp.progress_bar, "get_progress_bar", lambda *_: _PB(), raising=True)
+    monkeypatch.setattr(pp.concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    processed = []
+    failing = set()
+
+    def _pe(config, image_paths_list, mask_path, fg_bbox, dtm_threads=1, timer=None):
+        if mask_path in failing:
+            raise RuntimeError("simulated failure")
+        processed.append(mask_path.split("/")[-1].split("_")[0])
+        return {
+            "image": np.ones((2, 2, 2, 1), dtype=np.float32),
+            "mask": np.ones((2, 2, 2, 1), dtype=np.uint8),
+            "dtm": np.zeros((2, 2, 2, 2), dtype=np.float32),
+            "fg_bbox": fg_bbox,
+            "spacing": (1.0, 1.0, 1.0),
+        }
+
+    monkeypatch.setattr(pp, "preprocess_example", _pe, raising=True)
+
+    def run(**overrides):
+        processed.clear()
+        ns = argparse.Namespace(
+            results=str(results),
+            numpy=str(numpy_dir),
+            no_preprocess=False,
+            **{"compute_dtms": False, "num_workers_preprocess": None, **overrides},
+        )
+        pp.preprocess_dataset(ns)
+        return sorted(processed)
+
+    return SimpleNamespace(
+        run=run,
+        numpy_dir=numpy_dir,
+        results=results,
+        inputs=inputs,
+        rows=rows,
+        failing=failing,
+        processed=processed,
+    )
+
+
+def test_preprocess_dataset_memory_budget_runs_largest_first(resumable_dataset, monkeypatch):
+    """With a memory budget, patients are estimated and started largest first."""
+    ds = resumable_dataset
+    estimated = []
+
+    def _estimate(patient, image_columns, target_spacing, number_of_labels, fg_bbox, dtms):
+        estimated.append(patient["id"])
+        return {"p1": 10**9, "p2": 3 * 10**9}[patient["id"]]
+
+    monkeypatch.setattr(pp.scheduler, "estimate_peak_memory", _estimate)
+    assert ds.run(preprocess_memory_budget=2.0, num_workers_preprocess=2) == ["p1", "p2"]
+    assert sorted(estimated) == ["p1", "p2"]
+    assert ds.processed == ["p2", "p1"]
+
+    # Without a budget, no estimates are made.
+    estimated.clear()
+    ds.run(overwrite=True)
+    assert estimated == []
+
+
+def test_preprocess_dataset_writes_profile(resumable_dataset, capsys):
+    """--profile-preprocess writes per-patient timings and summary rows."""
+    ds = resumable_dataset
+    profile_path = ds.results / "preprocess_profile.csv"
+    ds.run()
+    assert not profile_path.exists()
+
+    ds.run(overwrite=True, profile_preprocess=True)
+    profile = pd.read_csv(profile_path)
+    assert profile["id"].tolist() == ["p1", "p2", "Median", "95th Percentile", "Max"]
+    assert {"save_seconds", "save_peak_mb", "total_seconds", "peak_mb"} <= set(profile.columns)
+    assert (profile["total_seconds"] >= profile["save_seconds"]).all()
+    assert "Slowest patients" in capsys.readouterr().out
+
+
+def test_preprocess_dataset_skips_up_to_date_patients(resumable_dataset):
+    """A rerun only preprocesses patients whose inputs or outputs changed."""
+    ds = resumable_dataset
+    assert ds.run() == ["p1", "p2"]
+    saved = json.loads((ds.numpy_dir / "manifest.json").read_text())
+    assert sorted(saved["patients"]) == ["p1", "p2"]
+    assert saved["patients"]["p1"]["files"] == [
+        "images/p1.npy",
+        "labels/p1.npy",
+        "fg_voxels/p1.npy",
+    ]
+
+    # Nothing changed.
+    assert ds.run() == []
+
+    # A changed input file and a deleted output are both redone.
+    (ds.inputs / "p1_msk.nii.gz").write_bytes(b"new mask")
+    (ds.numpy_dir / "labels" / "p2.npy").unlink()
+    assert ds.run() == ["p1", "p2"]
+
+    # --overwrite preprocesses everything again.
+    assert ds.run(overwrite=True) == ["p1", "p2"]
+
+
+def test_preprocess_dataset_redoes_patients_when_settings_change(resumable_dataset):
+    """Changing a preprocessing setting makes every patient stale."""
+    ds = resumable_dataset
+    ds.run()
+    assert ds.run(compute_dtms=True) == ["p1", "p2"]
+    assert ds.run(compute_dtms=True) == []
+    assert (ds.numpy_dir / "dtms" / "p1.npy").exists()
+
+    config = json.loads((ds.results / "config.json").read_text())
+    config["spatial_config"]["target_spacing"] = [2.0, 2.0, 2.0]
+    _write_json(ds.results / "config.json", config)
+    assert ds.run(compute_dtms=True) == ["p1", "p2"]
+
+
+def test_preprocess_dataset_removes_orphans_and_old_files(resumable_dataset):
+    """Patients removed from the dataset and files of an old format are deleted."""
+    ds = resumable_dataset
+    ds.run(storage_format="compact")
+    assert (ds.numpy_dir / "meta" / "p2.json").exists()
+
+    _write_csv(ds.results / "train_paths.csv", pd.DataFrame(ds.rows[:1]))
+    assert ds.run(storage_format="npy") == ["p1"]
+
+    saved = json.loads((ds.numpy_dir / "manifest.json").read_text())
+    assert list(saved["patients"]) == ["p1"]
+    remaining = sorted(
+        str(p.relative_to(ds.numpy_dir)) for p in ds.numpy_dir.rglob("*.npy") if p.is_file()
+    )
+    assert remaining == ["fg_voxels/p1.npy", "images/p1.npy", "labels/p1.npy"]
+    assert not (ds.numpy_dir / "meta" / "p1.json").exists()
+
+
+def test_preprocess_dataset_failure_removes_stale_outputs(resumable_dataset):
+    """A stale patient that fails is dropped with its files, and retried next time."""
+    ds = resumable_dataset
+    ds.run()
+    (ds.inputs / "p1_img.nii.gz").write_bytes(b"new image")
+    ds.failing.add(ds.rows[0]["mask"])
+    assert ds.run() == []
+
+    saved = json.loads((ds.numpy_dir / "manifest.json").read_text())
+    assert list(saved["patients"]) == ["p2"]
+    assert not (ds.numpy_dir / "images" / "p1.npy").exists()
+
+    ds.failing.clear()
+    assert ds.run() == ["p1"]
+
+
 def test_preprocess_dataset_missing_files_raise(tmp_path, base_config):
     """Missing config/train_paths/fg_bboxes should raise FileNotFoundError."""
     results = tmp_path / "results"
@@ -1298,7 +1433,7 @@ def test_preprocess_single_patient_happy_path_saves_arrays(tmp_path, monkeypatch
     for d in output_dirs.values():
         d.mkdir()
 
-    def _pe(config, image_paths_list, mask_path, fg_bbox):
+    def _pe(config, image_paths_list, mask_path, fg_bbox, dtm_threads=1, timer=None):
         return {
             "image": np.ones((2, 2, 2, 1), dtype=np.float32),
             "mask": np.zeros((2, 2, 2, 1), dtype=np.uint8),
@@ -1399,6 +1534,96 @@ def test_preprocess_single_patient_skips_dtm_when_disabled(tmp_path, monkeypatch
     assert not (output_dirs["dtms"] / "p1.npy").exists()
 
 
+def test_preprocess_single_patient_compact_skip_keeps_float32(tmp_path, monkeypatch):
+    """With skip=True, compact images keep raw intensities beyond the float16 range."""
+    output_dirs = {name: tmp_path / name for name in ("images", "labels", "dtms")}
+    for d in output_dirs.values():
+        d.mkdir()
+    image = np.full((2, 2, 2, 1), 70000.5, dtype=np.float32)
+
+    def _pe(**kwargs):
+        return {
+            "image": image,
+            "mask": np.ones((2, 2, 2, 1), dtype=np.uint8),
+            "dtm": None,
+            "fg_bbox": None,
+        }
+
+    monkeypatch.setattr(pp, "preprocess_example", _pe, raising=True)
+
+    err = pp._preprocess_single_patient(
+        config={"preprocessing": {"skip": True}},
+        patient={"id": "p1", "image": "/img.nii.gz", "mask": "/msk.nii.gz"},
+        image_columns=["image"],
+        fg_bbox=None,
+        output_dirs=output_dirs,
+        compute_dtms=False,
+        storage_format="compact",
+    )
+
+    assert err is None
+    saved = np.load(output_dirs["images"] / "p1.npy")
+    assert saved.dtype == np.float32
+    np.testing.assert_array_equal(saved, image)
+
+
+def test_preprocess_dataset_fills_missing_fg_bboxes(tmp_path, monkeypatch, base_config):
+    """Patients missing from fg_bboxes.csv get their box computed and saved."""
+    results = tmp_path / "results"
+    numpy_dir = tmp_path / "numpy"
+    results.mkdir(parents=True, exist_ok=True)
+    base_config["preprocessing"]["crop_to_foreground"] = True
+    _write_json(results / "config.json", base_config)
+
+    _write_csv(
+        results / "train_paths.csv",
+        pd.DataFrame(
+            [
+                {"id": "p1", "fold": 0, "image": "/tmp/p1.nii.gz", "mask": "/tmp/p1_m.nii.gz"},
+                {"id": "p2", "fold": 1, "image": "/tmp/p2.nii.gz", "mask": "/tmp/p2_m.nii.gz"},
+            ]
+        ),
+    )
+    box = {"x_start": 0, "x_end": 1, "y_start": 0, "y_end": 1, "z_start": 0, "z_end": 1}
+    _write_csv(results / "fg_bboxes.csv", pd.DataFrame([{"id": "p1", **box}]))
+
+    monkeypatch.setattr(pp.progress_bar, "get_progress_bar", lambda *_: _PB(), raising=True)
+    monkeypatch.setattr(pp.concurrent.futures, "ProcessPoolExecutor", ThreadPoolExecutor)
+    computed = []
+
+    def _fake_bbox(image_path):
+        computed.append(image_path)
+        return {**box, "x_end": 2}
+
+    monkeypatch.setattr(pp, "_get_fg_bbox_from_file", _fake_bbox, raising=True)
+    observed = {}
+
+    def _pe(config, image_paths_list, mask_path, fg_bbox, dtm_threads=1, timer=None):
+        observed[image_paths_list[0]] = fg_bbox
+        return {
+            "image": np.zeros((2, 2, 2, 1), dtype=np.float32),
+            "mask": np.zeros((2, 2, 2, 1), dtype=np.uint8),
+            "dtm": None,
+        }
+
+    monkeypatch.setattr(pp, "preprocess_example", _pe, raising=True)
+
+    ns = argparse.Namespace(
+        results=str(results),
+        numpy=str(numpy_dir),
+        compute_dtms=False,
+        no_preprocess=False,
+        num_workers_preprocess=None,
+    )
+    pp.preprocess_dataset(ns)
+
+    assert computed == ["/tmp/p2.nii.gz"]
+    assert observed["/tmp/p2.nii.gz"]["x_end"] == 2
+    saved = pd.read_csv(results / "fg_bboxes.csv").set_index("id")
+    assert saved.loc["p1", "x_end"] == 1
+    assert saved.loc["p2", "x_end"] == 2
+
+
 def test_preprocess_dataset_prints_error_summary_on_failures(tmp_path, monkeypatch, base_config):
     """preprocess_dataset prints 'N of M patients had errors' on failure."""
     results = tmp_path / "results"
@@ -4,6 +4,7 @@ import ants
 import numpy as np
 import pytest
 import SimpleITK as sitk
+import skimage
 
 # MIST imports.
 from mist.preprocessing import preprocessing_utils as pu
@@ -128,6 +129,99 @@ def test_get_fg_mask_bbox_returns_full_when_empty(monkeypatch):
     }
 
 
+def _reference_fg_mask_bbox(vol: np.ndarray) -> dict[str, int]:
+    """Reference bbox using np.percentile, np.clip, Otsu, and np.nonzero."""
+    lower, upper = np.percentile(
+        vol,
+        [pu.pc.FOREGROUND_BBOX_PERCENTILE_LOW, pu.pc.FOREGROUND_BBOX_PERCENTILE_HIGH],
+    )
+    clipped = np.clip(vol, lower, upper)
+    nz = np.nonzero(clipped > skimage.filters.threshold_otsu(clipped))
+    if nz[0].size == 0:
+        return {f"{ax}_start": 0 for ax in "xyz"} | {
+            f"{ax}_end": size - 1 for ax, size in zip("xyz", vol.shape, strict=True)
+        }
+    return {f"{ax}_start": int(idx.min()) for ax, idx in zip("xyz", nz, strict=True)} | {
+        f"{ax}_end": int(idx.max()) for ax, idx in zip("xyz", nz, strict=True)
+    }
+
+
+def _random_volume(seed: int) -> np.ndarray:
+    """Noisy volume with a bright blob and, for odd seeds, a CT-like air spike."""
+    rng = np.random.default_rng(seed)
+    shape = tuple(int(d) for d in rng.integers(12, 40, size=3))
+    vol = rng.normal(0.0, 20.0, size=shape).astype(np.float32)
+    lo = [int(rng.integers(0, d // 2)) for d in shape]
+    hi = [int(rng.integers(d // 2 + 1, d)) for d in shape]
+    vol[lo[0] : hi[0], lo[1] : hi[1], lo[2] : hi[2]] += 300.0
+    if seed % 2:
+        vol[: shape[0] // 3] = -1024.0
+    return vol
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_get_fg_mask_bbox_matches_reference(seed, monkeypatch):
+    """Streaming bbox equals the clip + Otsu + nonzero reference."""
+    # Small slabs and histograms exercise the multi-slab and gather paths.
+    monkeypatch.setattr(pu.pc, "FOREGROUND_BBOX_CHUNK_VOXELS", 2000)
+    monkeypatch.setattr(pu.pc, "FOREGROUND_BBOX_HIST_BINS", 64)
+    vol = _random_volume(seed)
+    bbox = pu.get_fg_mask_bbox(_make_ants_image(vol))
+    expected = _reference_fg_mask_bbox(vol)
+    assert {k: bbox[k] for k in expected} == expected
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.int16])
+def test_streaming_percentiles_match_numpy(dtype, monkeypatch):
+    """Histogram-based percentiles are identical to np.percentile."""
+    monkeypatch.setattr(pu.pc, "FOREGROUND_BBOX_HIST_BINS", 32)
+    arr = (np.random.default_rng(0).normal(0, 100, size=(11, 13, 7))).astype(dtype)
+    percentiles = [0.0, 33.0, 62.7, 99.5, 100.0]
+    result = pu._streaming_percentiles(arr, percentiles)
+    expected = np.percentile(arr, percentiles)
+    np.testing.assert_array_equal(np.asarray(result), expected)
+    assert np.asarray(result).dtype == expected.dtype
+
+
+def test_streaming_percentiles_crowded_bins(monkeypatch):
+    """Crowded bins resolve repeated values and fall back when mixed."""
+    monkeypatch.setattr(pu.pc, "FOREGROUND_BBOX_MAX_GATHER", 10)
+    monkeypatch.setattr(pu.pc, "FOREGROUND_BBOX_HIST_BINS", 4)
+
+    # A crowded bin holding only air is resolved without a fallback.
+    arr = np.full((10, 10, 10), -1024.0, dtype=np.float32)
+    arr[:2] = np.linspace(0, 100, 200).reshape(2, 10, 10)
+    assert pu._order_statistics(arr, [500]) == [-1024.0]
+
+    # A crowded bin with distinct values falls back to np.percentile.
+    arr = np.random.default_rng(1).normal(size=(10, 10, 10))
+    assert pu._order_statistics(arr, [500]) is None
+    np.testing.assert_array_equal(
+        pu._streaming_percentiles(arr, [33.0, 99.5]), np.percentile(arr, [33.0, 99.5])
+    )
+
+
+def test_get_fg_mask_bbox_constant_and_single_voxel():
+    """Degenerate images give the full-image bbox like the reference."""
+    for vol in (np.full((5, 6, 7), 3.0, dtype=np.float32), np.ones((1, 1, 1), np.float32)):
+        bbox = pu.get_fg_mask_bbox(_make_ants_image(vol))
+        expected = _reference_fg_mask_bbox(vol)
+        assert {k: bbox[k] for k in expected} == expected
+
+
+def test_get_fg_mask_bbox_stride_preview_is_close():
+    """Strided preview thresholds give boxes within a few voxels."""
+    # Ellipsoidal body whose intensity falls off smoothly towards its edge.
+    x, y, z = np.meshgrid(*(np.linspace(-1, 1, n) for n in (48, 40, 32)), indexing="ij")
+    radius = np.sqrt((x / 0.7) ** 2 + (y / 0.6) ** 2 + (z / 0.8) ** 2)
+    noise = np.random.default_rng(0).normal(0.0, 5.0, size=radius.shape)
+    vol = (np.clip(1.2 - radius, 0.0, None) * 500.0 + noise).astype(np.float32)
+    full = pu.get_fg_mask_bbox(_make_ants_image(vol))
+    preview = pu.get_fg_mask_bbox(_make_ants_image(vol), stride=2)
+    for key in full:
+        assert abs(full[key] - preview[key]) <= 2
+
+
 def test_aniso_intermediate_resample_changes_only_low_axis():
     """NN resampling along the low-res axis adjusts only that axis."""
     arr = np.zeros((6, 7, 3), dtype=np.float32)
@@ -231,3 +325,20 @@ def test_crop_to_fg_returns_expected_shape():
     exp_shape = (xe - xs + 1, ye - ys + 1, ze - zs + 1)
     assert cropped_arr.shape == exp_shape
     assert np.allclose(cropped_arr, vol[xs : xe + 1, ys : ye + 1, zs : ze + 1])
+
+
+def test_crop_to_fg_sitk_matches_crop_to_fg():
+    """SimpleITK cropping gives the same voxels and origin as crop_to_fg."""
+    rng = np.random.default_rng(0)
+    vol = rng.normal(size=(12, 10, 8)).astype(np.float32)
+    img = _make_ants_image(vol)
+    img.set_spacing((0.5, 1.0, 2.0))
+    img.set_origin((10.0, -4.0, 3.0))
+    bbox = {"x_start": 2, "x_end": 7, "y_start": 3, "y_end": 9, "z_start": 1, "z_end": 6}
+
+    expected = pu.crop_to_fg(img, bbox)
+    cropped = pu.crop_to_fg_sitk(pu.ants_to_sitk(img), bbox)
+
+    np.testing.assert_array_equal(sitk.GetArrayFromImage(cropped).T, expected.numpy())
+    np.testing.assert_allclose(cropped.GetOrigin(), expected.origin)
+    assert cropped.GetSpacing() == expected.spacing
@@ -0,0 +1,79 @@
+"""Tests for mist.preprocessing.profiling."""
+
+import contextlib
+
+import pandas as pd
+
+from mist.preprocessing import profiling
+
+
+def test_stage_without_timer_does_nothing():
+    """Without a timer, stages share one no-op context."""
+    assert profiling.stage(None, "read") is profiling.stage(None, "dtm")
+    assert isinstance(profiling.stage(None, "read"), contextlib.nullcontext)
+
+
+def test_stage_timer_adds_up_repeated_stages(monkeypatch):
+    """Repeated stages are added up and reported in pipeline order."""
+    clock = iter([0.0, 1.0, 3.0, 10.0, 14.0, 20.0])
+    monkeypatch.setattr(profiling.time, "perf_counter", lambda: next(clock))
+    monkeypatch.setattr(profiling, "peak_memory_mb", lambda: 64.0)
+
+    timer = profiling.StageTimer()
+    with profiling.stage(timer, "resample"):
+        pass
+    with profiling.stage(timer, "read"):
+        pass
+
+    row = timer.as_dict()
+    assert list(row) == [
+        "read_seconds",
+        "read_peak_mb",
+        "resample_seconds",
+        "resample_peak_mb",
+        "total_seconds",
+        "peak_mb",
+    ]
+    assert row["resample_seconds"] == 2.0
+    assert row["read_seconds"] == 4.0
+    assert row["total_seconds"] == 20.0
+    assert row["peak_mb"] == 64.0
+
+
+def test_stage_timer_records_failed_stages():
+    """A stage that raises is still timed."""
+    timer = profiling.StageTimer()
+    with contextlib.suppress(RuntimeError), timer.stage("dtm"):
+        raise RuntimeError("failed")
+    assert "dtm" in timer.seconds
+    assert timer.peak_mb["dtm"] > 0
+
+
+def _rows():
+    return [
+        {"id": "p2", "read_seconds": 1.0, "dtm_seconds": 5.0, "total_seconds": 7.0, "peak_mb": 30},
+        {"id": "p1", "read_seconds": 3.0, "total_seconds": 4.0, "peak_mb": 10},
+        {"id": "p3", "read_seconds": 2.0, "dtm_seconds": 1.0, "total_seconds": 3.5, "peak_mb": 20},
+    ]
+
+
+def test_write_profile_adds_summary_rows(tmp_path):
+    """Patients are sorted by id and followed by the median, p95, and max."""
+    path = tmp_path / "preprocess_profile.csv"
+    profiling.write_profile(path, _rows())
+    profile = pd.read_csv(path).set_index("id")
+
+    assert profile.index.tolist() == ["p1", "p2", "p3", "Median", "95th Percentile", "Max"]
+    assert profile.loc["Median", "read_seconds"] == 2.0
+    assert profile.loc["Max", "total_seconds"] == 7.0
+    assert profile.loc["Median", "dtm_seconds"] == 3.0
+    assert 4.0 < profile.loc["95th Percentile", "dtm_seconds"] < 5.0
+
+
+def test_slowest_patients():
+    """The slowest patients are listed with their slowest stage."""
+    lines = profiling.slowest_patients(_rows(), count=2)
+    assert lines == [
+        "p2: 7.0 s, peak 30 MiB, mostly dtm (5.0 s)",
+        "p1: 4.0 s, peak 10 MiB, mostly read (3.0 s)",
+    ]
@@ -0,0 +1,144 @@
+"""Tests for mist.preprocessing.scheduler."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from mist.preprocessing import scheduler
+
+
+@pytest.fixture
+def mask_path(tmp_path):
+    """A 10x8x6 mask with 2 mm spacing along z."""
+    mask = sitk.Image([10, 8, 6], sitk.sitkUInt8)
+    mask.SetSpacing((1.0, 1.0, 2.0))
+    path = tmp_path / "mask.nii.gz"
+    sitk.WriteImage(mask, str(path))
+    return str(path)
+
+
+class TestEstimatePeakMemory:
+    """Tests for estimate_peak_memory."""
+
+    def test_counts_inputs_and_resampled_volumes(self, mask_path):
+        """Inputs count at their size and outputs at the resampled size."""
+        patient = {"id": "p1", "t1": "t1.nii.gz", "t2": "t2.nii.gz", "mask": mask_path}
+        estimate = scheduler.estimate_peak_memory(
+            patient, ["t1", "t2"], [1.0, 1.0, 1.0], 3, None, compute_dtms=False
+        )
+        # Inputs: 2 images and a mask of 10x8x6. Resampled to 10x8x12: the
+        # images twice and the mask.
+        assert estimate == 4 * (480 * 3 + 960 * 5)
+
+        with_dtms = scheduler.estimate_peak_memory(
+            patient, ["t1", "t2"], [1.0, 1.0, 1.0], 3, None, compute_dtms=True
+        )
+        assert with_dtms == estimate + 4 * 960 * 3
+
+    def test_uses_foreground_bounding_box(self, mask_path):
+        """Cropped patients are estimated at the size of their bounding box."""
+        patient = {"id": "p1", "ct": "ct.nii.gz", "mask": mask_path}
+        fg_bbox = {"x_start": 2, "x_end": 5, "y_start": 0, "y_end": 3, "z_start": 1, "z_end": 2}
+        estimate = scheduler.estimate_peak_memory(
+            patient, ["ct"], [1.0, 1.0, 1.0], 2, fg_bbox, compute_dtms=False
+        )
+        assert estimate == 4 * (32 * 2 + 64 * 3)
+
+    def test_unreadable_mask_is_zero(self, tmp_path):
+        """Patients whose mask cannot be read are admitted without an estimate."""
+        patient = {"id": "p1", "ct": "ct.nii.gz", "mask": str(tmp_path / "missing.nii.gz")}
+        assert scheduler.estimate_peak_memory(patient, ["ct"], [1, 1, 1], 2, None, False) == 0
+
+
+class _Tracker:
+    """Runs jobs in threads and records the estimates in use over time."""
+
+    def __init__(self, estimates):
+        self.estimates = estimates
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.peak = 0
+        self.started = []
+
+    def job(self, i):
+        with self.lock:
+            self.started.append(i)
+            self.in_use += self.estimates[i]
+            self.peak = max(self.peak, self.in_use)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_use -= self.estimates[i]
+        return i
+
+
+class TestRunWithinBudget:
+    """Tests for run_within_budget."""
+
+    def test_without_budget_submits_all_in_order(self):
+        """Without a budget, every job is submitted at once."""
+        tracker = _Tracker([1, 1, 1])
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results = list(
+                scheduler.run_within_budget(
+                    lambda i: executor.submit(tracker.job, i), [0, 1, 2], [5, 1, 9]
+                )
+            )
+        assert tracker.started == [0, 1, 2]
+        assert sorted(job for job, _ in results) == [0, 1, 2]
+
+    def test_running_estimates_stay_within_budget(self):
+        """Jobs start largest first and never exceed the budget together."""
+        estimates = [2, 5, 1, 4, 3, 2, 1]
+        tracker = _Tracker(estimates)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                scheduler.run_within_budget(
+                    lambda i: executor.submit(tracker.job, i),
+                    list(range(len(estimates))),
+                    estimates,
+                    memory_budget=6,
+                    max_in_flight=4,
+                )
+            )
+
+        assert sorted(job for job, _ in results) == list(range(len(estimates)))
+        assert all(job == future.result() for job, future in results)
+        assert tracker.peak <= 6
+        assert tracker.started[0] == 1
+
+    def test_job_larger_than_budget_runs_alone(self):
+        """A job that exceeds the budget runs once nothing else is running."""
+        estimates = [1, 10, 1]
+        tracker = _Tracker(estimates)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(
+                scheduler.run_within_budget(
+                    lambda i: executor.submit(tracker.job, i),
+                    [0, 1, 2],
+                    estimates,
+                    memory_budget=5,
+                    max_in_flight=3,
+                )
+            )
+        assert tracker.started[0] == 1
+        assert tracker.peak == 10
+
+    def test_max_in_flight(self):
+        """No more than max_in_flight jobs run at the same time."""
+        estimates = list(np.ones(6, dtype=int))
+        tracker = _Tracker(estimates)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(
+                scheduler.run_within_budget(
+                    lambda i: executor.submit(tracker.job, i),
+                    list(range(6)),
+                    estimates,
+                    memory_budget=100,
+                    max_in_flight=2,
+                )
+            )
+        assert tracker.peak == 2
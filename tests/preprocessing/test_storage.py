@@ -0,0 +1,170 @@
+"""Tests for mist.preprocessing.storage."""
+
+import numpy as np
+import pytest
+
+from mist.preprocessing import storage
+
+
+def _example(rng: np.random.Generator, with_dtm: bool = True) -> dict:
+    """A preprocessed example with a small foreground region."""
+    mask = np.zeros((12, 10, 8, 1), dtype=np.uint8)
+    mask[3:7, 2:5, 4:6] = rng.integers(1, 3, size=(4, 3, 2, 1), dtype=np.uint8)
+    return {
+        "image": rng.normal(size=(12, 10, 8, 2)).astype(np.float32),
+        "mask": mask,
+        "dtm": rng.uniform(-1, 1, size=(12, 10, 8, 3)).astype(np.float32) if with_dtm else None,
+        "fg_bbox": {"x0": 1, "x1": 13, "y0": 0, "y1": 10, "z0": 2, "z1": 10},
+        "spacing": (1.0, 1.0, 3.0),
+    }
+
+
+@pytest.fixture
+def numpy_dir(tmp_path):
+    """Numpy directory with the subdirectories preprocess_dataset creates."""
+    for name in ("images", "labels", "dtms"):
+        (tmp_path / name).mkdir()
+    return tmp_path
+
+
+def test_get_storage_format_defaults_to_npy():
+    """Configurations without a storage format use npy."""
+    assert storage.get_storage_format({"preprocessing": {}}) == "npy"
+    assert storage.get_storage_format({"preprocessing": {"storage_format": None}}) == "npy"
+    assert storage.get_storage_format({"preprocessing": {"storage_format": "compact"}}) == (
+        "compact"
+    )
+
+
+def test_label_bounding_box():
+    """The box spans the nonzero voxels; an empty label gives one voxel."""
+    mask = np.zeros((6, 5, 4, 1), dtype=np.uint8)
+    mask[1, 2:4, 3] = 1
+    assert storage.label_bounding_box(mask) == ([1, 2, 3], [2, 4, 4])
+    assert storage.label_bounding_box(np.zeros_like(mask)) == ([0, 0, 0], [1, 1, 1])
+
+
+def test_npy_format_saves_arrays_unchanged(numpy_dir):
+    """The npy format writes the arrays as they are and no sidecars."""
+    example = _example(np.random.default_rng(0))
+    storage.save_example(numpy_dir, "p1", example)
+
+    np.testing.assert_array_equal(np.load(numpy_dir / "images" / "p1.npy"), example["image"])
+    np.testing.assert_array_equal(np.load(numpy_dir / "labels" / "p1.npy"), example["mask"])
+    np.testing.assert_array_equal(np.load(numpy_dir / "dtms" / "p1.npy"), example["dtm"])
+    assert not (numpy_dir / "meta").exists()
+    assert not (numpy_dir / "label_boxes").exists()
+
+
+def test_compact_format_round_trip(numpy_dir):
+    """Compact examples load back with exact labels and float16 precision."""
+    example = _example(np.random.default_rng(1))
+    storage.save_example(numpy_dir, "p1", example, storage_format="compact")
+
+    assert np.load(numpy_dir / "images" / "p1.npy").dtype == np.float16
+    assert np.load(numpy_dir / "labels" / "p1.npy").shape == (4, 3, 2, 1)
+    np.testing.assert_array_equal(
+        np.load(numpy_dir / "label_boxes" / "p1.npy"), [[-3, -2, -4, 0], [12, 10, 8, 1]]
+    )
+
+    loaded = storage.load_example(numpy_dir, "p1", storage_format="compact", load_dtm=True)
+    np.testing.assert_array_equal(loaded["mask"], example["mask"])
+    assert loaded["image"].dtype == np.float32
+    np.testing.assert_allclose(loaded["image"], example["image"], rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(loaded["dtm"], example["dtm"], rtol=1e-3, atol=1e-3)
+
+
+def test_compact_format_is_smaller(numpy_dir, tmp_path):
+    """Compact files take about half the space of npy files."""
+    example = _example(np.random.default_rng(2))
+    storage.save_example(numpy_dir, "npy", example)
+    storage.save_example(numpy_dir, "compact", example, storage_format="compact")
+
+    def _size(patient_id):
+        return sum(
+            (numpy_dir / name / f"{patient_id}.npy").stat().st_size
+            for name in ("images", "labels", "dtms")
+        )
+
+    assert _size("compact") < 0.6 * _size("npy")
+
+
+def test_compact_metadata(numpy_dir):
+    """The sidecar records shape, spacing, boxes, and voxel counts."""
+    example = _example(np.random.default_rng(3), with_dtm=False)
+    storage.save_example(numpy_dir, "p1", example, storage_format="compact")
+
+    meta = storage.load_metadata(numpy_dir, "p1")
+    values, counts = np.unique(example["mask"], return_counts=True)
+    assert meta["storage_format"] == "compact"
+    assert meta["shape"] == [12, 10, 8]
+    assert meta["spacing"] == [1.0, 1.0, 3.0]
+    assert meta["fg_bbox"] == example["fg_bbox"]
+    assert meta["label_bbox"] == {"start": [3, 2, 4], "stop": [7, 5, 6]}
+    assert meta["image_dtype"] == "float16"
+    assert meta["dtm_dtype"] is None
+    assert meta["voxel_counts"] == {str(v): int(c) for v, c in zip(values, counts, strict=True)}
+    assert not (numpy_dir / "dtms" / "p1.npy").exists()
+
+
+def test_compact_format_keeps_unnormalized_data_in_float32(numpy_dir):
+    """Raw intensities beyond the float16 range are saved as float32."""
+    example = _example(np.random.default_rng(6))
+    example["image"][0, 0, 0, 0] = 70000.5
+    example["dtm"] *= 1e5
+    storage.save_example(
+        numpy_dir,
+        "p1",
+        example,
+        storage_format="compact",
+        normalized_image=False,
+        normalized_dtm=False,
+    )
+
+    assert np.load(numpy_dir / "images" / "p1.npy").dtype == np.float32
+    assert np.load(numpy_dir / "dtms" / "p1.npy").dtype == np.float32
+    meta = storage.load_metadata(numpy_dir, "p1")
+    assert meta["image_dtype"] == "float32"
+    assert meta["dtm_dtype"] == "float32"
+    loaded = storage.load_example(numpy_dir, "p1", storage_format="compact", load_dtm=True)
+    np.testing.assert_array_equal(loaded["image"], example["image"])
+    np.testing.assert_array_equal(loaded["dtm"], example["dtm"])
+
+
+def test_unsupported_format_raises(numpy_dir):
+    """Unknown storage formats are rejected."""
+    with pytest.raises(ValueError, match="Unsupported storage format"):
+        storage.save_example(numpy_dir, "p1", _example(np.random.default_rng(4)), "zarr")
+
+
+@pytest.mark.parametrize("storage_format", ["npy", "compact"])
+@pytest.mark.parametrize("with_dtm", [False, True])
+def test_output_files_lists_written_files(numpy_dir, storage_format, with_dtm):
+    """output_files lists exactly the files save_example writes."""
+    example = _example(np.random.default_rng(5), with_dtm=with_dtm)
+    storage.save_example(numpy_dir, "p1", example, storage_format=storage_format)
+
+    written = sorted(str(p.relative_to(numpy_dir)) for p in numpy_dir.rglob("*") if p.is_file())
+    assert written == sorted(storage.output_files("p1", storage_format, with_dtm))
+
+
+def test_sample_foreground_voxels_gives_classes_equal_rows():
+    """Each class gets as many rows as the largest, capped, inside its voxels."""
+    mask = np.zeros((12, 10, 8, 1), dtype=np.uint8)
+    mask[1:6, 1:6, 1:6] = 1
+    mask[9, 8, 7] = 2
+    boxes = storage.sample_foreground_voxels(mask, max_per_class=50)
+
+    assert boxes.shape == (100, 6) and boxes.dtype == np.int32
+    np.testing.assert_array_equal(boxes[:, 3:], boxes[:, :3] + 1)
+    values = mask[boxes[:, 0], boxes[:, 1], boxes[:, 2], 0]
+    np.testing.assert_array_equal(values, [1] * 50 + [2] * 50)
+    assert len({tuple(box) for box in boxes[:50]}) == 50
+    np.testing.assert_array_equal(boxes, storage.sample_foreground_voxels(mask, max_per_class=50))
+    assert len(storage.sample_foreground_voxels(mask)) == 2 * 125
+
+
+def test_sample_foreground_voxels_without_foreground():
+    """An empty mask gives one box over the whole volume."""
+    boxes = storage.sample_foreground_voxels(np.zeros((6, 5, 4, 1), dtype=np.uint8))
+    np.testing.assert_array_equal(boxes, [[0, 0, 0, 6, 5, 4]])
@@ -4,9 +4,11 @@ import json
 import math
 import os
 import pickle
+import threading
 from pathlib import Path
 from types import SimpleNamespace
 
+import numpy as np
 import pandas as pd
 import pytest
 import rich
@@ -505,6 +507,66 @@ def test_setup_folds_with_dtms_and_valsplit(tmp_pipeline, mist_args, monkeypatch
     assert len(fold0["val_images"]) > 0
 
 
+@pytest.mark.parametrize("val_percent", [0.0, 0.5])
+def test_setup_folds_compact_storage_format(tmp_pipeline, mist_args, monkeypatch, val_percent):
+    """Compact data adds label box paths that follow the images through splits."""
+    results, _ = tmp_pipeline
+    cfg = json.loads((Path(results) / "config.json").read_text())
+    cfg["preprocessing"]["storage_format"] = "compact"
+    cfg["training"]["loss"]["name"] = "gsl"
+    cfg["training"]["val_percent"] = val_percent
+    (Path(results) / "config.json").write_text(json.dumps(cfg))
+
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
+    trainer = DummyTrainer(mist_args)
+    for fold in trainer.folds.values():
+        for split in ("train", "val"):
+            boxes = fold[f"{split}_label_boxes"]
+            assert [Path(p).parent.name for p in boxes] == ["label_boxes"] * len(boxes)
+            assert [Path(p).name for p in boxes] == [Path(p).name for p in fold[f"{split}_images"]]
+        assert [Path(p).name for p in fold["train_dtms"]] == [
+            Path(p).name for p in fold["train_images"]
+        ]
+
+
+def test_setup_folds_npy_storage_format_has_no_label_boxes(tmp_pipeline, mist_args, monkeypatch):
+    """The default format has no label boxes."""
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
+    trainer = DummyTrainer(mist_args)
+    assert trainer.folds[0]["train_label_boxes"] is None
+    assert trainer.folds[0]["val_label_boxes"] is None
+
+
+@pytest.mark.parametrize("val_percent", [0.0, 0.5])
+def test_setup_folds_fg_voxels(tmp_pipeline, mist_args, monkeypatch, val_percent):
+    """Foreground voxel paths follow the training images through splits."""
+    results, numpy_dir = tmp_pipeline
+    cfg = json.loads((Path(results) / "config.json").read_text())
+    cfg["training"]["val_percent"] = val_percent
+    (Path(results) / "config.json").write_text(json.dumps(cfg))
+    (numpy_dir / "fg_voxels").mkdir()
+    for patient_id in ("p0", "p1", "p2", "p3"):
+        np.save(numpy_dir / "fg_voxels" / f"{patient_id}.npy", np.zeros((1, 6), np.int32))
+
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
+    trainer = DummyTrainer(mist_args)
+    for fold in trainer.folds.values():
+        voxels = fold["train_fg_voxels"]
+        assert [Path(p).parent.name for p in voxels] == ["fg_voxels"] * len(voxels)
+        assert [Path(p).name for p in voxels] == [Path(p).name for p in fold["train_images"]]
+
+
+def test_setup_folds_without_all_fg_voxels(tmp_pipeline, mist_args, monkeypatch):
+    """Numpy directories missing foreground voxels fall back to None."""
+    _, numpy_dir = tmp_pipeline
+    (numpy_dir / "fg_voxels").mkdir()
+    np.save(numpy_dir / "fg_voxels" / "p0.npy", np.zeros((1, 6), np.int32))
+
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
+    trainer = DummyTrainer(mist_args)
+    assert trainer.folds[0]["train_fg_voxels"] is None
+
+
 def test_build_components_single_gpu(tmp_pipeline, mist_args, monkeypatch):
     """Test build_components with single GPU, no DDP."""
     monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
@@ -560,6 +622,41 @@ def test_train_fold_early_stop_on_nan(tmp_pipeline, mist_args, monkeypatch, patc
     assert patch_dist["destroy"] >= 1
 
 
+@pytest.mark.parametrize("sync_steps,expected", [(1, 5 + 1), (2, 3 + 1), (25, 1 + 1)])
+def test_train_fold_reads_loss_every_sync_steps(
+    tmp_pipeline, mist_args, monkeypatch, patch_dist, sync_steps, expected
+):
+    """Losses are all-reduced every loss_sync_steps steps and at epoch end."""
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 2, raising=False)
+    trainer = DummyTrainer(mist_args, train_loss_value=1.0, val_loss_value=2.0)
+    trainer.config["training"]["loss_sync_steps"] = sync_steps
+    trainer.folds[0]["steps_per_epoch"] = 5
+    trainer.folds[0]["val_images"] = ["val0", "val1"]
+    monkeypatch.setattr(trainer, "setup", lambda *a, **k: None)
+
+    trainer.train_fold(fold=0, rank=1, world_size=2)
+
+    assert patch_dist["all_reduce"] == expected
+
+
+def test_train_fold_early_stop_on_nan_between_reads(
+    tmp_pipeline, mist_args, monkeypatch, patch_dist
+):
+    """A NaN loss stops training even when losses are read every few steps."""
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
+    trainer = DummyTrainer(mist_args, train_loss_value=float("nan"), val_loss_value=2.0)
+    trainer.config["training"]["loss_sync_steps"] = 4
+    trainer.folds[0]["steps_per_epoch"] = 3
+    validated = []
+    monkeypatch.setattr(
+        trainer, "validation_step", lambda **k: validated.append(1) or torch.tensor(2.0)
+    )
+
+    trainer.train_fold(fold=0, rank=0, world_size=1)
+
+    assert not validated
+
+
 def test_overwrite_config_from_args(tmp_pipeline, mist_args, monkeypatch):
     """Test that mist_args overwrite config values correctly."""
     mist_args.model = "myarch"
@@ -596,6 +693,21 @@ def test_overwrite_config_from_args(tmp_pipeline, mist_args, monkeypatch):
     assert cfg["training"]["val_percent"] == pytest.approx(0.025)
 
 
+def test_overwrite_config_from_args_compile(tmp_pipeline, mist_args, monkeypatch):
+    """--compile turns training.compile on, and build_components compiles."""
+    mist_args.compile = True
+    monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
+    trainer = DummyTrainer(mist_args)
+    assert trainer.config["training"]["compile"]["enabled"] is True
+
+    compiled = []
+    monkeypatch.setattr(
+        bt, "compile_model", lambda model, config, cache_dir: compiled.append(cache_dir) or model
+    )
+    trainer.build_components(rank=0, world_size=1)
+    assert compiled == [trainer.results_dir / "compile_cache"]
+
+
 def test_fit_single_gpu_calls_run_directly(tmp_pipeline, mist_args, monkeypatch):
     """Test that fit with single GPU calls run directly."""
     monkeypatch.setattr(torch.cuda, "device_count", lambda: 1, raising=False)
@@ -737,7 +849,8 @@ def test_train_loop_else_branch_rank_nonzero(tmp_pipeline, mist_args, monkeypatc
 
     trainer.train_fold(fold=0, rank=1, world_size=2)
 
-    assert patch_dist["all_reduce"] >= 3
+    # One all-reduce for the two training losses and one for validation.
+    assert patch_dist["all_reduce"] == 2
     assert patch_dist["broadcast"] >= 1
     assert patch_dist["barrier"] >= 1
 
@@ -1019,6 +1132,60 @@ def test_train_fold_saves_checkpoint_each_epoch(tmp_pipeline, mist_args, monkeyp
     assert checkpoint["fold"] == 0
 
 
+def test_train_fold_keeps_last_and_best_checkpoints(tmp_pipeline, mist_args, monkeypatch):
+    """keep_last keeps recent epoch checkpoints, and keep_best the best one."""
+    monkeypatch.setattr(torch, "save", _real_torch_save)
+    monkeypatch.setattr(torch, "load", _real_torch_load)
+    monkeypatch.setattr(bt.BaseTrainer, "save_checkpoint", _real_save_checkpoint)
+
+    # The validation loss is the same every epoch, so only epoch 0 improves.
+    trainer = DummyTrainer(mist_args, train_loss_value=1.0, val_loss_value=0.5)
+    trainer.config["training"]["epochs"] = 4
+    trainer.config["training"]["checkpoints"] = {"keep_last": 2, "keep_best": True}
+    trainer.train_fold(fold=0, rank=0, world_size=1)
+
+    kept = sorted(path.name for path in trainer.checkpoints_dir.iterdir())
+    assert kept == [
+        "fold_0_checkpoint.pt",
+        "fold_0_checkpoint_best.pt",
+        "fold_0_checkpoint_epoch_2.pt",
+        "fold_0_checkpoint_epoch_3.pt",
+    ]
+    assert torch.load(trainer._checkpoint_path(0), weights_only=False)["epoch"] == 3
+    best = torch.load(trainer._best_checkpoint_path(0), weights_only=False)
+    assert best["epoch"] == 0
+
+
+def test_train_fold_writes_checkpoints_inline_without_async_write(
+    tmp_pipeline, mist_args, monkeypatch
+):
+    """With async_write off, checkpoints are written by the training thread."""
+    monkeypatch.setattr(torch, "load", _real_torch_load)
+    monkeypatch.setattr(bt.BaseTrainer, "save_checkpoint", _real_save_checkpoint)
+    threads = []
+
+    def save(obj, f, *args, **kwargs):
+        threads.append(threading.current_thread())
+        _real_torch_save(obj, f, *args, **kwargs)
+
+    monkeypatch.setattr(torch, "save", save)
+    trainer = DummyTrainer(mist_args, train_loss_value=1.0, val_loss_value=0.5)
+    trainer.config["training"]["checkpoints"] = {"async_write": False}
+    trainer.train_fold(fold=0, rank=0, world_size=1)
+
+    assert threads and all(thread is threading.current_thread() for thread in threads)
+    assert trainer._checkpoint_path(0).exists()
+
+
+def test_save_checkpoint_rejects_keep_last_below_one(tmp_pipeline, mist_args):
+    """keep_last must keep at least the latest checkpoint."""
+    trainer = DummyTrainer(mist_args)
+    trainer.config["training"]["checkpoints"] = {"keep_last": 0}
+    state = trainer.build_components(rank=0, world_size=1)
+    with pytest.raises(ValueError, match="keep_last must be at least 1"):
+        _real_save_checkpoint(trainer, fold=0, state=state)
+
+
 def test_resume_loads_checkpoint_and_prints_message(tmp_pipeline, mist_args, monkeypatch):
     """With --resume and an existing checkpoint, train_fold loads it and prints."""
     monkeypatch.setattr(torch, "save", _real_torch_save)
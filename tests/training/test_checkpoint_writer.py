@@ -0,0 +1,80 @@
+"""Tests for the background checkpoint writer."""
+
+import os
+import threading
+
+import pytest
+import torch
+from torch import nn
+
+from mist.training import checkpoint_writer as cw
+
+
+def test_to_cpu_copies_tensors():
+    """The copy does not change when the original tensors do."""
+    original = {"weights": [torch.ones(3)], "step": 4, "pair": (torch.zeros(2), "name")}
+    copied = cw.to_cpu(original)
+    original["weights"][0].add_(1.0)
+    original["pair"][0].add_(1.0)
+    assert torch.equal(copied["weights"][0], torch.ones(3))
+    assert torch.equal(copied["pair"][0], torch.zeros(2))
+    assert copied["step"] == 4 and copied["pair"][1] == "name"
+
+
+def test_to_cpu_keeps_state_dict_metadata():
+    """A copied module state dict loads into the module."""
+    model = nn.Sequential(nn.Linear(2, 2), nn.BatchNorm1d(2))
+    state_dict = model.state_dict()
+    copied = cw.to_cpu(state_dict)
+    assert type(copied) is type(state_dict)
+    assert copied._metadata == state_dict._metadata
+    model.load_state_dict(copied)
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_save_writes_file_atomically(tmp_path, asynchronous):
+    """Files hold the state as of save(), and no temporary file is left."""
+    writer = cw.CheckpointWriter(asynchronous=asynchronous)
+    tensor = torch.arange(4.0)
+    writer.save({"tensor": tensor}, tmp_path / "checkpoint.pt")
+    tensor.zero_()
+    writer.close()
+    loaded = torch.load(tmp_path / "checkpoint.pt")
+    assert torch.equal(loaded["tensor"], torch.arange(4.0))
+    assert sorted(os.listdir(tmp_path)) == ["checkpoint.pt"]
+
+
+def test_writes_run_in_order_in_the_background(tmp_path):
+    """Saves and other calls run in order on one background thread."""
+    writer = cw.CheckpointWriter()
+    threads = []
+    writer.save({"epoch": 0}, tmp_path / "latest.pt")
+    writer.run(lambda: threads.append(threading.current_thread()))
+    writer.run(cw.link_atomic, tmp_path / "latest.pt", tmp_path / "best.pt")
+    writer.save({"epoch": 1}, tmp_path / "latest.pt")
+    writer.close()
+    assert threads[0] is not threading.current_thread()
+    assert torch.load(tmp_path / "best.pt")["epoch"] == 0
+    assert torch.load(tmp_path / "latest.pt")["epoch"] == 1
+
+
+def test_background_errors_are_raised(tmp_path):
+    """An error in a background write is raised by the next call."""
+    writer = cw.CheckpointWriter()
+    writer.save({"epoch": 0}, tmp_path / "missing" / "checkpoint.pt")
+    with pytest.raises(FileNotFoundError):
+        writer.close()
+
+
+def test_link_atomic_copies_when_links_fail(tmp_path, monkeypatch):
+    """Without hard links, the destination is a copy of the source."""
+
+    def fail(*args):
+        raise OSError("links are not supported")
+
+    monkeypatch.setattr(cw.os, "link", fail)
+    (tmp_path / "source.pt").write_bytes(b"checkpoint")
+    (tmp_path / "destination.pt").write_bytes(b"old")
+    cw.link_atomic(tmp_path / "source.pt", tmp_path / "destination.pt")
+    assert (tmp_path / "destination.pt").read_bytes() == b"checkpoint"
+    assert sorted(os.listdir(tmp_path)) == ["destination.pt", "source.pt"]
@@ -16,6 +16,7 @@ from mist.data_loading import dali_loader as dl
 
 # MIST imports.
 from mist.training.trainers import base_trainer as bt
+from mist.training.trainers import patch_3d_trainer as p3d
 from mist.training.trainers.patch_3d_trainer import Patch3DTrainer
 
 
@@ -234,6 +235,116 @@ def test_build_dataloaders_passes_expected_args(tmp_pipeline, mist_args, monkeyp
     vl = captured["val"]
     assert vl["rank"] == 0 and vl["world_size"] == 1
     assert "image_paths" in vl and "label_paths" in vl
+    assert tr["label_box_paths"] is None and vl["label_box_paths"] is None
+    assert tr["half_precision"] is False and vl["half_precision"] is False
+    assert tr["fg_voxel_paths"] is None
+    assert tr["samples_per_volume"] == 1
+
+    fold_data["train_fg_voxels"] = ["fg_voxels/p0.npy", "fg_voxels/p2.npy"]
+    t.build_dataloaders(fold_data, rank=0, world_size=1)
+    assert captured["train"]["fg_voxel_paths"] == fold_data["train_fg_voxels"]
+
+    # Compact data forwards its label boxes and reads float16 images.
+    t.config["preprocessing"] = {"storage_format": "compact"}
+    fold_data["train_label_boxes"] = ["label_boxes/p0.npy", "label_boxes/p2.npy"]
+    fold_data["val_label_boxes"] = ["label_boxes/p1.npy"]
+    t.build_dataloaders(fold_data, rank=0, world_size=1)
+    assert captured["train"]["label_box_paths"] == fold_data["train_label_boxes"]
+    assert captured["val"]["label_box_paths"] == fold_data["val_label_boxes"]
+    assert captured["train"]["half_precision"] is True
+    assert captured["val"]["half_precision"] is True
+
+
+def test_build_dataloaders_uses_configured_backend(tmp_pipeline, mist_args, monkeypatch):
+    """training.data_loader selects the PyTorch loader, which works without DALI."""
+    captured = {}
+
+    def fake_loader(name: str):
+        def _get(**kwargs: Any) -> DummyIter:
+            captured[name] = kwargs
+            return DummyIter({"image": torch.zeros(1, 4)}, steps=1)
+
+        return _get
+
+    monkeypatch.setattr(p3d, "dali_loader", None)
+    monkeypatch.setattr(p3d.torch_loader, "get_training_dataset", fake_loader("train"))
+    monkeypatch.setattr(p3d.torch_loader, "get_validation_dataset", fake_loader("val"))
+    t = Patch3DTrainer(mist_args)
+    fold_data = {
+        "train_images": ["images/p0.npy"],
+        "train_labels": ["labels/p0.npy"],
+        "train_dtms": None,
+        "val_images": ["images/p1.npy"],
+        "val_labels": ["labels/p1.npy"],
+    }
+
+    t.config["training"]["data_loader"] = "torch"
+    t.build_dataloaders(fold_data, rank=0, world_size=1)
+    assert captured["train"]["image_paths"] == fold_data["train_images"]
+    assert captured["train"]["oversampling"] == t.config["training"]["dali_foreground_prob"]
+    assert captured["val"]["label_paths"] == fold_data["val_labels"]
+
+    t.config["training"]["samples_per_volume"] = 4
+    t.build_dataloaders(fold_data, rank=0, world_size=1)
+    assert captured["train"]["samples_per_volume"] == 4
+
+    t.config["training"]["data_loader"] = "dali"
+    with pytest.raises(RuntimeError, match="NVIDIA DALI is required"):
+        t.build_dataloaders(fold_data, rank=0, world_size=1)
+
+    t.config["training"]["data_loader"] = "jax"
+    with pytest.raises(ValueError, match="Unknown data loader 'jax'"):
+        t.build_dataloaders(fold_data, rank=0, world_size=1)
+
+
+@pytest.mark.parametrize("backend", ["dali", "torch"])
+def test_build_dataloaders_uses_shared_cache(
+    tmp_path, tmp_pipeline, mist_args, monkeypatch, backend
+):
+    """The PyTorch loaders get the cache, and DALI reads the fold's cached files."""
+    captured = {}
+
+    def fake_loader(name: str):
+        def _get(**kwargs: Any) -> DummyIter:
+            captured[name] = kwargs
+            return DummyIter({"image": torch.zeros(1, 4)}, steps=1)
+
+        return _get
+
+    module = dl if backend == "dali" else p3d.torch_loader
+    monkeypatch.setattr(module, "get_training_dataset", fake_loader("train"))
+    monkeypatch.setattr(module, "get_validation_dataset", fake_loader("val"))
+    t = Patch3DTrainer(mist_args)
+    t.config["training"]["data_loader"] = backend
+    t.config["training"]["shared_cache"] = {"enabled": True, "directory": str(tmp_path / "shm")}
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name in ("image0", "label0", "image1", "label1"):
+        (data_dir / f"{name}.npy").write_bytes(b"0" * 10)
+    fold_data = {
+        "train_images": [str(data_dir / "image0.npy")],
+        "train_labels": [str(data_dir / "label0.npy")],
+        "train_dtms": None,
+        "val_images": [str(data_dir / "image1.npy")],
+        "val_labels": [str(data_dir / "label1.npy")],
+    }
+    t.build_dataloaders(fold_data, rank=0, world_size=1)
+
+    if backend == "torch":
+        assert isinstance(captured["train"]["cache"], p3d.shared_cache.SharedFileCache)
+        assert captured["val"]["cache"] is captured["train"]["cache"]
+        assert captured["train"]["image_paths"] == fold_data["train_images"]
+    else:
+        assert "cache" not in captured["train"]
+        for name, key in [
+            ("train", "image_paths"),
+            ("train", "label_paths"),
+            ("val", "image_paths"),
+        ]:
+            (path,) = captured[name][key]
+            assert Path(path).parent.parent == tmp_path / "shm"
+        assert captured["train"]["dtm_paths"] is None
 
 
 @pytest.mark.parametrize("amp_enabled", [False, True])
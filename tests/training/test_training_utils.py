@@ -3,6 +3,7 @@ from pathlib import Path
 from typing import Any
 
 import pytest
+import torch
 
 # MIST imports.
 from mist.training import training_utils as tu
@@ -116,6 +117,33 @@ def test_running_mean_handles_ints_and_negatives():
     assert rm.result() == pytest.approx(4.0 / 3.0)
 
 
+def test_running_mean_add_sums_of_values():
+    """Test that RunningMean.add counts a sum as several values."""
+    rm = tu.RunningMean()
+    rm(1.0)
+    assert rm.add(9.0, 3) == pytest.approx(2.5)
+    assert rm.count == 4
+
+
+def test_loss_sum_pop_returns_sum_and_count():
+    """Test that LossSum sums detached losses and restarts after pop."""
+    loss_sum = tu.LossSum()
+    weight = torch.tensor(2.0, requires_grad=True)
+    for value in (1.0, 2.0, 3.0):
+        loss_sum.add(weight * value)
+    total, count = loss_sum.pop()
+    assert total.item() == pytest.approx(12.0)
+    assert not total.requires_grad
+    assert count == 3
+    assert loss_sum.count == 0 and loss_sum.total is None
+
+
+def test_loss_sum_pop_empty_raises():
+    """Test that LossSum.pop raises when no losses were added."""
+    with pytest.raises(ValueError, match="No losses"):
+        tu.LossSum().pop()
+
+
 def _make_paths(tmp_path: Path, subdir: str, ids):
     """Create dummy paths in a subdirectory and return them as a list."""
     d = tmp_path / subdir